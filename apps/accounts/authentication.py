@@ -0,0 +1,36 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .principal import get_principal, principal_cache_enabled, user_from_principal
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication resolving the token's user from its cached principal
+    instead of loading the user row on every request (when principals are cached)
+    """
+
+    def get_user(self, validated_token):
+        if not principal_cache_enabled():
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        principal = get_principal(user_id)
+        if principal is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        user = user_from_principal(principal)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != principal.password_hash:
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
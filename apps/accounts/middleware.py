@@ -0,0 +1,19 @@
+from django.utils.functional import SimpleLazyObject
+
+from .principal import ensure_principal
+
+
+class PrincipalMiddleware:
+    """
+    Attach the cached principal to session-authenticated users, so role checks
+    in the admin and in views don't query the user's profiles and scope.
+    Goes after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = request.user
+        request.user = SimpleLazyObject(lambda: ensure_principal(user))
+        return self.get_response(request)
@@ -0,0 +1,134 @@
+"""
+Cached principals of authenticated users.
+
+A principal is the compact part of a user that authentication and role checks
+need on every request: the user's identity and flags, the ids of their doctor
+or staff profile and center, and their AccessScope. It is cached under the
+user's id, so authenticating a request costs one cache read. The user object
+is rebuilt from it with every other field deferred and the profiles and scope
+already attached, so `user.doctor_profile`, `user.staff_profile` and
+`Model.objects.for_user(user)` need no queries either.
+
+Signals invalidate a principal whenever its user, profiles or scope change;
+PRINCIPAL_CACHE_TIMEOUT bounds how long anything missed can stay stale.
+Invalidation only reaches every process through a shared cache, so principals
+are only used when PRINCIPAL_CACHE_ENABLED is on (by default, with Redis);
+otherwise users are loaded from the database as plain JWTAuthentication does.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from apps.hospital.models import Doctor, Staff
+from apps.patients.managers import AccessScope, remember_access_scope, resolve_access_scope
+
+User = get_user_model()
+
+PRINCIPAL_USER_FIELDS = (
+    'id', 'email', 'username', 'first_name', 'last_name', 'role',
+    'is_active', 'is_staff', 'is_superuser', 'is_verified',
+)
+
+# `user` holds the PRINCIPAL_USER_FIELDS values. `password_hash` is the MD5 of the
+# stored password hash, which simplejwt puts in tokens when CHECK_REVOKE_TOKEN is on.
+Principal = namedtuple('Principal', [
+    'user', 'password_hash', 'doctor_id', 'staff_id', 'center_id', 'scope_kind', 'scope_ids'
+])
+
+
+def principal_cache_enabled():
+    return getattr(settings, 'PRINCIPAL_CACHE_ENABLED', True)
+
+
+def _principal_key(user_id):
+    return f'principal:{user_id}'
+
+
+def build_principal(user):
+    """Principal of a user loaded from the database"""
+    doctor_id = staff_id = center_id = None
+    if user.role == 'DOCTOR':
+        profile = Doctor.objects.filter(user_id=user.pk).values_list('pk', 'center_id').first()
+        if profile:
+            doctor_id, center_id = profile
+    elif user.role == 'STAFF':
+        profile = Staff.objects.filter(user_id=user.pk).values_list('pk', 'center_id').first()
+        if profile:
+            staff_id, center_id = profile
+    scope = resolve_access_scope(user)
+    return Principal(
+        user=tuple(getattr(user, field) for field in PRINCIPAL_USER_FIELDS),
+        password_hash=get_md5_hash_password(user.password),
+        doctor_id=doctor_id,
+        staff_id=staff_id,
+        center_id=center_id,
+        scope_kind=scope.kind,
+        scope_ids=scope.ids,
+    )
+
+
+def get_principal(user_id, user=None):
+    """
+    The cached principal of a user id, built on a miss from `user` or a fresh
+    database read. None if the user does not exist.
+    """
+    key = _principal_key(user_id)
+    principal = cache.get(key)
+    if principal is None:
+        if user is None:
+            user = User.objects.filter(pk=user_id).first()
+            if user is None:
+                return None
+        principal = build_principal(user)
+        cache.set(key, principal, getattr(settings, 'PRINCIPAL_CACHE_TIMEOUT', 300))
+    return principal
+
+
+def invalidate_principals(*user_ids):
+    cache.delete_many([_principal_key(user_id) for user_id in user_ids if user_id is not None])
+
+
+def _instance(model, db, values):
+    """A model instance with the given attribute values loaded and every other field deferred"""
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(db, names, [values[name] for name in names])
+
+
+def attach_principal(user, principal):
+    """Preset a user's profiles and access scope from its principal"""
+    db = user._state.db
+    profiles = (
+        (Doctor, 'doctor_profile', principal.doctor_id),
+        (Staff, 'staff_profile', principal.staff_id),
+    )
+    for model, accessor, profile_id in profiles:
+        related = getattr(User, accessor).related
+        if related.is_cached(user):
+            continue
+        profile = None
+        if profile_id is not None:
+            profile = _instance(model, db, {'id': profile_id, 'user_id': user.pk, 'center_id': principal.center_id})
+            related.field.set_cached_value(profile, user)
+        related.set_cached_value(user, profile)
+
+    remember_access_scope(user, AccessScope(principal.scope_kind, principal.scope_ids))
+    user.principal = principal
+    return user
+
+
+def user_from_principal(principal):
+    """A User with the principal's fields loaded and every other field deferred"""
+    user = _instance(User, router.db_for_read(User), dict(zip(PRINCIPAL_USER_FIELDS, principal.user)))
+    return attach_principal(user, principal)
+
+
+def ensure_principal(user):
+    """Attach the cached principal to an authenticated user loaded some other way"""
+    if principal_cache_enabled() and user.is_authenticated and getattr(user, 'principal', None) is None:
+        attach_principal(user, get_principal(user.pk, user=user))
+    return user
+
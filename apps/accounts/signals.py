@@ -0,0 +1,92 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from apps.hospital.models import Doctor, Staff
+from apps.patients.models import Patient
+from .principal import invalidate_principals
+
+User = get_user_model()
+
+# Fields whose previous values decide which principals saving a row reaches
+TRACKED_FIELDS = {
+    Doctor: ('user_id', 'center_id'),
+    Patient: ('user_id',),
+}
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_principal(sender, instance, update_fields=None, **kwargs):
+    """Any change to a user but a login can change its principal"""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_principals(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_principal(sender, instance, **kwargs):
+    invalidate_principals(instance.pk)
+
+
+@receiver(pre_save, sender=Doctor)
+@receiver(pre_save, sender=Patient)
+def remember_previous_owner(sender, instance, raw=False, **kwargs):
+    """Keep the user and center a row had, so moving it invalidates both sides"""
+    if instance.pk and not raw:
+        instance._principal_previous = sender.objects.filter(
+            pk=instance.pk
+        ).values_list(*TRACKED_FIELDS[sender]).first()
+
+
+def _moved(sender, instance, created):
+    """The row's previous tracked values if it is new or they changed, else False"""
+    current = tuple(getattr(instance, field) for field in TRACKED_FIELDS[sender])
+    previous = getattr(instance, '_principal_previous', None)
+    if created or previous != current:
+        return previous or ()
+    return False
+
+
+def invalidate_doctor_principals(doctors):
+    """Principals of the doctors' users and of the staff of their centers, whose scope lists them"""
+    user_ids = [user_id for user_id, _center_id in doctors]
+    center_ids = {center_id for _user_id, center_id in doctors}
+    user_ids += Staff.objects.filter(center_id__in=center_ids).values_list('user_id', flat=True)
+    invalidate_principals(*user_ids)
+
+
+@receiver(post_save, sender=Doctor)
+def invalidate_saved_doctor(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = _moved(sender, instance, created)
+    if previous is not False:
+        invalidate_doctor_principals([(instance.user_id, instance.center_id)] + ([previous] if previous else []))
+
+
+@receiver(post_delete, sender=Doctor)
+def invalidate_deleted_doctor(sender, instance, **kwargs):
+    invalidate_doctor_principals([(instance.user_id, instance.center_id)])
+
+
+@receiver(post_save, sender=Staff)
+@receiver(post_delete, sender=Staff)
+def invalidate_staff_principal(sender, instance, raw=False, **kwargs):
+    """Staff principals carry the profile and its center"""
+    if not raw:
+        invalidate_principals(instance.user_id)
+
+
+@receiver(post_save, sender=Patient)
+def invalidate_saved_patient(sender, instance, created, raw=False, **kwargs):
+    """Patient users see the patients they created"""
+    if raw:
+        return
+    previous = _moved(sender, instance, created)
+    if previous is not False:
+        invalidate_principals(instance.user_id, *previous)
+
+
+@receiver(post_delete, sender=Patient)
+def invalidate_deleted_patient(sender, instance, **kwargs):
+    invalidate_principals(instance.user_id)
@@ -1,9 +1,17 @@
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
 from django.urls import reverse
 
+from apps.hospital.models import City, Center, Doctor, Staff
+from apps.patients.models import Patient
+from .authentication import CachedJWTAuthentication
+
 User = get_user_model()
 
 
@@ -92,3 +100,87 @@ class UserAPITest(APITestCase):
         response = self.client.get(self.profile_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['email'], 'test@example.com')
+
+
+@override_settings(PRINCIPAL_CACHE_ENABLED=True)
+class CachedPrincipalTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='doctor@example.com', username='doctor', password='testpass123',
+            first_name='Omar', last_name='Ali', role='DOCTOR'
+        )
+        city = City.objects.create(name='BASRA', state='Basra', country='Iraq')
+        self.center = Center.objects.create(name='Basra Center', city=city, address='Basra', phone_number='+9647700000000')
+        self.doctor = Doctor.objects.create(
+            user=self.user, center=self.center, specialization='CARDIOLOGY', license_number='LIC1'
+        )
+        self.staff_user = User.objects.create_user(
+            email='staff@example.com', username='staff', password='testpass123', role='STAFF'
+        )
+        Staff.objects.create(user=self.staff_user, center=self.center, department='RECEPTION', employee_id='EMP1')
+
+    def _authenticate(self, user):
+        token = AccessToken.for_user(user)
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_authentication_costs_one_cache_read(self):
+        self._authenticate(self.user)
+        with self.assertNumQueries(0):
+            user = self._authenticate(self.user)
+            self.assertEqual((user.pk, user.role, user.get_full_name()), (self.user.pk, 'DOCTOR', 'Omar Ali'))
+            self.assertEqual(user.doctor_profile.pk, self.doctor.pk)
+            self.assertEqual(user.doctor_profile.center_id, self.center.pk)
+            self.assertFalse(hasattr(user, 'staff_profile'))
+            Patient.objects.for_user(user)
+        # Fields outside the principal still load on access
+        self.assertEqual(user.phone_number, '')
+
+    def test_principal_follows_role_and_profile_changes(self):
+        self.assertEqual(self._authenticate(self.staff_user).principal.scope_ids, (self.doctor.pk,))
+
+        other_user = User.objects.create_user(
+            email='doctor2@example.com', username='doctor2', password='testpass123', role='DOCTOR'
+        )
+        other = Doctor.objects.create(user=other_user, center=self.center, specialization='CARDIOLOGY', license_number='LIC2')
+        self.assertEqual(set(self._authenticate(self.staff_user).principal.scope_ids), {self.doctor.pk, other.pk})
+
+        self.staff_user.role = 'ADMIN'
+        self.staff_user.save()
+        self.assertEqual(self._authenticate(self.staff_user).principal.scope_kind, 'all')
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate(self.user)
+
+    def test_logins_keep_the_principal(self):
+        self._authenticate(self.user)
+        update_last_login(None, self.user)
+        with self.assertNumQueries(0):
+            self._authenticate(self.user)
+
+    @override_settings(PRINCIPAL_CACHE_ENABLED=False)
+    def test_users_are_loaded_from_the_database_without_a_shared_cache(self):
+        user = self._authenticate(self.user)
+        self.assertIsNone(getattr(user, 'principal', None))
+
+        # A change no signal reports, as one made in another process would be for a local cache
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate(self.user)
+
+        self.user.is_staff = True
+        self.user.is_active = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin:index'))
+        self.assertIsNone(getattr(response.wsgi_request.user, 'principal', None))
+
+    def test_session_users_get_the_principal(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin:index'))
+        self.assertEqual(response.wsgi_request.user.principal.doctor_id, self.doctor.pk)
@@ -0,0 +1,438 @@
+"""
+Cohort analytics - declarative patient filters compiled into a single SQL query
+with EXISTS subqueries, or evaluated with NumPy over cached column snapshots
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, CharField, Count, Exists, OuterRef, Value, When
+from django.utils import timezone
+
+from apps.patients.models import Patient, PatientDisease, Test, Treatment
+from hospital_system.admin_pagination import estimate_table_rows
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# (label, lowest age in the band); a band ends where the next one starts
+AGE_BANDS = [('0-17', 0), ('18-29', 18), ('30-44', 30), ('45-59', 45), ('60-74', 60), ('75+', 75)]
+
+BREAKDOWN_FIELDS = {
+    'gender': 'gender',
+    'blood_group': 'blood_group',
+    'city': 'doctor__center__city__name',
+    'center': 'doctor__center__name',
+    'age_band': 'age_band',
+}
+
+SNAPSHOT_MODELS = (Patient, PatientDisease, Test, Treatment)
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+_building = threading.Event()
+_recent_queries = deque(maxlen=100)
+
+
+def years_ago(today, years):
+    """Date `years` years before today (28 February for a 29 February today)"""
+    try:
+        return today.replace(year=today.year - years)
+    except ValueError:
+        return today.replace(year=today.year - years, day=28)
+
+
+def summarize(groups, dims):
+    """Fold (dimension values, count) groups into a total and one breakdown per dimension"""
+    total = 0
+    counts = {dim: {} for dim in dims}
+    for values, count in groups:
+        total += count
+        for dim, value in zip(dims, values):
+            counts[dim][value] = counts[dim].get(value, 0) + count
+
+    breakdowns = {}
+    for dim in dims:
+        items = [{'value': value, 'count': count} for value, count in counts[dim].items() if count]
+        breakdowns[dim] = sorted(items, key=lambda item: (-item['count'], str(item['value'])))
+    return {'count': total, 'breakdowns': breakdowns}
+
+
+# SQL evaluation
+
+def _disease_exists(criteria, today, now):
+    diagnoses = PatientDisease.objects.filter(patient=OuterRef('pk'))
+    if criteria.get('disease_ids'):
+        diagnoses = diagnoses.filter(disease_id__in=criteria['disease_ids'])
+    if criteria.get('disease_names'):
+        diagnoses = diagnoses.filter(disease__name__in=criteria['disease_names'])
+    if criteria.get('categories'):
+        diagnoses = diagnoses.filter(disease__category__in=criteria['categories'])
+    if criteria.get('statuses'):
+        diagnoses = diagnoses.filter(status__in=criteria['statuses'])
+    if criteria.get('within_days') is not None:
+        diagnoses = diagnoses.filter(diagnosed_date__gte=today - timedelta(days=criteria['within_days']))
+    return Exists(diagnoses)
+
+
+def _test_exists(criteria, today, now):
+    tests = Test.objects.filter(patient=OuterRef('pk'))
+    if criteria.get('name_contains'):
+        tests = tests.filter(test_name__icontains=criteria['name_contains'])
+    if criteria.get('test_types'):
+        tests = tests.filter(test_type__in=criteria['test_types'])
+    if criteria.get('statuses'):
+        tests = tests.filter(status__in=criteria['statuses'])
+    if criteria.get('within_days') is not None:
+        tests = tests.filter(test_date__gte=now - timedelta(days=criteria['within_days']))
+    return Exists(tests)
+
+
+def _treatment_exists(criteria, today, now):
+    treatments = Treatment.objects.filter(patient=OuterRef('pk'))
+    if criteria.get('name_contains'):
+        treatments = treatments.filter(treatment_name__icontains=criteria['name_contains'])
+    if criteria.get('disease_ids'):
+        treatments = treatments.filter(disease_id__in=criteria['disease_ids'])
+    if criteria.get('statuses'):
+        treatments = treatments.filter(status__in=criteria['statuses'])
+    if criteria.get('within_days') is not None:
+        treatments = treatments.filter(start_date__gte=today - timedelta(days=criteria['within_days']))
+    return Exists(treatments)
+
+
+RELATION_FILTERS = [
+    ('diseases', _disease_exists),
+    ('tests', _test_exists),
+    ('treatments', _treatment_exists),
+]
+
+
+def build_cohort_queryset(criteria, today, now):
+    """Patients matching the cohort criteria, as a single query"""
+    patients = Patient.objects.all()
+    patient = criteria.get('patient') or {}
+
+    if patient.get('age_min') is not None:
+        patients = patients.filter(date_of_birth__lte=years_ago(today, patient['age_min']))
+    if patient.get('age_max') is not None:
+        patients = patients.filter(date_of_birth__gt=years_ago(today, patient['age_max'] + 1))
+    if patient.get('genders'):
+        patients = patients.filter(gender__in=patient['genders'])
+    if patient.get('blood_groups'):
+        patients = patients.filter(blood_group__in=patient['blood_groups'])
+    if patient.get('cities'):
+        patients = patients.filter(doctor__center__city__name__in=patient['cities'])
+    if patient.get('center_ids'):
+        patients = patients.filter(doctor__center_id__in=patient['center_ids'])
+    if patient.get('is_active') is not None:
+        patients = patients.filter(is_active=patient['is_active'])
+
+    for section, build_exists in RELATION_FILTERS:
+        if section in criteria:
+            patients = patients.filter(build_exists(criteria[section] or {}, today, now))
+    return patients
+
+
+def age_band_expression(today):
+    """CASE expression mapping date_of_birth to its AGE_BANDS label"""
+    whens = [
+        When(date_of_birth__gt=years_ago(today, next_lower), then=Value(label))
+        for (label, _lower), (_next_label, next_lower) in zip(AGE_BANDS, AGE_BANDS[1:])
+    ]
+    return Case(*whens, default=Value(AGE_BANDS[-1][0]), output_field=CharField())
+
+
+def evaluate_sql(criteria, today, now):
+    """Count the cohort and all requested breakdowns in one grouped query"""
+    patients = build_cohort_queryset(criteria, today, now)
+    dims = criteria.get('breakdowns', [])
+    if not dims:
+        return {'count': patients.count(), 'breakdowns': {}}
+
+    if 'age_band' in dims:
+        patients = patients.annotate(age_band=age_band_expression(today))
+    fields = [BREAKDOWN_FIELDS[dim] for dim in dims]
+    groups = patients.values(*fields).annotate(count=Count('pk')).order_by()
+    return summarize(((tuple(row[field] for field in fields), row['count']) for row in groups), dims)
+
+
+# Vectorized evaluation
+
+class _Column:
+    """Dictionary-encoded column: integer codes into a list of distinct labels"""
+
+    def __init__(self, values):
+        self.labels = sorted(set(values), key=lambda value: (value is None, str(value)))
+        index = {label: i for i, label in enumerate(self.labels)}
+        self.codes = np.fromiter((index[value] for value in values), dtype=np.int32, count=len(values))
+
+    def isin(self, wanted):
+        wanted = set(wanted)
+        return np.isin(self.codes, [i for i, label in enumerate(self.labels) if label in wanted])
+
+    def contains(self, needle):
+        needle = needle.lower()
+        return np.isin(self.codes, [
+            i for i, label in enumerate(self.labels) if label is not None and needle in label.lower()
+        ])
+
+
+def _load_columns(queryset, fields):
+    columns = [[] for _field in fields]
+    for row in queryset.values_list(*fields).iterator(chunk_size=10000):
+        for column, value in zip(columns, row):
+            column.append(value)
+    return columns
+
+
+class CohortSnapshot:
+    """In-memory column arrays of patients and their diagnoses, tests and treatments"""
+
+    def __init__(self):
+        self.built_at = time.monotonic()
+        pks, dobs, genders, blood_groups, cities, center_ids, centers, active = _load_columns(
+            Patient.objects.order_by('pk'),
+            ['pk', 'date_of_birth', 'gender', 'blood_group', 'doctor__center__city__name',
+             'doctor__center_id', 'doctor__center__name', 'is_active']
+        )
+        self.patient_pk = np.array(pks, dtype=np.int64)
+        self.dob = np.array([dob.toordinal() for dob in dobs], dtype=np.int64)
+        self.gender = _Column(genders)
+        self.blood_group = _Column(blood_groups)
+        self.city = _Column(cities)
+        self.center = _Column(centers)
+        self.center_id = np.array(center_ids, dtype=np.int64)
+        self.is_active = np.array(active, dtype=bool)
+
+        patient_ids, disease_ids, names, categories, statuses, dates = _load_columns(
+            PatientDisease.objects.all(),
+            ['patient_id', 'disease_id', 'disease__name', 'disease__category', 'status', 'diagnosed_date']
+        )
+        self.diseases = {
+            'patient_idx': self._patient_index(patient_ids),
+            'disease_id': np.array(disease_ids, dtype=np.int64),
+            'name': _Column(names),
+            'category': _Column(categories),
+            'status': _Column(statuses),
+            'date': np.array([value.toordinal() for value in dates], dtype=np.int64),
+        }
+
+        patient_ids, names, test_types, statuses, dates = _load_columns(
+            Test.objects.all(), ['patient_id', 'test_name', 'test_type', 'status', 'test_date']
+        )
+        self.tests = {
+            'patient_idx': self._patient_index(patient_ids),
+            'name': _Column(names),
+            'test_type': _Column(test_types),
+            'status': _Column(statuses),
+            'timestamp': np.array([value.timestamp() for value in dates], dtype=np.float64),
+        }
+
+        patient_ids, names, disease_ids, statuses, dates = _load_columns(
+            Treatment.objects.all(), ['patient_id', 'treatment_name', 'disease_id', 'status', 'start_date']
+        )
+        self.treatments = {
+            'patient_idx': self._patient_index(patient_ids),
+            'name': _Column(names),
+            'disease_id': np.array(disease_ids, dtype=np.int64),
+            'status': _Column(statuses),
+            'date': np.array([value.toordinal() for value in dates], dtype=np.int64),
+        }
+
+    def _patient_index(self, patient_ids):
+        """Row index of each patient id; -1 for patients created after the patient columns were read"""
+        patient_ids = np.array(patient_ids, dtype=np.int64)
+        if not len(self.patient_pk):
+            return np.full(len(patient_ids), -1, dtype=np.int64)
+        index = np.clip(np.searchsorted(self.patient_pk, patient_ids), 0, len(self.patient_pk) - 1)
+        return np.where(self.patient_pk[index] == patient_ids, index, -1)
+
+    def _has_any(self, relation, rows):
+        hits = np.zeros(len(self.patient_pk), dtype=bool)
+        index = relation['patient_idx'][rows]
+        hits[index[index >= 0]] = True
+        return hits
+
+    def _disease_rows(self, criteria, today, now):
+        rows = np.ones(len(self.diseases['patient_idx']), dtype=bool)
+        if criteria.get('disease_ids'):
+            rows &= np.isin(self.diseases['disease_id'], criteria['disease_ids'])
+        if criteria.get('disease_names'):
+            rows &= self.diseases['name'].isin(criteria['disease_names'])
+        if criteria.get('categories'):
+            rows &= self.diseases['category'].isin(criteria['categories'])
+        if criteria.get('statuses'):
+            rows &= self.diseases['status'].isin(criteria['statuses'])
+        if criteria.get('within_days') is not None:
+            rows &= self.diseases['date'] >= (today - timedelta(days=criteria['within_days'])).toordinal()
+        return rows
+
+    def _test_rows(self, criteria, today, now):
+        rows = np.ones(len(self.tests['patient_idx']), dtype=bool)
+        if criteria.get('name_contains'):
+            rows &= self.tests['name'].contains(criteria['name_contains'])
+        if criteria.get('test_types'):
+            rows &= self.tests['test_type'].isin(criteria['test_types'])
+        if criteria.get('statuses'):
+            rows &= self.tests['status'].isin(criteria['statuses'])
+        if criteria.get('within_days') is not None:
+            rows &= self.tests['timestamp'] >= (now - timedelta(days=criteria['within_days'])).timestamp()
+        return rows
+
+    def _treatment_rows(self, criteria, today, now):
+        rows = np.ones(len(self.treatments['patient_idx']), dtype=bool)
+        if criteria.get('name_contains'):
+            rows &= self.treatments['name'].contains(criteria['name_contains'])
+        if criteria.get('disease_ids'):
+            rows &= np.isin(self.treatments['disease_id'], criteria['disease_ids'])
+        if criteria.get('statuses'):
+            rows &= self.treatments['status'].isin(criteria['statuses'])
+        if criteria.get('within_days') is not None:
+            rows &= self.treatments['date'] >= (today - timedelta(days=criteria['within_days'])).toordinal()
+        return rows
+
+    def _age_band_codes(self, today):
+        # A patient is in band k when they are at least as old as the k-th band boundary
+        boundaries = np.array(sorted(
+            years_ago(today, lower).toordinal() for _label, lower in AGE_BANDS[1:]
+        ), dtype=np.int64)
+        return len(boundaries) - np.searchsorted(boundaries, self.dob, side='left')
+
+    def evaluate(self, criteria, today, now):
+        """Same result as evaluate_sql(), computed over the snapshot arrays"""
+        mask = np.ones(len(self.patient_pk), dtype=bool)
+        patient = criteria.get('patient') or {}
+
+        if patient.get('age_min') is not None:
+            mask &= self.dob <= years_ago(today, patient['age_min']).toordinal()
+        if patient.get('age_max') is not None:
+            mask &= self.dob > years_ago(today, patient['age_max'] + 1).toordinal()
+        if patient.get('genders'):
+            mask &= self.gender.isin(patient['genders'])
+        if patient.get('blood_groups'):
+            mask &= self.blood_group.isin(patient['blood_groups'])
+        if patient.get('cities'):
+            mask &= self.city.isin(patient['cities'])
+        if patient.get('center_ids'):
+            mask &= np.isin(self.center_id, patient['center_ids'])
+        if patient.get('is_active') is not None:
+            mask &= self.is_active == patient['is_active']
+
+        if 'diseases' in criteria:
+            mask &= self._has_any(self.diseases, self._disease_rows(criteria['diseases'] or {}, today, now))
+        if 'tests' in criteria:
+            mask &= self._has_any(self.tests, self._test_rows(criteria['tests'] or {}, today, now))
+        if 'treatments' in criteria:
+            mask &= self._has_any(self.treatments, self._treatment_rows(criteria['treatments'] or {}, today, now))
+
+        result = {'count': int(mask.sum()), 'breakdowns': {}}
+        for dim in criteria.get('breakdowns', []):
+            if dim == 'age_band':
+                codes, labels = self._age_band_codes(today), [label for label, _lower in AGE_BANDS]
+            else:
+                column = getattr(self, dim)
+                codes, labels = column.codes, column.labels
+            counts = np.bincount(codes[mask], minlength=len(labels))
+            result['breakdowns'][dim] = summarize(
+                (((label,), int(count)) for label, count in zip(labels, counts)), [dim]
+            )['breakdowns'][dim]
+        return result
+
+
+def get_snapshot():
+    """The current snapshot if it is younger than COHORT_SNAPSHOT_TTL"""
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - snapshot.built_at < getattr(settings, 'COHORT_SNAPSHOT_TTL', 600):
+        return snapshot
+    return None
+
+
+def snapshot_rows():
+    """Rows a snapshot would load, from planner estimates where the database has them"""
+    return sum(
+        estimate_table_rows(model) or model.objects.count()
+        for model in SNAPSHOT_MODELS
+    )
+
+
+def build_snapshot():
+    """Build a snapshot and make it current"""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = CohortSnapshot()
+        return _snapshot
+
+
+def _build_in_background():
+    try:
+        if snapshot_rows() <= getattr(settings, 'COHORT_SNAPSHOT_MAX_ROWS', 2000000):
+            build_snapshot()
+    finally:
+        _building.clear()
+        connection.close()
+
+
+def schedule_snapshot_build():
+    """
+    Start building a snapshot on a background thread, unless one is already
+    being built. Tables above COHORT_SNAPSHOT_MAX_ROWS rows are never loaded.
+    """
+    if _building.is_set():
+        return
+    _building.set()
+    threading.Thread(target=_build_in_background, name='cohort-snapshot', daemon=True).start()
+
+
+def _is_repeated_workload():
+    """True once enough cohort queries arrived within one snapshot TTL to pay for a snapshot"""
+    now = time.monotonic()
+    _recent_queries.append(now)
+    window = getattr(settings, 'COHORT_SNAPSHOT_TTL', 600)
+    recent = sum(1 for timestamp in _recent_queries if now - timestamp < window)
+    return recent >= getattr(settings, 'COHORT_SNAPSHOT_MIN_QUERIES', 3)
+
+
+def _cache_key(criteria, today):
+    payload = json.dumps(criteria, sort_keys=True, default=str)
+    return f"cohort:{today.isoformat()}:{hashlib.sha1(payload.encode()).hexdigest()}"
+
+
+def run_cohort_query(criteria):
+    """
+    Count the patients matching validated cohort criteria, with breakdowns.
+
+    Results are cached per criteria. Cache misses run a single SQL query until
+    cohort queries become frequent, after which a NumPy snapshot of the clinical
+    columns is built on a background thread (when NumPy is installed and the
+    tables are small enough) and queries are answered from it until the
+    snapshot ages out. Requests never wait for a snapshot, they use SQL instead.
+    """
+    today = timezone.localdate()
+    now = timezone.now()
+    key = _cache_key(criteria, today)
+    result = cache.get(key)
+    if result is not None:
+        return {**result, 'cached': True}
+
+    snapshot = get_snapshot() if NUMPY_AVAILABLE else None
+    if snapshot is None and NUMPY_AVAILABLE and _is_repeated_workload():
+        schedule_snapshot_build()
+    if snapshot is not None:
+        result = snapshot.evaluate(criteria, today, now)
+        result['engine'] = 'vectorized'
+    else:
+        result = evaluate_sql(criteria, today, now)
+        result['engine'] = 'sql'
+
+    cache.set(key, result, getattr(settings, 'COHORT_CACHE_TIMEOUT', 300))
+    return {**result, 'cached': False}
@@ -0,0 +1,132 @@
+"""
+Disease prevalence - diagnosis counts per disease, city/center and week or month,
+computed in one grouped query per window and served as heatmap matrices
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from apps.hospital.models import Center, Disease
+from apps.patients.models import PatientDisease
+from .timeseries import TRUNC_FUNCTIONS, bucket_range
+
+PREVALENCE_GRANULARITIES = ['week', 'month']
+PREVALENCE_GROUPINGS = ['disease', 'city', 'center']
+VERSION_KEY = 'prevalence:version'
+
+
+def get_prevalence_version():
+    """Cache generation of prevalence cubes, bumped whenever a diagnosis changes"""
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def invalidate_prevalence():
+    """Make every cached prevalence cube stale"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def build_prevalence_cube(start, end, granularity):
+    """
+    Diagnosis counts grouped by period, disease and center for one window,
+    as a list of (period, disease_id, center_id, count) tuples
+    """
+    trunc = TRUNC_FUNCTIONS[granularity]
+    groups = PatientDisease.objects.filter(
+        diagnosed_date__range=[start, end]
+    ).annotate(
+        period=trunc('diagnosed_date')
+    ).values_list(
+        'period', 'disease_id', 'patient__doctor__center_id'
+    ).annotate(count=Count('id')).order_by()
+    return [(period.isoformat(), disease_id, center_id, count) for period, disease_id, center_id, count in groups]
+
+
+def get_prevalence_cube(start, end, granularity):
+    """The cube of a window, from the cache when it has not changed since it was built"""
+    key = f"prevalence:{get_prevalence_version()}:{granularity}:{start.isoformat()}:{end.isoformat()}"
+    cube = cache.get(key)
+    if cube is None:
+        cube = build_prevalence_cube(start, end, granularity)
+        cache.set(key, cube, getattr(settings, 'PREVALENCE_CACHE_TIMEOUT', 900))
+    return cube
+
+
+def build_prevalence_matrix(start, end, granularity='month', group_by='city',
+                            disease_ids=None, city_ids=None, center_ids=None, limit=50):
+    """
+    Heatmap payload: one row per disease (and city or center, depending on
+    group_by) with a count for every period of the window, empty periods included
+    """
+    periods = [period.isoformat() for period in bucket_range(start, end, granularity)]
+    period_index = {period: i for i, period in enumerate(periods)}
+
+    centers = {
+        center['id']: center
+        for center in Center.objects.values('id', 'name', 'city_id', 'city__name')
+    }
+    disease_ids = set(disease_ids or [])
+    city_ids = set(city_ids or [])
+    center_ids = set(center_ids or [])
+
+    rows = {}
+    for period, disease_id, center_id, count in get_prevalence_cube(start, end, granularity):
+        center = centers.get(center_id)
+        if center is None:
+            continue
+        if disease_ids and disease_id not in disease_ids:
+            continue
+        if city_ids and center['city_id'] not in city_ids:
+            continue
+        if center_ids and center_id not in center_ids:
+            continue
+
+        if group_by == 'center':
+            key = (disease_id, center_id)
+        elif group_by == 'city':
+            key = (disease_id, center['city_id'])
+        else:
+            key = (disease_id, None)
+
+        values = rows.get(key)
+        if values is None:
+            values = rows[key] = [0] * len(periods)
+        values[period_index[period]] += count
+
+    disease_names = dict(
+        Disease.objects.filter(id__in={disease_id for disease_id, _key in rows}).values_list('id', 'name')
+    )
+    city_names = {center['city_id']: center['city__name'] for center in centers.values()}
+
+    matrix = []
+    for (disease_id, key), values in rows.items():
+        row = {
+            'disease_id': disease_id,
+            'disease_name': disease_names.get(disease_id),
+            'values': values,
+            'total': sum(values),
+        }
+        if group_by == 'center':
+            row.update({
+                'center_id': key,
+                'center_name': centers[key]['name'],
+                'city_name': centers[key]['city__name'],
+            })
+        elif group_by == 'city':
+            row.update({'city_id': key, 'city_name': city_names[key]})
+        matrix.append(row)
+
+    matrix.sort(key=lambda row: (-row['total'], row['disease_name'] or ''))
+    matrix = matrix[:limit]
+
+    return {
+        'granularity': granularity,
+        'group_by': group_by,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'periods': periods,
+        'rows': matrix,
+        'max': max((max(row['values']) for row in matrix), default=0),
+    }
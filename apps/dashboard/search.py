@@ -0,0 +1,270 @@
+"""
+Universal search - one term looked up across patients, visits, tests,
+treatments, surgeries, doctors, medicines and diseases.
+
+Every entity has a searcher running one LIMITed query against that entity's
+table. Visits go through the visit search document and phone numbers, licence
+numbers and ICD codes are prefix matches, but names, results and the other
+free-text fields are substring (icontains) matches that scan their tables.
+Searchers run in parallel on a shared thread pool; the ones answering within
+UNIVERSAL_SEARCH_TIME_BUDGET_MS are ranked and grouped, the others are
+reported as timed out and their queries are cancelled at the deadline, so a
+slow scan costs partial results rather than the whole request or a pool
+thread. Clinical entities are scoped with for_user(), and entities whose
+viewset is narrower than "any authenticated user" (doctors) are only searched
+for the users that viewset admits.
+"""
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+
+from apps.hospital.models import Disease, Doctor, Medicine
+from apps.patients.managers import get_access_scope
+from apps.patients.models import Patient, Surgery, Test, Treatment, Visit
+from apps.patients.search import search_visit_ids
+
+logger = logging.getLogger(__name__)
+
+SearchHit = namedtuple('SearchHit', ['entity', 'id', 'title', 'subtitle', 'score'])
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'UNIVERSAL_SEARCH_WORKERS', 4), thread_name_prefix='universal-search'
+        )
+    return _executor
+
+
+def match_score(term, *texts):
+    """1.0 for an exact match of one of the texts, 0.8 for a prefix, 0.6 for a word prefix, 0.4 otherwise"""
+    term = term.casefold()
+    best = 0.4
+    for text in texts:
+        text = (text or '').casefold()
+        if text == term:
+            return 1.0
+        if text.startswith(term):
+            best = max(best, 0.8)
+        elif f' {term}' in text:
+            best = max(best, 0.6)
+    return best
+
+
+def _contains(term, *fields):
+    query = Q()
+    for field in fields:
+        query |= Q(**{f'{field}__icontains': term})
+    return query
+
+
+def search_patients(term, user, limit):
+    patients = Patient.objects.for_user(user).filter(
+        Q(patient_id__startswith=term) | Q(patient_name__icontains=term)
+    ).order_by('-created_at').values_list('pk', 'patient_name', 'patient_id')[:limit]
+    return [
+        SearchHit('patients', pk, name, phone, match_score(term, phone, name))
+        for pk, name, phone in patients
+    ]
+
+
+def search_visits(term, user, limit):
+    ids = search_visit_ids(term, visits=Visit.objects.for_user(user), limit=limit)
+    visits = {
+        row[0]: row for row in Visit.objects.filter(pk__in=ids).values_list(
+            'pk', 'patient__patient_name', 'chief_complaint'
+        )
+    }
+    # The index returns its best matches first
+    return [
+        SearchHit('visits', pk, visits[pk][1], visits[pk][2][:100], round(0.9 - 0.5 * position / len(ids), 3))
+        for position, pk in enumerate(ids) if pk in visits
+    ]
+
+
+def search_tests(term, user, limit):
+    tests = Test.objects.for_user(user).filter(
+        _contains(term, 'test_name', 'results')
+    ).order_by('-test_date').values_list('pk', 'test_name', 'patient__patient_name')[:limit]
+    return [SearchHit('tests', pk, name, patient, match_score(term, name)) for pk, name, patient in tests]
+
+
+def search_treatments(term, user, limit):
+    treatments = Treatment.objects.for_user(user).filter(
+        _contains(term, 'treatment_name')
+    ).order_by('-start_date').values_list('pk', 'treatment_name', 'patient__patient_name')[:limit]
+    return [SearchHit('treatments', pk, name, patient, match_score(term, name)) for pk, name, patient in treatments]
+
+
+def search_surgeries(term, user, limit):
+    surgeries = Surgery.objects.for_user(user).filter(
+        _contains(term, 'surgery_name', 'surgeon_name')
+    ).order_by('-scheduled_date').values_list('pk', 'surgery_name', 'surgeon_name', 'patient__patient_name')[:limit]
+    return [
+        SearchHit('surgeries', pk, name, patient, match_score(term, name, surgeon))
+        for pk, name, surgeon, patient in surgeries
+    ]
+
+
+def search_doctors(term, user, limit):
+    doctors = Doctor.objects.filter(
+        _contains(term, 'user__first_name', 'user__last_name') | Q(license_number__startswith=term)
+    ).order_by('user__first_name', 'pk').values_list(
+        'pk', 'user__first_name', 'user__last_name', 'specialization', 'license_number'
+    )[:limit]
+    return [
+        SearchHit('doctors', pk, f'{first_name} {last_name}'.strip(), specialization,
+                  match_score(term, first_name, last_name, license_number))
+        for pk, first_name, last_name, specialization, license_number in doctors
+    ]
+
+
+def search_medicines(term, user, limit):
+    medicines = Medicine.objects.filter(
+        _contains(term, 'name', 'generic_name')
+    ).order_by('name').values_list('pk', 'name', 'generic_name', 'strength')[:limit]
+    return [
+        SearchHit('medicines', pk, name, strength, match_score(term, name, generic_name))
+        for pk, name, generic_name, strength in medicines
+    ]
+
+
+def search_diseases(term, user, limit):
+    diseases = Disease.objects.filter(
+        _contains(term, 'name') | Q(icd_code__istartswith=term)
+    ).order_by('name').values_list('pk', 'name', 'icd_code')[:limit]
+    return [SearchHit('diseases', pk, name, icd_code, match_score(term, name, icd_code)) for pk, name, icd_code in diseases]
+
+
+# entity -> (label, searcher(term, user, limit), model)
+SEARCH_ENTITIES = {
+    'patients': (_('المرضى'), search_patients, Patient),
+    'visits': (_('الزيارات'), search_visits, Visit),
+    'tests': (_('الفحوصات'), search_tests, Test),
+    'treatments': (_('العلاجات'), search_treatments, Treatment),
+    'surgeries': (_('العمليات'), search_surgeries, Surgery),
+    'doctors': (_('الأطباء'), search_doctors, Doctor),
+    'medicines': (_('الأدوية'), search_medicines, Medicine),
+    'diseases': (_('الأمراض'), search_diseases, Disease),
+}
+
+
+@contextmanager
+def query_deadline(deadline):
+    """
+    Cancel the queries of this thread's connection still running at the
+    time.monotonic() deadline: a statement_timeout on PostgreSQL, a progress
+    handler on SQLite. Cancelled queries raise OperationalError.
+    """
+    if connection.vendor == 'postgresql':
+        timeout_ms = max(1, int((deadline - time.monotonic()) * 1000))
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f'SET LOCAL statement_timeout = {timeout_ms:d}')
+            yield
+    elif connection.vendor == 'sqlite':
+        connection.ensure_connection()
+        # A non-zero return from the handler interrupts the running statement
+        connection.connection.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+        try:
+            yield
+        finally:
+            connection.connection.set_progress_handler(None, 0)
+    else:
+        yield
+
+
+# entity -> users who may search it, mirroring the entity's viewset permission where it is
+# narrower than any authenticated user (DoctorViewSet: IsDoctorOrAdmin)
+ENTITY_ACCESS = {
+    'doctors': lambda user: user.is_doctor or user.is_admin,
+}
+
+
+def searchable_entities(user, entities=None):
+    """The given entities (all by default) that the user may search"""
+    return [
+        entity for entity in (entities or SEARCH_ENTITIES)
+        if entity in SEARCH_ENTITIES and ENTITY_ACCESS.get(entity, lambda user: True)(user)
+    ]
+
+
+def _run_searcher(searcher, term, user, limit, deadline):
+    # Worker threads hold their own database connections
+    close_old_connections()
+    try:
+        # Queued behind slower searchers until the request gave up on it
+        if time.monotonic() >= deadline:
+            return []
+        with query_deadline(deadline):
+            return searcher(term, user, limit)
+    finally:
+        close_old_connections()
+
+
+def universal_search(term, user, entities=None, limit=None, budget_ms=None):
+    """
+    Search the given entities (all the user may search by default) for the term.
+    Returns groups of hits, best group first, with the entities that timed out or failed.
+    """
+    entities = searchable_entities(user, entities)
+    limit = limit or getattr(settings, 'UNIVERSAL_SEARCH_LIMIT', 10)
+    if budget_ms is None:
+        budget_ms = getattr(settings, 'UNIVERSAL_SEARCH_TIME_BUDGET_MS', 800)
+    started = time.perf_counter()
+
+    # Resolve the scope here so the workers share it instead of each querying it
+    get_access_scope(user)
+
+    hits, timed_out, failed = {}, [], []
+
+    def collect(entity, run):
+        try:
+            hits[entity] = run()
+        except Exception:
+            logger.exception('Universal search on %s failed', entity)
+            failed.append(entity)
+
+    if getattr(settings, 'UNIVERSAL_SEARCH_WORKERS', 4) > 0:
+        deadline = time.monotonic() + budget_ms / 1000
+        futures = {
+            get_executor().submit(_run_searcher, SEARCH_ENTITIES[entity][1], term, user, limit, deadline): entity
+            for entity in entities
+        }
+        done, not_done = wait(futures, timeout=budget_ms / 1000)
+        timed_out = sorted(futures[future] for future in not_done)
+        for future in done:
+            collect(futures[future], future.result)
+    else:
+        # Searching inline, e.g. where worker threads can't see the caller's transaction
+        for entity in entities:
+            collect(entity, partial(SEARCH_ENTITIES[entity][1], term, user, limit))
+
+    groups = [
+        {
+            'entity': entity,
+            'label': str(SEARCH_ENTITIES[entity][0]),
+            'results': [hit._asdict() for hit in sorted(entity_hits, key=lambda hit: -hit.score)],
+        }
+        for entity, entity_hits in hits.items() if entity_hits
+    ]
+    groups.sort(key=lambda group: (-group['results'][0]['score'], entities.index(group['entity'])))
+    return {
+        'query': term,
+        'groups': groups,
+        'timed_out': timed_out,
+        'failed': sorted(failed),
+        'partial': bool(timed_out or failed),
+        'took_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
@@ -15,3 +15,60 @@ class DashboardStatsSerializer(serializers.Serializer):
     available_doctors = serializers.IntegerField()
     active_staff = serializers.IntegerField()
     active_centers = serializers.IntegerField()
+
+
+class CohortPatientFilterSerializer(serializers.Serializer):
+    """Patient-level cohort filters"""
+    age_min = serializers.IntegerField(min_value=0, max_value=150, required=False)
+    age_max = serializers.IntegerField(min_value=0, max_value=150, required=False)
+    genders = serializers.ListField(child=serializers.CharField(), required=False)
+    blood_groups = serializers.ListField(child=serializers.CharField(), required=False)
+    cities = serializers.ListField(child=serializers.CharField(), required=False)
+    center_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    is_active = serializers.BooleanField(required=False, allow_null=True, default=None)
+
+
+class CohortDiseaseFilterSerializer(serializers.Serializer):
+    """Patients with at least one matching diagnosis"""
+    disease_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    disease_names = serializers.ListField(child=serializers.CharField(), required=False)
+    categories = serializers.ListField(child=serializers.CharField(), required=False)
+    statuses = serializers.ListField(child=serializers.CharField(), required=False)
+    within_days = serializers.IntegerField(min_value=0, required=False)
+
+
+class CohortTestFilterSerializer(serializers.Serializer):
+    """Patients with at least one matching test"""
+    name_contains = serializers.CharField(required=False)
+    test_types = serializers.ListField(child=serializers.CharField(), required=False)
+    statuses = serializers.ListField(child=serializers.CharField(), required=False)
+    within_days = serializers.IntegerField(min_value=0, required=False)
+
+
+class CohortTreatmentFilterSerializer(serializers.Serializer):
+    """Patients with at least one matching treatment"""
+    name_contains = serializers.CharField(required=False)
+    disease_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    statuses = serializers.ListField(child=serializers.CharField(), required=False)
+    within_days = serializers.IntegerField(min_value=0, required=False)
+
+
+class CohortQuerySerializer(serializers.Serializer):
+    """Declarative cohort definition"""
+    BREAKDOWN_CHOICES = ['gender', 'blood_group', 'city', 'center', 'age_band']
+
+    patient = CohortPatientFilterSerializer(required=False)
+    diseases = CohortDiseaseFilterSerializer(required=False)
+    tests = CohortTestFilterSerializer(required=False)
+    treatments = CohortTreatmentFilterSerializer(required=False)
+    breakdowns = serializers.ListField(
+        child=serializers.ChoiceField(choices=BREAKDOWN_CHOICES),
+        required=False,
+        default=['gender', 'age_band', 'city']
+    )
+
+    def validate(self, data):
+        patient = data.get('patient', {})
+        if 'age_min' in patient and 'age_max' in patient and patient['age_min'] > patient['age_max']:
+            raise serializers.ValidationError('age_min cannot be greater than age_max')
+        return data
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.patients.models import PatientDisease
+from .prevalence import invalidate_prevalence
+
+
+@receiver(post_save, sender=PatientDisease)
+@receiver(post_delete, sender=PatientDisease)
+def invalidate_prevalence_on_diagnosis_change(sender, **kwargs):
+    """Drop cached prevalence cubes when a diagnosis is added, edited or removed"""
+    invalidate_prevalence()
@@ -0,0 +1,416 @@
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from apps.hospital.models import City, Center, Doctor, Disease
+from apps.patients.models import Patient, PatientDisease, Test, Treatment, Surgery
+from hospital_system.benchmarks import (
+    BENCHMARK_ENDPOINTS, UNBENCHMARKED_ROUTES, api_get_routes, check_baseline, load_baseline, run_benchmarks,
+    seed_benchmark_data,
+)
+from . import cohorts
+from .cohorts import NUMPY_AVAILABLE, CohortSnapshot, evaluate_sql, run_cohort_query, years_ago
+from .prevalence import build_prevalence_matrix
+from .search import SearchHit, query_deadline, universal_search
+
+User = get_user_model()
+
+
+class ClinicalDataMixin:
+    """Two cities with patients of different ages, diagnoses and tests"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='doctor@example.com',
+            username='doctor',
+            password='testpass123',
+            role='DOCTOR'
+        )
+        self.basra = City.objects.create(name='BASRA', state='Basra', country='Iraq')
+        self.baghdad = City.objects.create(name='BAGHDAD', state='Baghdad', country='Iraq')
+        basra_center = Center.objects.create(
+            name='Basra Center', city=self.basra, address='Basra', phone_number='+9647700000000'
+        )
+        baghdad_center = Center.objects.create(
+            name='Baghdad Center', city=self.baghdad, address='Baghdad', phone_number='+9647700000001'
+        )
+        self.basra_doctor = Doctor.objects.create(
+            user=self.user, center=basra_center, specialization='CARDIOLOGY', license_number='LIC1'
+        )
+        other_user = User.objects.create_user(
+            email='doctor2@example.com', username='doctor2', password='testpass123', role='DOCTOR'
+        )
+        self.baghdad_doctor = Doctor.objects.create(
+            user=other_user, center=baghdad_center, specialization='CARDIOLOGY', license_number='LIC2'
+        )
+        self.diabetes = Disease.objects.create(name='Diabetes', category='CHRONIC')
+        self.flu = Disease.objects.create(name='Flu', category='INFECTIOUS')
+
+        today = timezone.localdate()
+        self.patients = {
+            'old_diabetic_tested': self._create_patient(self.basra_doctor, years_ago(today, 70), 'M'),
+            'old_diabetic_untested': self._create_patient(self.basra_doctor, years_ago(today, 65), 'F'),
+            'young_diabetic_tested': self._create_patient(self.basra_doctor, years_ago(today, 30), 'M'),
+            'old_diabetic_baghdad': self._create_patient(self.baghdad_doctor, years_ago(today, 61), 'F'),
+            'old_flu_tested': self._create_patient(self.basra_doctor, years_ago(today, 80), 'F'),
+        }
+        for key in ('old_diabetic_tested', 'old_diabetic_untested', 'young_diabetic_tested', 'old_diabetic_baghdad'):
+            self._diagnose(self.patients[key], self.diabetes)
+        self._diagnose(self.patients['old_flu_tested'], self.flu)
+
+        for key in ('old_diabetic_tested', 'young_diabetic_tested', 'old_diabetic_baghdad', 'old_flu_tested'):
+            self._test(self.patients[key], 'HbA1c', timezone.now() - timedelta(days=10))
+        self._test(self.patients['old_diabetic_untested'], 'HbA1c', timezone.now() - timedelta(days=200))
+
+    def _create_patient(self, doctor, date_of_birth, gender):
+        number = Patient.objects.count()
+        return Patient.objects.create(
+            user=self.user, doctor=doctor, patient_name=f'Patient {number}',
+            patient_id=f'077000000{number:02d}', date_of_birth=date_of_birth, gender=gender,
+            address='Iraq', emergency_contact_name='Contact', emergency_contact_phone='07700000099'
+        )
+
+    def _diagnose(self, patient, disease):
+        PatientDisease.objects.create(patient=patient, disease=disease, diagnosed_date=date(2024, 1, 1))
+
+    def _test(self, patient, name, test_date):
+        Test.objects.create(
+            patient=patient, disease=self.diabetes, test_name=name, test_type='BLOOD', test_date=test_date
+        )
+
+
+class CohortQueryTest(ClinicalDataMixin, TestCase):
+    criteria = {
+        'patient': {'age_min': 60, 'cities': ['BASRA']},
+        'diseases': {'disease_names': ['Diabetes']},
+        'tests': {'name_contains': 'hba1c', 'within_days': 90},
+        'breakdowns': ['gender', 'age_band', 'city'],
+    }
+
+    def test_sql_cohort_in_one_query(self):
+        with self.assertNumQueries(1):
+            result = evaluate_sql(self.criteria, timezone.localdate(), timezone.now())
+
+        self.assertEqual(result['count'], 1)
+        self.assertEqual(result['breakdowns']['age_band'], [{'value': '60-74', 'count': 1}])
+
+    def test_age_bands(self):
+        result = evaluate_sql({'breakdowns': ['age_band']}, timezone.localdate(), timezone.now())
+        bands = {item['value']: item['count'] for item in result['breakdowns']['age_band']}
+        self.assertEqual(bands, {'60-74': 3, '30-44': 1, '75+': 1})
+
+    @skipUnless(NUMPY_AVAILABLE, 'numpy is not installed')
+    def test_vectorized_matches_sql(self):
+        snapshot = CohortSnapshot()
+        today, now = timezone.localdate(), timezone.now()
+        for criteria in (
+            self.criteria,
+            {'patient': {'age_max': 64, 'genders': ['F']}, 'breakdowns': ['city', 'center']},
+            {'diseases': {'categories': ['INFECTIOUS']}, 'tests': {}, 'breakdowns': ['age_band', 'gender']},
+        ):
+            self.assertEqual(snapshot.evaluate(criteria, today, now), evaluate_sql(criteria, today, now))
+
+    @skipUnless(NUMPY_AVAILABLE, 'numpy is not installed')
+    @override_settings(COHORT_SNAPSHOT_MIN_QUERIES=1)
+    def test_snapshot_is_built_off_the_request(self):
+        with mock.patch.object(cohorts, '_snapshot', None), \
+                mock.patch.object(cohorts.threading, 'Thread') as thread:
+            result = run_cohort_query(self.criteria)
+
+        self.assertEqual(result['engine'], 'sql')
+        thread.return_value.start.assert_called_once_with()
+        cohorts._building.clear()
+
+    @skipUnless(NUMPY_AVAILABLE, 'numpy is not installed')
+    @override_settings(COHORT_SNAPSHOT_MAX_ROWS=10)
+    def test_no_snapshot_above_row_limit(self):
+        with mock.patch.object(cohorts, '_snapshot', None), mock.patch.object(cohorts, 'connection'):
+            cohorts._building.set()
+            cohorts._build_in_background()
+            self.assertIsNone(cohorts.get_snapshot())
+        self.assertFalse(cohorts._building.is_set())
+
+
+class CohortAPITest(ClinicalDataMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(
+            email='cohort-admin@example.com', username='cohort-admin', password='testpass123', role='ADMIN'
+        )
+
+    def test_cohort_requires_admin_or_staff(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse('dashboard-cohort'), {'patient': {'age_min': 60}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cohort_endpoint(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post(reverse('dashboard-cohort'), {
+            'patient': {'age_min': 60},
+            'diseases': {'disease_names': ['Diabetes']},
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertFalse(response.data['cached'])
+
+        response = self.client.post(reverse('dashboard-cohort'), {
+            'patient': {'age_min': 60},
+            'diseases': {'disease_names': ['Diabetes']},
+        }, format='json')
+        self.assertTrue(response.data['cached'])
+
+    def test_cohort_rejects_invalid_age_range(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post(reverse('dashboard-cohort'), {
+            'patient': {'age_min': 70, 'age_max': 60},
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DiseasePrevalenceTest(ClinicalDataMixin, TestCase):
+    start, end = date(2023, 12, 1), date(2024, 2, 29)
+
+    def test_matrix_by_city_fills_empty_periods(self):
+        data = build_prevalence_matrix(self.start, self.end, granularity='month', group_by='city')
+
+        self.assertEqual(data['periods'], ['2023-12-01', '2024-01-01', '2024-02-01'])
+        rows = {(row['disease_name'], row['city_name']): row['values'] for row in data['rows']}
+        self.assertEqual(rows, {
+            ('Diabetes', 'BASRA'): [0, 3, 0],
+            ('Diabetes', 'BAGHDAD'): [0, 1, 0],
+            ('Flu', 'BASRA'): [0, 1, 0],
+        })
+        self.assertEqual(data['max'], 3)
+
+    def test_window_is_cached_until_a_diagnosis_changes(self):
+        build_prevalence_matrix(self.start, self.end, group_by='disease')
+        # Only the small center and disease dimension lookups hit the database
+        with self.assertNumQueries(2):
+            data = build_prevalence_matrix(self.start, self.end, group_by='disease', disease_ids=[self.flu.id])
+        self.assertEqual(data['rows'][0]['total'], 1)
+
+        PatientDisease.objects.create(
+            patient=self.patients['old_diabetic_tested'], disease=self.flu, diagnosed_date=date(2024, 2, 10)
+        )
+        data = build_prevalence_matrix(self.start, self.end, group_by='disease', disease_ids=[self.flu.id])
+        self.assertEqual(data['rows'][0]['values'], [0, 1, 1])
+
+
+
+class DiseasePrevalenceAPITest(ClinicalDataMixin, APITestCase):
+    def test_prevalence_endpoint(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('dashboard-disease-prevalence'), {
+            'granularity': 'week', 'group_by': 'center', 'start_date': '2024-01-01', 'end_date': '2024-01-31'
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['periods']), 5)
+
+        response = self.client.get(reverse('dashboard-disease-prevalence'), {'granularity': 'year'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_and_unbounded_windows_are_rejected(self):
+        self.client.force_authenticate(user=self.user)
+        for params in (
+            {'end_date': 'foo'},
+            {'start_date': '1000-01-01', 'granularity': 'week'},
+            {'limit': 0},
+        ):
+            response = self.client.get(reverse('dashboard-disease-prevalence'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class MonthlyStatisticsAPITest(ClinicalDataMixin, APITestCase):
+    def test_one_query_per_entity_with_empty_months_filled(self):
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('dashboard-monthly-statistics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 12)
+        self.assertEqual(response.data[-1]['month'], timezone.localdate().strftime('%Y-%m'))
+        self.assertEqual(sum(row['new_patients'] for row in response.data), 5)
+        self.assertEqual(sum(row['new_tests'] for row in response.data), 5)
+
+    def test_buckets_use_local_time(self):
+        # 22:30 UTC on 31 January is already 1 February in Asia/Baghdad (UTC+3)
+        Test.objects.update(test_date=datetime(2024, 1, 31, 22, 30, tzinfo=dt_timezone.utc))
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('dashboard-monthly-statistics'), {
+            'start_date': '2024-01-01', 'end_date': '2024-02-29'
+        })
+
+        self.assertEqual([row['new_tests'] for row in response.data], [0, 5])
+
+    def test_weekly_granularity(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('dashboard-monthly-statistics'), {'granularity': 'week', 'periods': 4})
+
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(date.fromisoformat(response.data[0]['period']).weekday(), 0)
+        self.assertNotIn('month', response.data[0])
+
+    def test_invalid_windows_are_rejected(self):
+        self.client.force_authenticate(user=self.user)
+        for params in (
+            {'end_date': 'foo'},
+            {'end_date': 'foo', 'start_date': '2024-01-01'},
+            {'start_date': '1000-01-01', 'granularity': 'day'},
+        ):
+            response = self.client.get(reverse('dashboard-monthly-statistics'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class DoctorWorkloadAPITest(ClinicalDataMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        patient = self.patients['old_diabetic_tested']
+        for name in ('Insulin', 'Diet'):
+            Treatment.objects.create(
+                patient=patient, disease=self.diabetes, treatment_name=name,
+                description=name, start_date=date(2024, 1, 1)
+            )
+        Surgery.objects.create(
+            patient=patient, surgery_name='Amputation', description='-', surgeon_name='Dr. S',
+            scheduled_date=timezone.now() - timedelta(days=30), status='COMPLETED'
+        )
+
+    def test_counts_are_not_multiplied_by_joins(self):
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('dashboard-doctor-workload'), {'months': 6})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        basra = response.data['results'][0]
+        self.assertEqual(basra['doctor_id'], self.basra_doctor.id)
+        self.assertEqual(
+            (basra['patients_count'], basra['tests_count'], basra['treatments_count'], basra['surgeries_count']),
+            (4, 4, 2, 1)
+        )
+        self.assertEqual(basra['tests_per_patient'], 1.0)
+        self.assertEqual(basra['surgeries_per_month'], round(1 / 6, 2))
+
+    def test_ordering_is_validated(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('dashboard-doctor-workload'), {'ordering': 'user__password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filters_and_months_are_validated(self):
+        self.client.force_authenticate(user=self.user)
+        for params in ({'center_id': 'abc'}, {'city_id': 'x'}, {'months': 99999999}, {'months': 0}):
+            response = self.client.get(reverse('dashboard-doctor-workload'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+        response = self.client.get(reverse('dashboard-doctor-workload'), {'city_id': self.basra.id})
+        self.assertEqual(response.data['count'], 1)
+
+
+@override_settings(UNIVERSAL_SEARCH_WORKERS=0)
+class UniversalSearchTest(ClinicalDataMixin, APITestCase):
+    def _search(self, **params):
+        self.client.force_authenticate(user=self.user)
+        return self.client.get(reverse('dashboard-search'), params)
+
+    def _groups(self, response):
+        return {group['entity']: group['results'] for group in response.data['groups']}
+
+    def test_results_are_grouped_ranked_and_scoped(self):
+        response = self._search(q='07700000000')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        patients = self._groups(response)['patients']
+        self.assertEqual(patients[0]['id'], self.patients['old_diabetic_tested'].pk)
+        self.assertEqual(patients[0]['score'], 1.0)
+
+        response = self._search(q='Patient', entities='patients,diseases')
+        groups = self._groups(response)
+        self.assertEqual(len(groups['patients']), 4)
+        self.assertNotIn(self.patients['old_diabetic_baghdad'].pk, [hit['id'] for hit in groups['patients']])
+        self.assertNotIn('diseases', groups)
+        self.assertFalse(response.data['partial'])
+
+        self.assertEqual(self._groups(self._search(q='diab'))['diseases'][0]['title'], 'Diabetes')
+
+    def test_doctors_are_only_searched_by_doctors_and_admins(self):
+        self.assertEqual(len(self._groups(self._search(q='LIC', entities='doctors'))['doctors']), 2)
+
+        patient_user = User.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123', role='PATIENT'
+        )
+        self.client.force_authenticate(user=patient_user)
+        for params in ({'q': 'LIC', 'entities': 'doctors'}, {'q': 'LIC'}):
+            response = self.client.get(reverse('dashboard-search'), params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('doctors', self._groups(response))
+
+    def test_parameters_are_validated(self):
+        self.assertEqual(self._search(q='x').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._search(q='Patient', entities='users').status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(UNIVERSAL_SEARCH_WORKERS=2)
+    def test_slow_and_failing_entities_give_partial_results(self):
+        def fast(term, user, limit):
+            return [SearchHit('diseases', 1, 'Diabetes', '', 0.8)]
+
+        def slow(term, user, limit):
+            time.sleep(0.5)
+            return []
+
+        def failing(term, user, limit):
+            raise RuntimeError('index unavailable')
+
+        entities = {'diseases': ('Diseases', fast, Disease), 'visits': ('Visits', slow, None), 'tests': ('Tests', failing, None)}
+        with mock.patch.dict('apps.dashboard.search.SEARCH_ENTITIES', entities, clear=True):
+            result = universal_search('diab', self.user, budget_ms=100)
+
+        self.assertEqual([group['entity'] for group in result['groups']], ['diseases'])
+        self.assertEqual((result['timed_out'], result['failed'], result['partial']), (['visits'], ['tests'], True))
+        self.assertLess(result['took_ms'], 500)
+
+    def test_query_deadline_cancels_running_queries(self):
+        started = time.monotonic()
+        with self.assertRaises(OperationalError), transaction.atomic():
+            with query_deadline(started + 0.05), connection.cursor() as cursor:
+                cursor.execute(
+                    'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000000) '
+                    'SELECT COUNT(*) FROM n'
+                )
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_admin_page(self):
+        admin_user = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='testpass123', role='ADMIN'
+        )
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin_universal_search'), {'q': 'Diabetes'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, reverse('admin:hospital_disease_change', args=[self.diabetes.pk]))
+
+
+class QueryBudgetTest(TestCase):
+    """Every endpoint and report task within the query budget of benchmark_baseline.json"""
+
+    def test_every_get_route_is_benchmarked(self):
+        benchmarked = {spec.url_name for spec in BENCHMARK_ENDPOINTS} | set(UNBENCHMARKED_ROUTES)
+        self.assertEqual(api_get_routes() - benchmarked, set())
+
+    def test_endpoints_and_tasks_stay_within_query_budgets(self):
+        cache.clear()
+        baseline = load_baseline()
+        fixtures = seed_benchmark_data(baseline['scale'])
+        # Tasks of optional packages missing where the baseline was recorded have no budget
+        names = set(baseline['measurements']) | {spec.name for spec in BENCHMARK_ENDPOINTS}
+        measurements = run_benchmarks(fixtures, iterations=1, names=names)
+
+        self.assertEqual(check_baseline(measurements, baseline), [])
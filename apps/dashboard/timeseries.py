@@ -0,0 +1,114 @@
+"""
+Time buckets - date truncation matching the database Trunc functions, gap
+filling and timezone-aware bucketed counts
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+TRUNC_FUNCTIONS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def truncate_date(value, granularity):
+    """Start of the bucket containing a date, as TruncDay/TruncWeek/TruncMonth compute it"""
+    if granularity == 'week':
+        return value - timedelta(days=value.weekday())
+    if granularity == 'month':
+        return value.replace(day=1)
+    return value
+
+
+def next_bucket(value, granularity):
+    """Start of the bucket following the one starting at value"""
+    if granularity == 'week':
+        return value + timedelta(days=7)
+    if granularity == 'month':
+        return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return value + timedelta(days=1)
+
+
+def bucket_range(start, end, granularity):
+    """Start dates of every bucket overlapping [start, end], including empty ones"""
+    buckets = []
+    current = truncate_date(start, granularity)
+    while current <= end:
+        buckets.append(current)
+        current = next_bucket(current, granularity)
+    return buckets
+
+
+def shift_bucket(value, granularity, count):
+    """Start of the bucket `count` buckets away (negative counts go back in time)"""
+    if granularity == 'week':
+        return value + timedelta(weeks=count)
+    if granularity == 'month':
+        month_index = value.year * 12 + value.month - 1 + count
+        return value.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+    return value + timedelta(days=count)
+
+
+def spans_more_than(start, end, granularity, periods):
+    """True when [start, end] overlaps more than `periods` buckets, without listing them"""
+    try:
+        return shift_bucket(truncate_date(start, granularity), granularity, periods) <= end
+    except (OverflowError, ValueError):
+        # Past the last representable date, so past `end` too
+        return False
+
+
+def local_day_bounds(start, end):
+    """Aware datetimes covering the local dates [start, end] in the current timezone"""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    )
+
+
+def count_by_bucket(queryset, field, granularity, start, end):
+    """
+    Count rows per bucket of a date or datetime field between the local dates
+    start and end, in a single GROUP BY query. Datetimes are bucketed in the
+    current timezone, so a row at 23:30 UTC on the last of the month lands in
+    the next month in Asia/Baghdad.
+    """
+    trunc = TRUNC_FUNCTIONS[granularity]
+    is_datetime = queryset.model._meta.get_field(field).get_internal_type() == 'DateTimeField'
+
+    if is_datetime:
+        tz = timezone.get_current_timezone()
+        lower, upper = local_day_bounds(start, end)
+        queryset = queryset.filter(**{f'{field}__gte': lower, f'{field}__lt': upper})
+        bucket = trunc(field, tzinfo=tz)
+    else:
+        queryset = queryset.filter(**{f'{field}__range': [start, end]})
+        bucket = trunc(field)
+
+    counts = {}
+    for row in queryset.annotate(bucket=bucket).values('bucket').annotate(count=Count('pk')).order_by():
+        value = row['bucket']
+        if is_datetime:
+            value = timezone.localtime(value, tz).date()
+        counts[value] = counts.get(value, 0) + row['count']
+    return counts
+
+
+def build_time_series(series, start, end, granularity):
+    """
+    One row per bucket between start and end, empty buckets included, with a
+    count for each named (queryset, date field) series
+    """
+    counts = {
+        name: count_by_bucket(queryset, field, granularity, start, end)
+        for name, (queryset, field) in series.items()
+    }
+    return [
+        {'period': bucket, **{name: counts[name].get(bucket, 0) for name in series}}
+        for bucket in bucket_range(start, end, granularity)
+    ]
@@ -2,14 +2,45 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count, Q, Avg
+from rest_framework.pagination import PageNumberPagination
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.shortcuts import render
+from django.urls import reverse
+from django.utils.translation import gettext_lazy as _
+from django.db.models import Count, Q, Avg, Sum
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import datetime, timedelta
-from .serializers import DashboardStatsSerializer
+from .serializers import DashboardStatsSerializer, CohortQuerySerializer
+from .cohorts import run_cohort_query
+from .prevalence import PREVALENCE_GRANULARITIES, PREVALENCE_GROUPINGS, build_prevalence_matrix
+from .timeseries import TRUNC_FUNCTIONS, build_time_series, shift_bucket, spans_more_than, truncate_date
+from .workload import WORKLOAD_ORDERING, annotate_workload, get_workload_queryset, serialize_workload
+from .search import SEARCH_ENTITIES, universal_search
 from apps.hospital.models import City, Center, Doctor, Staff, Disease, Medicine
-from apps.patients.models import Patient, Test, Treatment, Surgery
+from apps.patients.models import Patient, Test, Treatment, Surgery, PatientSummary
+from apps.patients.summary import get_summary
 from apps.accounts.models import User
-from apps.hospital.permissions import IsAdminOrReadOnly
+from apps.hospital.permissions import IsAdminOrReadOnly, IsStaffOrAdmin
+
+# Upper bound on the number of buckets a statistics window may span
+MAX_STATISTICS_PERIODS = 400
+# Upper bound on the hits universal search returns per entity
+MAX_SEARCH_LIMIT = 50
+# Upper bound on the doctor workload rate window, in months
+MAX_WORKLOAD_MONTHS = 120
+
+
+def _full_name(first_name, last_name):
+    """User.get_full_name() of values() columns"""
+    return f'{first_name} {last_name}'.strip()
+
+
+class WorkloadPagination(PageNumberPagination):
+    """Page size for doctor workload, adjustable up to 100 per page"""
+    page_size_query_param = 'page_size'
+    max_page_size = 100
 
 
 class DashboardViewSet(viewsets.ViewSet):
@@ -40,8 +71,11 @@ class DashboardViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def patients_by_city(self, request):
         """Get patient count per city"""
+        # One chain of joins, so each patient is a single row and the distinct counts stay exact
         cities = City.objects.annotate(
-            patients_count=Count('centers__doctors__patients')
+            patients_count=Count('centers__doctors__patients'),
+            centers_count=Count('centers', distinct=True),
+            doctors_count=Count('centers__doctors', distinct=True)
         ).order_by('-patients_count')
         
         data = []
@@ -50,8 +84,8 @@ class DashboardViewSet(viewsets.ViewSet):
                 'city_name': city.name,
                 'state': city.state,
                 'patients_count': city.patients_count,
-                'centers_count': city.centers.count(),
-                'doctors_count': sum(center.doctors.count() for center in city.centers.all())
+                'centers_count': city.centers_count,
+                'doctors_count': city.doctors_count
             })
         
         return Response(data)
@@ -59,9 +93,11 @@ class DashboardViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def patients_by_center(self, request):
         """Get patient count per center"""
+        # Staff is prefetched rather than joined, joining it would count patients x staff rows
         centers = Center.objects.annotate(
-            patients_count=Count('doctors__patients')
-        ).order_by('-patients_count')
+            patients_count=Count('doctors__patients'),
+            doctors_count=Count('doctors', distinct=True)
+        ).select_related('city').prefetch_related('staff').order_by('-patients_count')
         
         data = []
         for center in centers:
@@ -69,8 +105,8 @@ class DashboardViewSet(viewsets.ViewSet):
                 'center_name': center.name,
                 'city_name': center.city.name,
                 'patients_count': center.patients_count,
-                'doctors_count': center.doctors.count(),
-                'staff_count': center.staff.count(),
+                'doctors_count': center.doctors_count,
+                'staff_count': len(center.staff.all()),
                 'is_active': center.is_active
             })
         
@@ -95,6 +131,43 @@ class DashboardViewSet(viewsets.ViewSet):
         
         return Response(data)
     
+    @action(detail=False, methods=['get'])
+    def disease_prevalence(self, request):
+        """Get weekly/monthly diagnosis counts per disease and city or center as a heatmap matrix"""
+        granularity = request.query_params.get('granularity', 'month')
+        group_by = request.query_params.get('group_by', 'city')
+        if granularity not in PREVALENCE_GRANULARITIES:
+            return Response({'error': f"granularity must be one of: {', '.join(PREVALENCE_GRANULARITIES)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if group_by not in PREVALENCE_GROUPINGS:
+            return Response({'error': f"group_by must be one of: {', '.join(PREVALENCE_GROUPINGS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            end_date = parse_date(request.query_params['end_date']) if 'end_date' in request.query_params else timezone.localdate()
+            if end_date is None:
+                raise ValueError
+            start_date = parse_date(request.query_params['start_date']) if 'start_date' in request.query_params else end_date - timedelta(days=365)
+            id_filters = {
+                name: [int(value) for value in request.query_params[name].split(',') if value]
+                for name in ('disease_ids', 'city_ids', 'center_ids')
+                if name in request.query_params
+            }
+            limit = int(request.query_params.get('limit', 50))
+            if limit < 1:
+                raise ValueError
+        except (ValueError, OverflowError):
+            return Response({'error': 'Invalid date, id or limit parameter'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if start_date is None or start_date > end_date:
+            return Response({'error': 'start_date and end_date must be valid dates with start_date <= end_date'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if spans_more_than(start_date, end_date, granularity, MAX_STATISTICS_PERIODS):
+            return Response({'error': f'The window spans more than {MAX_STATISTICS_PERIODS} periods'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = build_prevalence_matrix(
+            start_date, end_date, granularity=granularity, group_by=group_by, limit=limit, **id_filters
+        )
+        return Response(data)
+    
     @action(detail=False, methods=['get'])
     def upcoming_surgeries(self, request):
         """Get upcoming surgeries"""
@@ -102,18 +175,22 @@ class DashboardViewSet(viewsets.ViewSet):
         upcoming_surgeries = Surgery.objects.filter(
             status='SCHEDULED',
             scheduled_date__gte=timezone.now()
-        ).order_by('scheduled_date')[:int(limit)]
+        ).order_by('scheduled_date').values(
+            'surgery_name', 'patient__user__first_name', 'patient__user__last_name', 'patient__patient_id',
+            'surgeon_name', 'scheduled_date', 'patient__doctor__center__name',
+            'patient__doctor__center__city__name'
+        )[:int(limit)]
         
         data = []
         for surgery in upcoming_surgeries:
             data.append({
-                'surgery_name': surgery.surgery_name,
-                'patient_name': surgery.patient.user.get_full_name(),
-                'patient_id': surgery.patient.patient_id,
-                'surgeon_name': surgery.surgeon_name,
-                'scheduled_date': surgery.scheduled_date,
-                'center_name': surgery.patient.doctor.center.name,
-                'city_name': surgery.patient.doctor.center.city.name
+                'surgery_name': surgery['surgery_name'],
+                'patient_name': _full_name(surgery['patient__user__first_name'], surgery['patient__user__last_name']),
+                'patient_id': surgery['patient__patient_id'],
+                'surgeon_name': surgery['surgeon_name'],
+                'scheduled_date': surgery['scheduled_date'],
+                'center_name': surgery['patient__doctor__center__name'],
+                'city_name': surgery['patient__doctor__center__city__name']
             })
         
         return Response(data)
@@ -122,21 +199,28 @@ class DashboardViewSet(viewsets.ViewSet):
     def recent_tests(self, request):
         """Get recent tests"""
         limit = request.query_params.get('limit', 20)
-        recent_tests = Test.objects.select_related(
-            'patient__user', 'disease', 'patient__doctor__user'
-        ).order_by('-test_date')[:int(limit)]
+        # Rows rather than instances, the list is read on every dashboard load
+        test_types = dict(Test._meta.get_field('test_type').flatchoices)
+        statuses = dict(Test._meta.get_field('status').flatchoices)
+        recent_tests = Test.objects.order_by('-test_date').values(
+            'test_name', 'test_type', 'patient__user__first_name', 'patient__user__last_name',
+            'patient__patient_id', 'disease__name', 'test_date', 'status',
+            'patient__doctor__user__first_name', 'patient__doctor__user__last_name'
+        )[:int(limit)]
         
         data = []
         for test in recent_tests:
             data.append({
-                'test_name': test.test_name,
-                'test_type': test.get_test_type_display(),
-                'patient_name': test.patient.user.get_full_name(),
-                'patient_id': test.patient.patient_id,
-                'disease_name': test.disease.name,
-                'test_date': test.test_date,
-                'status': test.get_status_display(),
-                'doctor_name': test.patient.doctor.user.get_full_name()
+                'test_name': test['test_name'],
+                'test_type': test_types.get(test['test_type'], test['test_type']),
+                'patient_name': _full_name(test['patient__user__first_name'], test['patient__user__last_name']),
+                'patient_id': test['patient__patient_id'],
+                'disease_name': test['disease__name'],
+                'test_date': test['test_date'],
+                'status': statuses.get(test['status'], test['status']),
+                'doctor_name': _full_name(
+                    test['patient__doctor__user__first_name'], test['patient__doctor__user__last_name']
+                )
             })
         
         return Response(data)
@@ -147,83 +231,88 @@ class DashboardViewSet(viewsets.ViewSet):
         limit = request.query_params.get('limit', 20)
         active_treatments = Treatment.objects.filter(
             status='ACTIVE'
-        ).select_related(
-            'patient__user', 'disease', 'patient__doctor__user'
-        ).order_by('-start_date')[:int(limit)]
+        ).annotate(
+            medicines_count=Count('treatment_medicines')
+        ).order_by('-start_date').values(
+            'treatment_name', 'patient__user__first_name', 'patient__user__last_name', 'patient__patient_id',
+            'disease__name', 'start_date', 'end_date', 'patient__doctor__user__first_name',
+            'patient__doctor__user__last_name', 'medicines_count'
+        )[:int(limit)]
         
         data = []
         for treatment in active_treatments:
             data.append({
-                'treatment_name': treatment.treatment_name,
-                'patient_name': treatment.patient.user.get_full_name(),
-                'patient_id': treatment.patient.patient_id,
-                'disease_name': treatment.disease.name,
-                'start_date': treatment.start_date,
-                'end_date': treatment.end_date,
-                'doctor_name': treatment.patient.doctor.user.get_full_name(),
-                'medicines_count': treatment.treatment_medicines.count()
+                'treatment_name': treatment['treatment_name'],
+                'patient_name': _full_name(
+                    treatment['patient__user__first_name'], treatment['patient__user__last_name']
+                ),
+                'patient_id': treatment['patient__patient_id'],
+                'disease_name': treatment['disease__name'],
+                'start_date': treatment['start_date'],
+                'end_date': treatment['end_date'],
+                'doctor_name': _full_name(
+                    treatment['patient__doctor__user__first_name'], treatment['patient__doctor__user__last_name']
+                ),
+                'medicines_count': treatment['medicines_count']
             })
         
         return Response(data)
     
     @action(detail=False, methods=['get'])
     def monthly_statistics(self, request):
-        """Get monthly statistics for the last 12 months"""
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=365)
-        
-        # Get monthly data
-        months = []
-        current_date = start_date.replace(day=1)
-        
-        while current_date <= end_date:
-            next_month = current_date + timedelta(days=32)
-            next_month = next_month.replace(day=1)
-            
-            month_start = current_date
-            month_end = next_month - timedelta(days=1)
-            
-            # Count new patients in this month
-            new_patients = Patient.objects.filter(
-                created_at__range=[month_start, month_end]
-            ).count()
-            
-            # Count new tests in this month
-            new_tests = Test.objects.filter(
-                test_date__range=[month_start, month_end]
-            ).count()
-            
-            # Count new treatments in this month
-            new_treatments = Treatment.objects.filter(
-                start_date__range=[month_start, month_end]
-            ).count()
-            
-            # Count new surgeries in this month
-            new_surgeries = Surgery.objects.filter(
-                scheduled_date__range=[month_start, month_end]
-            ).count()
-            
-            months.append({
-                'month': current_date.strftime('%Y-%m'),
-                'month_name': current_date.strftime('%B %Y'),
-                'new_patients': new_patients,
-                'new_tests': new_tests,
-                'new_treatments': new_treatments,
-                'new_surgeries': new_surgeries
-            })
-            
-            current_date = next_month
+        """
+        Get new patients, tests, treatments and surgeries per period.
+        Query params: granularity (day/week/month, default month), periods (number
+        of buckets ending with the current one, default 12) or start_date/end_date.
+        """
+        granularity = request.query_params.get('granularity', 'month')
+        if granularity not in TRUNC_FUNCTIONS:
+            return Response({'error': f"granularity must be one of: {', '.join(TRUNC_FUNCTIONS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            end_date = parse_date(request.query_params['end_date']) if 'end_date' in request.query_params else timezone.localdate()
+            if end_date is None:
+                raise ValueError
+            if 'start_date' in request.query_params:
+                start_date = parse_date(request.query_params['start_date'])
+            else:
+                periods = int(request.query_params.get('periods', 12))
+                if not 1 <= periods <= MAX_STATISTICS_PERIODS:
+                    raise ValueError
+                start_date = shift_bucket(truncate_date(end_date, granularity), granularity, 1 - periods)
+        except (ValueError, OverflowError):
+            return Response({'error': f'periods must be between 1 and {MAX_STATISTICS_PERIODS}, dates must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if start_date is None or start_date > end_date:
+            return Response({'error': 'start_date and end_date must be valid dates with start_date <= end_date'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if spans_more_than(start_date, end_date, granularity, MAX_STATISTICS_PERIODS):
+            return Response({'error': f'The window spans more than {MAX_STATISTICS_PERIODS} periods'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # One GROUP BY query per entity, empty periods filled in
+        rows = build_time_series({
+            'new_patients': (Patient.objects.all(), 'created_at'),
+            'new_tests': (Test.objects.all(), 'test_date'),
+            'new_treatments': (Treatment.objects.all(), 'start_date'),
+            'new_surgeries': (Surgery.objects.all(), 'scheduled_date'),
+        }, start_date, end_date, granularity)
+        
+        data = []
+        for row in rows:
+            period = row.pop('period')
+            entry = {'period': period.isoformat()}
+            if granularity == 'month':
+                entry.update({'month': period.strftime('%Y-%m'), 'month_name': period.strftime('%B %Y')})
+            entry.update(row)
+            data.append(entry)
         
-        return Response(months)
+        return Response(data)
     
     @action(detail=False, methods=['get'])
     def doctor_statistics(self, request):
         """Get doctor statistics"""
-        doctors = Doctor.objects.select_related('user', 'center__city').annotate(
-            patients_count=Count('patients'),
-            tests_count=Count('patients__tests'),
-            treatments_count=Count('patients__treatments'),
-            surgeries_count=Count('patients__surgeries')
+        doctors = annotate_workload(
+            Doctor.objects.select_related('user', 'center__city')
         ).order_by('-patients_count')
         
         data = []
@@ -244,6 +333,44 @@ class DashboardViewSet(viewsets.ViewSet):
         
         return Response(data)
     
+    @action(detail=False, methods=['get'])
+    def doctor_workload(self, request):
+        """
+        Get paginated doctor workload with rates (tests per patient, surgeries per month).
+        Query params: months (rate window, default 12), center_id, city_id,
+        specialization, ordering (e.g. -tests_count), page, page_size.
+        """
+        ordering = request.query_params.get('ordering', '-patients_count')
+        if ordering.lstrip('-') not in WORKLOAD_ORDERING:
+            return Response({'error': f"ordering must be one of: {', '.join(WORKLOAD_ORDERING)}"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            months = int(request.query_params.get('months', 12))
+            if not 1 <= months <= MAX_WORKLOAD_MONTHS:
+                raise ValueError
+        except ValueError:
+            return Response({'error': f'months must be between 1 and {MAX_WORKLOAD_MONTHS}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            center_id, city_id = (
+                int(request.query_params[param]) if request.query_params.get(param) else None
+                for param in ('center_id', 'city_id')
+            )
+        except ValueError:
+            return Response({'error': 'center_id and city_id must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        doctors = get_workload_queryset(
+            months=months,
+            center_id=center_id,
+            city_id=city_id,
+            specialization=request.query_params.get('specialization'),
+            ordering=ordering
+        )
+        
+        paginator = WorkloadPagination()
+        page = paginator.paginate_queryset(doctors, request, view=self)
+        return paginator.get_paginated_response([serialize_workload(doctor, months) for doctor in page])
+    
     @action(detail=False, methods=['get'])
     def test_statistics(self, request):
         """Get test statistics"""
@@ -316,17 +443,15 @@ class DashboardViewSet(viewsets.ViewSet):
         elif user.is_doctor:
             # Doctor dashboard
             doctor = user.doctor_profile
+            totals = PatientSummary.objects.filter(patient__doctor=doctor).aggregate(
+                pending_tests=Sum('tests_pending'),
+                active_treatments=Sum('treatments_active')
+            )
             stats = {
                 'my_patients': doctor.patients.count(),
                 'active_patients': doctor.patients.filter(is_active=True).count(),
-                'pending_tests': Test.objects.filter(
-                    patient__doctor=doctor,
-                    status='PENDING'
-                ).count(),
-                'active_treatments': Treatment.objects.filter(
-                    patient__doctor=doctor,
-                    status='ACTIVE'
-                ).count(),
+                'pending_tests': totals['pending_tests'] or 0,
+                'active_treatments': totals['active_treatments'] or 0,
                 'upcoming_surgeries': Surgery.objects.filter(
                     patient__doctor=doctor,
                     status='SCHEDULED',
@@ -336,18 +461,81 @@ class DashboardViewSet(viewsets.ViewSet):
         elif user.is_patient:
             # Patient dashboard
             patient = user.patient_profile
+            summary = get_summary(patient)
             stats = {
-                'my_tests': patient.tests.count(),
-                'pending_tests': patient.tests.filter(status='PENDING').count(),
-                'completed_tests': patient.tests.filter(status='COMPLETED').count(),
-                'active_treatments': patient.treatments.filter(status='ACTIVE').count(),
+                'my_tests': summary.tests_total,
+                'pending_tests': summary.tests_pending,
+                'completed_tests': summary.tests_completed,
+                'active_treatments': summary.treatments_active,
                 'upcoming_surgeries': patient.surgeries.filter(
                     status='SCHEDULED',
                     scheduled_date__gte=timezone.now()
                 ).count(),
-                'diseases': patient.patient_diseases.count(),
+                'diseases': summary.diseases_total,
             }
         else:
             stats = {}
         
         return Response(stats)
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsStaffOrAdmin])
+    def cohort(self, request):
+        """Count the patients matching declarative cohort filters, with breakdowns (all patients, staff only)"""
+        serializer = CohortQuerySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(run_cohort_query(serializer.validated_data))
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def search(self, request):
+        """Search patients, visits, tests, treatments, surgeries, doctors, medicines and diseases at once"""
+        try:
+            query, entities, limit = parse_search_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(universal_search(query, request.user, entities=entities, limit=limit))
+
+
+def parse_search_params(params):
+    """(query, entities, limit) of a universal search request, ValueError when invalid"""
+    query = params.get('q', '').strip()
+    if len(query) < 2:
+        raise ValueError('q must be at least 2 characters')
+    entities = [entity for entity in params.get('entities', '').split(',') if entity] or None
+    unknown = set(entities or ()) - set(SEARCH_ENTITIES)
+    if unknown:
+        raise ValueError(f"entities must be among: {', '.join(SEARCH_ENTITIES)}")
+    try:
+        limit = min(int(params.get('limit', 10)), MAX_SEARCH_LIMIT)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return query, entities, max(limit, 1)
+
+
+@staff_member_required
+def universal_search_page(request):
+    """Admin page searching every entity, grouped by entity with links to the admin"""
+    context = {
+        **admin.site.each_context(request),
+        'title': _('البحث الشامل'),
+        'search_result': None,
+    }
+    if request.GET.get('q', '').strip():
+        try:
+            query, entities, limit = parse_search_params(request.GET)
+        except ValueError as e:
+            context['search_error'] = str(e)
+        else:
+            result = universal_search(query, request.user, entities=entities, limit=limit)
+            for group in result['groups']:
+                model = SEARCH_ENTITIES[group['entity']][2]
+                for hit in group['results']:
+                    if model is Patient:
+                        hit['url'] = reverse('admin_patient_profile', args=[hit['id']])
+                    else:
+                        hit['url'] = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_change', args=[hit['id']])
+            context['search_result'] = result
+            context['incomplete'] = [str(SEARCH_ENTITIES[entity][0]) for entity in result['timed_out'] + result['failed']]
+    return render(request, 'admin/universal_search.html', context)
@@ -0,0 +1,83 @@
+"""
+Doctor workload - per-relation correlated subquery counts, so every count scans
+its own table once instead of joining patients x tests x treatments x surgeries
+"""
+from datetime import timedelta
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.hospital.models import Doctor
+from apps.patients.models import Patient, Surgery, Test, Treatment, Visit
+
+WORKLOAD_ORDERING = [
+    'patients_count', 'tests_count', 'treatments_count', 'surgeries_count',
+    'visits_count', 'recent_surgeries_count', 'experience_years',
+]
+
+
+def count_per_doctor(queryset, doctor_field):
+    """Correlated COUNT(*) of queryset rows belonging to the outer doctor, 0 when there are none"""
+    counts = queryset.filter(**{doctor_field: OuterRef('pk')}).order_by().values(
+        doctor_field
+    ).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def annotate_workload(doctors, months=12):
+    """Annotate doctors with their patient, test, treatment, surgery and visit counts"""
+    since = timezone.now() - timedelta(days=round(months * 365.25 / 12))
+    return doctors.annotate(
+        patients_count=count_per_doctor(Patient.objects.all(), 'doctor'),
+        active_patients_count=count_per_doctor(Patient.objects.filter(is_active=True), 'doctor'),
+        tests_count=count_per_doctor(Test.objects.all(), 'patient__doctor'),
+        pending_tests_count=count_per_doctor(Test.objects.filter(status='PENDING'), 'patient__doctor'),
+        treatments_count=count_per_doctor(Treatment.objects.all(), 'patient__doctor'),
+        active_treatments_count=count_per_doctor(Treatment.objects.filter(status='ACTIVE'), 'patient__doctor'),
+        surgeries_count=count_per_doctor(Surgery.objects.all(), 'patient__doctor'),
+        recent_surgeries_count=count_per_doctor(
+            Surgery.objects.filter(scheduled_date__gte=since, scheduled_date__lte=timezone.now()), 'patient__doctor'
+        ),
+        visits_count=count_per_doctor(Visit.objects.all(), 'doctor'),
+    )
+
+
+def _rate(numerator, denominator):
+    return round(numerator / denominator, 2) if denominator else 0.0
+
+
+def serialize_workload(doctor, months=12):
+    """Workload row of an annotated doctor, including per-patient and per-month rates"""
+    return {
+        'doctor_id': doctor.id,
+        'doctor_name': doctor.user.get_full_name(),
+        'specialization': doctor.get_specialization_display(),
+        'center_name': doctor.center.name,
+        'city_name': doctor.center.city.name,
+        'is_available': doctor.is_available,
+        'patients_count': doctor.patients_count,
+        'active_patients_count': doctor.active_patients_count,
+        'tests_count': doctor.tests_count,
+        'pending_tests_count': doctor.pending_tests_count,
+        'treatments_count': doctor.treatments_count,
+        'active_treatments_count': doctor.active_treatments_count,
+        'surgeries_count': doctor.surgeries_count,
+        'visits_count': doctor.visits_count,
+        'tests_per_patient': _rate(doctor.tests_count, doctor.patients_count),
+        'treatments_per_patient': _rate(doctor.treatments_count, doctor.patients_count),
+        'visits_per_patient': _rate(doctor.visits_count, doctor.patients_count),
+        'surgeries_per_month': _rate(doctor.recent_surgeries_count, months),
+    }
+
+
+def get_workload_queryset(months=12, center_id=None, city_id=None, specialization=None, ordering='-patients_count'):
+    """Doctors with their workload annotations, filtered and ordered"""
+    doctors = Doctor.objects.select_related('user', 'center__city')
+    if center_id:
+        doctors = doctors.filter(center_id=center_id)
+    if city_id:
+        doctors = doctors.filter(center__city_id=city_id)
+    if specialization:
+        doctors = doctors.filter(specialization=specialization)
+    return annotate_workload(doctors, months=months).order_by(ordering, 'pk')
@@ -525,7 +525,7 @@ class StaffAdmin(admin.ModelAdmin):
         return form
     
     class Media:
-        js = ('admin/js/staff_form.js',)
+        js = ('admin/js/reference_data.js', 'admin/js/staff_form.js')
     
     def get_staff_name(self, obj):
         """Display staff name in Arabic format with styling"""
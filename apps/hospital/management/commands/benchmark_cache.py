@@ -0,0 +1,85 @@
+import multiprocessing
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital_system.cache import TieredCache
+
+KEY = 'reference:benchmark:{}'
+
+
+def run_worker(alias, keys, operations, write_ratio, seed):
+    """Read (and now and then write) random keys, returning the latencies in ms and the cache stats"""
+    cache = caches[alias]
+    if isinstance(cache, TieredCache):
+        cache.reset_stats()
+    rng = random.Random(seed)
+    timings = []
+    for _operation in range(operations):
+        key = KEY.format(rng.randrange(keys))
+        started = time.perf_counter()
+        if rng.random() < write_ratio:
+            cache.set(key, {'id': key, 'name': key * 4}, 300)
+        else:
+            cache.get(key)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, cache.stats() if isinstance(cache, TieredCache) else {}
+
+
+class Command(BaseCommand):
+    help = 'Compare cache read latency and throughput of cache aliases across worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--aliases', nargs='+', default=None, help='Cache aliases to compare (default: all)')
+        parser.add_argument('--workers', type=int, default=3, help='Worker processes, as gunicorn --workers')
+        parser.add_argument('--operations', type=int, default=5000, help='Operations per worker')
+        parser.add_argument('--keys', type=int, default=200, help='Distinct keys')
+        parser.add_argument('--write-ratio', type=float, default=0.01, help='Share of operations that are writes')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or list(settings.CACHES)
+        unknown = set(aliases) - set(settings.CACHES)
+        if unknown:
+            raise CommandError(f"Unknown cache aliases: {', '.join(sorted(unknown))}")
+
+        keys = [KEY.format(i) for i in range(options['keys'])]
+        context = multiprocessing.get_context('fork')
+        for alias in aliases:
+            cache = caches[alias]
+            shared = cache.l2 if isinstance(cache, TieredCache) else cache
+            if isinstance(shared, LocMemCache) and options['workers'] > 1:
+                self.stdout.write(self.style.WARNING(
+                    f'{alias}: local memory cache, workers do not share entries'
+                ))
+            cache.set_many({key: {'id': key, 'name': key * 4} for key in keys}, 300)
+
+            jobs = [
+                (alias, options['keys'], options['operations'], options['write_ratio'], seed)
+                for seed in range(options['workers'])
+            ]
+            started = time.perf_counter()
+            with context.Pool(options['workers']) as pool:
+                results = pool.starmap(run_worker, jobs)
+            elapsed = time.perf_counter() - started
+            cache.delete_many(keys)
+
+            timings = sorted(timing for worker_timings, _stats in results for timing in worker_timings)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{alias} ({cache.__class__.__name__}), {options['workers']} workers: "
+                f'{len(timings) / elapsed:,.0f} ops/s, median {statistics.median(timings):.3f} ms, '
+                f'p99 {timings[int(len(timings) * 0.99) - 1]:.3f} ms'
+            ))
+            totals = {}
+            for _timings, stats in results:
+                for counts in stats.values():
+                    for outcome in ('l1_hits', 'l2_hits', 'misses'):
+                        totals[outcome] = totals.get(outcome, 0) + counts[outcome]
+            if totals:
+                self.stdout.write(
+                    f"  L1 hits {totals['l1_hits']}, L2 hits {totals['l2_hits']}, misses {totals['misses']}"
+                )
@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from hospital_system.benchmarks import (
+    BASELINE_PATH, BENCHMARK_ENDPOINTS, BENCHMARK_TASKS, check_baseline, load_baseline, run_benchmarks,
+    seed_benchmark_data, write_baseline,
+)
+
+# A cache of its own, so the throwaway database's objects never reach the shared cache
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-endpoints',
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Time every API endpoint and report task against seeded data in a throwaway database, '
+        'and compare query counts and p95 latencies with the stored baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=None, help='Data scale (default: the baseline\'s)')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed runs per endpoint or task')
+        parser.add_argument('--tolerance', type=float, default=1.5,
+                            help='Allowed p95 latency, as a multiple of the baseline\'s')
+        parser.add_argument('--only', nargs='+', default=None, help='Endpoints and tasks to run (default: all)')
+        parser.add_argument('--update-baseline', action='store_true', help=f'Write the results to {BASELINE_PATH}')
+
+    def handle(self, *args, **options):
+        known = {spec.name for spec in BENCHMARK_ENDPOINTS} | {spec.name for spec in BENCHMARK_TASKS}
+        unknown = set(options['only'] or ()) - known
+        if unknown:
+            raise CommandError(f"Unknown endpoints or tasks: {', '.join(sorted(unknown))}")
+        if options['update_baseline'] and options['only']:
+            raise CommandError('--update-baseline records every endpoint and task, drop --only')
+
+        try:
+            baseline = load_baseline()
+        except FileNotFoundError:
+            baseline = None
+        scale = options['scale'] or (baseline['scale'] if baseline else 1)
+
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES):
+                fixtures = seed_benchmark_data(scale)
+                measurements = run_benchmarks(fixtures, options['iterations'], options['only'])
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        for measurement in measurements:
+            self.stdout.write(
+                f'{measurement.name}: {measurement.outcome}, {measurement.queries} queries, '
+                f'p50 {measurement.p50_ms:.1f} ms, p95 {measurement.p95_ms:.1f} ms, p99 {measurement.p99_ms:.1f} ms'
+            )
+        skipped = [spec.name for spec in BENCHMARK_TASKS if not spec.available]
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped for a missing optional package: {', '.join(skipped)}"
+            ))
+
+        if options['update_baseline']:
+            write_baseline(measurements, scale)
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {BASELINE_PATH} (scale {scale})'))
+            return
+        if baseline is None:
+            raise CommandError(f'There is no baseline at {BASELINE_PATH}, run with --update-baseline')
+        if scale != baseline['scale']:
+            self.stdout.write(self.style.WARNING(
+                f"The baseline was recorded at scale {baseline['scale']}, not compared"
+            ))
+            return
+
+        regressions = check_baseline(measurements, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Every endpoint and task is within its baseline'))
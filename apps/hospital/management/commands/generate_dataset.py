@@ -0,0 +1,74 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.dateparse import parse_date
+
+from hospital_system.dataset import DEFAULT_VOLUMES, generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Add a synthetic dataset of configurable volumes, e.g. --centers 500 --doctors 5000 '
+        '--patients 2000000 --tests 20000000 --visits 20000000 for production-sized data'
+    )
+
+    def add_arguments(self, parser):
+        for volume, default in DEFAULT_VOLUMES.items():
+            parser.add_argument(
+                f"--{volume.replace('_', '-')}", dest=volume, type=int, default=default,
+                help=f"{volume.replace('_', ' ').capitalize()} to add (default {default:,})"
+            )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--as-of', default=None, help='Date the data is generated around (default: today)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Worker processes (SQLite always uses one)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk_create() statement')
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk_create() on PostgreSQL as well')
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options['as_of']:
+            as_of = parse_date(options['as_of'])
+            if as_of is None:
+                raise CommandError('--as-of must be a date (YYYY-MM-DD)')
+        volumes = {volume: options[volume] for volume in DEFAULT_VOLUMES}
+        if any(count < 0 for count in volumes.values()):
+            raise CommandError('Volumes cannot be negative')
+        if connection.vendor == 'sqlite' and options['workers'] > 1:
+            self.stdout.write(self.style.WARNING('SQLite takes a single writer, generating in one process'))
+
+        started = time.perf_counter()
+        step_started = {}
+        reported = {}
+
+        def progress(step, done, total):
+            step_started.setdefault(step, time.perf_counter())
+            if not done:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{step}: {total:,} rows'))
+            if not total:
+                return
+            # A line per tenth of a step
+            tenth = done * 10 // total
+            if tenth == reported.setdefault(step, 0):
+                return
+            reported[step] = tenth
+            elapsed = time.perf_counter() - step_started[step]
+            self.stdout.write(
+                f'{step}: {done:,}/{total:,} ({done * 100 // total}%), {done / max(elapsed, 1e-6):,.0f} rows/s'
+            )
+
+        try:
+            generated = generate_dataset(
+                volumes, seed=options['seed'], as_of=as_of, workers=options['workers'],
+                batch_size=options['batch_size'], use_copy=False if options['no_copy'] else None,
+                progress=progress,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {", ".join(f"{count:,} {volume}" for volume, count in generated.items())} '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
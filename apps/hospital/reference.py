@@ -0,0 +1,126 @@
+"""
+Reference data snapshot - cities with all their centers and doctors (flagged
+with is_active and is_available), plus the active diseases and medicines, in
+one payload that clients fetch once and filter locally instead of asking the
+by-city and by-center endpoints every time a form field changes. Inactive
+centers and unavailable doctors are included because the admin forms can
+still assign them, as they could through those endpoints.
+
+The snapshot is built once per version and language and cached as its
+rendered JSON, with a strong ETag (a hash of that JSON) and its build time as
+Last-Modified. With REFERENCE_DATA_CACHED_VERSION (the default with Redis) the
+version is a cache counter the hospital signals bump whenever a city, center,
+doctor, doctor's name, disease or medicine changes. A per-process cache would
+only see the bumps of its own process, so without it the version is derived
+from the row counts and latest updated_at of the source tables, in one query.
+"""
+import hashlib
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+from django.utils.translation import get_language
+
+from .models import Center, City, Disease, Doctor, Medicine
+
+VERSION_KEY = 'reference:version'
+
+ReferenceSnapshot = namedtuple('ReferenceSnapshot', ['body', 'etag', 'last_modified'])
+
+
+def _database_version():
+    """Hash of the row count and latest updated_at of every table the snapshot reads"""
+    quote = connection.ops.quote_name
+    columns = []
+    for model in (City, Center, Doctor, get_user_model(), Disease, Medicine):
+        table = quote(model._meta.db_table)
+        columns += [f'(SELECT COUNT(*) FROM {table})', f'(SELECT MAX({quote("updated_at")}) FROM {table})']
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(columns)}")
+        row = cursor.fetchone()
+    return hashlib.sha256(repr(row).encode()).hexdigest()[:16]
+
+
+def get_reference_version():
+    """Generation of the snapshot, changing whenever reference data changes"""
+    if not getattr(settings, 'REFERENCE_DATA_CACHED_VERSION', True):
+        return _database_version()
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def invalidate_reference_data():
+    """Make the cached snapshot stale"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def build_reference_data():
+    """The snapshot payload, in one query per table"""
+    city_names = {value: str(label) for value, label in City.IRAQ_CITIES}
+    specializations = {value: str(label) for value, label in Doctor.SPECIALIZATION_CHOICES}
+
+    doctors_by_center = {}
+    doctors = Doctor.objects.order_by('user__first_name', 'user__last_name', 'pk').values_list(
+        'pk', 'center_id', 'user__first_name', 'user__last_name', 'specialization', 'is_available'
+    )
+    for pk, center_id, first_name, last_name, specialization, is_available in doctors:
+        doctors_by_center.setdefault(center_id, []).append({
+            'id': pk,
+            'name': f'{first_name} {last_name}'.strip(),
+            'specialization': specialization,
+            'specialization_display': specializations.get(specialization, specialization),
+            'is_available': is_available,
+        })
+
+    centers_by_city = {}
+    centers = Center.objects.order_by('name', 'pk').values(
+        'id', 'city_id', 'name', 'address', 'phone_number', 'is_active'
+    )
+    for center in centers:
+        center['doctors'] = doctors_by_center.get(center['id'], [])
+        centers_by_city.setdefault(center.pop('city_id'), []).append(center)
+
+    cities = [
+        {
+            'id': pk,
+            'name': name,
+            'display_name': city_names.get(name, name),
+            'state': state,
+            'centers': centers_by_city.get(pk, []),
+        }
+        for pk, name, state in City.objects.order_by('name').values_list('pk', 'name', 'state')
+    ]
+    return {
+        'cities': cities,
+        'diseases': list(Disease.objects.filter(is_active=True).order_by('name').values(
+            'id', 'name', 'category', 'icd_code'
+        )),
+        'medicines': list(Medicine.objects.filter(is_active=True).order_by('name', 'pk').values(
+            'id', 'name', 'generic_name', 'dosage_form', 'strength'
+        )),
+    }
+
+
+def get_reference_snapshot():
+    """The ReferenceSnapshot of the current version, built on first use"""
+    key = f'reference:snapshot:{get_reference_version()}:{get_language()}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        body = json.dumps(
+            build_reference_data(), cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')
+        ).encode()
+        # The ETag only changes with the content, so a version bump that changed nothing still gets a 304
+        snapshot = ReferenceSnapshot(
+            body=body,
+            etag='"{}"'.format(hashlib.sha256(body).hexdigest()[:32]),
+            last_modified=int(timezone.now().timestamp()),
+        )
+        cache.set(key, snapshot, getattr(settings, 'REFERENCE_DATA_CACHE_TIMEOUT', 86400))
+    return snapshot
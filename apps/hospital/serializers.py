@@ -1,11 +1,15 @@
 from rest_framework import serializers
 from .models import City, Center, Doctor, Staff, Medicine, Disease
 from apps.accounts.serializers import UserSerializer
+from hospital_system.fieldsets import SparseFieldsetMixin
 
 
-class CitySerializer(serializers.ModelSerializer):
+class CitySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     centers_count = serializers.SerializerMethodField()
     
+    # The counts come from the viewset's prefetched relations
+    field_sources = {'centers_count': ['centers']}
+    
     class Meta:
         model = City
         fields = '__all__'
@@ -15,11 +19,14 @@ class CitySerializer(serializers.ModelSerializer):
         return obj.centers.count()
 
 
-class CenterSerializer(serializers.ModelSerializer):
+class CenterSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     city_name = serializers.CharField(source='city.name', read_only=True)
     doctors_count = serializers.SerializerMethodField()
     staff_count = serializers.SerializerMethodField()
     
+    expandable_fields = {'city': CitySerializer}
+    field_sources = {'doctors_count': ['doctors'], 'staff_count': ['staff']}
+    
     class Meta:
         model = Center
         fields = '__all__'
@@ -32,18 +39,25 @@ class CenterSerializer(serializers.ModelSerializer):
         return obj.staff.count()
 
 
-class DoctorSerializer(serializers.ModelSerializer):
+class DoctorSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     center_name = serializers.CharField(source='center.name', read_only=True)
     city_name = serializers.CharField(source='center.city.name', read_only=True)
     patients_count = serializers.SerializerMethodField()
     
+    expandable_fields = {'center': CenterSerializer}
+    field_sources = {'patients_count': ['patients']}
+    
     class Meta:
         model = Doctor
         fields = '__all__'
         read_only_fields = ('created_at', 'updated_at')
     
     def get_patients_count(self, obj):
+        # Listings that skip the patients prefetch annotate the count instead
+        patients_count = getattr(obj, 'patients_count', None)
+        if patients_count is not None:
+            return patients_count
         return obj.patients.count()
 
 
@@ -62,11 +76,13 @@ class DoctorCreateSerializer(serializers.ModelSerializer):
         return doctor
 
 
-class StaffSerializer(serializers.ModelSerializer):
+class StaffSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     center_name = serializers.CharField(source='center.name', read_only=True)
     city_name = serializers.CharField(source='center.city.name', read_only=True)
     
+    expandable_fields = {'center': CenterSerializer}
+    
     class Meta:
         model = Staff
         fields = '__all__'
@@ -87,14 +103,14 @@ class StaffCreateSerializer(serializers.ModelSerializer):
         return staff
 
 
-class MedicineSerializer(serializers.ModelSerializer):
+class MedicineSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Medicine
         fields = '__all__'
         read_only_fields = ('created_at', 'updated_at')
 
 
-class DiseaseSerializer(serializers.ModelSerializer):
+class DiseaseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Disease
         fields = '__all__'
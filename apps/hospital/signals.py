@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from hospital_system.admin_filters import invalidate_filter_choices
+from .models import Center, City, Disease, Doctor, Medicine
+from .reference import invalidate_reference_data
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_doctor_choices(sender, **kwargs):
+    """Drop the cached admin doctor filter choices when a doctor is added, moved or removed"""
+    invalidate_filter_choices('doctors')
+
+
+@receiver(post_save, sender=User)
+def invalidate_doctor_choices_on_rename(sender, instance, update_fields=None, **kwargs):
+    """Doctor names come from their user, but logins only touch last_login"""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    if instance.role == 'DOCTOR':
+        invalidate_filter_choices('doctors')
+        invalidate_reference_data()
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+@receiver(post_save, sender=Center)
+@receiver(post_delete, sender=Center)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=Disease)
+@receiver(post_delete, sender=Disease)
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+def invalidate_reference_snapshot(sender, **kwargs):
+    """Rebuild the reference data snapshot after any change to the data it holds"""
+    invalidate_reference_data()
@@ -1,9 +1,25 @@
-from django.test import TestCase
+import io
+import uuid
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.cache import cache, caches
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
 from .models import City, Center, Doctor, Staff, Medicine, Disease
+from apps.patients.models import Patient, PatientDisease, PatientSummary, Visit, VisitSearchDocument
+from hospital_system.cache import TieredCache
+from hospital_system.dataset import generate_dataset
+from hospital_system.fastjson import FastJSONParser, FastJSONRenderer
 
 User = get_user_model()
 
@@ -188,3 +204,248 @@ class HospitalAPITest(APITestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data['name'], 'New Center')
+
+    def test_center_doctors_count_patients_without_loading_them(self):
+        center = Center.objects.create(
+            name='Test Center', city=self.city, address='123 Test Street', phone_number='+1234567890'
+        )
+        doctor = Doctor.objects.create(
+            user=User.objects.create_user(
+                email='doctor@example.com', username='doctor', password='testpass123', role='DOCTOR'
+            ),
+            center=center, specialization='CARDIOLOGY', license_number='LIC123456'
+        )
+        for phone in ('07700000001', '07700000002'):
+            Patient.objects.create(
+                user=self.user, doctor=doctor, patient_name=f'Patient {phone}', patient_id=phone,
+                date_of_birth=date(1960, 5, 1), gender='M', address='Basra',
+                emergency_contact_name='Contact', emergency_contact_phone='07700000099'
+            )
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('center-doctors', kwargs={'pk': center.pk}))
+        self.assertEqual([row['patients_count'] for row in response.data], [2])
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('center-doctors-by-center'), {'center_id': center.pk})
+        self.assertEqual([row['patients_count'] for row in response.data['doctors']], [2])
+
+
+
+@override_settings(REFERENCE_DATA_CACHED_VERSION=True)
+class ReferenceDataTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='staff@example.com', username='staff', password='testpass123', role='STAFF'
+        )
+        self.city = City.objects.create(name='BASRA', state='Basra')
+        self.center = Center.objects.create(
+            name='Basra Center', city=self.city, address='Street', phone_number='+9647700000000'
+        )
+        Center.objects.create(
+            name='Closed Center', city=self.city, address='Street', phone_number='+9647700000001', is_active=False
+        )
+        for username, available in (('available', True), ('away', False)):
+            doctor_user = User.objects.create_user(
+                email=f'{username}@example.com', username=username, password='testpass123',
+                first_name=username.title(), last_name='Doctor', role='DOCTOR'
+            )
+            Doctor.objects.create(
+                user=doctor_user, center=self.center, specialization='GENERAL',
+                license_number=username, is_available=available
+            )
+        Disease.objects.create(name='Diabetes', category='CHRONIC', icd_code='E11')
+        Medicine.objects.create(name='Metformin', dosage_form='tablet', strength='500mg', manufacturer='Acme')
+        self.url = reverse('reference_data')
+
+    def _get(self, **headers):
+        self.client.force_authenticate(user=self.user)
+        return self.client.get(self.url, **headers)
+
+    def test_snapshot(self):
+        response = self._get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        [city] = data['cities']
+        center, closed = city['centers']
+        self.assertEqual((center['name'], center['is_active']), ('Basra Center', True))
+        self.assertEqual((closed['name'], closed['is_active']), ('Closed Center', False))
+        self.assertEqual(
+            [(doctor['name'], doctor['is_available']) for doctor in center['doctors']],
+            [('Available Doctor', True), ('Away Doctor', False)]
+        )
+        self.assertEqual([disease['name'] for disease in data['diseases']], ['Diabetes'])
+        self.assertEqual([medicine['name'] for medicine in data['medicines']], ['Metformin'])
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_unchanged_snapshot_is_not_modified(self):
+        etag = self._get()['ETag']
+        with self.assertNumQueries(0):
+            response = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_changes_invalidate_the_snapshot(self):
+        etag = self._get()['ETag']
+        self.center.name = 'Basra General'
+        self.center.save()
+        response = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['cities'][0]['centers'][0]['name'], 'Basra General')
+
+    @override_settings(REFERENCE_DATA_CACHED_VERSION=False)
+    def test_version_comes_from_the_database_without_a_shared_cache(self):
+        etag = self._get()['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self._get(HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A change this process's signals never saw, as with a write in another worker
+        Center.objects.filter(pk=self.center.pk).update(name='Basra General', updated_at=timezone.now())
+        response = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['cities'][0]['centers'][0]['name'], 'Basra General')
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiered-test'},
+})
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        caches['shared'].clear()
+
+    def _worker(self, poll_interval=60):
+        """A TieredCache as one worker process would hold it, over the shared L2"""
+        return TieredCache(None, {'OPTIONS': {
+            'L2': 'shared', 'L1_PREFIXES': ['reference:'], 'L1_MAX_ENTRIES': 3,
+            'L1_POLL_INTERVAL': poll_interval,
+        }})
+
+    def test_reads_are_served_from_l1(self):
+        cache = self._worker()
+        cache.set('reference:cities', ['Basra'])
+        cache.l2.set('reference:cities', ['changed behind its back'])
+        self.assertEqual(cache.get('reference:cities'), ['Basra'])
+
+        # Values are copies, mutating one does not change L1
+        cache.get('reference:cities').append('Baghdad')
+        self.assertEqual(cache.get('reference:cities'), ['Basra'])
+        self.assertEqual(cache.stats()['reference'], {'l1_hits': 3, 'l2_hits': 0, 'misses': 0, 'hit_ratio': 1.0})
+
+    def test_other_keys_bypass_l1(self):
+        cache = self._worker()
+        cache.set('principal:1', 'alice')
+        cache.l2.set('principal:1', 'bob')
+        self.assertEqual(cache.get('principal:1'), 'bob')
+        self.assertIsNone(cache.get('principal:2'))
+        self.assertEqual(cache.stats()['principal'], {'l1_hits': 0, 'l2_hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_writes_of_other_workers_invalidate_l1_on_the_next_poll(self):
+        reader, writer = self._worker(), self._worker()
+        writer.set('reference:centers', 'v1')
+        self.assertEqual(reader.get('reference:centers'), 'v1')
+
+        writer.set('reference:centers', 'v2')
+        self.assertEqual(reader.get('reference:centers'), 'v1')
+        reader._polled_at -= 60
+        self.assertEqual(reader.get('reference:centers'), 'v2')
+
+        writer.delete('reference:centers')
+        reader._polled_at -= 60
+        self.assertIsNone(reader.get('reference:centers'))
+
+    def test_version_keys(self):
+        reader, writer = self._worker(poll_interval=0), self._worker(poll_interval=0)
+        self.assertEqual(reader.get_or_set('reference:version', 1, None), 1)
+        writer.incr('reference:version')
+        self.assertEqual(reader.get('reference:version'), 2)
+        self.assertEqual(writer.get_many(['reference:version', 'reference:missing']), {'reference:version': 2})
+
+    def test_l1_is_bounded(self):
+        cache = self._worker()
+        cache.set_many({f'reference:{i}': i for i in range(5)})
+        self.assertEqual(len(cache._l1), 3)
+        self.assertEqual(cache.get('reference:0'), 0)
+        self.assertEqual(cache.stats()['reference']['l2_hits'], 1)
+
+
+class FastJSONTest(SimpleTestCase):
+    data = {
+        'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'name': 'مستشفى البصرة\u2028',
+        'fee': Decimal('12.50'),
+        'born': date(1960, 5, 1),
+        'seen': datetime(2024, 1, 31, 22, 30, tzinfo=dt_timezone.utc),
+        'label': gettext_lazy('Active'),
+        'counts': {1: 2},
+        'tags': ('a', 'b'),
+        'ratio': 0.25,
+        'missing': None,
+    }
+
+    def test_renders_what_json_renderer_renders(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_indented_responses_fall_back(self):
+        media_type = 'application/json; indent=2'
+        self.assertEqual(
+            FastJSONRenderer().render(self.data, media_type), JSONRenderer().render(self.data, media_type)
+        )
+
+    def test_parses_what_json_parser_parses(self):
+        body = '{"name": "بغداد", "ids": [1, 2], "fee": 1.5, "active": true, "note": null}'.encode()
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body))
+        )
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"name": '))
+
+
+class GenerateDatasetTest(TestCase):
+    volumes = {
+        'cities': 3, 'centers': 4, 'doctors': 5, 'staff': 2, 'patients': 30, 'patient_diseases': 60,
+        'tests': 40, 'treatments': 20, 'surgeries': 10, 'visits': 40,
+    }
+
+    def _generate(self, **kwargs):
+        return generate_dataset(self.volumes, seed=7, as_of=date(2026, 1, 1), **kwargs)
+
+    def test_volumes_and_consistency(self):
+        self.assertEqual(self._generate(), self.volumes)
+
+        self.assertEqual(City.objects.count(), 3)
+        self.assertEqual((Center.objects.count(), Doctor.objects.count(), Staff.objects.count()), (4, 5, 2))
+        self.assertEqual(Patient.objects.count(), 30)
+        self.assertEqual(PatientDisease.objects.count(), 60)
+        self.assertEqual(Visit.objects.exclude(doctor_id=F('patient__doctor_id')).count(), 0)
+        phone_ids = list(Patient.objects.values_list('patient_id', flat=True))
+        self.assertEqual(len(set(phone_ids)), 30)
+        for phone in phone_ids:
+            self.assertRegex(phone, r'^07[5789]\d{8}$')
+        # Built although bulk inserts skip the signals
+        self.assertEqual(PatientSummary.objects.count(), 30)
+        self.assertEqual(VisitSearchDocument.objects.count(), 40)
+        self.assertEqual(
+            sum(PatientSummary.objects.values_list('tests_total', flat=True)), 40
+        )
+
+    def test_same_seed_gives_same_data(self):
+        self._generate()
+        first = list(Patient.objects.order_by('pk').values_list('patient_name', 'date_of_birth', 'address'))
+        self._generate(batch_size=7)
+        second = list(Patient.objects.order_by('pk').values_list('patient_name', 'date_of_birth', 'address'))
+        self.assertEqual(second[:30], second[30:])
+        self.assertEqual(first, second[:30])
+        # Phone ids follow the new primary keys, so they stay unique
+        self.assertEqual(Patient.objects.values('patient_id').distinct().count(), 60)
+
+    def test_rejects_impossible_volumes(self):
+        with self.assertRaises(ValueError):
+            generate_dataset({**self.volumes, 'doctors': 0})
+        with self.assertRaises(ValueError):
+            generate_dataset({**self.volumes, 'patient_diseases': 10 ** 6})
@@ -13,4 +13,5 @@ router.register(r'diseases', views.DiseaseViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('centers-by-city/', views.centers_by_city, name='centers_by_city'),
+    path('reference-data/', views.ReferenceDataView.as_view(), name='reference_data'),
 ]
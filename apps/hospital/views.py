@@ -2,18 +2,26 @@ from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Count, Q
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from apps.accounts.authentication import CachedJWTAuthentication
+from hospital_system.conditional import ConditionalGetMixin
+from hospital_system.fieldsets import FieldsetProjectionMixin
 from .models import City, Center, Doctor, Staff, Medicine, Disease
 from .serializers import (
     CitySerializer, CenterSerializer, DoctorSerializer, DoctorCreateSerializer,
     StaffSerializer, StaffCreateSerializer, MedicineSerializer, DiseaseSerializer
 )
 from .permissions import IsAdminOrReadOnly, IsDoctorOrAdmin, IsStaffOrAdmin
+from .reference import get_reference_snapshot
 
 
-class CityViewSet(viewsets.ModelViewSet):
+class CityViewSet(ConditionalGetMixin, FieldsetProjectionMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing cities
     """
@@ -25,6 +33,7 @@ class CityViewSet(viewsets.ModelViewSet):
     filterset_fields = ['state', 'country']
     ordering_fields = ['name', 'created_at']
     ordering = ['name']
+    etag_models = ('hospital.Center',)
     
     @action(detail=True, methods=['get'])
     def centers(self, request, pk=None):
@@ -41,7 +50,7 @@ class CityViewSet(viewsets.ModelViewSet):
             centers_count=Count('centers'),
             doctors_count=Count('centers__doctors'),
             staff_count=Count('centers__staff')
-        ).order_by('-centers_count')
+        ).order_by('-centers_count').prefetch_related('centers')
         
         serializer = CitySerializer(cities, many=True)
         return Response(serializer.data)
@@ -57,7 +66,7 @@ class CityViewSet(viewsets.ModelViewSet):
         return Response({'centers': []})
 
 
-class CenterViewSet(viewsets.ModelViewSet):
+class CenterViewSet(ConditionalGetMixin, FieldsetProjectionMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing centers
     """
@@ -69,12 +78,15 @@ class CenterViewSet(viewsets.ModelViewSet):
     filterset_fields = ['city', 'is_active']
     ordering_fields = ['name', 'created_at']
     ordering = ['name']
+    etag_models = ('hospital.City', 'hospital.Doctor', 'hospital.Staff')
     
     @action(detail=True, methods=['get'])
     def doctors(self, request, pk=None):
         """Get all doctors in a center"""
         center = self.get_object()
-        doctors = center.doctors.filter(is_available=True)
+        doctors = center.doctors.filter(is_available=True).select_related(
+            'user', 'center__city'
+        ).annotate(patients_count=Count('patients'))
         serializer = DoctorSerializer(doctors, many=True)
         return Response(serializer.data)
     
@@ -93,7 +105,7 @@ class CenterViewSet(viewsets.ModelViewSet):
         stats = {
             'doctors_count': center.doctors.count(),
             'staff_count': center.staff.count(),
-            'patients_count': sum(doctor.patients.count() for doctor in center.doctors.all()),
+            'patients_count': center.doctors.aggregate(count=Count('patients'))['count'],
             'active_doctors': center.doctors.filter(is_available=True).count(),
         }
         return Response(stats)
@@ -103,13 +115,15 @@ class CenterViewSet(viewsets.ModelViewSet):
         """Get doctors filtered by center"""
         center_id = request.query_params.get('center_id')
         if center_id:
-            doctors = Doctor.objects.filter(center_id=center_id, is_available=True).select_related('user')
+            doctors = Doctor.objects.filter(center_id=center_id, is_available=True).select_related(
+                'user', 'center__city'
+            ).annotate(patients_count=Count('patients'))
             serializer = DoctorSerializer(doctors, many=True)
             return Response({'doctors': serializer.data})
         return Response({'doctors': []})
 
 
-class DoctorViewSet(viewsets.ModelViewSet):
+class DoctorViewSet(ConditionalGetMixin, FieldsetProjectionMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing doctors
     """
@@ -121,6 +135,7 @@ class DoctorViewSet(viewsets.ModelViewSet):
     filterset_fields = ['center', 'specialization', 'is_available']
     ordering_fields = ['user__first_name', 'experience_years', 'created_at']
     ordering = ['user__first_name']
+    etag_models = ('accounts.User', 'hospital.Center', 'hospital.City', 'patients.Patient')
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -130,9 +145,14 @@ class DoctorViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def patients(self, request, pk=None):
         """Get all patients of a doctor"""
+        # apps.patients.serializers imports this app's serializers
+        from apps.patients.serializers import PatientSerializer
+
         doctor = self.get_object()
-        patients = doctor.patients.filter(is_active=True)
-        serializer = DoctorSerializer(patients, many=True)
+        patients = doctor.patients.filter(is_active=True).select_related(
+            'user', 'doctor__user', 'doctor__center__city', 'summary'
+        )
+        serializer = PatientSerializer(patients, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
@@ -176,7 +196,7 @@ class DoctorViewSet(viewsets.ModelViewSet):
         return Response({'error': 'doctor_id parameter required'}, status=400)
 
 
-class StaffViewSet(viewsets.ModelViewSet):
+class StaffViewSet(ConditionalGetMixin, FieldsetProjectionMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing staff
     """
@@ -188,6 +208,7 @@ class StaffViewSet(viewsets.ModelViewSet):
     filterset_fields = ['center', 'department', 'is_active']
     ordering_fields = ['user__first_name', 'created_at']
     ordering = ['user__first_name']
+    etag_models = ('accounts.User', 'hospital.Center', 'hospital.City')
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -222,7 +243,7 @@ class StaffViewSet(viewsets.ModelViewSet):
         return Response(stats)
 
 
-class MedicineViewSet(viewsets.ModelViewSet):
+class MedicineViewSet(ConditionalGetMixin, FieldsetProjectionMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing medicines
     """
@@ -262,7 +283,7 @@ class MedicineViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class DiseaseViewSet(viewsets.ModelViewSet):
+class DiseaseViewSet(ConditionalGetMixin, FieldsetProjectionMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing diseases
     """
@@ -316,6 +337,30 @@ class DiseaseViewSet(viewsets.ModelViewSet):
         return Response(stats)
 
 
+class ReferenceDataView(APIView):
+    """
+    Cities with their centers and doctors (flagged is_active / is_available),
+    plus active diseases and medicines, for clients to fetch once and filter locally. Requests sending
+    the snapshot's ETag in If-None-Match get a 304 while it has not changed.
+    """
+    # Session authentication lets the admin forms use it as well
+    authentication_classes = [CachedJWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        snapshot = get_reference_snapshot()
+        response = get_conditional_response(
+            request, etag=snapshot.etag, last_modified=snapshot.last_modified
+        )
+        if response is None:
+            response = HttpResponse(snapshot.body, content_type='application/json')
+        response['ETag'] = snapshot.etag
+        response['Last-Modified'] = http_date(snapshot.last_modified)
+        # Clients may keep it, but have to revalidate before using it again
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
@@ -1,10 +1,94 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
 from django.utils.translation import gettext_lazy as _
-from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 from django.db.models import Q
 from django import forms
+from .managers import get_access_scope
 from .models import Patient, PatientDisease, Test, Treatment, TreatmentMedicine, Surgery, Visit
+from .search import search_rank, search_visit_ids
+from .summary import refresh_summaries
 from apps.hospital.models import Doctor, City, Center, Disease
+from hospital_system.admin_filters import CachedChoicesFilter, get_cached_choices, use_autocomplete
+from hospital_system.admin_pagination import EstimatedCountAdminMixin
+from hospital_system.conditional import update_versioned
+from hospital_system.admin_rendering import (
+    BadgeSet, CellTemplate, RenderContextAdminMixin, ReversedURL, age_on, render_date
+)
+
+
+def update_with_summaries(queryset, relation, **values):
+    """update_versioned() for a bulk action, then refresh the relation in its patients' summaries"""
+    # Read the patients first, the update can take the rows out of a filtered changelist queryset
+    patient_ids = list(queryset.values_list('patient_id', flat=True))
+    updated = update_versioned(queryset, **values)
+    refresh_summaries(patient_ids, [relation])
+    return updated
+
+
+# List cells, compiled once instead of formatted per changelist row
+UNSET_CELL = mark_safe('<span style="color: #9ca3af;">غير محدد</span>')
+PATIENT_PROFILE_URL = ReversedURL('admin_patient_profile')
+PATIENT_NAME_LINK_CELL = CellTemplate(
+    '<div style="display: flex; align-items: center; gap: 8px;">'
+    '<i class="fas fa-user" style="color: #667eea; font-size: 14px;"></i>'
+    '<span style="color: #1f2937; font-weight: 600; font-size: 14px;">{}</span>'
+    '<a href="{}" style="margin-left: 8px; color: #10b981; text-decoration: none;" title="عرض الملف الشخصي">'
+    '<i class="fas fa-user-circle" style="font-size: 16px;"></i>'
+    '</a>'
+    '</div>'
+)
+PATIENT_NAME_CELL = CellTemplate('<span style="color: #1f2937; font-weight: 600;">{}</span>')
+DOCTOR_INFO_CELL = CellTemplate(
+    '<div style="display: flex; flex-direction: column; gap: 2px;">'
+    '<span style="color: #1f2937; font-weight: 600; font-size: 13px;">{}</span>'
+    '<span style="color: #6b7280; font-size: 11px;">{}</span>'
+    '</div>'
+)
+AGE_CELL = CellTemplate(
+    '<div style="display: flex; align-items: center; gap: 6px;">'
+    '<i class="fas fa-birthday-cake" style="color: #f59e0b; font-size: 12px;"></i>'
+    '<span style="color: #374151; font-weight: 500;">{} سنة</span>'
+    '</div>'
+)
+PATIENT_STATUS_BADGES = BadgeSet(
+    CellTemplate(
+        '<span style="display: inline-flex; align-items: center; gap: 4px; padding: 4px 8px; background: {}; '
+        'color: {}; border-radius: 6px; font-size: 12px; font-weight: 600;">'
+        '<i class="fas {}"></i>{}</span>'
+    ),
+    {
+        True: ('#d1fae5', '#065f46', 'fa-check-circle', 'نشط'),
+        False: ('#fee2e2', '#991b1b', 'fa-times-circle', 'غير نشط'),
+    },
+)
+STATUS_BADGE_CELL = CellTemplate(
+    '<span style="background-color: {}; color: white; padding: 4px 8px; border-radius: 12px; font-size: 12px; font-weight: 600;">{}</span>'
+)
+VISIT_STATUS_BADGES = BadgeSet(STATUS_BADGE_CELL, {
+    'SCHEDULED': ('#3b82f6', 'مجدولة'),
+    'IN_PROGRESS': ('#f59e0b', 'قيد التنفيذ'),
+    'COMPLETED': ('#10b981', 'مكتملة'),
+    'CANCELLED': ('#ef4444', 'ملغية'),
+    'NO_SHOW': ('#6b7280', 'لم يحضر'),
+})
+DISEASE_STATUS_BADGES = BadgeSet(STATUS_BADGE_CELL, {
+    'ACTIVE': ('#ef4444', 'نشط'),
+    'TREATED': ('#f59e0b', 'معالج'),
+    'CHRONIC': ('#8b5cf6', 'مزمن'),
+    'CURED': ('#10b981', 'مشفي'),
+})
+TEST_STATUS_BADGES = BadgeSet(STATUS_BADGE_CELL, {
+    'PENDING': ('#f59e0b', 'معلق'),
+    'COMPLETED': ('#10b981', 'مكتمل'),
+    'CANCELLED': ('#ef4444', 'ملغي'),
+})
+
+
+def patient_display_name(patient):
+    if patient.patient_name and patient.patient_name.strip():
+        return patient.patient_name
+    return f"{patient.user.first_name} {patient.user.last_name}"
 
 
 class PatientForm(forms.ModelForm):
@@ -431,14 +515,57 @@ class PatientListFilter(admin.SimpleListFilter):
             return queryset.filter(created_at__lt=timezone.now() - timedelta(days=365))
 
 
-class DoctorListFilter(admin.SimpleListFilter):
+def doctor_filter_scope(user):
+    """Cache scope of the doctors a user can filter by"""
+    if user.role == 'DOCTOR':
+        return f'doctor:{user.pk}'
+    if user.role == 'STAFF':
+        center_id = user.staff_profile.center_id if hasattr(user, 'staff_profile') else None
+        return f'center:{center_id}'
+    return 'all'
+
+
+def doctor_choices(user):
+    """(id, full name) of the doctors a user can filter by, in one joined query"""
+    doctors = Doctor.objects.all()
+    if user.role == 'DOCTOR':
+        doctors = doctors.filter(user=user)
+    elif user.role == 'STAFF':
+        if not hasattr(user, 'staff_profile'):
+            return []
+        doctors = doctors.filter(center_id=user.staff_profile.center_id)
+    rows = doctors.order_by('user__first_name', 'user__last_name', 'pk').values_list(
+        'pk', 'user__first_name', 'user__last_name'
+    )
+    return [(pk, f'{first_name} {last_name}'.strip()) for pk, first_name, last_name in rows]
+
+
+def doctor_sidebar_context(request):
+    """Doctors of the changelist filter sidebar, or a search box once there are too many"""
+    choices = get_cached_choices('doctors', doctor_filter_scope(request.user), lambda: doctor_choices(request.user))
+    if use_autocomplete(choices):
+        return {'doctors': [], 'doctors_autocomplete': True}
+    return {'doctors': choices, 'doctors_autocomplete': False}
+
+
+class RoleScopedAdminMixin:
+    """ModelAdmin mixin limiting changelists and change views to rows the user may see"""
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).for_user(request.user)
+
+
+class DoctorListFilter(CachedChoicesFilter):
     title = _('الطبيب')
     parameter_name = 'doctor'
+    choices_namespace = 'doctors'
+    autocomplete_field = 'doctor'
 
-    def lookups(self, request, model_admin):
-        from apps.hospital.models import Doctor
-        doctors = Doctor.objects.all()
-        return [(doctor.id, doctor.user.get_full_name()) for doctor in doctors if doctor.user]
+    def get_scope(self, request):
+        return doctor_filter_scope(request.user)
+
+    def load_choices(self, request):
+        return doctor_choices(request.user)
 
     def queryset(self, request, queryset):
         if self.value():
@@ -446,7 +573,7 @@ class DoctorListFilter(admin.SimpleListFilter):
 
 
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
+class PatientAdmin(RoleScopedAdminMixin, RenderContextAdminMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     form = PatientForm
     list_display = ('get_patient_name', 'patient_id', 'get_doctor_info', 'get_age', 'gender', 'blood_group', 'get_status_badge', 'created_at')
     list_display_links = ('get_patient_name', 'patient_id')  # Make these clickable for editing
@@ -468,13 +595,13 @@ class PatientAdmin(admin.ModelAdmin):
     
     def mark_as_active(self, request, queryset):
         """Mark selected patients as active"""
-        updated = queryset.update(is_active=True)
+        updated = update_versioned(queryset, is_active=True)
         self.message_user(request, f'{updated} patients marked as active.')
     mark_as_active.short_description = "Mark selected patients as active"
     
     def mark_as_inactive(self, request, queryset):
         """Mark selected patients as inactive"""
-        updated = queryset.update(is_active=False)
+        updated = update_versioned(queryset, is_active=False)
         self.message_user(request, f'{updated} patients marked as inactive.')
     mark_as_inactive.short_description = "Mark selected patients as inactive"
     
@@ -491,6 +618,11 @@ class PatientAdmin(admin.ModelAdmin):
         }),
     )
     
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context.update(doctor_sidebar_context(request))
+        return super().changelist_view(request, extra_context=extra_context)
+    
     # Enhanced search with better performance
     def get_search_results(self, request, queryset, search_term):
         if search_term:
@@ -513,24 +645,7 @@ class PatientAdmin(admin.ModelAdmin):
     
     def get_patient_name(self, obj):
         """Display patient name with enhanced styling and profile link"""
-        from django.urls import reverse
-        # Use patient_name if available, otherwise fall back to user name
-        if obj.patient_name and obj.patient_name.strip():
-            name = obj.patient_name
-        else:
-            name = f"{obj.user.first_name} {obj.user.last_name}"
-        
-        profile_url = reverse('admin_patient_profile', args=[obj.id])
-        return format_html(
-            '<div style="display: flex; align-items: center; gap: 8px;">'
-            '<i class="fas fa-user" style="color: #667eea; font-size: 14px;"></i>'
-            '<span style="color: #1f2937; font-weight: 600; font-size: 14px;">{}</span>'
-            '<a href="{}" style="margin-left: 8px; color: #10b981; text-decoration: none;" title="عرض الملف الشخصي">'
-            '<i class="fas fa-user-circle" style="font-size: 16px;"></i>'
-            '</a>'
-            '</div>',
-            name, profile_url
-        )
+        return PATIENT_NAME_LINK_CELL.render(patient_display_name(obj), PATIENT_PROFILE_URL(obj.id))
     get_patient_name.short_description = _('اسم المريض')
     get_patient_name.admin_order_field = 'user__first_name'
     
@@ -538,50 +653,21 @@ class PatientAdmin(admin.ModelAdmin):
         """Display doctor information with specialization"""
         if obj.doctor:
             doctor_name = f"د. {obj.doctor.user.first_name} {obj.doctor.user.last_name}"
-            specialization = obj.doctor.specialization or "غير محدد"
-            return format_html(
-                '<div style="display: flex; flex-direction: column; gap: 2px;">'
-                '<span style="color: #1f2937; font-weight: 600; font-size: 13px;">{}</span>'
-                '<span style="color: #6b7280; font-size: 11px;">{}</span>'
-                '</div>',
-                doctor_name, specialization
-            )
-        return format_html('<span style="color: #9ca3af;">غير محدد</span>')
+            return DOCTOR_INFO_CELL.render(doctor_name, obj.doctor.specialization or "غير محدد")
+        return UNSET_CELL
     get_doctor_info.short_description = _('الطبيب')
     get_doctor_info.admin_order_field = 'doctor__user__first_name'
     
     def get_age(self, obj):
-        """Calculate and display patient age"""
+        """Display patient age, as of the date the changelist was rendered"""
         if obj.date_of_birth:
-            from datetime import date
-            today = date.today()
-            age = today.year - obj.date_of_birth.year - ((today.month, today.day) < (obj.date_of_birth.month, obj.date_of_birth.day))
-            return format_html(
-                '<div style="display: flex; align-items: center; gap: 6px;">'
-                '<i class="fas fa-birthday-cake" style="color: #f59e0b; font-size: 12px;"></i>'
-                '<span style="color: #374151; font-weight: 500;">{} سنة</span>'
-                '</div>',
-                age
-            )
-        return format_html('<span style="color: #9ca3af;">غير محدد</span>')
+            return AGE_CELL.render(age_on(obj.date_of_birth, render_date()))
+        return UNSET_CELL
     get_age.short_description = _('العمر')
     
     def get_status_badge(self, obj):
         """Display status with a modern badge"""
-        if obj.is_active:
-            return format_html(
-                '<span style="display: inline-flex; align-items: center; gap: 4px; padding: 4px 8px; background: #d1fae5; color: #065f46; border-radius: 6px; font-size: 12px; font-weight: 600;">'
-                '<i class="fas fa-check-circle"></i>'
-                'نشط'
-                '</span>'
-            )
-        else:
-            return format_html(
-                '<span style="display: inline-flex; align-items: center; gap: 4px; padding: 4px 8px; background: #fee2e2; color: #991b1b; border-radius: 6px; font-size: 12px; font-weight: 600;">'
-                '<i class="fas fa-times-circle"></i>'
-                'غير نشط'
-                '</span>'
-            )
+        return PATIENT_STATUS_BADGES.render(obj.is_active)
     get_status_badge.short_description = _('الحالة')
     get_status_badge.admin_order_field = 'is_active'
     
@@ -760,7 +846,7 @@ class VisitForm(forms.ModelForm):
 
 
 @admin.register(Visit)
-class VisitAdmin(admin.ModelAdmin):
+class VisitAdmin(RoleScopedAdminMixin, RenderContextAdminMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     form = VisitForm
     list_display = ('get_patient_name', 'doctor', 'visit_type', 'visit_date', 'get_status_badge', 'chief_complaint_short', 'created_at')
     list_display_links = ('get_patient_name', 'visit_date')  # Make these clickable for editing
@@ -784,39 +870,32 @@ class VisitAdmin(admin.ModelAdmin):
     
     def mark_as_scheduled(self, request, queryset):
         """Mark selected visits as scheduled"""
-        updated = queryset.update(status='SCHEDULED')
+        updated = update_with_summaries(queryset, 'visits', status='SCHEDULED')
         self.message_user(request, f'{updated} visits marked as scheduled.')
     mark_as_scheduled.short_description = "Mark selected visits as scheduled"
     
     def mark_as_in_progress(self, request, queryset):
         """Mark selected visits as in progress"""
-        updated = queryset.update(status='IN_PROGRESS')
+        updated = update_with_summaries(queryset, 'visits', status='IN_PROGRESS')
         self.message_user(request, f'{updated} visits marked as in progress.')
     mark_as_in_progress.short_description = "Mark selected visits as in progress"
     
     def mark_as_completed(self, request, queryset):
         """Mark selected visits as completed"""
-        updated = queryset.update(status='COMPLETED')
+        updated = update_with_summaries(queryset, 'visits', status='COMPLETED')
         self.message_user(request, f'{updated} visits marked as completed.')
     mark_as_completed.short_description = "Mark selected visits as completed"
     
     def mark_as_cancelled(self, request, queryset):
         """Mark selected visits as cancelled"""
-        updated = queryset.update(status='CANCELLED')
+        updated = update_with_summaries(queryset, 'visits', status='CANCELLED')
         self.message_user(request, f'{updated} visits marked as cancelled.')
     mark_as_cancelled.short_description = "Mark selected visits as cancelled"
     
     
     def get_patient_name(self, obj):
         """Display patient name with styling"""
-        if hasattr(obj.patient, 'patient_name') and obj.patient.patient_name:
-            name = obj.patient.patient_name
-        else:
-            name = f"{obj.patient.user.first_name} {obj.patient.user.last_name}"
-        return format_html(
-            '<span style="color: #1f2937; font-weight: 600;">{}</span>',
-            name
-        )
+        return PATIENT_NAME_CELL.render(patient_display_name(obj.patient))
     get_patient_name.short_description = _('اسم المريض')
     
     def chief_complaint_short(self, obj):
@@ -828,59 +907,26 @@ class VisitAdmin(admin.ModelAdmin):
     
     def get_status_badge(self, obj):
         """Display status with colored badge"""
-        status_colors = {
-            'SCHEDULED': '#3b82f6',    # Blue
-            'IN_PROGRESS': '#f59e0b',  # Orange
-            'COMPLETED': '#10b981',    # Green
-            'CANCELLED': '#ef4444',    # Red
-            'NO_SHOW': '#6b7280',      # Gray
-        }
-        
-        status_labels = {
-            'SCHEDULED': 'مجدولة',
-            'IN_PROGRESS': 'قيد التنفيذ',
-            'COMPLETED': 'مكتملة',
-            'CANCELLED': 'ملغية',
-            'NO_SHOW': 'لم يحضر',
-        }
-        
-        color = status_colors.get(obj.status, '#6b7280')
-        label = status_labels.get(obj.status, obj.status)
-        
-        return format_html(
-            '<span style="background-color: {}; color: white; padding: 4px 8px; border-radius: 12px; font-size: 12px; font-weight: 600;">{}</span>',
-            color, label
-        )
+        return VISIT_STATUS_BADGES.render(obj.status)
     get_status_badge.short_description = _('الحالة')
     get_status_badge.admin_order_field = 'status'
     
     # Enhanced search with better performance
     def get_search_results(self, request, queryset, search_term):
+        """Matches from the visit search index, without joins or DISTINCT"""
         if search_term:
-            # Use select_related for better performance
-            queryset = queryset.select_related('patient', 'patient__user', 'doctor', 'doctor__user')
-            
-            # Search in multiple fields
-            from django.db.models import Q
-            search_query = Q()
-            
-            # Search in patient name and ID
-            search_query |= Q(patient__patient_name__icontains=search_term)
-            search_query |= Q(patient__patient_id__icontains=search_term)
-            
-            # Search in doctor name
-            search_query |= Q(doctor__user__first_name__icontains=search_term)
-            search_query |= Q(doctor__user__last_name__icontains=search_term)
-            
-            # Search in chief complaint and diagnosis
-            search_query |= Q(chief_complaint__icontains=search_term)
-            search_query |= Q(diagnosis__icontains=search_term)
-            search_query |= Q(treatment_plan__icontains=search_term)
-            
-            queryset = queryset.filter(search_query).distinct()
-        
+            ids = search_visit_ids(search_term, visits=queryset)
+            request.visit_search_rank = search_rank(ids) if ids else None
+            queryset = queryset.filter(pk__in=ids)
         return queryset, False
     
+    def get_ordering(self, request):
+        # Searches list the best matches first unless a column is sorted
+        rank = getattr(request, 'visit_search_rank', None)
+        if rank is not None and ORDER_VAR not in request.GET:
+            return (rank,)
+        return super().get_ordering(request)
+    
     def get_form(self, request, obj=None, **kwargs):
         """Return custom form with request context"""
         form_class = self.form
@@ -967,57 +1013,34 @@ class VisitAdmin(admin.ModelAdmin):
         """Control who can change patients"""
         if request.user.role == 'ADMIN':
             return True
-        elif request.user.role == 'DOCTOR':
-            return obj and obj.doctor.user == request.user
-        elif request.user.role == 'STAFF':
-            return obj and hasattr(request.user, 'staff_profile') and obj.doctor.center == request.user.staff_profile.center
+        elif request.user.role in ('DOCTOR', 'STAFF'):
+            # The doctor's own visits, or those of every doctor of the staff member's center
+            return obj is not None and obj.doctor_id in get_access_scope(request.user).ids
         return False
     
     def has_delete_permission(self, request, obj=None):
         """Control who can delete patients"""
         if request.user.role == 'ADMIN':
             return True
-        elif request.user.role == 'DOCTOR':
-            return obj and obj.doctor.user == request.user
-        elif request.user.role == 'STAFF':
-            return obj and hasattr(request.user, 'staff_profile') and obj.doctor.center == request.user.staff_profile.center
+        elif request.user.role in ('DOCTOR', 'STAFF'):
+            # The doctor's own visits, or those of every doctor of the staff member's center
+            return obj is not None and obj.doctor_id in get_access_scope(request.user).ids
         return False
     
     def changelist_view(self, request, extra_context=None):
         extra_context = extra_context or {}
         extra_context['title'] = _('إدارة المرضى - البحث والفلترة المتقدمة')
         
-        # Add doctors list for filter sidebar based on role
-        if request.user.role == 'ADMIN':
-            extra_context['doctors'] = Doctor.objects.select_related('user', 'center').all()[:20]
-        elif request.user.role == 'DOCTOR':
-            extra_context['doctors'] = Doctor.objects.filter(user=request.user)
-        elif request.user.role == 'STAFF' and hasattr(request.user, 'staff_profile'):
-            extra_context['doctors'] = Doctor.objects.filter(center=request.user.staff_profile.center)
-        
-        # Add search statistics
-        if request.GET.get('q'):
-            search_term = request.GET.get('q')
-            total_results = self.get_queryset(request).count()
-            extra_context['search_info'] = f'تم العثور على {total_results} نتيجة للبحث عن "{search_term}"'
+        # Doctors for the filter sidebar, shared with DoctorListFilter's cached choices
+        extra_context.update(doctor_sidebar_context(request))
         
+        # Search statistics (search_info) come from the changelist's own count
         return super().changelist_view(request, extra_context=extra_context)
     
     def get_queryset(self, request):
-        """Filter patients based on user role and optimize with select_related"""
+        """Visits the user may see, with their patient and doctor"""
         qs = super().get_queryset(request)
-        
-        if request.user.role == 'DOCTOR':
-            # Doctors can only see their own patients
-            qs = qs.filter(doctor__user=request.user)
-        elif request.user.role == 'STAFF':
-            # Staff can see patients from their center
-            if hasattr(request.user, 'staff_profile') and request.user.staff_profile.center:
-                qs = qs.filter(doctor__center=request.user.staff_profile.center)
-            else:
-                qs = qs.none()
-        
-        return qs.select_related('user', 'doctor', 'doctor__user')
+        return qs.select_related('patient', 'patient__user', 'doctor', 'doctor__user')
     
     class Meta:
         verbose_name = _('المريض')
@@ -1081,7 +1104,7 @@ class PatientDiseaseForm(forms.ModelForm):
 
 
 @admin.register(PatientDisease)
-class PatientDiseaseAdmin(admin.ModelAdmin):
+class PatientDiseaseAdmin(RoleScopedAdminMixin, RenderContextAdminMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     form = PatientDiseaseForm
     list_display = ('get_patient_name', 'disease', 'diagnosed_date', 'get_status_badge', 'created_at')
     list_display_links = ('get_patient_name', 'disease')  # Make these clickable for editing
@@ -1101,19 +1124,19 @@ class PatientDiseaseAdmin(admin.ModelAdmin):
     
     def mark_as_active(self, request, queryset):
         """Mark selected diseases as active"""
-        updated = queryset.update(status='ACTIVE')
+        updated = update_with_summaries(queryset, 'diseases', status='ACTIVE')
         self.message_user(request, f'{updated} diseases marked as active.')
     mark_as_active.short_description = "Mark selected diseases as active"
     
     def mark_as_treated(self, request, queryset):
         """Mark selected diseases as treated"""
-        updated = queryset.update(status='TREATED')
+        updated = update_with_summaries(queryset, 'diseases', status='TREATED')
         self.message_user(request, f'{updated} diseases marked as treated.')
     mark_as_treated.short_description = "Mark selected diseases as treated"
     
     def mark_as_cured(self, request, queryset):
         """Mark selected diseases as cured"""
-        updated = queryset.update(status='CURED')
+        updated = update_with_summaries(queryset, 'diseases', status='CURED')
         self.message_user(request, f'{updated} diseases marked as cured.')
     mark_as_cured.short_description = "Mark selected diseases as cured"
     
@@ -1153,39 +1176,12 @@ class PatientDiseaseAdmin(admin.ModelAdmin):
     
     def get_patient_name(self, obj):
         """Display patient name with styling"""
-        if hasattr(obj.patient, 'patient_name') and obj.patient.patient_name:
-            name = obj.patient.patient_name
-        else:
-            name = f"{obj.patient.user.first_name} {obj.patient.user.last_name}"
-        return format_html(
-            '<span style="color: #1f2937; font-weight: 600;">{}</span>',
-            name
-        )
+        return PATIENT_NAME_CELL.render(patient_display_name(obj.patient))
     get_patient_name.short_description = _('اسم المريض')
     
     def get_status_badge(self, obj):
         """Display status with colored badge"""
-        status_colors = {
-            'ACTIVE': '#ef4444',    # Red
-            'TREATED': '#f59e0b',   # Orange
-            'CHRONIC': '#8b5cf6',   # Purple
-            'CURED': '#10b981',     # Green
-        }
-        
-        status_labels = {
-            'ACTIVE': 'نشط',
-            'TREATED': 'معالج',
-            'CHRONIC': 'مزمن',
-            'CURED': 'مشفي',
-        }
-        
-        color = status_colors.get(obj.status, '#6b7280')
-        label = status_labels.get(obj.status, obj.status)
-        
-        return format_html(
-            '<span style="background-color: {}; color: white; padding: 4px 8px; border-radius: 12px; font-size: 12px; font-weight: 600;">{}</span>',
-            color, label
-        )
+        return DISEASE_STATUS_BADGES.render(obj.status)
     get_status_badge.short_description = _('الحالة')
     get_status_badge.admin_order_field = 'status'
     
@@ -1307,7 +1303,7 @@ class TestForm(forms.ModelForm):
 
 
 @admin.register(Test)
-class TestAdmin(admin.ModelAdmin):
+class TestAdmin(RoleScopedAdminMixin, RenderContextAdminMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     form = TestForm
     list_display = ('get_patient_name', 'disease', 'test_name', 'test_type', 'test_date', 'get_status_badge', 'created_at')
     list_display_links = ('get_patient_name', 'test_name')  # Make these clickable for editing
@@ -1327,19 +1323,19 @@ class TestAdmin(admin.ModelAdmin):
     
     def mark_as_pending(self, request, queryset):
         """Mark selected tests as pending"""
-        updated = queryset.update(status='PENDING')
+        updated = update_with_summaries(queryset, 'tests', status='PENDING')
         self.message_user(request, f'{updated} tests marked as pending.')
     mark_as_pending.short_description = "Mark selected tests as pending"
     
     def mark_as_completed(self, request, queryset):
         """Mark selected tests as completed"""
-        updated = queryset.update(status='COMPLETED')
+        updated = update_with_summaries(queryset, 'tests', status='COMPLETED')
         self.message_user(request, f'{updated} tests marked as completed.')
     mark_as_completed.short_description = "Mark selected tests as completed"
     
     def mark_as_cancelled(self, request, queryset):
         """Mark selected tests as cancelled"""
-        updated = queryset.update(status='CANCELLED')
+        updated = update_with_summaries(queryset, 'tests', status='CANCELLED')
         self.message_user(request, f'{updated} tests marked as cancelled.')
     mark_as_cancelled.short_description = "Mark selected tests as cancelled"
     
@@ -1378,37 +1374,12 @@ class TestAdmin(admin.ModelAdmin):
     
     def get_patient_name(self, obj):
         """Display patient name with styling"""
-        if hasattr(obj.patient, 'patient_name') and obj.patient.patient_name:
-            name = obj.patient.patient_name
-        else:
-            name = f"{obj.patient.user.first_name} {obj.patient.user.last_name}"
-        return format_html(
-            '<span style="color: #1f2937; font-weight: 600;">{}</span>',
-            name
-        )
+        return PATIENT_NAME_CELL.render(patient_display_name(obj.patient))
     get_patient_name.short_description = _('اسم المريض')
     
     def get_status_badge(self, obj):
         """Display status with colored badge"""
-        status_colors = {
-            'PENDING': '#f59e0b',    # Orange
-            'COMPLETED': '#10b981',  # Green
-            'CANCELLED': '#ef4444',  # Red
-        }
-        
-        status_labels = {
-            'PENDING': 'معلق',
-            'COMPLETED': 'مكتمل',
-            'CANCELLED': 'ملغي',
-        }
-        
-        color = status_colors.get(obj.status, '#6b7280')
-        label = status_labels.get(obj.status, obj.status)
-        
-        return format_html(
-            '<span style="background-color: {}; color: white; padding: 4px 8px; border-radius: 12px; font-size: 12px; font-weight: 600;">{}</span>',
-            color, label
-        )
+        return TEST_STATUS_BADGES.render(obj.status)
     get_status_badge.short_description = _('الحالة')
     get_status_badge.admin_order_field = 'status'
     
@@ -1450,7 +1421,7 @@ class TestAdmin(admin.ModelAdmin):
 
 
 @admin.register(Treatment)
-class TreatmentAdmin(admin.ModelAdmin):
+class TreatmentAdmin(RoleScopedAdminMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     """Admin configuration for Treatment model"""
     list_display = ['patient', 'disease', 'treatment_name', 'status', 'start_date', 'end_date', 'created_at']
     list_filter = ['status', 'start_date', 'end_date', 'created_at', 'disease']
@@ -1469,17 +1440,10 @@ class TreatmentAdmin(admin.ModelAdmin):
             'fields': ('description', 'notes')
         }),
     )
-    
-    def get_queryset(self, request):
-        """Filter treatments based on user permissions"""
-        qs = super().get_queryset(request)
-        if request.user.role == 'DOCTOR':
-            return qs.filter(patient__doctor__user=request.user)
-        return qs
 
 
 @admin.register(TreatmentMedicine)
-class TreatmentMedicineAdmin(admin.ModelAdmin):
+class TreatmentMedicineAdmin(RoleScopedAdminMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     """Admin configuration for TreatmentMedicine model"""
     list_display = ['treatment', 'medicine', 'dosage', 'frequency', 'duration_days']
     list_filter = ['medicine', 'frequency', 'duration_days']
@@ -1497,7 +1461,7 @@ class TreatmentMedicineAdmin(admin.ModelAdmin):
 
 
 @admin.register(Surgery)
-class SurgeryAdmin(admin.ModelAdmin):
+class SurgeryAdmin(RoleScopedAdminMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     """Admin configuration for Surgery model"""
     list_display = ['patient', 'surgery_name', 'status', 'scheduled_date', 'surgeon_name', 'created_at']
     list_filter = ['status', 'scheduled_date', 'created_at', 'complications']
@@ -1516,10 +1480,3 @@ class SurgeryAdmin(admin.ModelAdmin):
             'fields': ('description', 'complications', 'complications_description', 'notes')
         }),
     )
-    
-    def get_queryset(self, request):
-        """Filter surgeries based on user permissions"""
-        qs = super().get_queryset(request)
-        if request.user.role == 'DOCTOR':
-            return qs.filter(patient__doctor__user=request.user)
-        return qs
@@ -0,0 +1,73 @@
+import statistics
+import time
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.patients.models import Patient, PatientDisease, Test, Visit
+
+MODELS = {
+    'patient': Patient,
+    'visit': Visit,
+    'patientdisease': PatientDisease,
+    'test': Test,
+}
+
+
+class Command(BaseCommand):
+    help = 'Time rendering of a patients admin changelist page with a given number of rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(MODELS), default='patient', help='Changelist to render')
+        parser.add_argument('--rows', type=int, default=100, help='Rows per page')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed renders')
+
+    def handle(self, *args, **options):
+        model = MODELS[options['model']]
+        model_admin = admin.site._registry[model]
+        rows = min(options['rows'], model.objects.count())
+        if not rows:
+            raise CommandError(f'There are no {model._meta.verbose_name_plural} to render')
+
+        url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+        list_per_page = model_admin.list_per_page
+        model_admin.list_per_page = rows
+        timings = []
+        try:
+            # A throwaway superuser, rolled back with everything else
+            with transaction.atomic():
+                user = get_user_model().objects.create_superuser(
+                    email='admin-benchmark@example.invalid', username='admin-benchmark',
+                    password=None, role='ADMIN'
+                )
+                self._render(model_admin, url, user)  # warm-up: template loading, URL resolver
+                for _iteration in range(options['iterations']):
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        self._render(model_admin, url, user)
+                        timings.append((time.perf_counter() - started) * 1000)
+                transaction.set_rollback(True)
+        finally:
+            model_admin.list_per_page = list_per_page
+
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural} changelist, {rows} rows, {len(timings)} renders: '
+            f'median {statistics.median(timings):.1f} ms, min {min(timings):.1f} ms, '
+            f'max {max(timings):.1f} ms, {len(queries)} queries per render'
+        )
+
+    def _render(self, model_admin, url, user):
+        request = RequestFactory().get(url)
+        request.user = user
+        request.session = SessionBase()
+        request._messages = FallbackStorage(request)
+        response = model_admin.changelist_view(request)
+        response.render()
+        return response
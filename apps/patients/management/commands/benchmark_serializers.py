@@ -0,0 +1,75 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from apps.patients.views import PatientDiseaseViewSet, SurgeryViewSet, TestViewSet, TreatmentViewSet
+from hospital_system.fastjson import ORJSON_AVAILABLE, FastJSONRenderer
+from hospital_system.fastpath import build_plan
+
+VIEWSETS = {
+    'tests': TestViewSet,
+    'treatments': TreatmentViewSet,
+    'surgeries': SurgeryViewSet,
+    'patientdiseases': PatientDiseaseViewSet,
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare serializing and rendering a list page through ModelSerializer and the values() fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entity', choices=sorted(VIEWSETS), default='tests', help='List to serialize')
+        parser.add_argument('--rows', type=int, default=1000, help='Rows per page')
+        parser.add_argument('--iterations', type=int, default=10, help='Timed pages per path')
+
+    def handle(self, *args, **options):
+        viewset = VIEWSETS[options['entity']]
+        queryset = viewset.queryset.order_by(*viewset.ordering, 'pk')
+        rows = min(options['rows'], queryset.count())
+        if not rows:
+            raise CommandError(f"There are no {options['entity']} to serialize")
+        serializer_class = viewset.serializer_class
+        plan = build_plan(serializer_class())
+        if plan is None:
+            raise CommandError(f'{serializer_class.__name__} has no values() plan')
+
+        # A fresh queryset each time, an evaluated one would hand out its cached rows
+        def model_serializer():
+            return serializer_class(queryset[:rows], many=True).data
+
+        def values_plan():
+            return plan.render(plan.values(queryset)[:rows])
+
+        paths = {
+            'ModelSerializer + json': (model_serializer, JSONRenderer()),
+            'values() plan + json': (values_plan, JSONRenderer()),
+        }
+        if ORJSON_AVAILABLE:
+            paths['ModelSerializer + orjson'] = (model_serializer, FastJSONRenderer())
+            paths['values() plan + orjson'] = (values_plan, FastJSONRenderer())
+        else:
+            self.stdout.write(self.style.WARNING('orjson is not installed, only the json module is compared'))
+
+        bodies = {}
+        baseline = None
+        for name, (serialize, renderer) in paths.items():
+            bodies[name] = renderer.render(serialize())  # warm-up, and the body compared below
+            timings = []
+            for _iteration in range(options['iterations']):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    renderer.render(serialize())
+                    timings.append((time.perf_counter() - started) * 1000)
+            median = statistics.median(timings)
+            baseline = baseline or median
+            self.stdout.write(
+                f'{name}: {rows} rows, median {median:.1f} ms ({rows / median * 1000:,.0f} rows/s, '
+                f'{baseline / median:.1f}x), {len(queries)} queries per page'
+            )
+
+        if len(set(bodies.values())) > 1:
+            self.stdout.write(self.style.WARNING('The paths rendered different bodies'))
@@ -0,0 +1,76 @@
+import re
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.patients.managers import SCOPE_ALL, get_access_scope
+from apps.patients.models import Patient, PatientDisease, Surgery, Test, Treatment, TreatmentMedicine, Visit
+
+MODELS = [Patient, PatientDisease, Test, Treatment, TreatmentMedicine, Surgery, Visit]
+ROLES = ['ADMIN', 'DOCTOR', 'STAFF', 'PATIENT']
+
+# SQLite ("SEARCH ... USING INDEX") and PostgreSQL ("Index Scan", "Bitmap Index Scan") plans
+INDEX_USE = re.compile(r'USING (COVERING )?INDEX|USING INTEGER PRIMARY KEY|Index (Only )?Scan', re.IGNORECASE)
+
+
+def sample_user(role):
+    """A user of the role whose scope is not empty, preferring ones with the most rows"""
+    users = get_user_model().objects.filter(role=role)
+    if role == 'DOCTOR':
+        users = users.filter(doctor_profile__isnull=False)
+    elif role == 'STAFF':
+        users = users.filter(staff_profile__isnull=False)
+    elif role == 'PATIENT':
+        users = users.filter(created_patients__isnull=False).distinct()
+    return users.order_by('pk').first()
+
+
+class Command(BaseCommand):
+    help = 'Show the query plan and timing of each role scope on every clinical model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=10, help='Timed runs per query')
+        parser.add_argument('--plans', action='store_true', help='Print the full query plans')
+
+    def handle(self, *args, **options):
+        for role in ROLES:
+            user = sample_user(role)
+            if user is None:
+                self.stdout.write(self.style.WARNING(f'{role}: no user with a non-empty scope, skipped'))
+                continue
+
+            with CaptureQueriesContext(connection) as queries:
+                scope = get_access_scope(user)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{role} ({user.username}): scope {scope.kind}, {len(scope.ids)} ids, '
+                f'resolved in {len(queries)} queries'
+            ))
+            if scope.kind != SCOPE_ALL and not scope.ids:
+                continue
+
+            for model in MODELS:
+                queryset = model.objects.for_user(user).order_by().values_list('pk', flat=True)
+                plan = queryset.explain()
+                timings = []
+                for _iteration in range(options['iterations']):
+                    started = time.perf_counter()
+                    rows = len(list(queryset.all()))
+                    timings.append((time.perf_counter() - started) * 1000)
+
+                if scope.kind == SCOPE_ALL:
+                    access = 'unscoped'
+                elif INDEX_USE.search(plan):
+                    access = 'index'
+                else:
+                    access = self.style.WARNING('full scan')
+                self.stdout.write(
+                    f'  {model._meta.db_table:<22} {rows:>8} rows  {access:<10} '
+                    f'median {statistics.median(timings):.2f} ms'
+                )
+                if options['plans']:
+                    for line in plan.splitlines():
+                        self.stdout.write(f'      {line}')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from apps.patients.summary import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute the PatientSummary row of every patient'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Patients recomputed per batch')
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_summaries(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} patient summaries'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from apps.patients.models import Visit
+from apps.patients.search import build_visit_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search document of every visit'
+
+    def handle(self, *args, **options):
+        built = build_visit_documents(Visit.objects.all())
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {built} visit search documents'))
@@ -0,0 +1,115 @@
+"""
+Role-scoped querysets for clinical models.
+
+What a user may see is resolved once into an AccessScope: everything (admins),
+the patients of a set of doctors (a doctor's own, or every doctor of a staff
+member's center), a set of patients (the records a patient user owns), or
+nothing. The scope is cached on the user object, so every queryset built while
+serving one request shares it, and each model turns it into a filter on the
+foreign key ids it already stores instead of joining through users and centers.
+"""
+from collections import namedtuple
+
+from django.apps import apps
+from django.db import models
+
+from apps.hospital.models import Doctor, Staff
+
+SCOPE_ALL = 'all'
+SCOPE_DOCTORS = 'doctors'
+SCOPE_PATIENTS = 'patients'
+SCOPE_NONE = 'none'
+
+AccessScope = namedtuple('AccessScope', ['kind', 'ids'])
+
+_SCOPE_ATTR = '_access_scope'
+
+
+def resolve_access_scope(user):
+    """AccessScope of a user, in at most one query"""
+    if not getattr(user, 'is_authenticated', False):
+        return AccessScope(SCOPE_NONE, ())
+    if user.is_superuser or user.role == 'ADMIN':
+        return AccessScope(SCOPE_ALL, ())
+
+    if user.role == 'DOCTOR':
+        ids = Doctor.objects.filter(user_id=user.pk).values_list('pk', flat=True)
+        return AccessScope(SCOPE_DOCTORS, tuple(ids))
+    if user.role == 'STAFF':
+        center = Staff.objects.filter(user_id=user.pk).values('center_id')[:1]
+        ids = Doctor.objects.filter(center_id=models.Subquery(center)).values_list('pk', flat=True)
+        return AccessScope(SCOPE_DOCTORS, tuple(ids))
+    if user.role == 'PATIENT':
+        Patient = apps.get_model('patients', 'Patient')
+        ids = Patient.objects.filter(user_id=user.pk).values_list('pk', flat=True)
+        return AccessScope(SCOPE_PATIENTS, tuple(ids))
+    return AccessScope(SCOPE_NONE, ())
+
+
+def get_access_scope(user):
+    """The user's AccessScope, resolved on first use and kept on the user object"""
+    scope = getattr(user, _SCOPE_ATTR, None)
+    if scope is None:
+        scope = remember_access_scope(user, resolve_access_scope(user))
+    return scope
+
+
+def remember_access_scope(user, scope):
+    """Keep an already known scope on the user object"""
+    try:
+        setattr(user, _SCOPE_ATTR, scope)
+    except AttributeError:
+        pass
+    return scope
+
+
+def clear_access_scope(user):
+    """Forget a scope cached on a user object, e.g. after changing its role"""
+    user.__dict__.pop(_SCOPE_ATTR, None)
+
+
+class ScopedQuerySet(models.QuerySet):
+    """
+    QuerySet with for_user(). Subclasses name the lookups reaching the owning
+    doctor's id and the patient's id from their model.
+    """
+    doctor_lookup = 'patient__doctor_id'
+    patient_lookup = 'patient_id'
+
+    def for_user(self, user):
+        """Rows the user may see"""
+        scope = get_access_scope(user)
+        if scope.kind == SCOPE_ALL:
+            return self.all()
+        if scope.kind == SCOPE_NONE or not scope.ids:
+            return self.none()
+
+        lookup = self.doctor_lookup if scope.kind == SCOPE_DOCTORS else self.patient_lookup
+        if len(scope.ids) == 1:
+            return self.filter(**{lookup: scope.ids[0]})
+        return self.filter(**{f'{lookup}__in': scope.ids})
+
+
+class PatientQuerySet(ScopedQuerySet):
+    doctor_lookup = 'doctor_id'
+    patient_lookup = 'pk'
+
+
+class VisitQuerySet(ScopedQuerySet):
+    # Visits are scoped by the doctor who holds them
+    doctor_lookup = 'doctor_id'
+
+
+class TreatmentMedicineQuerySet(ScopedQuerySet):
+    doctor_lookup = 'treatment__patient__doctor_id'
+    patient_lookup = 'treatment__patient_id'
+
+
+class DeletionLogQuerySet(ScopedQuerySet):
+    doctor_lookup = 'doctor_id'
+
+    def for_user(self, user):
+        # A deleted patient is no longer among its user's patient ids, so theirs go by the user
+        if get_access_scope(user).kind == SCOPE_PATIENTS:
+            return self.filter(patient_user_id=user.pk)
+        return super().for_user(user)
@@ -0,0 +1,111 @@
+# Generated by Django 4.2.16 on 2026-10-19 06:47
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q
+import django.db.models.deletion
+import django.utils.timezone
+
+
+BATCH_SIZE = 1000
+
+# The same columns as summary.SUMMARY_RELATIONS: relation -> (model, statuses counted)
+RELATIONS = {
+    'diseases': ('PatientDisease', ['ACTIVE', 'TREATED', 'CHRONIC', 'CURED']),
+    'tests': ('Test', ['PENDING', 'IN_PROGRESS', 'COMPLETED', 'CANCELLED']),
+    'treatments': ('Treatment', ['ACTIVE', 'COMPLETED', 'CANCELLED']),
+    'surgeries': ('Surgery', ['SCHEDULED', 'IN_PROGRESS', 'COMPLETED', 'CANCELLED', 'POSTPONED']),
+    'visits': ('Visit', ['SCHEDULED', 'IN_PROGRESS', 'COMPLETED', 'CANCELLED', 'NO_SHOW']),
+}
+
+
+def build_summaries(apps, schema_editor):
+    """Summarize existing patients, batch by batch, as summary.rebuild_summaries() does"""
+    Patient = apps.get_model('patients', 'Patient')
+    PatientSummary = apps.get_model('patients', 'PatientSummary')
+    Surgery = apps.get_model('patients', 'Surgery')
+    Visit = apps.get_model('patients', 'Visit')
+    now = django.utils.timezone.now()
+    last_pk = 0
+    while True:
+        batch = list(Patient.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not batch:
+            return
+        values = {pk: {} for pk in batch}
+        for relation, (model_name, statuses) in RELATIONS.items():
+            rows = apps.get_model('patients', model_name).objects.filter(patient_id__in=batch).values(
+                'patient_id', 'status'
+            ).annotate(count=Count('pk')).order_by()
+            for row in rows:
+                patient_values = values[row['patient_id']]
+                total = f'{relation}_total'
+                patient_values[total] = patient_values.get(total, 0) + row['count']
+                if row['status'] in statuses:
+                    patient_values[f"{relation}_{row['status'].lower()}"] = row['count']
+
+        last_visits = Visit.objects.filter(patient_id__in=batch).values('patient_id').annotate(
+            value=Max('visit_date', filter=Q(status='COMPLETED'))
+        ).order_by()
+        for row in last_visits:
+            values[row['patient_id']]['last_visit_date'] = row['value']
+        next_surgeries = Surgery.objects.filter(patient_id__in=batch).values('patient_id').annotate(
+            value=Min('scheduled_date', filter=Q(status='SCHEDULED', scheduled_date__gte=now))
+        ).order_by()
+        for row in next_surgeries:
+            values[row['patient_id']]['next_surgery_date'] = row['value']
+
+        PatientSummary.objects.bulk_create(
+            [PatientSummary(patient_id=pk, updated_at=now, **patient_values) for pk, patient_values in values.items()],
+            ignore_conflicts=True,
+        )
+        last_pk = batch[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_visit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSummary',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='patients.patient')),
+                ('diseases_total', models.PositiveIntegerField(default=0)),
+                ('diseases_active', models.PositiveIntegerField(default=0)),
+                ('diseases_treated', models.PositiveIntegerField(default=0)),
+                ('diseases_chronic', models.PositiveIntegerField(default=0)),
+                ('diseases_cured', models.PositiveIntegerField(default=0)),
+                ('tests_total', models.PositiveIntegerField(default=0)),
+                ('tests_pending', models.PositiveIntegerField(default=0)),
+                ('tests_in_progress', models.PositiveIntegerField(default=0)),
+                ('tests_completed', models.PositiveIntegerField(default=0)),
+                ('tests_cancelled', models.PositiveIntegerField(default=0)),
+                ('treatments_total', models.PositiveIntegerField(default=0)),
+                ('treatments_active', models.PositiveIntegerField(default=0)),
+                ('treatments_completed', models.PositiveIntegerField(default=0)),
+                ('treatments_cancelled', models.PositiveIntegerField(default=0)),
+                ('surgeries_total', models.PositiveIntegerField(default=0)),
+                ('surgeries_scheduled', models.PositiveIntegerField(default=0)),
+                ('surgeries_in_progress', models.PositiveIntegerField(default=0)),
+                ('surgeries_completed', models.PositiveIntegerField(default=0)),
+                ('surgeries_cancelled', models.PositiveIntegerField(default=0)),
+                ('surgeries_postponed', models.PositiveIntegerField(default=0)),
+                ('visits_total', models.PositiveIntegerField(default=0)),
+                ('visits_scheduled', models.PositiveIntegerField(default=0)),
+                ('visits_in_progress', models.PositiveIntegerField(default=0)),
+                ('visits_completed', models.PositiveIntegerField(default=0)),
+                ('visits_cancelled', models.PositiveIntegerField(default=0)),
+                ('visits_no_show', models.PositiveIntegerField(default=0)),
+                ('last_visit_date', models.DateTimeField(blank=True, null=True)),
+                ('next_surgery_date', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'ملخص المريض',
+                'verbose_name_plural': 'ملخصات المرضى',
+                'db_table': 'patient_summaries',
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
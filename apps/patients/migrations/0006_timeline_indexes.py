@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-19 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_patient_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientdisease',
+            index=models.Index(fields=['patient', 'diagnosed_date'], name='patient_dis_patient_646061_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='surgery',
+            index=models.Index(fields=['patient', 'scheduled_date'], name='surgeries_patient_97f765_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['patient', 'test_date'], name='tests_patient_65f2e7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treatment',
+            index=models.Index(fields=['patient', 'start_date'], name='treatments_patient_618e92_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['patient', 'visit_date'], name='patients_vi_patient_39a7e3_idx'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 4.2.16 on 2026-10-19 07:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# SQLite: an external-content FTS5 table over the documents, kept in sync by triggers
+SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE visit_search_fts USING fts5("
+    "document, content='visit_search_documents', content_rowid='visit_id', tokenize='trigram')",
+    "CREATE TRIGGER visit_search_fts_insert AFTER INSERT ON visit_search_documents BEGIN "
+    "INSERT INTO visit_search_fts(rowid, document) VALUES (new.visit_id, new.document); END",
+    "CREATE TRIGGER visit_search_fts_delete AFTER DELETE ON visit_search_documents BEGIN "
+    "INSERT INTO visit_search_fts(visit_search_fts, rowid, document) VALUES ('delete', old.visit_id, old.document); END",
+    "CREATE TRIGGER visit_search_fts_update AFTER UPDATE ON visit_search_documents BEGIN "
+    "INSERT INTO visit_search_fts(visit_search_fts, rowid, document) VALUES ('delete', old.visit_id, old.document); "
+    "INSERT INTO visit_search_fts(rowid, document) VALUES (new.visit_id, new.document); END",
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS visit_search_fts_insert',
+    'DROP TRIGGER IF EXISTS visit_search_fts_delete',
+    'DROP TRIGGER IF EXISTS visit_search_fts_update',
+    'DROP TABLE IF EXISTS visit_search_fts',
+]
+
+# PostgreSQL: a trigram GIN index, serving ILIKE '%term%' and word_similarity() ranking
+POSTGRESQL_INDEX = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX visit_search_documents_trgm ON visit_search_documents USING gin (document gin_trgm_ops)',
+]
+POSTGRESQL_DROP = ['DROP INDEX IF EXISTS visit_search_documents_trgm']
+
+
+def create_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_INDEX, 'postgresql': POSTGRESQL_INDEX}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def build_documents(apps, schema_editor):
+    """Index existing visits, with the same text as search.visit_document()"""
+    Visit = apps.get_model('patients', 'Visit')
+    VisitSearchDocument = apps.get_model('patients', 'VisitSearchDocument')
+    documents = []
+    for visit in Visit.objects.select_related('patient', 'doctor__user').order_by('pk').iterator(chunk_size=500):
+        parts = [
+            visit.patient.patient_name, visit.patient.patient_id,
+            visit.doctor.user.first_name, visit.doctor.user.last_name,
+            visit.chief_complaint, visit.diagnosis, visit.treatment_plan, visit.notes,
+        ]
+        documents.append(VisitSearchDocument(visit_id=visit.pk, document='\n'.join(part for part in parts if part)))
+        if len(documents) == 500:
+            VisitSearchDocument.objects.bulk_create(documents)
+            documents = []
+    VisitSearchDocument.objects.bulk_create(documents)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitSearchDocument',
+            fields=[
+                ('visit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='patients.visit')),
+                ('document', models.TextField()),
+            ],
+            options={
+                'verbose_name': 'فهرس بحث الزيارة',
+                'verbose_name_plural': 'فهرس بحث الزيارات',
+                'db_table': 'visit_search_documents',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(build_documents, migrations.RunPython.noop),
+    ]
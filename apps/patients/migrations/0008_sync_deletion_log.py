@@ -0,0 +1,63 @@
+# Generated by Django 4.2.16 on 2026-10-19 07:28
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_visit_search_documents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(choices=[('patients', 'مريض'), ('visits', 'زيارة'), ('tests', 'فحص'), ('treatments', 'علاج'), ('surgeries', 'عملية')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('patient_id', models.BigIntegerField()),
+                ('doctor_id', models.BigIntegerField(blank=True, null=True)),
+                ('patient_user_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'سجل الحذف',
+                'verbose_name_plural': 'سجل الحذف',
+                'db_table': 'deletion_log',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['updated_at', 'id'], name='patients_updated_47c2e0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='surgery',
+            index=models.Index(fields=['updated_at', 'id'], name='surgeries_updated_69014a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['updated_at', 'id'], name='tests_updated_13487a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treatment',
+            index=models.Index(fields=['updated_at', 'id'], name='treatments_updated_d46c24_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['updated_at', 'id'], name='patients_vi_updated_ee5535_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletionlog',
+            index=models.Index(fields=['deleted_at', 'id'], name='deletion_lo_deleted_350220_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletionlog',
+            index=models.Index(fields=['doctor_id', 'deleted_at'], name='deletion_lo_doctor__a9acc9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletionlog',
+            index=models.Index(fields=['patient_user_id', 'deleted_at'], name='deletion_lo_patient_efebaf_idx'),
+        ),
+    ]
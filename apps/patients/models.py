@@ -1,8 +1,10 @@
 from django.db import models
 from django.core.validators import RegexValidator
 from django.utils.translation import gettext_lazy as _
+from django.utils import timezone
 from apps.accounts.models import User
 from apps.hospital.models import Doctor, Disease, Medicine
+from .managers import DeletionLogQuerySet, PatientQuerySet, ScopedQuerySet, TreatmentMedicineQuerySet, VisitQuerySet
 
 
 class Patient(models.Model):
@@ -49,6 +51,8 @@ class Patient(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('تاريخ الإنشاء'))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_('تاريخ التحديث'))
     
+    objects = PatientQuerySet.as_manager()
+    
     class Meta:
         db_table = 'patients'
         indexes = [
@@ -56,6 +60,7 @@ class Patient(models.Model):
             models.Index(fields=['patient_id']),
             models.Index(fields=['is_active']),
             models.Index(fields=['date_of_birth']),
+            models.Index(fields=['updated_at', 'id']),
         ]
     
     def __str__(self):
@@ -89,6 +94,8 @@ class PatientDisease(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ScopedQuerySet.as_manager()
+    
     class Meta:
         db_table = 'patient_diseases'
         unique_together = ['patient', 'disease']
@@ -97,6 +104,7 @@ class PatientDisease(models.Model):
             models.Index(fields=['disease']),
             models.Index(fields=['status']),
             models.Index(fields=['diagnosed_date']),
+            models.Index(fields=['patient', 'diagnosed_date']),
         ]
     
     def __str__(self):
@@ -140,6 +148,8 @@ class Test(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ScopedQuerySet.as_manager()
+    
     class Meta:
         db_table = 'tests'
         indexes = [
@@ -148,6 +158,8 @@ class Test(models.Model):
             models.Index(fields=['test_type']),
             models.Index(fields=['status']),
             models.Index(fields=['test_date']),
+            models.Index(fields=['patient', 'test_date']),
+            models.Index(fields=['updated_at', 'id']),
         ]
     
     def __str__(self):
@@ -175,6 +187,8 @@ class Treatment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ScopedQuerySet.as_manager()
+    
     class Meta:
         db_table = 'treatments'
         indexes = [
@@ -182,6 +196,8 @@ class Treatment(models.Model):
             models.Index(fields=['disease']),
             models.Index(fields=['status']),
             models.Index(fields=['start_date']),
+            models.Index(fields=['patient', 'start_date']),
+            models.Index(fields=['updated_at', 'id']),
         ]
     
     def __str__(self):
@@ -200,6 +216,8 @@ class TreatmentMedicine(models.Model):
     instructions = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = TreatmentMedicineQuerySet.as_manager()
+    
     class Meta:
         db_table = 'treatment_medicines'
         unique_together = ['treatment', 'medicine']
@@ -244,6 +262,8 @@ class Surgery(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ScopedQuerySet.as_manager()
+    
     class Meta:
         db_table = 'surgeries'
         indexes = [
@@ -251,6 +271,8 @@ class Surgery(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['scheduled_date']),
             models.Index(fields=['surgeon_name']),
+            models.Index(fields=['patient', 'scheduled_date']),
+            models.Index(fields=['updated_at', 'id']),
         ]
     
     def __str__(self):
@@ -291,6 +313,8 @@ class Visit(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('تاريخ الإنشاء'))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_('تاريخ التحديث'))
     
+    objects = VisitQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('زيارة')
         verbose_name_plural = _('الزيارات')
@@ -301,7 +325,114 @@ class Visit(models.Model):
             models.Index(fields=['visit_date']),
             models.Index(fields=['status']),
             models.Index(fields=['visit_type']),
+            models.Index(fields=['patient', 'visit_date']),
+            models.Index(fields=['updated_at', 'id']),
         ]
     
     def __str__(self):
         return f"{self.patient.patient_name or self.patient.user.get_full_name()} - {self.get_visit_type_display()} - {self.visit_date.strftime('%Y-%m-%d %H:%M')}"
+
+
+class PatientSummary(models.Model):
+    """
+    Materialized per-patient counts by status and key dates, kept up to date
+    from model signals (see summary.py) so list and profile screens read one row
+    """
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    
+    diseases_total = models.PositiveIntegerField(default=0)
+    diseases_active = models.PositiveIntegerField(default=0)
+    diseases_treated = models.PositiveIntegerField(default=0)
+    diseases_chronic = models.PositiveIntegerField(default=0)
+    diseases_cured = models.PositiveIntegerField(default=0)
+    
+    tests_total = models.PositiveIntegerField(default=0)
+    tests_pending = models.PositiveIntegerField(default=0)
+    tests_in_progress = models.PositiveIntegerField(default=0)
+    tests_completed = models.PositiveIntegerField(default=0)
+    tests_cancelled = models.PositiveIntegerField(default=0)
+    
+    treatments_total = models.PositiveIntegerField(default=0)
+    treatments_active = models.PositiveIntegerField(default=0)
+    treatments_completed = models.PositiveIntegerField(default=0)
+    treatments_cancelled = models.PositiveIntegerField(default=0)
+    
+    surgeries_total = models.PositiveIntegerField(default=0)
+    surgeries_scheduled = models.PositiveIntegerField(default=0)
+    surgeries_in_progress = models.PositiveIntegerField(default=0)
+    surgeries_completed = models.PositiveIntegerField(default=0)
+    surgeries_cancelled = models.PositiveIntegerField(default=0)
+    surgeries_postponed = models.PositiveIntegerField(default=0)
+    
+    visits_total = models.PositiveIntegerField(default=0)
+    visits_scheduled = models.PositiveIntegerField(default=0)
+    visits_in_progress = models.PositiveIntegerField(default=0)
+    visits_completed = models.PositiveIntegerField(default=0)
+    visits_cancelled = models.PositiveIntegerField(default=0)
+    visits_no_show = models.PositiveIntegerField(default=0)
+    
+    last_visit_date = models.DateTimeField(null=True, blank=True)  # latest completed visit
+    next_surgery_date = models.DateTimeField(null=True, blank=True)  # earliest scheduled surgery not yet past
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'patient_summaries'
+        verbose_name = _('ملخص المريض')
+        verbose_name_plural = _('ملخصات المرضى')
+    
+    def __str__(self):
+        return f"Summary of {self.patient_id}"
+
+
+class VisitSearchDocument(models.Model):
+    """
+    Denormalized search text of a visit (patient and doctor names, patient phone,
+    clinical free text), kept up to date from model signals (see search.py) and
+    indexed per database backend by the 0007 migration
+    """
+    visit = models.OneToOneField(Visit, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    document = models.TextField()
+    
+    class Meta:
+        db_table = 'visit_search_documents'
+        verbose_name = _('فهرس بحث الزيارة')
+        verbose_name_plural = _('فهرس بحث الزيارات')
+    
+    def __str__(self):
+        return f"Search document of visit {self.visit_id}"
+
+
+class DeletionLog(models.Model):
+    """
+    Tombstone of a deleted clinical row, kept with the ids its role scope is
+    resolved from so sync clients can be told what to drop (see sync.py)
+    """
+    ENTITY_CHOICES = [
+        ('patients', _('مريض')),
+        ('visits', _('زيارة')),
+        ('tests', _('فحص')),
+        ('treatments', _('علاج')),
+        ('surgeries', _('عملية')),
+    ]
+    
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    object_id = models.BigIntegerField()
+    patient_id = models.BigIntegerField()
+    doctor_id = models.BigIntegerField(null=True, blank=True)
+    patient_user_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+    
+    objects = DeletionLogQuerySet.as_manager()
+    
+    class Meta:
+        db_table = 'deletion_log'
+        verbose_name = _('سجل الحذف')
+        verbose_name_plural = _('سجل الحذف')
+        indexes = [
+            models.Index(fields=['deleted_at', 'id']),
+            models.Index(fields=['doctor_id', 'deleted_at']),
+            models.Index(fields=['patient_user_id', 'deleted_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.entity} {self.object_id} deleted at {self.deleted_at}"
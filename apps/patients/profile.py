@@ -0,0 +1,124 @@
+"""
+Patient profile loader - fetches each related section of a patient exactly once,
+derives the profile statistics from the loaded rows and hands the template
+immutable sections, truncated for very long histories until expanded
+"""
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import TreatmentMedicine
+from .summary import SUMMARY_RELATIONS, get_next_surgery_date, get_summary
+
+# rows: tuple of model instances, newest first
+# total: number of rows the patient has in the section, loaded or not
+# has_more: rows were truncated to the section limit
+# status_counts: Counter of every row's status, loaded or not
+ProfileSection = namedtuple('ProfileSection', ['name', 'rows', 'total', 'has_more', 'status_counts'])
+
+
+def _diseases(patient):
+    return patient.patient_diseases.select_related('disease').order_by('-diagnosed_date', '-pk')
+
+
+def _tests(patient):
+    return patient.tests.select_related('disease').order_by('-test_date', '-pk')
+
+
+def _treatments(patient):
+    medicines = Prefetch('treatment_medicines', queryset=TreatmentMedicine.objects.select_related('medicine'))
+    return patient.treatments.select_related('disease').prefetch_related(medicines).order_by('-start_date', '-pk')
+
+
+def _surgeries(patient):
+    return patient.surgeries.order_by('-scheduled_date', '-pk')
+
+
+def _visits(patient):
+    return patient.visits.select_related('doctor__user').order_by('-visit_date', '-pk')
+
+
+PROFILE_SECTIONS = {
+    'diseases': _diseases,
+    'tests': _tests,
+    'treatments': _treatments,
+    'surgeries': _surgeries,
+    'visits': _visits,
+}
+
+
+def load_section(patient, name, limit=None):
+    """
+    Load one section in a single query (two for treatments and their medicines).
+    One row past the limit is fetched to tell whether the section was truncated;
+    truncated sections take their total and status counts from the patient summary.
+    """
+    queryset = PROFILE_SECTIONS[name](patient)
+    if limit is None:
+        rows = tuple(queryset)
+        has_more = False
+    else:
+        rows = tuple(queryset[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+    if not has_more:
+        return ProfileSection(name, rows, len(rows), False, Counter(row.status for row in rows))
+
+    summary = get_summary(patient)
+    _model, statuses = SUMMARY_RELATIONS[name]
+    status_counts = Counter({status: getattr(summary, f'{name}_{status.lower()}') for status in statuses})
+    return ProfileSection(name, rows, getattr(summary, f'{name}_total'), True, status_counts)
+
+
+def build_profile_stats(sections, patient):
+    """Profile statistics of loaded sections"""
+    diseases, tests, treatments = sections['diseases'], sections['tests'], sections['treatments']
+    surgeries, visits = sections['surgeries'], sections['visits']
+    stats = {
+        'total_diseases': diseases.total,
+        'active_diseases': diseases.status_counts['ACTIVE'],
+        'total_tests': tests.total,
+        'pending_tests': tests.status_counts['PENDING'],
+        'completed_tests': tests.status_counts['COMPLETED'],
+        'total_treatments': treatments.total,
+        'active_treatments': treatments.status_counts['ACTIVE'],
+        'total_surgeries': surgeries.total,
+        'upcoming_surgeries': surgeries.status_counts['SCHEDULED'],
+        'total_visits': visits.total,
+        'completed_visits': visits.status_counts['COMPLETED'],
+        'scheduled_visits': visits.status_counts['SCHEDULED'],
+    }
+
+    # Truncated sections may not hold the row the date comes from
+    if visits.has_more:
+        stats['last_visit_date'] = get_summary(patient).last_visit_date
+    else:
+        stats['last_visit_date'] = max(
+            (visit.visit_date for visit in visits.rows if visit.status == 'COMPLETED'), default=None
+        )
+    if surgeries.has_more:
+        stats['next_surgery_date'] = get_next_surgery_date(patient)
+    else:
+        now = timezone.now()
+        stats['next_surgery_date'] = min(
+            (surgery.scheduled_date for surgery in surgeries.rows
+             if surgery.status == 'SCHEDULED' and surgery.scheduled_date >= now),
+            default=None
+        )
+    return stats
+
+
+def load_patient_profile(patient, expand=(), limit=None):
+    """
+    Sections and statistics of a patient's profile. Sections named in `expand`
+    are loaded in full, the others up to `limit` rows (PATIENT_PROFILE_SECTION_LIMIT by default).
+    """
+    limit = limit or getattr(settings, 'PATIENT_PROFILE_SECTION_LIMIT', 50)
+    sections = {
+        name: load_section(patient, name, None if name in expand else limit)
+        for name in PROFILE_SECTIONS
+    }
+    return sections, build_profile_stats(sections, patient)
@@ -0,0 +1,114 @@
+"""
+Visit search on the VisitSearchDocument index.
+
+Each visit's document holds the text a visit search looks at: the patient's
+name and phone number, the doctor's name and the visit's clinical free text.
+Documents are rebuilt from the model signals and indexed by the 0007 migration,
+with a pg_trgm GIN index on PostgreSQL and an FTS5 trigram table on SQLite.
+A search is then one ranked lookup on the document table, capped at
+VISIT_SEARCH_MAX_RESULTS ids, instead of icontains ORed over four joined
+tables followed by a DISTINCT.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+
+from .models import VisitSearchDocument
+
+VISIT_TEXT_FIELDS = ('chief_complaint', 'diagnosis', 'treatment_plan', 'notes')
+BATCH_SIZE = 500
+
+
+def visit_document(visit):
+    """Search text of a visit, with its patient and doctor's user loaded"""
+    doctor = visit.doctor.user
+    parts = [visit.patient.patient_name, visit.patient.patient_id, doctor.first_name, doctor.last_name]
+    parts += [getattr(visit, field) for field in VISIT_TEXT_FIELDS]
+    return '\n'.join(part for part in parts if part)
+
+
+def _save_documents(documents):
+    VisitSearchDocument.objects.bulk_create(
+        documents, update_conflicts=True, unique_fields=['visit'], update_fields=['document']
+    )
+
+
+def build_visit_documents(visits):
+    """Create or refresh the documents of a queryset of visits, batch by batch. Returns the number built."""
+    built = 0
+    documents = []
+    for visit in visits.select_related('patient', 'doctor__user').order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        documents.append(VisitSearchDocument(visit_id=visit.pk, document=visit_document(visit)))
+        if len(documents) == BATCH_SIZE:
+            _save_documents(documents)
+            built += len(documents)
+            documents = []
+    if documents:
+        _save_documents(documents)
+        built += len(documents)
+    return built
+
+
+def _escape_like(word):
+    return word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _within(visits, column):
+    """SQL restricting an id column to a filtered visits queryset, with its params"""
+    if visits is None or not visits.query.where:
+        return '', []
+    sql, params = visits.order_by().values('pk').query.sql_with_params()
+    return f' AND {column} IN ({sql})', list(params)
+
+
+def search_visit_ids(term, visits=None, limit=None):
+    """
+    Ids of the visits whose document contains every word of the term, best
+    matches first. Filters of the `visits` queryset apply before the limit.
+    """
+    words = term.split()
+    if not words:
+        return []
+    limit = limit or getattr(settings, 'VISIT_SEARCH_MAX_RESULTS', 500)
+    table = connection.ops.quote_name(VisitSearchDocument._meta.db_table)
+
+    if connection.vendor == 'postgresql':
+        within, within_params = _within(visits, 'visit_id')
+        where = ' AND '.join(['document ILIKE %s'] * len(words))
+        sql = (
+            f'SELECT visit_id FROM {table} WHERE {where}{within} '
+            'ORDER BY word_similarity(%s, document) DESC, visit_id DESC LIMIT %s'
+        )
+        params = [f'%{_escape_like(word)}%' for word in words] + within_params + [term, limit]
+    elif connection.vendor == 'sqlite' and all(len(word) >= 3 for word in words):
+        # Trigram FTS matches substrings of three characters or more, each word quoted as a phrase
+        within, within_params = _within(visits, 'rowid')
+        sql = (
+            f'SELECT rowid FROM visit_search_fts WHERE visit_search_fts MATCH %s{within} '
+            'ORDER BY rank, rowid DESC LIMIT %s'
+        )
+        params = [' '.join('"{}"'.format(word.replace('"', '""')) for word in words)] + within_params + [limit]
+    else:
+        documents = VisitSearchDocument.objects.all()
+        if visits is not None:
+            documents = documents.filter(visit__in=visits.order_by().values('pk'))
+        for word in words:
+            documents = documents.filter(document__icontains=word)
+        return list(documents.order_by('-visit_id').values_list('visit_id', flat=True)[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_rank(ids):
+    """Ordering expression putting visits in the order of `ids`"""
+    return Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+
+
+def search_visits(queryset, term):
+    """The queryset's visits matching the term, annotated with their `search_rank` (0 is best)"""
+    ids = search_visit_ids(term, visits=queryset)
+    if not ids:
+        return queryset.none().annotate(search_rank=Value(0, output_field=IntegerField()))
+    return queryset.filter(pk__in=ids).annotate(search_rank=search_rank(ids)).order_by('search_rank')
@@ -1,11 +1,13 @@
 from rest_framework import serializers
-from .models import Patient, PatientDisease, Test, Treatment, TreatmentMedicine, Surgery
+from .models import Patient, PatientDisease, Test, Treatment, TreatmentMedicine, Surgery, PatientSummary, Visit
+from .summary import get_summary
 from apps.hospital.serializers import DoctorSerializer, DiseaseSerializer, MedicineSerializer
 from apps.accounts.serializers import UserSerializer
 from apps.accounts.models import User
+from hospital_system.fieldsets import SparseFieldsetMixin
 
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     doctor_name = serializers.CharField(source='doctor.user.get_full_name', read_only=True)
     doctor_specialization = serializers.CharField(source='doctor.specialization', read_only=True)
@@ -17,22 +19,31 @@ class PatientSerializer(serializers.ModelSerializer):
     treatments_count = serializers.SerializerMethodField()
     surgeries_count = serializers.SerializerMethodField()
     
+    expandable_fields = {'doctor': DoctorSerializer}
+    field_sources = {
+        'age': ['date_of_birth'],
+        'diseases_count': ['summary.diseases_total'],
+        'tests_count': ['summary.tests_total'],
+        'treatments_count': ['summary.treatments_total'],
+        'surgeries_count': ['summary.surgeries_total'],
+    }
+    
     class Meta:
         model = Patient
         fields = '__all__'
         read_only_fields = ('created_at', 'updated_at', 'patient_id')
     
     def get_diseases_count(self, obj):
-        return obj.patient_diseases.count()
+        return get_summary(obj).diseases_total
     
     def get_tests_count(self, obj):
-        return obj.tests.count()
+        return get_summary(obj).tests_total
     
     def get_treatments_count(self, obj):
-        return obj.treatments.count()
+        return get_summary(obj).treatments_total
     
     def get_surgeries_count(self, obj):
-        return obj.surgeries.count()
+        return get_summary(obj).surgeries_total
 
 
 class PatientCreateSerializer(serializers.ModelSerializer):
@@ -60,22 +71,26 @@ class PatientCreateSerializer(serializers.ModelSerializer):
         return patient
 
 
-class PatientDiseaseSerializer(serializers.ModelSerializer):
+class PatientDiseaseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     disease_name = serializers.CharField(source='disease.name', read_only=True)
     disease_category = serializers.CharField(source='disease.category', read_only=True)
     patient_name = serializers.CharField(source='patient.user.get_full_name', read_only=True)
     
+    expandable_fields = {'disease': DiseaseSerializer}
+    
     class Meta:
         model = PatientDisease
         fields = '__all__'
         read_only_fields = ('created_at', 'updated_at')
 
 
-class TestSerializer(serializers.ModelSerializer):
+class TestSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.user.get_full_name', read_only=True)
     disease_name = serializers.CharField(source='disease.name', read_only=True)
     doctor_name = serializers.CharField(source='patient.doctor.user.get_full_name', read_only=True)
     
+    expandable_fields = {'disease': DiseaseSerializer}
+    
     class Meta:
         model = Test
         fields = '__all__'
@@ -92,19 +107,21 @@ class TreatmentMedicineSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at',)
 
 
-class TreatmentSerializer(serializers.ModelSerializer):
+class TreatmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.user.get_full_name', read_only=True)
     disease_name = serializers.CharField(source='disease.name', read_only=True)
     doctor_name = serializers.CharField(source='patient.doctor.user.get_full_name', read_only=True)
     medicines = TreatmentMedicineSerializer(source='treatment_medicines', many=True, read_only=True)
     
+    expandable_fields = {'disease': DiseaseSerializer}
+    
     class Meta:
         model = Treatment
         fields = '__all__'
         read_only_fields = ('created_at', 'updated_at')
 
 
-class SurgerySerializer(serializers.ModelSerializer):
+class SurgerySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.user.get_full_name', read_only=True)
     patient_id = serializers.CharField(source='patient.patient_id', read_only=True)
     doctor_name = serializers.CharField(source='patient.doctor.user.get_full_name', read_only=True)
@@ -115,7 +132,19 @@ class SurgerySerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at', 'updated_at')
 
 
-class PatientSummarySerializer(serializers.ModelSerializer):
+
+class VisitSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    patient_name = serializers.CharField(source='patient.patient_name', read_only=True)
+    doctor_name = serializers.CharField(source='doctor.user.get_full_name', read_only=True)
+    
+    expandable_fields = {'doctor': DoctorSerializer}
+    
+    class Meta:
+        model = Visit
+        fields = '__all__'
+        read_only_fields = ('created_at', 'updated_at')
+
+class PatientSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Optimized serializer for mobile app - includes only essential fields
     """
@@ -126,8 +155,18 @@ class PatientSummarySerializer(serializers.ModelSerializer):
     center_name = serializers.CharField(source='doctor.center.name', read_only=True)
     age = serializers.ReadOnlyField()
     
+    field_sources = {'age': ['date_of_birth']}
+    
     class Meta:
         model = Patient
         fields = ('id', 'patient_id', 'name', 'email', 'phone', 'date_of_birth', 
                  'gender', 'blood_group', 'doctor_name', 'center_name', 'age', 
                  'is_active', 'created_at')
+
+
+class PatientSummaryCountsSerializer(serializers.ModelSerializer):
+    """Materialized counts and key dates of a patient"""
+    
+    class Meta:
+        model = PatientSummary
+        exclude = ('patient',)
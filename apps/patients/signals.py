@@ -0,0 +1,139 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from hospital_system.conditional import update_versioned
+from .models import DeletionLog, Patient, PatientSummary, Surgery, Test, Treatment, TreatmentMedicine, Visit
+from .search import build_visit_documents
+from .summary import RELATION_BY_MODEL, refresh_summaries
+from .sync import ENTITY_BY_MODEL
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Patient)
+def create_patient_summary(sender, instance, created, raw=False, **kwargs):
+    """Every new patient starts with an empty summary"""
+    if created and not raw:
+        PatientSummary.objects.get_or_create(patient=instance)
+
+
+def remember_previous_patient(sender, instance, raw=False, **kwargs):
+    """Keep the patient a row belonged to, so moving it refreshes both summaries"""
+    if instance.pk and not raw:
+        instance._summary_previous_patient_id = sender.objects.filter(
+            pk=instance.pk
+        ).values_list('patient_id', flat=True).first()
+
+
+def refresh_patient_summary(sender, instance, raw=False, **kwargs):
+    """Recompute the counts of the relation that changed"""
+    if raw:
+        return
+    patient_ids = {instance.patient_id, getattr(instance, '_summary_previous_patient_id', None)}
+    patient_ids.discard(None)
+    refresh_summaries(patient_ids, [RELATION_BY_MODEL[sender]])
+
+
+for model in RELATION_BY_MODEL:
+    pre_save.connect(remember_previous_patient, sender=model, dispatch_uid=f'summary_pre_save_{model.__name__}')
+    post_save.connect(refresh_patient_summary, sender=model, dispatch_uid=f'summary_post_save_{model.__name__}')
+    post_delete.connect(refresh_patient_summary, sender=model, dispatch_uid=f'summary_post_delete_{model.__name__}')
+
+
+@receiver(post_save, sender=Visit)
+def index_visit(sender, instance, raw=False, **kwargs):
+    """Rebuild the visit's search document"""
+    if not raw:
+        build_visit_documents(Visit.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Patient)
+def reindex_patient_visits(sender, instance, created, raw=False, **kwargs):
+    """Visit documents carry the patient's name and phone number"""
+    if not created and not raw:
+        build_visit_documents(instance.visits.all())
+
+
+@receiver(post_save, sender=User)
+def reindex_doctor_visits(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Visit documents carry the doctor's name, which lives on the user"""
+    if raw or instance.role != 'DOCTOR':
+        return
+    if update_fields is not None and not set(update_fields) & {'first_name', 'last_name'}:
+        return
+    build_visit_documents(Visit.objects.filter(doctor__user_id=instance.pk))
+
+
+# patient id -> (doctor id, user id) of the patients being deleted on this thread,
+# so the tombstones of their cascaded rows need no lookups
+_deleting = threading.local()
+
+
+@receiver(pre_delete, sender=Patient)
+def remember_deleted_patient(sender, instance, **kwargs):
+    if not hasattr(_deleting, 'patients'):
+        _deleting.patients = {}
+    _deleting.patients[instance.pk] = (instance.doctor_id, instance.user_id)
+
+
+def _patient_owners(patient_id):
+    owners = getattr(_deleting, 'patients', {}).get(patient_id)
+    if owners is None:
+        owners = Patient.objects.filter(pk=patient_id).values_list('doctor_id', 'user_id').first()
+    return owners or (None, None)
+
+
+def log_deletion(sender, instance, **kwargs):
+    """Leave a tombstone for sync clients, with the ids its scope is resolved from"""
+    if sender is Patient:
+        doctor_id, user_id = instance.doctor_id, instance.user_id
+        getattr(_deleting, 'patients', {}).pop(instance.pk, None)
+    else:
+        doctor_id, user_id = _patient_owners(instance.patient_id)
+    if sender is Visit:
+        # Visits are scoped by their own doctor
+        doctor_id = instance.doctor_id
+    DeletionLog.objects.create(
+        entity=ENTITY_BY_MODEL[sender], object_id=instance.pk,
+        patient_id=instance.pk if sender is Patient else instance.patient_id,
+        doctor_id=doctor_id, patient_user_id=user_id,
+    )
+
+
+for model in ENTITY_BY_MODEL:
+    post_delete.connect(log_deletion, sender=model, dispatch_uid=f'sync_post_delete_{model.__name__}')
+
+
+@receiver(pre_save, sender=Patient)
+def remember_previous_doctor(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._sync_previous_doctor_id = Patient.objects.filter(
+            pk=instance.pk
+        ).values_list('doctor_id', flat=True).first()
+
+
+@receiver(post_save, sender=Patient)
+def resync_moved_patient(sender, instance, created, raw=False, **kwargs):
+    """
+    A patient moved to another doctor leaves the previous doctor's scope with a
+    tombstone, and its rows are touched so the new doctor's clients receive them
+    """
+    previous = getattr(instance, '_sync_previous_doctor_id', None)
+    if created or raw or previous is None or previous == instance.doctor_id:
+        return
+    DeletionLog.objects.create(entity='patients', object_id=instance.pk, patient_id=instance.pk, doctor_id=previous)
+    now = timezone.now()
+    for model in (Test, Treatment, Surgery):
+        update_versioned(model.objects.filter(patient_id=instance.pk), updated_at=now)
+
+
+@receiver(post_save, sender=TreatmentMedicine)
+@receiver(post_delete, sender=TreatmentMedicine)
+def touch_treatment(sender, instance, raw=False, **kwargs):
+    """Treatments are synced with their medicines, so a medicine change touches its treatment"""
+    if not raw:
+        Treatment.objects.filter(pk=instance.treatment_id).update(updated_at=timezone.now())
@@ -0,0 +1,143 @@
+"""
+Patient summaries - per-relation refresh of the PatientSummary projection,
+used by the model signals, bulk admin actions and the rebuild command
+"""
+from django.db.models import Count, Max, Min, Q
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .models import Patient, PatientDisease, Test, Treatment, Surgery, Visit, PatientSummary
+
+# relation name -> (model, statuses counted into <relation>_<status> columns)
+SUMMARY_RELATIONS = {
+    'diseases': (PatientDisease, ['ACTIVE', 'TREATED', 'CHRONIC', 'CURED']),
+    'tests': (Test, ['PENDING', 'IN_PROGRESS', 'COMPLETED', 'CANCELLED']),
+    'treatments': (Treatment, ['ACTIVE', 'COMPLETED', 'CANCELLED']),
+    'surgeries': (Surgery, ['SCHEDULED', 'IN_PROGRESS', 'COMPLETED', 'CANCELLED', 'POSTPONED']),
+    'visits': (Visit, ['SCHEDULED', 'IN_PROGRESS', 'COMPLETED', 'CANCELLED', 'NO_SHOW']),
+}
+
+# relation name -> (summary column, aggregate over that relation's rows)
+SUMMARY_DATES = {
+    'visits': ('last_visit_date', Max('visit_date', filter=Q(status='COMPLETED'))),
+    'surgeries': ('next_surgery_date', Min('scheduled_date', filter=Q(status='SCHEDULED', scheduled_date__gte=Now()))),
+}
+
+RELATION_BY_MODEL = {model: relation for relation, (model, _statuses) in SUMMARY_RELATIONS.items()}
+
+
+def relation_fields(relation):
+    """Summary columns owned by a relation"""
+    _model, statuses = SUMMARY_RELATIONS[relation]
+    fields = [f'{relation}_total'] + [f'{relation}_{status.lower()}' for status in statuses]
+    if relation in SUMMARY_DATES:
+        fields.append(SUMMARY_DATES[relation][0])
+    return fields
+
+
+def compute_relation(relation, patient_ids):
+    """
+    Column values of one relation for a set of patients, as {patient_id: {column: value}},
+    in one grouped query (plus one for the relation's date column, if any)
+    """
+    model, _statuses = SUMMARY_RELATIONS[relation]
+    values = {patient_id: dict.fromkeys(relation_fields(relation), 0) for patient_id in patient_ids}
+
+    rows = model.objects.filter(patient_id__in=patient_ids).values('patient_id', 'status').annotate(
+        count=Count('pk')
+    ).order_by()
+    for row in rows:
+        patient_values = values[row['patient_id']]
+        patient_values[f'{relation}_total'] += row['count']
+        column = f"{relation}_{row['status'].lower()}"
+        if column in patient_values:
+            patient_values[column] = row['count']
+
+    if relation in SUMMARY_DATES:
+        column, aggregate = SUMMARY_DATES[relation]
+        for patient_values in values.values():
+            patient_values[column] = None
+        dates = model.objects.filter(patient_id__in=patient_ids).values('patient_id').annotate(
+            value=aggregate
+        ).order_by()
+        for row in dates:
+            values[row['patient_id']][column] = row['value']
+    return values
+
+
+def refresh_summaries(patient_ids, relations=None):
+    """
+    Recompute the given relations (all by default) of existing summaries.
+    Rows are only ever updated, never created, so refreshing from the signals of
+    children deleted together with their patient cannot resurrect a summary.
+    """
+    patient_ids = list(set(patient_ids))
+    if not patient_ids:
+        return
+    updates = {patient_id: {} for patient_id in patient_ids}
+    for relation in relations or SUMMARY_RELATIONS:
+        for patient_id, values in compute_relation(relation, patient_ids).items():
+            updates[patient_id].update(values)
+
+    now = timezone.now()
+    for patient_id, values in updates.items():
+        PatientSummary.objects.filter(patient_id=patient_id).update(updated_at=now, **values)
+
+
+def build_summaries(patient_ids):
+    """Create or fully recompute the summaries of a batch of patients"""
+    patient_ids = list(patient_ids)
+    values = {patient_id: {} for patient_id in patient_ids}
+    for relation in SUMMARY_RELATIONS:
+        for patient_id, relation_values in compute_relation(relation, patient_ids).items():
+            values[patient_id].update(relation_values)
+
+    now = timezone.now()
+    summaries = [
+        PatientSummary(patient_id=patient_id, updated_at=now, **patient_values)
+        for patient_id, patient_values in values.items()
+    ]
+    update_fields = [field for relation in SUMMARY_RELATIONS for field in relation_fields(relation)]
+    PatientSummary.objects.bulk_create(
+        summaries,
+        update_conflicts=True,
+        unique_fields=['patient'],
+        update_fields=update_fields + ['updated_at'],
+    )
+    return len(summaries)
+
+
+def rebuild_summaries(batch_size=1000):
+    """Recompute the summary of every patient, batch by batch. Returns the number rebuilt."""
+    rebuilt = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            Patient.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return rebuilt
+        rebuilt += build_summaries(batch)
+        last_pk = batch[-1]
+
+
+def get_next_surgery_date(patient):
+    """
+    A patient's next scheduled surgery from the summary. The summary's date goes
+    stale once that surgery's time passes, so it is then recomputed.
+    """
+    summary = get_summary(patient)
+    if summary.next_surgery_date is not None and summary.next_surgery_date < timezone.now():
+        refresh_summaries([patient.pk], ['surgeries'])
+        summary.refresh_from_db(fields=relation_fields('surgeries'))
+    return summary.next_surgery_date
+
+
+def get_summary(patient):
+    """A patient's summary, built on the spot for patients that predate the summary table"""
+    try:
+        return patient.summary
+    except PatientSummary.DoesNotExist:
+        build_summaries([patient.pk])
+        patient.summary = PatientSummary.objects.get(patient=patient)
+        return patient.summary
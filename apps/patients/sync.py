@@ -0,0 +1,152 @@
+"""
+Delta sync for offline clients.
+
+A client keeps an opaque cursor holding, per entity, the (updated_at, id) of
+the last row it received, and the (deleted_at, id) of the last tombstone. A
+sync returns the rows of the user's role scope changed after those positions,
+oldest first along the (updated_at, id) indexes and at most `limit` of each,
+plus the tombstones the delete signals logged in the deletion log. While
+`has_more` is set the client calls again with the new cursor.
+
+Rows changed in the last SYNC_SETTLE_SECONDS are left to the next sync, so a
+transaction committing shortly after its updated_at is not skipped. Created
+and updated rows are told apart by created_at, and clients should upsert
+both. A patient tombstone also covers the patient's tests, treatments and
+surgeries; one is logged for the previous doctor when a patient moves.
+Treatments are synced with their medicines, so adding, changing or removing
+a medicine touches its treatment's updated_at.
+Tombstones are kept SYNC_TOMBSTONE_RETENTION_DAYS, and a cursor older than
+that gets `reset` with a full sync, after which the client replaces its data.
+"""
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import DeletionLog, Patient, Surgery, Test, Treatment, Visit
+from .serializers import (
+    PatientSummarySerializer, SurgerySerializer, TestSerializer, TreatmentSerializer, VisitSerializer
+)
+
+SyncEntity = namedtuple('SyncEntity', ['model', 'serializer', 'select_related', 'prefetch_related'])
+
+SYNC_ENTITIES = {
+    'patients': SyncEntity(Patient, PatientSummarySerializer, ('user', 'doctor__user', 'doctor__center'), ()),
+    'visits': SyncEntity(Visit, VisitSerializer, ('patient', 'doctor__user'), ()),
+    'tests': SyncEntity(Test, TestSerializer, ('patient__user', 'disease', 'patient__doctor__user'), ()),
+    'treatments': SyncEntity(
+        Treatment, TreatmentSerializer, ('patient__user', 'disease', 'patient__doctor__user'),
+        ('treatment_medicines__medicine',)
+    ),
+    'surgeries': SyncEntity(Surgery, SurgerySerializer, ('patient__user', 'patient__doctor__user'), ()),
+}
+ENTITY_BY_MODEL = {spec.model: entity for entity, spec in SYNC_ENTITIES.items()}
+
+# Cursor position of the deletion log
+TOMBSTONES = 'deleted'
+
+
+def encode_cursor(positions):
+    data = {key: [moment.isoformat(), pk] for key, (moment, pk) in positions.items()}
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """{entity or TOMBSTONES: (datetime, id)} of a cursor, ValueError if it is not one"""
+    if not cursor:
+        return {}
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        positions = {}
+        for key, (moment, pk) in data.items():
+            moment = parse_datetime(moment)
+            if key not in SYNC_ENTITIES and key != TOMBSTONES or not isinstance(pk, int):
+                raise ValueError
+            # Positions are compared with aware datetimes
+            if moment is None or timezone.is_naive(moment):
+                raise ValueError
+            positions[key] = (moment, pk)
+    except (ValueError, TypeError, AttributeError, binascii.Error):
+        raise ValueError('Invalid sync cursor')
+    return positions
+
+
+def _after(queryset, field, position):
+    """Rows past a (moment, id) position in (field, id) order"""
+    if position is None:
+        return queryset
+    moment, pk = position
+    return queryset.filter(Q(**{f'{field}__gt': moment}) | Q(**{field: moment, 'pk__gt': pk}))
+
+
+def _page(queryset, field, position, horizon, limit):
+    """One page of rows past a position, the position after it and whether rows are left"""
+    rows = list(
+        _after(queryset.filter(**{f'{field}__lt': horizon}), field, position).order_by(field, 'pk')[:limit + 1]
+    )
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (getattr(rows[-1], field), rows[-1].pk), True
+    # Everything before the horizon has been sent
+    return rows, (horizon, 0), False
+
+
+def sync_changes(user, cursor=None, limit=None):
+    """
+    Changes of the user's scope since a cursor (everything without one):
+    {'changes': {entity: {'created', 'updated', 'deleted'}}, 'cursor', 'has_more', 'reset'}
+    """
+    positions = decode_cursor(cursor)
+    limit = limit or getattr(settings, 'SYNC_PAGE_SIZE', 200)
+    now = timezone.now()
+    horizon = now - timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 2))
+
+    reset = False
+    retention = timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 90))
+    if positions and (TOMBSTONES not in positions or positions[TOMBSTONES][0] < now - retention):
+        # Tombstones the client has not seen may have been purged already
+        positions, reset = {}, True
+
+    changes = {}
+    next_positions = {}
+    has_more = False
+    for entity, spec in SYNC_ENTITIES.items():
+        queryset = spec.model.objects.for_user(user).select_related(*spec.select_related)
+        if spec.prefetch_related:
+            queryset = queryset.prefetch_related(*spec.prefetch_related)
+        position = positions.get(entity)
+        rows, next_positions[entity], more = _page(queryset, 'updated_at', position, horizon, limit)
+        has_more = has_more or more
+
+        since = position[0] if position else None
+        records = spec.serializer(rows, many=True).data
+        changes[entity] = {
+            'created': [record for row, record in zip(rows, records) if since is None or row.created_at > since],
+            'updated': [record for row, record in zip(rows, records) if since is not None and row.created_at <= since],
+            'deleted': [],
+        }
+
+    if positions:
+        tombstones, next_positions[TOMBSTONES], more = _page(
+            DeletionLog.objects.for_user(user), 'deleted_at', positions[TOMBSTONES], horizon, limit
+        )
+        has_more = has_more or more
+        for tombstone in tombstones:
+            changes[tombstone.entity]['deleted'].append(tombstone.object_id)
+    else:
+        # A client starting from nothing has nothing to delete
+        next_positions[TOMBSTONES] = (horizon, 0)
+
+    return {
+        'changes': changes,
+        'cursor': encode_cursor(next_positions),
+        'has_more': has_more,
+        'reset': reset,
+        'synced_until': horizon,
+    }
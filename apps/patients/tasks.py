@@ -0,0 +1,15 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from .models import DeletionLog
+
+
+@shared_task
+def purge_deletion_log():
+    """Delete sync tombstones older than the retention period (run by Celery beat)"""
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 90))
+    deleted, _ = DeletionLog.objects.filter(deleted_at__lt=cutoff).delete()
+    return f"Purged {deleted} tombstones older than {cutoff:%Y-%m-%d}"
@@ -0,0 +1,905 @@
+from datetime import date, datetime, time, timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from apps.hospital.models import City, Center, Doctor, Disease, Medicine, Staff
+from apps.hospital.serializers import DiseaseSerializer
+from hospital_system.admin_pagination import EstimatedCountPaginator
+from hospital_system.admin_rendering import BadgeSet, CellTemplate, ReversedURL
+from hospital_system.fastpath import build_plan
+from .admin import DoctorListFilter
+from .models import (
+    DeletionLog, Patient, PatientDisease, PatientSummary, Test, Treatment, TreatmentMedicine, Surgery, Visit,
+    VisitSearchDocument
+)
+from .profile import load_patient_profile
+from .serializers import PatientSerializer, TestSerializer, TreatmentSerializer
+from .search import search_visit_ids, search_visits
+from .sync import encode_cursor
+from .timeline import load_timeline
+from .summary import get_next_surgery_date, rebuild_summaries
+
+User = get_user_model()
+
+
+class PatientFixturesMixin:
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='doctor@example.com',
+            username='doctor',
+            password='testpass123',
+            role='DOCTOR'
+        )
+        city = City.objects.create(name='BASRA', state='Basra', country='Iraq')
+        center = Center.objects.create(name='Basra Center', city=city, address='Basra', phone_number='+9647700000000')
+        self.doctor = Doctor.objects.create(
+            user=self.user, center=center, specialization='CARDIOLOGY', license_number='LIC1'
+        )
+        self.disease = Disease.objects.create(name='Diabetes', category='CHRONIC')
+        self.patient = self._create_patient('07700000001')
+
+    def _create_patient(self, phone):
+        return Patient.objects.create(
+            user=self.user, doctor=self.doctor, patient_name=f'Patient {phone}', patient_id=phone,
+            date_of_birth=date(1960, 5, 1), gender='M', address='Basra',
+            emergency_contact_name='Contact', emergency_contact_phone='07700000099'
+        )
+
+    def _create_test(self, patient, status='PENDING'):
+        return Test.objects.create(
+            patient=patient, disease=self.disease, test_name='HbA1c', test_type='BLOOD',
+            test_date=timezone.now(), status=status
+        )
+
+
+class PatientSummaryTest(PatientFixturesMixin, TestCase):
+    def _summary(self, patient=None):
+        return PatientSummary.objects.get(patient=patient or self.patient)
+
+    def test_new_patient_gets_empty_summary(self):
+        summary = self._summary()
+        self.assertEqual(summary.tests_total, 0)
+        self.assertIsNone(summary.last_visit_date)
+
+    def test_counts_follow_saves_and_deletes(self):
+        test = self._create_test(self.patient)
+        self._create_test(self.patient, status='COMPLETED')
+        self.assertEqual((self._summary().tests_total, self._summary().tests_pending), (2, 1))
+
+        test.status = 'COMPLETED'
+        test.save()
+        self.assertEqual((self._summary().tests_pending, self._summary().tests_completed), (0, 2))
+
+        test.delete()
+        self.assertEqual(self._summary().tests_total, 1)
+
+    def test_moving_a_row_refreshes_both_patients(self):
+        other = self._create_patient('07700000002')
+        test = self._create_test(self.patient)
+
+        test.patient = other
+        test.save()
+
+        self.assertEqual(self._summary().tests_total, 0)
+        self.assertEqual(self._summary(other).tests_total, 1)
+
+    def test_last_visit_date(self):
+        visit_date = timezone.now() - timedelta(days=3)
+        Visit.objects.create(
+            patient=self.patient, doctor=self.doctor, visit_date=visit_date,
+            status='COMPLETED', chief_complaint='Checkup'
+        )
+        Visit.objects.create(
+            patient=self.patient, doctor=self.doctor, visit_date=timezone.now() + timedelta(days=3),
+            status='SCHEDULED', chief_complaint='Follow up'
+        )
+
+        summary = self._summary()
+        self.assertEqual(summary.visits_total, 2)
+        self.assertEqual(summary.last_visit_date, visit_date)
+
+    def test_deleting_patient_removes_summary(self):
+        self._create_test(self.patient)
+        self.patient.delete()
+        self.assertFalse(PatientSummary.objects.exists())
+
+    def test_rebuild_repairs_drift(self):
+        self._create_test(self.patient)
+        PatientSummary.objects.update(tests_total=42)
+        Test.objects.update(status='CANCELLED')
+
+        self.assertEqual(rebuild_summaries(batch_size=1), 1)
+        summary = self._summary()
+        self.assertEqual((summary.tests_total, summary.tests_pending, summary.tests_cancelled), (1, 0, 1))
+
+    def test_admin_action_on_filtered_changelist_refreshes_summary(self):
+        self._create_test(self.patient)
+        test_admin = admin.site._registry[Test]
+        request = RequestFactory().post('/')
+        with mock.patch.object(test_admin, 'message_user'):
+            test_admin.mark_as_completed(request, Test.objects.filter(status='PENDING'))
+
+        summary = self._summary()
+        self.assertEqual((summary.tests_pending, summary.tests_completed), (0, 1))
+
+    def test_next_surgery_date_skips_past_surgeries(self):
+        def schedule(days):
+            return Surgery.objects.create(
+                patient=self.patient, surgery_name='Bypass', description='-', surgeon_name='Dr. S',
+                scheduled_date=timezone.now() + timedelta(days=days), status='SCHEDULED'
+            )
+
+        schedule(-2)
+        upcoming = schedule(5)
+        self.assertEqual(self._summary().next_surgery_date, upcoming.scheduled_date)
+
+        # The summary's date passes without any surgery being saved
+        PatientSummary.objects.update(next_surgery_date=timezone.now() - timedelta(days=1))
+        patient = Patient.objects.get(pk=self.patient.pk)
+        self.assertEqual(get_next_surgery_date(patient), upcoming.scheduled_date)
+
+    def test_migration_backfills_existing_patients(self):
+        self._create_test(self.patient)
+        PatientSummary.objects.all().delete()
+
+        import_module('apps.patients.migrations.0005_patient_summary').build_summaries(django_apps, None)
+
+        summary = self._summary()
+        self.assertEqual((summary.tests_total, summary.tests_pending), (1, 1))
+
+    def test_rebuild_command_creates_missing_summaries(self):
+        PatientSummary.objects.all().delete()
+        call_command('rebuild_patient_summaries', stdout=StringIO())
+        self.assertTrue(PatientSummary.objects.filter(patient=self.patient).exists())
+
+
+class PatientProfileTest(PatientFixturesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for status in ('PENDING', 'PENDING', 'COMPLETED'):
+            self._create_test(self.patient, status=status)
+        medicine = Medicine.objects.create(
+            name='Metformin', dosage_form='tablet', strength='500mg', manufacturer='Pharma'
+        )
+        for name in ('Insulin', 'Diet'):
+            treatment = Treatment.objects.create(
+                patient=self.patient, disease=self.disease, treatment_name=name,
+                description=name, start_date=date(2024, 1, 1)
+            )
+            TreatmentMedicine.objects.create(
+                treatment=treatment, medicine=medicine, dosage='1', frequency='daily', duration_days=30
+            )
+        self.visit_date = timezone.now() - timedelta(days=2)
+        Visit.objects.create(
+            patient=self.patient, doctor=self.doctor, visit_date=self.visit_date,
+            status='COMPLETED', chief_complaint='Checkup'
+        )
+        Surgery.objects.create(
+            patient=self.patient, surgery_name='Bypass', description='-', surgeon_name='Dr. S',
+            scheduled_date=timezone.now() + timedelta(days=5)
+        )
+
+    def _patient(self):
+        return Patient.objects.select_related('summary').get(pk=self.patient.pk)
+
+    def test_each_section_is_loaded_once(self):
+        patient = self._patient()
+        # One query per section, plus the treatment medicines prefetch
+        with self.assertNumQueries(6):
+            sections, stats = load_patient_profile(patient)
+            for treatment in sections['treatments'].rows:
+                [item.medicine.name for item in treatment.treatment_medicines.all()]
+            [visit.doctor.user.get_full_name() for visit in sections['visits'].rows]
+
+        self.assertIsInstance(sections['tests'].rows, tuple)
+        self.assertEqual((stats['total_tests'], stats['pending_tests'], stats['completed_tests']), (3, 2, 1))
+        self.assertEqual((stats['total_treatments'], stats['active_treatments']), (2, 2))
+        self.assertEqual(stats['last_visit_date'], self.visit_date)
+        self.assertEqual(stats['upcoming_surgeries'], 1)
+
+    def test_truncated_section_takes_totals_from_summary(self):
+        patient = self._patient()
+        with self.assertNumQueries(6):
+            sections, stats = load_patient_profile(patient, limit=2)
+
+        tests = sections['tests']
+        self.assertEqual((len(tests.rows), tests.total, tests.has_more), (2, 3, True))
+        self.assertEqual(stats['pending_tests'], 2)
+
+        sections, _stats = load_patient_profile(self._patient(), expand=['tests'], limit=2)
+        self.assertEqual((len(sections['tests'].rows), sections['tests'].has_more), (3, False))
+
+    def test_profile_page(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('admin_patient_profile', args=[self.patient.pk]), {'expand': 'tests,unknown'}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['expand'], 'tests')
+        self.assertEqual(response.context['stats']['total_tests'], 3)
+        self.assertContains(response, 'Metformin')
+
+
+class TimelineFixturesMixin(PatientFixturesMixin):
+    def setUp(self):
+        super().setUp()
+        # Rows sharing a timestamp, and a test at the local midnight a diagnosis sorts at
+        midnight = timezone.make_aware(datetime.combine(date(2024, 3, 1), time.min))
+        for offset in (0, 0, 1, 2):
+            Test.objects.create(
+                patient=self.patient, disease=self.disease, test_name='HbA1c', test_type='BLOOD',
+                test_date=midnight + timedelta(hours=offset)
+            )
+        for name, day in (('Diabetes', date(2024, 3, 1)), ('Asthma', date(2024, 3, 1)), ('Flu', date(2024, 2, 1))):
+            disease, _created = Disease.objects.get_or_create(name=name, defaults={'category': 'CHRONIC'})
+            PatientDisease.objects.create(patient=self.patient, disease=disease, diagnosed_date=day)
+        Treatment.objects.create(
+            patient=self.patient, disease=self.disease, treatment_name='Insulin',
+            description='-', start_date=date(2024, 3, 2)
+        )
+        Visit.objects.create(
+            patient=self.patient, doctor=self.doctor, visit_date=midnight + timedelta(hours=10),
+            status='COMPLETED', chief_complaint='Checkup'
+        )
+
+
+class PatientTimelineTest(TimelineFixturesMixin, TestCase):
+    def test_pages_cover_the_merged_stream_once(self):
+        everything, next_cursor = load_timeline(self.patient, limit=100)
+        self.assertIsNone(next_cursor)
+        self.assertEqual(len(everything), 9)
+        self.assertEqual(everything[0]['kind'], 'treatment')
+        self.assertEqual(everything[-1]['kind'], 'diagnosis')
+
+        paged, cursor = [], None
+        while True:
+            # One keyset query per table for every page
+            with self.assertNumQueries(5):
+                entries, cursor = load_timeline(self.patient, cursor=cursor, limit=2)
+            paged.extend(entries)
+            if cursor is None:
+                break
+        self.assertEqual(paged, everything)
+
+    def test_kinds_filter(self):
+        entries, _cursor = load_timeline(self.patient, kinds=['visit', 'treatment'])
+        self.assertEqual([entry['kind'] for entry in entries], ['treatment', 'visit'])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            load_timeline(self.patient, cursor='not-a-cursor')
+
+
+class PatientTimelineAPITest(TimelineFixturesMixin, APITestCase):
+    def test_timeline_endpoint(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('patient-timeline', args=[self.patient.pk])
+        response = self.client.get(url, {'limit': 5})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 5)
+        response = self.client.get(url, {'cursor': response.data['next_cursor']})
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIsNone(response.data['next_cursor'])
+
+        response = self.client.get(url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_admin_timeline_requires_staff(self):
+        url = reverse('admin_patient_timeline', args=[self.patient.pk])
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_302_FOUND)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url, {'kinds': 'diagnosis'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['results']), 3)
+
+
+class AdminChangelistCountTest(PatientFixturesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for number in range(2, 5):
+            self._create_patient(f'0770000000{number}')
+        self.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='testpass123', role='ADMIN'
+        )
+
+    @override_settings(ADMIN_COUNT_CAP=2)
+    def test_filtered_count_is_capped(self):
+        paginator = EstimatedCountPaginator(Patient.objects.filter(is_active=True).order_by('pk'), 25)
+        self.assertEqual(paginator.count, 3)
+        self.assertTrue(paginator.is_capped)
+        self.assertEqual(paginator.count_display, '2+')
+
+    @override_settings(ADMIN_COUNT_CAP=1)
+    def test_pages_past_the_cap_load(self):
+        paginator = EstimatedCountPaginator(Patient.objects.filter(is_active=True).order_by('pk'), 1)
+        page = paginator.page(3)
+        self.assertEqual(list(page), [Patient.objects.order_by('pk')[2]])
+        self.assertTrue(page.has_next())
+        self.assertFalse(paginator.page(4).has_next())
+        self.assertEqual(paginator.count_display, '1+')
+
+        self.client.force_login(self.admin)
+        with mock.patch.object(admin.site._registry[Patient], 'list_per_page', 1):
+            response = self.client.get(reverse('admin:patients_patient_changelist'), {'is_active__exact': 1, 'p': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+
+    @mock.patch('hospital_system.admin_pagination.estimate_table_rows', return_value=5000000)
+    def test_unfiltered_count_uses_estimate(self, estimate):
+        paginator = EstimatedCountPaginator(Patient.objects.order_by('pk'), 25)
+        with self.assertNumQueries(0):
+            self.assertEqual(paginator.count, 5000000)
+        self.assertEqual(paginator.count_display, '~5000000')
+
+        paginator = EstimatedCountPaginator(Patient.objects.filter(gender='M').order_by('pk'), 25)
+        self.assertEqual((paginator.count, paginator.is_estimated), (4, False))
+        estimate.assert_called_once()
+
+    def test_search_info_reuses_changelist_count(self):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:patients_patient_changelist'), {'q': 'Patient'})
+
+        self.assertEqual(response.status_code, 200)
+        counts = [query['sql'] for query in queries if 'COUNT(' in query['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertEqual(response.context['cl'].result_count, 4)
+
+        response = self.client.get(reverse('admin:patients_visit_changelist'), {'q': 'Checkup'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['search_info'], 'تم العثور على 0 نتيجة للبحث عن "Checkup"')
+
+
+class DoctorListFilterTest(PatientFixturesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='testpass123', role='ADMIN'
+        )
+        other_user = User.objects.create_user(
+            email='doctor2@example.com', username='doctor2', password='testpass123',
+            first_name='Zaid', last_name='Ali', role='DOCTOR'
+        )
+        Doctor.objects.create(
+            user=other_user, center=self.doctor.center, specialization='CARDIOLOGY', license_number='LIC2'
+        )
+
+    def _filter(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return DoctorListFilter(request, {}, Patient, admin.site._registry[Patient])
+
+    def test_choices_are_cached_until_a_doctor_changes(self):
+        with self.assertNumQueries(1):
+            self.assertEqual([label for _value, label in self._filter(self.admin).lookup_choices], ['', 'Zaid Ali'])
+        with self.assertNumQueries(0):
+            self._filter(self.admin)
+
+        self.user.first_name = 'Omar'
+        self.user.save()
+        self.assertEqual([label for _value, label in self._filter(self.admin).lookup_choices], ['Omar', 'Zaid Ali'])
+
+    def test_choices_are_scoped_by_role(self):
+        self.assertEqual(self._filter(self.user).lookup_choices, [(str(self.doctor.pk), '')])
+
+    @override_settings(ADMIN_FILTER_AUTOCOMPLETE_THRESHOLD=1)
+    def test_switches_to_autocomplete(self):
+        list_filter = self._filter(self.admin)
+        self.assertTrue(list_filter.autocomplete)
+        self.assertEqual(list_filter.template, 'admin/filters/autocomplete_filter.html')
+        self.assertEqual(list_filter.lookup_choices, [])
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:patients_patient_changelist'), {'doctor': self.doctor.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'autocomplete-filter')
+
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'patients', 'model_name': 'patient', 'field_name': 'doctor', 'term': 'Zaid'
+        })
+        results = response.json()['results']
+        self.assertEqual([result['id'] for result in results], [str(Doctor.objects.get(license_number='LIC2').pk)])
+
+
+class AdminCellRenderingTest(PatientFixturesMixin, TestCase):
+    def test_cell_templates_escape_arguments(self):
+        badges = BadgeSet(CellTemplate('<b style="color: {}">{}</b>'), {'OK': ('green', 'Fine')})
+        self.assertEqual(badges.render('OK'), '<b style="color: green">Fine</b>')
+        self.assertEqual(badges.render('<x>'), '<b style="color: #6b7280">&lt;x&gt;</b>')
+
+    def test_reversed_url_matches_reverse(self):
+        url = ReversedURL('admin_patient_profile')
+        self.assertEqual(url(42), reverse('admin_patient_profile', args=[42]))
+        self.assertEqual(url(7), reverse('admin_patient_profile', args=[7]))
+
+    @mock.patch('hospital_system.admin_rendering.timezone')
+    def test_changelist_reads_the_date_once(self, mocked_timezone):
+        mocked_timezone.localdate.return_value = date(2024, 4, 30)
+        self._create_patient('07700000002')
+        admin_user = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='testpass123', role='ADMIN'
+        )
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:patients_patient_changelist'))
+
+        self.assertContains(response, '63 سنة', count=2)
+        self.assertContains(response, reverse('admin_patient_profile', args=[self.patient.pk]))
+        mocked_timezone.localdate.assert_called_once()
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_admin_render', iterations=2, stdout=out)
+        self.assertIn('1 rows, 2 renders', out.getvalue())
+        self.assertFalse(User.objects.filter(username='admin-benchmark').exists())
+
+
+class RoleScopeTest(PatientFixturesMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self._create_test(self.patient)
+        city = City.objects.create(name='BAGHDAD', state='Baghdad', country='Iraq')
+        other_center = Center.objects.create(
+            name='Baghdad Center', city=city, address='Baghdad', phone_number='+9647700000001'
+        )
+        other_user = User.objects.create_user(
+            email='doctor2@example.com', username='doctor2', password='testpass123', role='DOCTOR'
+        )
+        other_doctor = Doctor.objects.create(
+            user=other_user, center=other_center, specialization='CARDIOLOGY', license_number='LIC2'
+        )
+        self.other_patient = Patient.objects.create(
+            user=other_user, doctor=other_doctor, patient_name='Other', patient_id='07700000002',
+            date_of_birth=date(1970, 1, 1), gender='F', address='Baghdad',
+            emergency_contact_name='Contact', emergency_contact_phone='07700000099'
+        )
+        self._create_test(self.other_patient)
+        self.staff_user = User.objects.create_user(
+            email='staff@example.com', username='staff', password='testpass123', role='STAFF'
+        )
+        Staff.objects.create(
+            user=self.staff_user, center=self.doctor.center, department='RECEPTION', employee_id='EMP1'
+        )
+
+    def _visible(self, model, user):
+        return list(model.objects.for_user(user).values_list('pk', flat=True))
+
+    def test_scopes_by_role(self):
+        admin_user = User.objects.create_user(
+            email='admin@example.com', username='admin', password='testpass123', role='ADMIN'
+        )
+        patient_user = User.objects.create_user(
+            email='patient@example.com', username='patient', password='testpass123', role='PATIENT'
+        )
+        self.assertEqual(len(self._visible(Patient, admin_user)), 2)
+        self.assertEqual(self._visible(Patient, self.user), [self.patient.pk])
+        self.assertEqual(self._visible(Patient, self.staff_user), [self.patient.pk])
+        self.assertEqual(self._visible(Test, self.staff_user), list(self.patient.tests.values_list('pk', flat=True)))
+        self.assertEqual(self._visible(Patient, patient_user), [])
+
+    def test_scope_is_resolved_once_per_user_object(self):
+        with self.assertNumQueries(1):
+            for model in (Patient, PatientDisease, Test, Treatment, Surgery, Visit):
+                model.objects.for_user(self.staff_user)
+        with self.assertNumQueries(0):
+            Test.objects.for_user(self.staff_user)
+
+    def test_predicates_use_foreign_key_ids(self):
+        self.assertNotIn('JOIN', str(Patient.objects.for_user(self.user).query))
+        self.assertNotIn('JOIN', str(Visit.objects.for_user(self.staff_user).query))
+        sql = str(Test.objects.for_user(self.user).query)
+        self.assertEqual(sql.count('JOIN'), 1)
+        self.assertNotIn('accounts_user', sql)
+
+    def test_api_and_admin_share_the_scope(self):
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get(reverse('test-list'))
+        self.assertEqual([row['id'] for row in response.data['results']], [self._visible(Test, self.staff_user)[0]])
+
+        self.user.is_staff = True
+        self.user.save()
+        self.user.user_permissions.add(Permission.objects.get(codename='view_test'))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin:patients_test_changelist'))
+        self.assertEqual([test.patient_id for test in response.context['cl'].result_list], [self.patient.pk])
+
+    def test_explain_command(self):
+        out = StringIO()
+        call_command('explain_scopes', iterations=1, stdout=out)
+        self.assertIn('DOCTOR (doctor): scope doctors, 1 ids, resolved in 1 queries', out.getvalue())
+        self.assertNotIn('full scan', out.getvalue())
+
+
+class VisitSearchTest(PatientFixturesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.first_name, self.user.last_name = 'Omar', 'Saleh'
+        self.user.save()
+        self.chest = self._create_visit(self.patient, 'Chest pain on exertion', diagnosis='Angina')
+        self.headache = self._create_visit(self.patient, 'Headache', diagnosis='Migraine, chest clear')
+
+    def _create_visit(self, patient, complaint, **fields):
+        return Visit.objects.create(
+            patient=patient, doctor=self.doctor, visit_date=timezone.now(), chief_complaint=complaint, **fields
+        )
+
+    def test_documents_follow_visits_patients_and_doctors(self):
+        self.assertIn('Omar', self.chest.search_document.document)
+        self.assertIn('07700000001', self.chest.search_document.document)
+
+        self.patient.patient_name = 'Karim Hassan'
+        self.patient.save()
+        self.user.last_name = 'Jabbar'
+        self.user.save()
+        self.assertCountEqual(search_visit_ids('karim jabbar'), [self.headache.pk, self.chest.pk])
+
+        self.chest.delete()
+        self.assertEqual(search_visit_ids('angina'), [])
+
+    def test_search_is_ranked_and_scoped(self):
+        self.assertEqual(search_visit_ids('chest')[0], self.chest.pk)
+        self.assertEqual(search_visit_ids('mi'), [self.headache.pk])
+
+        other = self._create_patient('07700000002')
+        other_visit = self._create_visit(other, 'Chest pain')
+        visits = Visit.objects.filter(patient=other)
+        self.assertEqual(search_visit_ids('chest', visits=visits), [other_visit.pk])
+        self.assertEqual(list(search_visits(Visit.objects.all(), 'nothing like this')), [])
+
+    def test_admin_search_uses_the_index(self):
+        admin_user = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='testpass123', role='ADMIN'
+        )
+        self.client.force_login(admin_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:patients_visit_changelist'), {'q': 'chest'})
+
+        self.assertEqual(list(response.context['cl'].result_list), [self.chest, self.headache])
+        self.assertFalse([query for query in queries if 'DISTINCT' in query['sql']])
+        self.assertTrue([query for query in queries if 'visit_search_fts' in query['sql']])
+
+    def test_rebuild_command(self):
+        VisitSearchDocument.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_visit_search', stdout=out)
+        self.assertIn('Rebuilt 2 visit search documents', out.getvalue())
+        self.assertEqual(search_visit_ids('angina'), [self.chest.pk])
+
+
+@override_settings(CONDITIONAL_GET_ENABLED=True)
+class ConditionalGetTest(PatientFixturesMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.client.force_authenticate(user=self.user)
+
+    def _get(self, url, etag=None):
+        if etag is None:
+            return self.client.get(url)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_list_is_not_modified_without_queries(self):
+        url = reverse('patient-list')
+        etag = self._get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self._get(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        # Other query strings are other representations
+        self.assertNotEqual(self.client.get(url, {'mobile': 'true'})['ETag'], etag)
+
+        # A new test changes the patient's counts
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_test(self.patient)
+        self.assertEqual(self._get(url, etag).status_code, status.HTTP_200_OK)
+
+    def test_unchanged_detail_is_not_modified(self):
+        url = reverse('patient-detail', args=[self.patient.pk])
+        etag = self._get(url)['ETag']
+        with mock.patch('apps.patients.views.PatientSerializer.to_representation') as serialize:
+            response = self._get(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        serialize.assert_not_called()
+
+        self.patient.address = 'Zubair'
+        self.patient.save()
+        response = self._get(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['address'], 'Zubair')
+
+    def test_child_collections_change_the_parent_etag(self):
+        treatment = Treatment.objects.create(
+            patient=self.patient, disease=self.disease, treatment_name='Metformin course',
+            description='Daily', start_date=date(2024, 1, 1)
+        )
+        medicine = Medicine.objects.create(name='Metformin', dosage_form='tablet', strength='500mg', manufacturer='Acme')
+        url = reverse('treatment-detail', args=[treatment.pk])
+        etag = self._get(url)['ETag']
+        self.assertEqual(self._get(url, etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TreatmentMedicine.objects.create(
+                treatment=treatment, medicine=medicine, dosage='500mg', frequency='daily', duration_days=30
+            )
+        response = self._get(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['medicines']), 1)
+
+    def test_admin_bulk_actions_change_etags(self):
+        test = self._create_test(self.patient)
+        list_url, detail_url = reverse('test-list'), reverse('test-detail', args=[test.pk])
+        list_etag, detail_etag = self._get(list_url)['ETag'], self._get(detail_url)['ETag']
+
+        test_admin = admin.site._registry[Test]
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(test_admin, 'message_user'):
+            test_admin.mark_as_completed(RequestFactory().post('/'), Test.objects.filter(pk=test.pk))
+
+        self.assertEqual(self._get(list_url, list_etag).status_code, status.HTTP_200_OK)
+        response = self._get(detail_url, detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'COMPLETED')
+
+    @override_settings(CONDITIONAL_GET_ENABLED=False)
+    def test_disabled_without_a_shared_cache(self):
+        response = self._get(reverse('patient-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', response)
+
+    def test_scopes_have_their_own_list_etags(self):
+        url = reverse('test-list')
+        etag = self._get(url)['ETag']
+        admin_user = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='testpass123', role='ADMIN'
+        )
+        self.client.force_authenticate(user=admin_user)
+        self.assertEqual(self._get(url, etag).status_code, status.HTTP_200_OK)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncTest(PatientFixturesMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.test = self._create_test(self.patient)
+        self.client.force_authenticate(user=self.user)
+
+    def _sync(self, cursor=None, **params):
+        if cursor:
+            params['cursor'] = cursor
+        response = self.client.get(reverse('patient_sync'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def _ids(self, records):
+        return [record['id'] for record in records]
+
+    def test_changes_since_the_cursor(self):
+        first = self._sync()
+        self.assertEqual(self._ids(first['changes']['patients']['created']), [self.patient.pk])
+        self.assertEqual(self._ids(first['changes']['tests']['created']), [self.test.pk])
+        self.assertFalse(first['has_more'])
+
+        self.assertFalse(any(any(change.values()) for change in self._sync(first['cursor'])['changes'].values()))
+
+        self.test.status = 'COMPLETED'
+        self.test.save()
+        new_test = self._create_test(self.patient)
+        doomed = self._create_test(self.patient)
+        doomed_id = doomed.pk
+        doomed.delete()
+
+        changes = self._sync(first['cursor'])['changes']['tests']
+        self.assertEqual(self._ids(changes['updated']), [self.test.pk])
+        self.assertEqual(self._ids(changes['created']), [new_test.pk])
+        self.assertEqual(changes['deleted'], [doomed_id])
+
+    def test_medicine_changes_resync_the_treatment(self):
+        treatment = Treatment.objects.create(
+            patient=self.patient, disease=self.disease, treatment_name='Metformin course',
+            description='Daily', start_date=date(2024, 1, 1)
+        )
+        medicine = Medicine.objects.create(name='Metformin', dosage_form='tablet', strength='500mg', manufacturer='Acme')
+        cursor = self._sync()['cursor']
+
+        response = self.client.post(reverse('treatment-add-medicine', args=[treatment.pk]), {
+            'medicine': medicine.pk, 'dosage': '500mg', 'frequency': 'daily', 'duration_days': 30
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        page = self._sync(cursor)
+        [updated] = page['changes']['treatments']['updated']
+        self.assertEqual((updated['id'], len(updated['medicines'])), (treatment.pk, 1))
+
+        TreatmentMedicine.objects.get(treatment=treatment).delete()
+        [updated] = self._sync(page['cursor'])['changes']['treatments']['updated']
+        self.assertEqual(updated['medicines'], [])
+
+    def test_pages(self):
+        for _i in range(3):
+            self._create_test(self.patient)
+        seen, cursor, has_more = [], None, True
+        while has_more:
+            page = self._sync(cursor, limit=1)
+            seen += self._ids(page['changes']['tests']['created'] + page['changes']['tests']['updated'])
+            cursor, has_more = page['cursor'], page['has_more']
+        self.assertEqual(sorted(seen), sorted(Test.objects.values_list('pk', flat=True)))
+
+    def test_scope_and_moves(self):
+        other_user = User.objects.create_user(
+            email='doctor2@example.com', username='doctor2', password='testpass123', role='DOCTOR'
+        )
+        other_doctor = Doctor.objects.create(
+            user=other_user, center=self.doctor.center, specialization='CARDIOLOGY', license_number='LIC2'
+        )
+        other_patient = self._create_patient('07700000002')
+        other_patient.doctor = other_doctor
+        other_patient.save()
+        other_test = self._create_test(other_patient)
+
+        cursor = self._sync()['cursor']
+        self.client.force_authenticate(user=other_user)
+        other_cursor = self._sync()['cursor']
+
+        # The patient moves back, with its test
+        other_patient.doctor = self.doctor
+        other_patient.save()
+        self.assertEqual(self._sync(other_cursor)['changes']['patients']['deleted'], [other_patient.pk])
+        self.client.force_authenticate(user=self.user)
+        changes = self._sync(cursor)['changes']
+        self.assertEqual(self._ids(changes['patients']['updated']), [other_patient.pk])
+        self.assertEqual(self._ids(changes['tests']['updated']), [other_test.pk])
+
+    def test_cascaded_deletes_leave_tombstones(self):
+        cursor = self._sync()['cursor']
+        patient_id, test_id = self.patient.pk, self.test.pk
+        self.patient.delete()
+        changes = self._sync(cursor)['changes']
+        self.assertEqual(changes['patients']['deleted'], [patient_id])
+        self.assertEqual(changes['tests']['deleted'], [test_id])
+        self.assertEqual(DeletionLog.objects.get(entity='tests').doctor_id, self.doctor.pk)
+
+    def test_expired_and_invalid_cursors(self):
+        cursor = encode_cursor({'deleted': (timezone.now() - timedelta(days=365), 0)})
+        result = self._sync(cursor)
+        self.assertTrue(result['reset'])
+        self.assertEqual(self._ids(result['changes']['patients']['created']), [self.patient.pk])
+
+        naive = encode_cursor({'patients': (datetime(2024, 1, 1), 1)})
+        for cursor in ('garbage', naive):
+            response = self.client.get(reverse('patient_sync'), {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SparseFieldsetTest(PatientFixturesMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.user)
+        self.patient.medical_history = 'Long history'
+        self.patient.save()
+
+    def _get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, [query['sql'] for query in queries.captured_queries]
+
+    def test_fields_prune_payload_and_columns(self):
+        data, queries = self._get(reverse('patient-list'), fields='id,patient_name,doctor_name,tests_count')
+        self.assertEqual(
+            data['results'],
+            [{'id': self.patient.pk, 'patient_name': self.patient.patient_name,
+              'doctor_name': self.user.get_full_name(), 'tests_count': 0}]
+        )
+        sql = next(query for query in queries if query.startswith('SELECT "patients"."id"'))
+        self.assertNotIn('"medical_history"', sql)
+        self.assertNotIn('"hospital_centers"', sql)
+        self.assertIn('"patient_summaries"."tests_total"', sql)
+
+    def test_exclude_drops_columns_and_nested_objects(self):
+        url = reverse('patient-detail', args=[self.patient.pk])
+        data, queries = self._get(url, exclude='user,medical_history,allergies')
+        self.assertNotIn('user', data)
+        self.assertNotIn('medical_history', data)
+        self.assertEqual(data['address'], 'Basra')
+        sql = next(query for query in queries if query.startswith('SELECT "patients"."id"'))
+        self.assertNotIn('"medical_history"', sql)
+        self.assertNotIn('"accounts_user"."email"', sql)
+        # Without parameters the full representation is unchanged
+        self.assertEqual(self._get(url)[0]['medical_history'], 'Long history')
+
+    def test_expand_inlines_related_objects(self):
+        test = self._create_test(self.patient)
+        url = reverse('test-detail', args=[test.pk])
+        self.assertEqual(self._get(url)[0]['disease'], self.disease.pk)
+        data, _queries = self._get(url, fields='id,test_name', expand='disease')
+        self.assertEqual(set(data), {'id', 'test_name', 'disease'})
+        self.assertEqual(data['disease']['name'], 'Diabetes')
+
+    def test_unrequested_prefetches_are_skipped(self):
+        treatment = Treatment.objects.create(
+            patient=self.patient, disease=self.disease, treatment_name='Metformin course',
+            description='Daily', start_date=date(2024, 1, 1)
+        )
+        medicine = Medicine.objects.create(name='Metformin', dosage_form='tablet', strength='500mg', manufacturer='Acme')
+        TreatmentMedicine.objects.create(
+            treatment=treatment, medicine=medicine, dosage='500mg', frequency='daily', duration_days=30
+        )
+        url = reverse('treatment-list')
+        data, queries = self._get(url, fields='id,medicines')
+        self.assertEqual(data['results'][0]['medicines'][0]['medicine_name'], 'Metformin')
+        self.assertTrue(any('"treatment_medicines"' in query for query in queries))
+        _data, queries = self._get(url, fields='id,treatment_name')
+        self.assertFalse(any('"treatment_medicines"' in query or '"medicines"' in query for query in queries))
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(reverse('patient-list'), {'fields': 'id,salary'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('patient-list'), {'expand': 'user'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ValuesPlanTest(PatientFixturesMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.user)
+        self.test = self._create_test(self.patient)
+        self.treatment = Treatment.objects.create(
+            patient=self.patient, disease=self.disease, treatment_name='Metformin course',
+            description='Daily', start_date=date(2024, 1, 1)
+        )
+        for name in ('Metformin', 'Insulin'):
+            TreatmentMedicine.objects.create(
+                treatment=self.treatment, dosage='500mg', frequency='daily', duration_days=30,
+                medicine=Medicine.objects.create(name=name, dosage_form='tablet', strength='500mg', manufacturer='Acme')
+            )
+        Treatment.objects.create(
+            patient=self.patient, disease=self.disease, treatment_name='Diet', description='Low sugar',
+            start_date=date(2024, 2, 1)
+        )
+
+    def _serialized(self, serializer_class, queryset):
+        return [dict(record) for record in serializer_class(queryset, many=True).data]
+
+    def test_lists_match_the_model_serializer(self):
+        response = self.client.get(reverse('test-list'))
+        self.assertEqual(response.data['results'], self._serialized(TestSerializer, Test.objects.all()))
+        self.assertEqual(list(response.data['results'][0]), list(TestSerializer().fields))
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('treatment-list'))
+        expected = self._serialized(TreatmentSerializer, Treatment.objects.order_by('-start_date'))
+        self.assertEqual(response.data['results'], expected)
+        self.assertEqual(len(response.data['results'][1]['medicines']), 2)
+        self.assertEqual(response.data['results'][0]['medicines'], [])
+
+    def test_only_model_paths_have_a_plan(self):
+        self.assertIsNotNone(build_plan(TreatmentSerializer()))
+        self.assertIsNone(build_plan(PatientSerializer()))
+
+        response = self.client.get(reverse('test-list'), {'fields': 'id,patient_name', 'expand': 'disease'})
+        self.assertEqual(
+            response.data['results'],
+            [{'id': self.test.pk, 'patient_name': self.user.get_full_name(),
+              'disease': dict(DiseaseSerializer(self.disease).data)}]
+        )
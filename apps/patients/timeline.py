@@ -0,0 +1,147 @@
+"""
+Patient timeline - visits, tests, treatments, surgeries and diagnoses of a
+patient as one stream, newest first, paginated with a keyset cursor.
+
+Each page runs one indexed (patient, date) query per table, each limited to the
+page size, and merges their results with a k-way heap merge. The cursor is the
+(timestamp, kind, id) key of the last entry returned, so pages stay stable
+while new rows are added and never need an OFFSET.
+"""
+import base64
+import binascii
+import heapq
+import json
+from datetime import datetime, time
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from .models import PatientDisease, Test, Treatment, Surgery, Visit
+
+DEFAULT_TIMELINE_LIMIT = 20
+MAX_TIMELINE_LIMIT = 100
+
+
+def _diagnosis_entry(row):
+    return row.disease.name, row.notes
+
+
+def _test_entry(row):
+    return row.test_name, f'{row.get_test_type_display()} - {row.disease.name}'
+
+
+def _treatment_entry(row):
+    return row.treatment_name, row.disease.name
+
+
+def _surgery_entry(row):
+    return row.surgery_name, row.surgeon_name
+
+
+def _visit_entry(row):
+    return row.get_visit_type_display(), f'{row.doctor.user.get_full_name()} - {row.chief_complaint}'
+
+
+# kind -> (model, date field, related rows to join, (title, details) of a row)
+TIMELINE_SOURCES = {
+    'diagnosis': (PatientDisease, 'diagnosed_date', ['disease'], _diagnosis_entry),
+    'surgery': (Surgery, 'scheduled_date', [], _surgery_entry),
+    'test': (Test, 'test_date', ['disease'], _test_entry),
+    'treatment': (Treatment, 'start_date', ['disease'], _treatment_entry),
+    'visit': (Visit, 'visit_date', ['doctor__user'], _visit_entry),
+}
+
+
+def _as_datetime(value):
+    """Date fields sort at the start of their local day"""
+    if isinstance(value, datetime):
+        return value
+    return timezone.make_aware(datetime.combine(value, time.min))
+
+
+def encode_cursor(key):
+    timestamp, kind, pk = key
+    payload = json.dumps([timestamp.isoformat(), kind, pk])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(timestamp, kind, id) of a cursor, ValueError if it was not produced by encode_cursor"""
+    try:
+        timestamp, kind, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp = datetime.fromisoformat(timestamp)
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if timezone.is_naive(timestamp) or kind not in TIMELINE_SOURCES or not isinstance(pk, int):
+        raise ValueError('Invalid cursor')
+    return timestamp, kind, pk
+
+
+def _after(kind, field, is_date, cursor):
+    """Rows of one source that sort after the cursor in (timestamp, kind, id) descending order"""
+    timestamp, cursor_kind, cursor_pk = cursor
+    if kind < cursor_kind:
+        tie = Q()
+    elif kind == cursor_kind:
+        tie = Q(pk__lt=cursor_pk)
+    else:
+        tie = None
+
+    if is_date:
+        day = timezone.localtime(timestamp).date()
+        if _as_datetime(day) != timestamp:
+            # The cursor falls inside the day, after the day's date rows
+            return Q(**{f'{field}__lte': day})
+        boundary = day
+    else:
+        boundary = timestamp
+
+    condition = Q(**{f'{field}__lt': boundary})
+    if tie is not None:
+        condition |= Q(**{field: boundary}) & tie
+    return condition
+
+
+def _source_rows(patient, kind, cursor, limit):
+    model, field, related, _describe = TIMELINE_SOURCES[kind]
+    is_date = model._meta.get_field(field).get_internal_type() == 'DateField'
+    queryset = model.objects.filter(patient=patient).select_related(*related)
+    if cursor:
+        queryset = queryset.filter(_after(kind, field, is_date, cursor))
+    for row in queryset.order_by(f'-{field}', '-pk')[:limit]:
+        yield (_as_datetime(getattr(row, field)), kind, row.pk), row
+
+
+def _serialize(key, row):
+    timestamp, kind, pk = key
+    title, details = TIMELINE_SOURCES[kind][3](row)
+    value = getattr(row, TIMELINE_SOURCES[kind][1])
+    return {
+        'kind': kind,
+        'id': pk,
+        'timestamp': timezone.localtime(timestamp).isoformat(),
+        'all_day': not isinstance(value, datetime),
+        'title': title,
+        'details': Truncator(details).words(20),
+        'status': row.status,
+        'status_display': row.get_status_display(),
+    }
+
+
+def load_timeline(patient, cursor=None, limit=DEFAULT_TIMELINE_LIMIT, kinds=None):
+    """
+    One page of a patient's timeline, as (entries, next cursor). The next cursor
+    is None on the last page. Raises ValueError for an invalid cursor.
+    """
+    limit = max(1, min(limit, MAX_TIMELINE_LIMIT))
+    position = decode_cursor(cursor) if cursor else None
+    kinds = [kind for kind in TIMELINE_SOURCES if not kinds or kind in kinds]
+
+    # No source can contribute more than limit + 1 rows to the page
+    streams = [_source_rows(patient, kind, position, limit + 1) for kind in kinds]
+    merged = heapq.merge(*streams, key=lambda item: item[0], reverse=True)
+    page = [item for _index, item in zip(range(limit + 1), merged)]
+
+    next_cursor = encode_cursor(page[limit - 1][0]) if len(page) > limit else None
+    return [_serialize(key, row) for key, row in page[:limit]], next_cursor
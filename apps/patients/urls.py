@@ -11,6 +11,8 @@ router.register(r'surgeries', views.SurgeryViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    # Delta sync for offline clients
+    path('sync/', views.SyncView.as_view(), name='patient_sync'),
     # AJAX endpoints for admin form filtering
     path('admin/get-centers-by-city/', views.get_centers_by_city, name='get_centers_by_city'),
     path('admin/get-doctors-by-center/', views.get_doctors_by_center, name='get_doctors_by_center'),
@@ -2,6 +2,7 @@ from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Count, Q
 from django.http import JsonResponse
@@ -14,22 +15,29 @@ from django.views.generic import DetailView
 from django.urls import reverse
 from django.utils.html import format_html
 from .models import Patient, PatientDisease, Test, Treatment, TreatmentMedicine, Surgery
+from .summary import get_summary
+from .profile import PROFILE_SECTIONS, load_patient_profile
+from .timeline import TIMELINE_SOURCES, DEFAULT_TIMELINE_LIMIT, load_timeline
+from .sync import sync_changes
 from .serializers import (
     PatientSerializer, PatientCreateSerializer, PatientSummarySerializer,
     PatientDiseaseSerializer, TestSerializer, TreatmentSerializer,
-    TreatmentMedicineSerializer, SurgerySerializer
+    TreatmentMedicineSerializer, SurgerySerializer, PatientSummaryCountsSerializer
 )
 from apps.hospital.permissions import IsOwnerOrDoctorOrAdmin, IsPatientOrDoctorOrAdmin
 from apps.hospital.models import City, Center, Doctor
+from hospital_system.conditional import ConditionalGetMixin
+from hospital_system.fastpath import ValuesListMixin
+from hospital_system.fieldsets import FieldsetProjectionMixin
 
 
-class PatientViewSet(viewsets.ModelViewSet):
+class PatientViewSet(ConditionalGetMixin, FieldsetProjectionMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing patients
     """
     queryset = Patient.objects.select_related(
-        'user', 'doctor__user', 'doctor__center__city'
-    ).prefetch_related('patient_diseases__disease', 'tests', 'treatments', 'surgeries')
+        'user', 'doctor__user', 'doctor__center__city', 'summary'
+    )
     serializer_class = PatientSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrDoctorOrAdmin]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -37,6 +45,11 @@ class PatientViewSet(viewsets.ModelViewSet):
     filterset_fields = ['doctor', 'gender', 'blood_group', 'is_active']
     ordering_fields = ['user__first_name', 'created_at', 'date_of_birth']
     ordering = ['-created_at']
+    etag_models = ('accounts.User', 'hospital.Doctor', 'hospital.Center', 'hospital.City')
+    # The counts come from the summary, which changes with the patient's rows
+    etag_fields = ('updated_at', 'summary.updated_at')
+    etag_list_models = ('patients.PatientDisease', 'patients.Test', 'patients.Treatment',
+                        'patients.Surgery', 'patients.Visit')
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -49,15 +62,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         """
         Filter patients based on user role
         """
-        user = self.request.user
-        if user.is_admin:
-            return self.queryset
-        elif user.is_doctor:
-            return self.queryset.filter(doctor__user=user)
-        elif user.is_patient:
-            return self.queryset.filter(user=user)
-        else:
-            return self.queryset.none()
+        return self.queryset.for_user(self.request.user)
     
     @action(detail=True, methods=['get'])
     def diseases(self, request, pk=None):
@@ -91,12 +96,29 @@ class PatientViewSet(viewsets.ModelViewSet):
         serializer = SurgerySerializer(surgeries, many=True)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def summary(self, request, pk=None):
+        """Get the materialized counts and key dates of a patient"""
+        patient = self.get_object()
+        serializer = PatientSummaryCountsSerializer(get_summary(patient))
+        return Response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        """Get the patient's visits, tests, treatments, surgeries and diagnoses, newest first"""
+        patient = self.get_object()
+        try:
+            entries, next_cursor = timeline_page(patient, request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': entries, 'next_cursor': next_cursor})
+    
     @action(detail=False, methods=['get'])
     def by_doctor(self, request):
         """Get patients by doctor"""
         doctor_id = request.query_params.get('doctor_id')
         if doctor_id:
-            patients = self.queryset.filter(doctor_id=doctor_id)
+            patients = self.get_queryset().filter(doctor_id=doctor_id)
         else:
             patients = self.queryset.none()
         
@@ -122,7 +144,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         return Response(stats)
 
 
-class PatientDiseaseViewSet(viewsets.ModelViewSet):
+class PatientDiseaseViewSet(ConditionalGetMixin, FieldsetProjectionMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing patient diseases
     """
@@ -134,23 +156,16 @@ class PatientDiseaseViewSet(viewsets.ModelViewSet):
     filterset_fields = ['patient', 'disease', 'status']
     ordering_fields = ['diagnosed_date', 'created_at']
     ordering = ['-diagnosed_date']
+    etag_models = ('accounts.User', 'hospital.Disease', 'patients.Patient')
     
     def get_queryset(self):
         """
         Filter patient diseases based on user role
         """
-        user = self.request.user
-        if user.is_admin:
-            return self.queryset
-        elif user.is_doctor:
-            return self.queryset.filter(patient__doctor__user=user)
-        elif user.is_patient:
-            return self.queryset.filter(patient__user=user)
-        else:
-            return self.queryset.none()
+        return self.queryset.for_user(self.request.user)
 
 
-class TestViewSet(viewsets.ModelViewSet):
+class TestViewSet(ConditionalGetMixin, FieldsetProjectionMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing tests
     """
@@ -162,29 +177,22 @@ class TestViewSet(viewsets.ModelViewSet):
     filterset_fields = ['patient', 'disease', 'test_type', 'status']
     ordering_fields = ['test_date', 'created_at']
     ordering = ['-test_date']
+    etag_models = ('accounts.User', 'hospital.Disease', 'patients.Patient')
     
     def get_queryset(self):
         """
         Filter tests based on user role
         """
-        user = self.request.user
-        if user.is_admin:
-            return self.queryset
-        elif user.is_doctor:
-            return self.queryset.filter(patient__doctor__user=user)
-        elif user.is_patient:
-            return self.queryset.filter(patient__user=user)
-        else:
-            return self.queryset.none()
+        return self.queryset.for_user(self.request.user)
     
     @action(detail=False, methods=['get'])
     def by_type(self, request):
         """Get tests grouped by type"""
         test_type = request.query_params.get('test_type')
         if test_type:
-            tests = self.queryset.filter(test_type=test_type)
+            tests = self.get_queryset().filter(test_type=test_type)
         else:
-            tests = self.queryset.all()
+            tests = self.get_queryset().all()
         
         serializer = TestSerializer(tests, many=True)
         return Response(serializer.data)
@@ -192,12 +200,12 @@ class TestViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def pending(self, request):
         """Get pending tests"""
-        tests = self.queryset.filter(status='PENDING')
+        tests = self.get_queryset().filter(status='PENDING')
         serializer = TestSerializer(tests, many=True)
         return Response(serializer.data)
 
 
-class TreatmentViewSet(viewsets.ModelViewSet):
+class TreatmentViewSet(ConditionalGetMixin, FieldsetProjectionMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing treatments
     """
@@ -209,25 +217,20 @@ class TreatmentViewSet(viewsets.ModelViewSet):
     filterset_fields = ['patient', 'disease', 'status']
     ordering_fields = ['start_date', 'created_at']
     ordering = ['-start_date']
+    etag_models = ('accounts.User', 'hospital.Disease', 'hospital.Medicine', 'patients.Patient')
+    etag_child_models = ('patients.TreatmentMedicine',)
+    etag_list_models = ('patients.TreatmentMedicine',)
     
     def get_queryset(self):
         """
         Filter treatments based on user role
         """
-        user = self.request.user
-        if user.is_admin:
-            return self.queryset
-        elif user.is_doctor:
-            return self.queryset.filter(patient__doctor__user=user)
-        elif user.is_patient:
-            return self.queryset.filter(patient__user=user)
-        else:
-            return self.queryset.none()
+        return self.queryset.for_user(self.request.user)
     
     @action(detail=False, methods=['get'])
     def active(self, request):
         """Get active treatments"""
-        treatments = self.queryset.filter(status='ACTIVE')
+        treatments = self.get_queryset().filter(status='ACTIVE')
         serializer = TreatmentSerializer(treatments, many=True)
         return Response(serializer.data)
     
@@ -245,7 +248,7 @@ class TreatmentViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class SurgeryViewSet(viewsets.ModelViewSet):
+class SurgeryViewSet(ConditionalGetMixin, FieldsetProjectionMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing surgeries
     """
@@ -257,26 +260,19 @@ class SurgeryViewSet(viewsets.ModelViewSet):
     filterset_fields = ['patient', 'status', 'complications']
     ordering_fields = ['scheduled_date', 'created_at']
     ordering = ['-scheduled_date']
+    etag_models = ('accounts.User', 'patients.Patient')
     
     def get_queryset(self):
         """
         Filter surgeries based on user role
         """
-        user = self.request.user
-        if user.is_admin:
-            return self.queryset
-        elif user.is_doctor:
-            return self.queryset.filter(patient__doctor__user=user)
-        elif user.is_patient:
-            return self.queryset.filter(patient__user=user)
-        else:
-            return self.queryset.none()
+        return self.queryset.for_user(self.request.user)
     
     @action(detail=False, methods=['get'])
     def upcoming(self, request):
         """Get upcoming surgeries"""
         from django.utils import timezone
-        surgeries = self.queryset.filter(
+        surgeries = self.get_queryset().filter(
             status='SCHEDULED',
             scheduled_date__gte=timezone.now()
         ).order_by('scheduled_date')
@@ -289,14 +285,39 @@ class SurgeryViewSet(viewsets.ModelViewSet):
         """Get surgeries by status"""
         status = request.query_params.get('status')
         if status:
-            surgeries = self.queryset.filter(status=status)
+            surgeries = self.get_queryset().filter(status=status)
         else:
-            surgeries = self.queryset.all()
+            surgeries = self.get_queryset().all()
         
         serializer = SurgerySerializer(surgeries, many=True)
         return Response(serializer.data)
 
 
+
+MAX_SYNC_PAGE_SIZE = 1000
+
+
+class SyncView(APIView):
+    """
+    Patients, visits, tests, treatments and surgeries of the user's scope created,
+    updated or deleted since the `cursor` of the previous sync (everything without
+    one), at most `limit` of each; call again with the new cursor while `has_more`
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 0)) or None
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit is not None:
+            limit = max(1, min(limit, MAX_SYNC_PAGE_SIZE))
+        try:
+            result = sync_changes(request.user, cursor=request.query_params.get('cursor'), limit=limit)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
 # AJAX endpoints for admin form filtering
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -356,6 +377,30 @@ def check_phone_uniqueness(request):
     return JsonResponse({'exists': False, 'message': 'رقم الهاتف غير صحيح'})
 
 
+def timeline_page(patient, params):
+    """Timeline page selected by the cursor, limit and kinds query parameters"""
+    try:
+        limit = int(params.get('limit', DEFAULT_TIMELINE_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    kinds = [kind for kind in params.get('kinds', '').split(',') if kind in TIMELINE_SOURCES]
+    return load_timeline(patient, cursor=params.get('cursor'), limit=limit, kinds=kinds)
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def patient_timeline(request, patient_id):
+    """
+    Timeline pages for the patient profile page, loaded as the user scrolls
+    """
+    patient = get_object_or_404(Patient, id=patient_id)
+    try:
+        entries, next_cursor = timeline_page(patient, request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'results': entries, 'next_cursor': next_cursor})
+
+
 @staff_member_required
 def patient_profile(request, patient_id):
     """
@@ -363,39 +408,14 @@ def patient_profile(request, patient_id):
     """
     patient = get_object_or_404(
         Patient.objects.select_related(
-            'user', 'doctor__user', 'doctor__center__city'
-        ).prefetch_related(
-            'patient_diseases__disease',
-            'tests__disease',
-            'treatments__disease',
-            'treatments__treatment_medicines__medicine',
-            'surgeries'
+            'user', 'doctor__user', 'doctor__center__city', 'summary'
         ),
         id=patient_id
     )
     
-    # Get all related data
-    diseases = patient.patient_diseases.select_related('disease').order_by('-diagnosed_date')
-    tests = patient.tests.select_related('disease').order_by('-test_date')
-    treatments = patient.treatments.select_related('disease').prefetch_related('treatment_medicines__medicine').order_by('-start_date')
-    surgeries = patient.surgeries.order_by('-scheduled_date')
-    visits = patient.visits.select_related('doctor', 'doctor__user').order_by('-visit_date')
-    
-    # Statistics
-    stats = {
-        'total_diseases': diseases.count(),
-        'active_diseases': diseases.filter(status='ACTIVE').count(),
-        'total_tests': tests.count(),
-        'pending_tests': tests.filter(status='PENDING').count(),
-        'completed_tests': tests.filter(status='COMPLETED').count(),
-        'total_treatments': treatments.count(),
-        'active_treatments': treatments.filter(status='ACTIVE').count(),
-        'total_surgeries': surgeries.count(),
-        'upcoming_surgeries': surgeries.filter(status='SCHEDULED').count(),
-        'total_visits': visits.count(),
-        'completed_visits': visits.filter(status='COMPLETED').count(),
-        'scheduled_visits': visits.filter(status='SCHEDULED').count(),
-    }
+    # Each section is fetched once; stats are derived from the loaded rows
+    expand = [name for name in request.GET.get('expand', '').split(',') if name in PROFILE_SECTIONS]
+    sections, stats = load_patient_profile(patient, expand=expand)
     
     # Quick action URLs
     quick_actions = {
@@ -409,11 +429,8 @@ def patient_profile(request, patient_id):
     
     context = {
         'patient': patient,
-        'diseases': diseases,
-        'tests': tests,
-        'treatments': treatments,
-        'surgeries': surgeries,
-        'visits': visits,
+        **sections,
+        'expand': ','.join(expand),
         'stats': stats,
         'quick_actions': quick_actions,
         'title': f'ملف المريض - {patient.user.get_full_name()}',
@@ -14,6 +14,7 @@ class ReportListFilter(admin.SimpleListFilter):
             ('processing', _('قيد المعالجة')),
             ('completed', _('مكتمل')),
             ('failed', _('فشل')),
+            ('expired', _('منتهي الصلاحية')),
             ('recent', _('حديث (آخر 7 أيام)')),
         )
 
@@ -28,6 +29,8 @@ class ReportListFilter(admin.SimpleListFilter):
             return queryset.filter(status='COMPLETED')
         if self.value() == 'failed':
             return queryset.filter(status='FAILED')
+        if self.value() == 'expired':
+            return queryset.filter(status='EXPIRED')
         if self.value() == 'recent':
             return queryset.filter(created_at__gte=timezone.now() - timedelta(days=7))
 
@@ -38,7 +41,7 @@ class ReportAdmin(admin.ModelAdmin):
     list_filter = (ReportListFilter, 'report_type', 'format', 'status', 'created_at')
     search_fields = ('name', 'generated_by__first_name', 'generated_by__last_name', 'report_type')
     ordering = ('-created_at',)
-    readonly_fields = ('created_at', 'completed_at', 'file_path')
+    readonly_fields = ('created_at', 'completed_at', 'file_path', 'file_size', 'expires_at')
     list_per_page = 25
     list_max_show_all = 100
     date_hierarchy = 'created_at'
@@ -73,7 +76,7 @@ class ReportAdmin(admin.ModelAdmin):
             'fields': ('parameters',)
         }),
         (_('الملف'), {
-            'fields': ('file_path',)
+            'fields': ('file_path', 'file_size', 'expires_at')
         }),
         (_('المعلومات الإضافية'), {
             'fields': ('generated_by', 'created_at', 'completed_at'),
@@ -0,0 +1,197 @@
+"""
+Columnar exports - analytics extracts written as Parquet files with pyarrow,
+one row group at a time so whole tables are never held in memory
+"""
+import os
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from .exports import filter_by_period
+from .retention import get_reports_dir
+from apps.hospital.models import Disease
+from apps.patients.models import Patient, Test, Treatment, Surgery
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Column kinds, mapped to Arrow types by _arrow_type(). 'category' columns are
+# dictionary-encoded: a few distinct values repeated over millions of rows.
+INT = 'int'
+FLOAT = 'float'
+BOOL = 'bool'
+STRING = 'string'
+CATEGORY = 'category'
+DATE = 'date'
+TIMESTAMP = 'timestamp'
+
+# City, center and doctor dimensions joined onto every patient-level table
+PATIENT_DIMENSIONS = [
+    ('patient_pk', 'patient_id', INT),
+    ('doctor_id', 'patient__doctor_id', INT),
+    ('doctor_specialization', 'patient__doctor__specialization', CATEGORY),
+    ('center_id', 'patient__doctor__center_id', INT),
+    ('center', 'patient__doctor__center__name', CATEGORY),
+    ('city', 'patient__doctor__center__city__name', CATEGORY),
+]
+
+# Each entity exports (column, lookup, kind) triples; 'date_field' drives year/date filters
+PARQUET_SPECS = {
+    'patients': {
+        'model': Patient,
+        'date_field': 'created_at',
+        'columns': [
+            ('id', 'id', INT),
+            ('patient_id', 'patient_id', STRING),
+            ('patient_name', 'patient_name', STRING),
+            ('date_of_birth', 'date_of_birth', DATE),
+            ('gender', 'gender', CATEGORY),
+            ('blood_group', 'blood_group', CATEGORY),
+            ('is_active', 'is_active', BOOL),
+            ('doctor_id', 'doctor_id', INT),
+            ('doctor_specialization', 'doctor__specialization', CATEGORY),
+            ('doctor_consultation_fee', 'doctor__consultation_fee', FLOAT),
+            ('center_id', 'doctor__center_id', INT),
+            ('center', 'doctor__center__name', CATEGORY),
+            ('city', 'doctor__center__city__name', CATEGORY),
+            ('created_at', 'created_at', TIMESTAMP),
+            ('updated_at', 'updated_at', TIMESTAMP),
+        ],
+    },
+    'diseases': {
+        'model': Disease,
+        'date_field': 'created_at',
+        'columns': [
+            ('id', 'id', INT),
+            ('name', 'name', STRING),
+            ('category', 'category', CATEGORY),
+            ('icd_code', 'icd_code', STRING),
+            ('is_active', 'is_active', BOOL),
+            ('created_at', 'created_at', TIMESTAMP),
+            ('updated_at', 'updated_at', TIMESTAMP),
+        ],
+    },
+    'tests': {
+        'model': Test,
+        'date_field': 'test_date',
+        'columns': [
+            ('id', 'id', INT),
+            *PATIENT_DIMENSIONS,
+            ('disease_id', 'disease_id', INT),
+            ('disease_category', 'disease__category', CATEGORY),
+            ('test_name', 'test_name', STRING),
+            ('test_type', 'test_type', CATEGORY),
+            ('status', 'status', CATEGORY),
+            ('test_date', 'test_date', TIMESTAMP),
+            ('created_at', 'created_at', TIMESTAMP),
+            ('updated_at', 'updated_at', TIMESTAMP),
+        ],
+    },
+    'treatments': {
+        'model': Treatment,
+        'date_field': 'start_date',
+        'columns': [
+            ('id', 'id', INT),
+            *PATIENT_DIMENSIONS,
+            ('disease_id', 'disease_id', INT),
+            ('disease_category', 'disease__category', CATEGORY),
+            ('treatment_name', 'treatment_name', STRING),
+            ('status', 'status', CATEGORY),
+            ('start_date', 'start_date', DATE),
+            ('end_date', 'end_date', DATE),
+            ('created_at', 'created_at', TIMESTAMP),
+            ('updated_at', 'updated_at', TIMESTAMP),
+        ],
+    },
+    'surgeries': {
+        'model': Surgery,
+        'date_field': 'scheduled_date',
+        'columns': [
+            ('id', 'id', INT),
+            *PATIENT_DIMENSIONS,
+            ('surgery_name', 'surgery_name', STRING),
+            ('surgeon_name', 'surgeon_name', STRING),
+            ('status', 'status', CATEGORY),
+            ('complications', 'complications', CATEGORY),
+            ('scheduled_date', 'scheduled_date', TIMESTAMP),
+            ('actual_date', 'actual_date', TIMESTAMP),
+            ('created_at', 'created_at', TIMESTAMP),
+            ('updated_at', 'updated_at', TIMESTAMP),
+        ],
+    },
+}
+
+
+def _arrow_type(kind):
+    return {
+        INT: pa.int64(),
+        FLOAT: pa.float64(),
+        BOOL: pa.bool_(),
+        STRING: pa.string(),
+        CATEGORY: pa.dictionary(pa.int32(), pa.string()),
+        DATE: pa.date32(),
+        TIMESTAMP: pa.timestamp('us', tz='UTC'),
+    }[kind]
+
+
+def get_parquet_schema(entity):
+    """Arrow schema of an entity extract"""
+    return pa.schema([
+        pa.field(name, _arrow_type(kind)) for name, _lookup, kind in PARQUET_SPECS[entity]['columns']
+    ])
+
+
+def _build_array(values, kind):
+    if kind == CATEGORY:
+        return pa.array(values, type=pa.string()).dictionary_encode()
+    if kind == FLOAT:
+        values = [float(value) if isinstance(value, Decimal) else value for value in values]
+    return pa.array(values, type=_arrow_type(kind))
+
+
+def _write_row_group(writer, schema, columns, kinds):
+    arrays = [_build_array(values, kind) for values, kind in zip(columns, kinds)]
+    writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+def write_parquet_export(report, chunk_size=None, row_group_size=None):
+    """
+    Stream the rows of an extract into a Parquet file, one row group per
+    row_group_size rows. Returns (filepath, rows written).
+    """
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    row_group_size = row_group_size or getattr(settings, 'EXPORT_ROW_GROUP_SIZE', 50000)
+
+    params = report.parameters
+    entity = params['entity']
+    spec = PARQUET_SPECS[entity]
+    lookups = [lookup for _name, lookup, _kind in spec['columns']]
+    kinds = [kind for _name, _lookup, kind in spec['columns']]
+    schema = get_parquet_schema(entity)
+
+    queryset = filter_by_period(spec['model'].objects.all(), spec['date_field'], params)
+    rows = queryset.order_by('pk').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+    filename = f"export_{entity}_{report.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.parquet"
+    filepath = os.path.join(get_reports_dir(), filename)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+    total_rows = 0
+    columns = [[] for _lookup in lookups]
+    with pq.ParquetWriter(filepath, schema, compression='snappy') as writer:
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+            total_rows += 1
+            if len(columns[0]) >= row_group_size:
+                _write_row_group(writer, schema, columns, kinds)
+                columns = [[] for _lookup in lookups]
+        if columns[0] or not total_rows:
+            _write_row_group(writer, schema, columns, kinds)
+
+    return filepath, total_rows
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from apps.reports.retention import sweep_expired_reports, get_disk_usage
+
+
+class Command(BaseCommand):
+    help = 'Delete expired report files and purge old report rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usage', action='store_true', help='Print disk usage per report type after cleanup')
+
+    def handle(self, *args, **options):
+        stats = sweep_expired_reports()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Expired {stats['expired']} reports, deleted {stats['rows_deleted']} rows "
+                f"and {stats['orphans_deleted']} orphan files, freed {stats['bytes_freed']} bytes"
+            )
+        )
+
+        if options['usage']:
+            usage = get_disk_usage()
+            self.stdout.write(f"Total: {usage['total_bytes']} bytes in {usage['total_reports']} reports")
+            for row in usage['by_type']:
+                self.stdout.write(f"  {row['report_type']}: {row['bytes']} bytes ({row['reports']} reports)")
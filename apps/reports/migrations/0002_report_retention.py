@@ -0,0 +1,32 @@
+# Generated by Django 4.2.16 on 2026-10-19 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='تاريخ انتهاء الصلاحية'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='file_size',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='حجم الملف'),
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'في الانتظار'), ('GENERATING', 'قيد التوليد'), ('COMPLETED', 'مكتمل'), ('FAILED', 'فشل'), ('EXPIRED', 'منتهي الصلاحية')], default='PENDING', max_length=20, verbose_name='الحالة'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['status', 'expires_at'], name='reports_status_4496a0_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0002_report_retention'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='report',
+            name='report_type',
+            field=models.CharField(choices=[('PATIENT_RECORD', 'سجل المريض'), ('TEST_RESULTS', 'نتائج الفحوصات'), ('TREATMENT_SUMMARY', 'ملخص العلاج'), ('SURGERY_REPORT', 'تقرير الجراحة'), ('PATIENTS_PER_CITY', 'المرضى حسب المدينة'), ('COMMON_DISEASES', 'الأمراض الشائعة'), ('CENTER_STATISTICS', 'إحصائيات المركز'), ('DATA_EXPORT', 'تصدير البيانات')], max_length=20, verbose_name='نوع التقرير'),
+        ),
+    ]
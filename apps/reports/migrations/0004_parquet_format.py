@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0003_data_export_report_type'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='report',
+            name='format',
+            field=models.CharField(choices=[('PDF', 'PDF'), ('EXCEL', 'Excel'), ('CSV', 'CSV'), ('PARQUET', 'Parquet')], max_length=10, verbose_name='الصيغة'),
+        ),
+    ]
@@ -15,12 +15,14 @@ class Report(models.Model):
         ('PATIENTS_PER_CITY', _('المرضى حسب المدينة')),
         ('COMMON_DISEASES', _('الأمراض الشائعة')),
         ('CENTER_STATISTICS', _('إحصائيات المركز')),
+        ('DATA_EXPORT', _('تصدير البيانات')),
     ]
     
     FORMAT_CHOICES = [
         ('PDF', 'PDF'),
         ('EXCEL', 'Excel'),
         ('CSV', 'CSV'),
+        ('PARQUET', 'Parquet'),
     ]
     
     STATUS_CHOICES = [
@@ -28,6 +30,7 @@ class Report(models.Model):
         ('GENERATING', _('قيد التوليد')),
         ('COMPLETED', _('مكتمل')),
         ('FAILED', _('فشل')),
+        ('EXPIRED', _('منتهي الصلاحية')),
     ]
     
     name = models.CharField(max_length=200, verbose_name=_('اسم التقرير'))
@@ -35,10 +38,12 @@ class Report(models.Model):
     format = models.CharField(max_length=10, choices=FORMAT_CHOICES, verbose_name=_('الصيغة'))
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING', verbose_name=_('الحالة'))
     file_path = models.CharField(max_length=500, blank=True, verbose_name=_('مسار الملف'))
+    file_size = models.PositiveBigIntegerField(default=0, verbose_name=_('حجم الملف'))  # bytes on disk
     parameters = models.JSONField(default=dict, blank=True, verbose_name=_('المعاملات'))  # Store report parameters
     generated_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='generated_reports', verbose_name=_('تم توليده بواسطة'))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('تاريخ الإنشاء'))
     completed_at = models.DateTimeField(null=True, blank=True, verbose_name=_('تاريخ الإكمال'))
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name=_('تاريخ انتهاء الصلاحية'))
     
     class Meta:
         db_table = 'reports'
@@ -49,6 +54,7 @@ class Report(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['generated_by']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['status', 'expires_at']),
         ]
     
     def __str__(self):
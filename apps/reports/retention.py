@@ -0,0 +1,169 @@
+"""
+Report retention - per-type TTLs, expiry sweeping and disk-usage accounting
+"""
+import logging
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import Report
+
+logger = logging.getLogger('hospital_system')
+
+REPORTS_DIR = 'reports'
+
+
+def get_reports_dir():
+    """Absolute path of the directory that holds generated report files"""
+    return os.path.join(settings.MEDIA_ROOT, REPORTS_DIR)
+
+
+def get_retention_days(report_type):
+    """Number of days a generated file of this report type is kept"""
+    retention = getattr(settings, 'REPORT_RETENTION_DAYS', {})
+    return retention.get(report_type, retention.get('default', 30))
+
+
+def finalize_report(report, filepath):
+    """Mark a report as completed and record its size and expiry date"""
+    now = timezone.now()
+    try:
+        file_size = os.path.getsize(filepath)
+    except OSError:
+        file_size = 0
+
+    report.status = 'COMPLETED'
+    report.file_path = filepath
+    report.file_size = file_size
+    report.completed_at = now
+    report.expires_at = now + timedelta(days=get_retention_days(report.report_type))
+    report.save(update_fields=['status', 'file_path', 'file_size', 'completed_at', 'expires_at'])
+    return report
+
+
+def get_user_usage(user):
+    """Bytes currently held on disk by the reports of a user"""
+    usage = Report.objects.filter(
+        generated_by=user, status='COMPLETED'
+    ).aggregate(total=Sum('file_size'))['total']
+    return usage or 0
+
+
+def check_quota(user):
+    """
+    Return (allowed, usage, quota) for a user about to request a new report.
+    A quota of 0 disables the check.
+    """
+    quota = getattr(settings, 'REPORT_USER_QUOTA_BYTES', 0)
+    if not quota:
+        return True, None, quota
+    usage = get_user_usage(user)
+    return usage < quota, usage, quota
+
+
+def get_disk_usage(user=None):
+    """
+    Disk usage of completed reports, broken down by report type and by user.
+    Pass a user to restrict the accounting to that user's reports.
+    """
+    reports = Report.objects.filter(status='COMPLETED')
+    if user is not None:
+        reports = reports.filter(generated_by=user)
+
+    totals = reports.aggregate(total_bytes=Sum('file_size'), total_reports=Count('id'))
+    by_type = reports.values('report_type').annotate(
+        bytes=Sum('file_size'), reports=Count('id')
+    ).order_by('-bytes')
+
+    usage = {
+        'total_bytes': totals['total_bytes'] or 0,
+        'total_reports': totals['total_reports'],
+        'by_type': list(by_type),
+    }
+    if user is None:
+        usage['by_user'] = list(
+            reports.values('generated_by', 'generated_by__email').annotate(
+                bytes=Sum('file_size'), reports=Count('id')
+            ).order_by('-bytes')
+        )
+    return usage
+
+
+def _remove_file(path):
+    """Delete a report file, returning the number of bytes freed"""
+    if not path:
+        return 0
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        logger.warning(f"Could not delete report file {path}: {e}")
+        return 0
+
+
+def sweep_expired_reports(now=None, batch_size=500):
+    """
+    Delete the files of expired reports, mark their rows as EXPIRED and purge
+    rows that have been expired or failed for longer than REPORT_ROW_RETENTION_DAYS.
+    """
+    now = now or timezone.now()
+    stats = {'expired': 0, 'bytes_freed': 0, 'rows_deleted': 0, 'orphans_deleted': 0}
+
+    while True:
+        batch = list(
+            Report.objects.filter(status='COMPLETED', expires_at__lte=now)
+            .values_list('id', 'file_path')[:batch_size]
+        )
+        if not batch:
+            break
+        for _report_id, file_path in batch:
+            stats['bytes_freed'] += _remove_file(file_path)
+        stats['expired'] += Report.objects.filter(
+            id__in=[report_id for report_id, _path in batch]
+        ).update(status='EXPIRED', file_path='', file_size=0)
+
+    row_cutoff = now - timedelta(days=getattr(settings, 'REPORT_ROW_RETENTION_DAYS', 180))
+    stale_rows = Report.objects.filter(status__in=['EXPIRED', 'FAILED'], created_at__lt=row_cutoff)
+    for file_path in stale_rows.exclude(file_path='').values_list('file_path', flat=True):
+        stats['bytes_freed'] += _remove_file(file_path)
+    stats['rows_deleted'], _ = stale_rows.delete()
+
+    orphans = sweep_orphan_files(now)
+    stats['orphans_deleted'] = orphans['files']
+    stats['bytes_freed'] += orphans['bytes']
+    return stats
+
+
+def sweep_orphan_files(now=None):
+    """
+    Delete files in the reports directory that no report row references anymore,
+    e.g. files left behind by failed or deleted reports. Files younger than the
+    shortest TTL are skipped so reports being generated are never touched.
+    """
+    now = now or timezone.now()
+    reports_dir = get_reports_dir()
+    stats = {'files': 0, 'bytes': 0}
+    if not os.path.isdir(reports_dir):
+        return stats
+
+    retention_days = getattr(settings, 'REPORT_RETENTION_DAYS', {}).values()
+    min_age = timedelta(days=min(retention_days, default=1))
+    referenced = set(Report.objects.exclude(file_path='').values_list('file_path', flat=True))
+
+    with os.scandir(reports_dir) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.path in referenced:
+                continue
+            modified = datetime.fromtimestamp(entry.stat().st_mtime, tz=dt_timezone.utc)
+            if now - modified < min_age:
+                continue
+            freed = _remove_file(entry.path)
+            stats['files'] += 1
+            stats['bytes'] += freed
+    return stats
@@ -8,4 +8,4 @@ class ReportSerializer(serializers.ModelSerializer):
     class Meta:
         model = Report
         fields = '__all__'
-        read_only_fields = ('created_at', 'completed_at', 'file_path')
+        read_only_fields = ('created_at', 'completed_at', 'file_path', 'file_size', 'expires_at')
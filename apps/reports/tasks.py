@@ -3,6 +3,7 @@ from django.conf import settings
 from django.template.loader import render_to_string
 from django.http import HttpResponse
 from django.utils import timezone
+from django.db.models import Count, Q
 import os
 import json
 from datetime import datetime, timedelta
@@ -33,6 +34,9 @@ except ImportError:
             pass
 
 from .models import Report
+from .retention import finalize_report, sweep_expired_reports
+from .exports import prepare_export, run_export
+from .columnar import PYARROW_AVAILABLE, write_parquet_export
 from apps.patients.models import Patient, Test, Treatment, Surgery
 from apps.hospital.models import City, Disease
 
@@ -227,10 +231,7 @@ def generate_patient_record_pdf(report_id):
         doc.build(story)
         
         # Update report
-        report.status = 'COMPLETED'
-        report.file_path = filepath
-        report.completed_at = timezone.now()
-        report.save()
+        finalize_report(report, filepath)
         
         return f"Patient record PDF generated successfully: {filepath}"
         
@@ -339,10 +340,7 @@ def generate_test_results_pdf(report_id):
         doc.build(story)
         
         # Update report
-        report.status = 'COMPLETED'
-        report.file_path = filepath
-        report.completed_at = timezone.now()
-        report.save()
+        finalize_report(report, filepath)
         
         return f"Test results PDF generated successfully: {filepath}"
         
@@ -474,10 +472,7 @@ def generate_treatment_summary_pdf(report_id):
         doc.build(story)
         
         # Update report
-        report.status = 'COMPLETED'
-        report.file_path = filepath
-        report.completed_at = timezone.now()
-        report.save()
+        finalize_report(report, filepath)
         
         return f"Treatment summary PDF generated successfully: {filepath}"
         
@@ -564,10 +559,7 @@ def generate_surgery_report_pdf(report_id):
         doc.build(story)
         
         # Update report
-        report.status = 'COMPLETED'
-        report.file_path = filepath
-        report.completed_at = timezone.now()
-        report.save()
+        finalize_report(report, filepath)
         
         return f"Surgery report PDF generated successfully: {filepath}"
         
@@ -648,10 +640,7 @@ def generate_patients_per_city_excel(report_id):
         wb.save(filepath)
         
         # Update report
-        report.status = 'COMPLETED'
-        report.file_path = filepath
-        report.completed_at = timezone.now()
-        report.save()
+        finalize_report(report, filepath)
         
         return f"Patients per city Excel generated successfully: {filepath}"
         
@@ -680,18 +669,24 @@ def generate_common_diseases_excel(report_id):
         start_date = report.parameters.get('start_date')
         end_date = report.parameters.get('end_date')
         
-        # Filter diseases
-        diseases_query = Disease.objects.all()
+        # Count diagnoses and affected centers per disease in one grouped query
+        diagnosis_filter = Q()
         
         if center_ids:
-            diseases_query = diseases_query.filter(
-                patient_diseases__patient__doctor__center_id__in=center_ids
-            ).distinct()
+            diagnosis_filter &= Q(patient_diseases__patient__doctor__center_id__in=center_ids)
         
         if start_date and end_date:
-            diseases_query = diseases_query.filter(
-                patient_diseases__diagnosed_date__range=[start_date, end_date]
-            ).distinct()
+            diagnosis_filter &= Q(patient_diseases__diagnosed_date__range=[start_date, end_date])
+        
+        diseases_query = Disease.objects.annotate(
+            patient_count=Count('patient_diseases', filter=diagnosis_filter, distinct=True),
+            centers_affected=Count('patient_diseases__patient__doctor__center', filter=diagnosis_filter, distinct=True)
+        )
+        
+        if center_ids or (start_date and end_date):
+            diseases_query = diseases_query.filter(patient_count__gt=0)
+        
+        diseases_query = diseases_query.order_by('-patient_count', 'name')
         
         # Create Excel file
         filename = f"common_diseases_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
@@ -714,16 +709,11 @@ def generate_common_diseases_excel(report_id):
         # Data
         row = 2
         for disease in diseases_query:
-            patient_count = disease.patient_diseases.count()
-            centers_affected = disease.patient_diseases.values_list(
-                'patient__doctor__center__name', flat=True
-            ).distinct().count()
-            
             ws.cell(row=row, column=1, value=disease.name)
             ws.cell(row=row, column=2, value=disease.get_category_display())
             ws.cell(row=row, column=3, value=disease.icd_code or '')
-            ws.cell(row=row, column=4, value=patient_count)
-            ws.cell(row=row, column=5, value=centers_affected)
+            ws.cell(row=row, column=4, value=disease.patient_count)
+            ws.cell(row=row, column=5, value=disease.centers_affected)
             row += 1
         
         # Auto-adjust column widths
@@ -742,10 +732,7 @@ def generate_common_diseases_excel(report_id):
         wb.save(filepath)
         
         # Update report
-        report.status = 'COMPLETED'
-        report.file_path = filepath
-        report.completed_at = timezone.now()
-        report.save()
+        finalize_report(report, filepath)
         
         return f"Common diseases Excel generated successfully: {filepath}"
         
@@ -754,3 +741,72 @@ def generate_common_diseases_excel(report_id):
         report.status = 'FAILED'
         report.save()
         raise e
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def generate_data_export_csv(report_id):
+    """
+    Generate a gzip-compressed CSV data export. The task is acknowledged only once
+    it finishes, so an export interrupted by a worker restart is redelivered and
+    resumes from its last checkpoint.
+    """
+    try:
+        report = Report.objects.get(id=report_id)
+        if report.status == 'COMPLETED':
+            return f"Data export already completed: {report.file_path}"
+        
+        report.status = 'GENERATING'
+        report.save(update_fields=['status'])
+        
+        prepare_export(report)
+        rows = run_export(report)
+        
+        # Update report
+        filepath = report.parameters['output_path']
+        finalize_report(report, filepath)
+        
+        return f"Data export generated successfully: {filepath} ({rows} rows)"
+        
+    except Exception as e:
+        report = Report.objects.get(id=report_id)
+        report.status = 'FAILED'
+        report.save(update_fields=['status'])
+        raise e
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def generate_data_export_parquet(report_id):
+    """Generate a columnar Parquet analytics extract"""
+    try:
+        if not PYARROW_AVAILABLE:
+            report = Report.objects.get(id=report_id)
+            report.status = 'FAILED'
+            report.save()
+            return "Parquet generation requires the pyarrow package"
+        
+        report = Report.objects.get(id=report_id)
+        report.status = 'GENERATING'
+        report.save(update_fields=['status'])
+        
+        filepath, rows = write_parquet_export(report)
+        
+        # Update report
+        finalize_report(report, filepath)
+        
+        return f"Parquet export generated successfully: {filepath} ({rows} rows)"
+        
+    except Exception as e:
+        report = Report.objects.get(id=report_id)
+        report.status = 'FAILED'
+        report.save(update_fields=['status'])
+        raise e
+
+
+@shared_task
+def cleanup_expired_reports():
+    """Delete expired report files and purge old report rows (run by Celery beat)"""
+    stats = sweep_expired_reports()
+    return (
+        f"Expired {stats['expired']} reports, deleted {stats['rows_deleted']} rows "
+        f"and {stats['orphans_deleted']} orphan files, freed {stats['bytes_freed']} bytes"
+    )
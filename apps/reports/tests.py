@@ -0,0 +1,267 @@
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipIf, skipUnless
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+from django.urls import reverse
+
+from .models import Report
+from .retention import finalize_report, sweep_expired_reports, check_quota
+from . import exports
+from .exports import prepare_export, run_export
+from .columnar import PARQUET_SPECS, PYARROW_AVAILABLE
+from .tasks import generate_data_export_csv, generate_data_export_parquet
+from apps.hospital.models import City, Center, Doctor, Disease
+from apps.patients.models import Patient, Test
+
+User = get_user_model()
+
+
+class ReportRetentionTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.user = User.objects.create_user(
+            email='admin@example.com',
+            username='admin',
+            password='testpass123',
+            role='ADMIN'
+        )
+
+    def _write_report_file(self, name, size=128):
+        reports_dir = os.path.join(self.media_root, 'reports')
+        os.makedirs(reports_dir, exist_ok=True)
+        path = os.path.join(reports_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def _create_report(self, report_type='COMMON_DISEASES'):
+        return Report.objects.create(
+            name='Test Report',
+            report_type=report_type,
+            format='EXCEL',
+            generated_by=self.user,
+        )
+
+    @override_settings(REPORT_RETENTION_DAYS={'default': 30, 'COMMON_DISEASES': 7})
+    def test_finalize_records_size_and_ttl(self):
+        report = self._create_report()
+        path = self._write_report_file('common.xlsx', size=256)
+
+        finalize_report(report, path)
+        report.refresh_from_db()
+
+        self.assertEqual(report.status, 'COMPLETED')
+        self.assertEqual(report.file_size, 256)
+        self.assertAlmostEqual(
+            (report.expires_at - report.completed_at).total_seconds(),
+            timedelta(days=7).total_seconds()
+        )
+
+    def test_sweep_deletes_expired_files(self):
+        report = self._create_report()
+        path = self._write_report_file('old.xlsx', size=64)
+        finalize_report(report, path)
+        Report.objects.filter(id=report.id).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        stats = sweep_expired_reports()
+        report.refresh_from_db()
+
+        self.assertEqual(stats['expired'], 1)
+        self.assertEqual(stats['bytes_freed'], 64)
+        self.assertEqual(report.status, 'EXPIRED')
+        self.assertEqual(report.file_path, '')
+        self.assertFalse(os.path.exists(path))
+
+    @override_settings(REPORT_USER_QUOTA_BYTES=100)
+    def test_quota_blocks_user_over_limit(self):
+        report = self._create_report()
+        finalize_report(report, self._write_report_file('big.xlsx', size=150))
+
+        allowed, usage, quota = check_quota(self.user)
+        self.assertFalse(allowed)
+        self.assertEqual(usage, 150)
+
+
+class ReportQuotaAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='admin@example.com',
+            username='admin',
+            password='testpass123',
+            role='ADMIN'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    @override_settings(REPORT_USER_QUOTA_BYTES=100)
+    def test_generate_rejected_over_quota(self):
+        Report.objects.create(
+            name='Existing', report_type='COMMON_DISEASES', format='EXCEL',
+            status='COMPLETED', file_size=500, generated_by=self.user
+        )
+        response = self.client.post(reverse('report-generate-common-diseases'), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_507_INSUFFICIENT_STORAGE)
+
+    def test_usage_endpoint(self):
+        Report.objects.create(
+            name='Existing', report_type='COMMON_DISEASES', format='EXCEL',
+            status='COMPLETED', file_size=500, generated_by=self.user
+        )
+        response = self.client.get(reverse('report-usage'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_bytes'], 500)
+
+
+class ExportFixturesMixin:
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.user = User.objects.create_user(
+            email='doctor@example.com',
+            username='doctor',
+            password='testpass123',
+            role='DOCTOR'
+        )
+        city = City.objects.create(name='Test City', state='Test State', country='Test Country')
+        center = Center.objects.create(
+            name='Test Center', city=city, address='123 Test Street', phone_number='+1234567890'
+        )
+        doctor = Doctor.objects.create(
+            user=self.user, center=center, specialization='CARDIOLOGY',
+            license_number='LIC123456', experience_years=5, consultation_fee=1000.00
+        )
+        self.patient = Patient.objects.create(
+            user=self.user, doctor=doctor, patient_name='Test Patient', patient_id='07700000001',
+            date_of_birth='1990-01-01', gender='M', address='Basra',
+            emergency_contact_name='Contact', emergency_contact_phone='07700000002'
+        )
+        self.disease = Disease.objects.create(name='Test Disease', category='CHRONIC')
+        self.tests = [self._create_test(f'Test {i}') for i in range(5)]
+
+    def _create_test(self, name):
+        return Test.objects.create(
+            patient=self.patient, disease=self.disease, test_name=name,
+            test_type='BLOOD', test_date=timezone.now()
+        )
+
+
+class ReportDataExportTest(ExportFixturesMixin, TestCase):
+    def _create_export(self, incremental=False):
+        return Report.objects.create(
+            name='Data Export - tests',
+            report_type='DATA_EXPORT',
+            format='CSV',
+            generated_by=self.user,
+            parameters={'entity': 'tests', 'year': None, 'incremental': incremental}
+        )
+
+    def _read_rows(self, path):
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            return list(csv.reader(f))
+
+    def test_export_writes_all_rows(self):
+        report = self._create_export()
+        generate_data_export_csv(report.id)
+        report.refresh_from_db()
+
+        self.assertEqual(report.status, 'COMPLETED')
+        rows = self._read_rows(report.file_path)
+        self.assertEqual(rows[0][:2], ['id', 'patient_id'])
+        self.assertEqual([int(row[0]) for row in rows[1:]], [test.id for test in self.tests])
+
+    def test_resume_after_interruption_writes_each_row_once(self):
+        report = prepare_export(self._create_export())
+        save_checkpoint = exports._save_checkpoint
+        calls = []
+
+        def crash_on_second_checkpoint(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('worker lost')
+            save_checkpoint(*args)
+
+        with mock.patch.object(exports, '_save_checkpoint', crash_on_second_checkpoint):
+            with self.assertRaises(RuntimeError):
+                run_export(report, checkpoint_rows=2)
+
+        report.refresh_from_db()
+        self.assertEqual(report.parameters['checkpoint']['rows'], 2)
+        self.assertEqual(run_export(report, checkpoint_rows=2), 5)
+
+        rows = self._read_rows(report.parameters['output_path'])
+        self.assertEqual([int(row[0]) for row in rows[1:]], [test.id for test in self.tests])
+
+    def test_incremental_export_only_includes_changed_rows(self):
+        now = timezone.now()
+        Test.objects.update(updated_at=now - timedelta(minutes=2))
+        Test.objects.filter(id=self.tests[2].id).update(updated_at=now)
+        Report.objects.create(
+            name='Data Export - tests', report_type='DATA_EXPORT', format='CSV',
+            status='COMPLETED', completed_at=now, generated_by=self.user,
+            parameters={'entity': 'tests', 'year': None,
+                        'watermark_to': (now - timedelta(minutes=1)).isoformat()}
+        )
+
+        report = self._create_export(incremental=True)
+        generate_data_export_csv(report.id)
+        report.refresh_from_db()
+
+        rows = self._read_rows(report.file_path)
+        self.assertEqual([int(row[0]) for row in rows[1:]], [self.tests[2].id])
+
+
+class ReportParquetExportTest(ExportFixturesMixin, TestCase):
+    def test_extract_lookups_are_valid(self):
+        for entity, spec in PARQUET_SPECS.items():
+            lookups = [lookup for _name, lookup, _kind in spec['columns']]
+            # Compiling the query raises FieldError for a broken lookup
+            str(spec['model'].objects.values_list(*lookups).query)
+
+    @skipUnless(PYARROW_AVAILABLE, 'pyarrow is not installed')
+    def test_extract_written_in_row_groups(self):
+        import pyarrow.parquet as pq
+
+        report = Report.objects.create(
+            name='Data Export - tests', report_type='DATA_EXPORT', format='PARQUET',
+            generated_by=self.user, parameters={'entity': 'tests'}
+        )
+        with self.settings(EXPORT_ROW_GROUP_SIZE=2):
+            generate_data_export_parquet(report.id)
+        report.refresh_from_db()
+
+        parquet_file = pq.ParquetFile(report.file_path)
+        self.assertEqual(report.status, 'COMPLETED')
+        self.assertEqual(parquet_file.metadata.num_rows, 5)
+        self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+        self.assertTrue(str(parquet_file.schema_arrow.field('test_type').type).startswith('dictionary'))
+
+    @skipIf(PYARROW_AVAILABLE, 'pyarrow is installed')
+    def test_extract_rejected_without_pyarrow(self):
+        from rest_framework.test import APIClient
+
+        admin = User.objects.create_user(
+            email='admin@example.com', username='admin', password='testpass123', role='ADMIN'
+        )
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        response = client.post(
+            reverse('report-generate-data-export'), {'entity': 'tests', 'format': 'PARQUET'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
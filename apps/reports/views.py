@@ -6,7 +6,10 @@ from django.http import HttpResponse, FileResponse
 from django.shortcuts import get_object_or_404
 from .models import Report
 from .serializers import ReportSerializer
-from .tasks import generate_patient_record_pdf, generate_test_results_pdf, generate_treatment_summary_pdf, generate_surgery_report_pdf, generate_patients_per_city_excel, generate_common_diseases_excel
+from .retention import check_quota, get_disk_usage
+from .exports import EXPORT_SPECS
+from .columnar import PARQUET_SPECS, PYARROW_AVAILABLE
+from .tasks import generate_patient_record_pdf, generate_test_results_pdf, generate_treatment_summary_pdf, generate_surgery_report_pdf, generate_patients_per_city_excel, generate_common_diseases_excel, generate_data_export_csv, generate_data_export_parquet
 from apps.patients.models import Patient
 from apps.hospital.permissions import IsAdminOrReadOnly
 
@@ -29,9 +32,24 @@ class ReportViewSet(viewsets.ModelViewSet):
         else:
             return self.queryset.filter(generated_by=user)
     
+    def quota_exceeded_response(self, request):
+        """Return an error response if the user is over their report disk quota"""
+        allowed, usage, quota = check_quota(request.user)
+        if allowed:
+            return None
+        return Response({
+            'error': 'Report storage quota exceeded',
+            'usage_bytes': usage,
+            'quota_bytes': quota,
+        }, status=status.HTTP_507_INSUFFICIENT_STORAGE)
+    
     @action(detail=False, methods=['post'])
     def generate_patient_record(self, request):
         """Generate patient record PDF"""
+        quota_error = self.quota_exceeded_response(request)
+        if quota_error:
+            return quota_error
+        
         patient_id = request.data.get('patient_id')
         if not patient_id:
             return Response({'error': 'patient_id is required'}, status=status.HTTP_400_BAD_REQUEST)
@@ -61,6 +79,10 @@ class ReportViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def generate_test_results(self, request):
         """Generate test results PDF"""
+        quota_error = self.quota_exceeded_response(request)
+        if quota_error:
+            return quota_error
+        
         patient_id = request.data.get('patient_id')
         test_ids = request.data.get('test_ids', [])
         
@@ -92,6 +114,10 @@ class ReportViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def generate_treatment_summary(self, request):
         """Generate treatment summary PDF"""
+        quota_error = self.quota_exceeded_response(request)
+        if quota_error:
+            return quota_error
+        
         patient_id = request.data.get('patient_id')
         treatment_ids = request.data.get('treatment_ids', [])
         
@@ -123,6 +149,10 @@ class ReportViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def generate_surgery_report(self, request):
         """Generate surgery report PDF"""
+        quota_error = self.quota_exceeded_response(request)
+        if quota_error:
+            return quota_error
+        
         surgery_id = request.data.get('surgery_id')
         
         if not surgery_id:
@@ -154,6 +184,10 @@ class ReportViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def generate_patients_per_city(self, request):
         """Generate patients per city Excel report"""
+        quota_error = self.quota_exceeded_response(request)
+        if quota_error:
+            return quota_error
+        
         city_ids = request.data.get('city_ids', [])
         
         # Create report record
@@ -176,6 +210,10 @@ class ReportViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def generate_common_diseases(self, request):
         """Generate common diseases Excel report"""
+        quota_error = self.quota_exceeded_response(request)
+        if quota_error:
+            return quota_error
+        
         center_ids = request.data.get('center_ids', [])
         start_date = request.data.get('start_date')
         end_date = request.data.get('end_date')
@@ -201,11 +239,100 @@ class ReportViewSet(viewsets.ModelViewSet):
             'report_id': report.id
         }, status=status.HTTP_202_ACCEPTED)
     
+    @action(detail=False, methods=['post'])
+    def generate_data_export(self, request):
+        """
+        Generate a raw data export: a gzip-compressed CSV of tests, treatments,
+        visits or patient diseases, or a Parquet analytics extract of patients,
+        diseases, tests, treatments or surgeries (format=PARQUET)
+        """
+        quota_error = self.quota_exceeded_response(request)
+        if quota_error:
+            return quota_error
+        
+        export_format = str(request.data.get('format', 'CSV')).upper()
+        if export_format not in ('CSV', 'PARQUET'):
+            return Response({'error': 'format must be CSV or PARQUET'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if export_format == 'PARQUET' and not PYARROW_AVAILABLE:
+            return Response({
+                'error': 'Parquet export requires the pyarrow package'
+            }, status=status.HTTP_501_NOT_IMPLEMENTED)
+        
+        specs = PARQUET_SPECS if export_format == 'PARQUET' else EXPORT_SPECS
+        entity = request.data.get('entity')
+        if entity not in specs:
+            return Response({
+                'error': f"entity must be one of: {', '.join(specs)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        year = request.data.get('year')
+        if year is not None:
+            try:
+                year = int(year)
+            except (TypeError, ValueError):
+                return Response({'error': 'year must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        incremental = str(request.data.get('incremental', False)).lower() in ('1', 'true', 'yes')
+        
+        # Create report record
+        report = Report.objects.create(
+            name=f"Data Export - {entity}" + (f" {year}" if year else ''),
+            report_type='DATA_EXPORT',
+            format=export_format,
+            generated_by=request.user,
+            parameters={
+                'entity': entity,
+                'year': year,
+                'start_date': request.data.get('start_date'),
+                'end_date': request.data.get('end_date'),
+                'incremental': incremental and export_format == 'CSV'
+            }
+        )
+        
+        # Start background task
+        if export_format == 'PARQUET':
+            generate_data_export_parquet.delay(report.id)
+        else:
+            generate_data_export_csv.delay(report.id)
+        
+        return Response({
+            'message': 'Report generation started',
+            'report_id': report.id
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['post'])
+    def resume_export(self, request, pk=None):
+        """Resume a failed data export from its last checkpoint"""
+        report = self.get_object()
+        
+        if report.report_type != 'DATA_EXPORT' or report.format != 'CSV' or report.status != 'FAILED':
+            return Response({'error': 'Only failed CSV data exports can be resumed'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        generate_data_export_csv.delay(report.id)
+        
+        return Response({
+            'message': 'Report generation resumed',
+            'report_id': report.id,
+            'checkpoint': report.parameters.get('checkpoint')
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['get'])
+    def usage(self, request):
+        """Get disk usage of generated reports (all users for admins)"""
+        data = get_disk_usage() if request.user.is_admin else get_disk_usage(user=request.user)
+        _, usage, quota = check_quota(request.user)
+        data['quota_bytes'] = quota
+        return Response(data)
+    
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
         """Download generated report"""
         report = self.get_object()
         
+        if report.status == 'EXPIRED':
+            return Response({'error': 'Report has expired'}, status=status.HTTP_410_GONE)
+        
         if report.status != 'COMPLETED':
             return Response({'error': 'Report not ready'}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -215,10 +342,13 @@ class ReportViewSet(viewsets.ModelViewSet):
         try:
             import os
             if os.path.exists(report.file_path):
+                extension = report.format.lower()
+                if report.file_path.endswith('.gz'):
+                    extension += '.gz'
                 response = FileResponse(
                     open(report.file_path, 'rb'),
                     as_attachment=True,
-                    filename=f"{report.name}.{report.format.lower()}"
+                    filename=f"{report.name}.{extension}"
                 )
                 return response
             else:
@@ -0,0 +1,77 @@
+"""
+Admin list filters with cached lookup choices.
+
+Choices are cached per filter namespace and per scope (typically the user's
+role and center) under a version key, so one invalidate_filter_choices() call
+makes every scope stale. Filters with more choices than
+ADMIN_FILTER_AUTOCOMPLETE_THRESHOLD render as a search box backed by the admin
+autocomplete view instead of a list of links.
+"""
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+
+
+def _version_key(namespace):
+    return f'admin_filter:{namespace}:version'
+
+
+def get_filter_version(namespace):
+    return cache.get_or_set(_version_key(namespace), 1, None)
+
+
+def invalidate_filter_choices(namespace):
+    """Make the cached choices of every scope of a filter namespace stale"""
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.set(_version_key(namespace), 1, None)
+
+
+def get_cached_choices(namespace, scope, load_choices):
+    """(value, label) choices of one scope of a namespace, loaded by load_choices() on a miss"""
+    key = f'admin_filter:{namespace}:v{get_filter_version(namespace)}:{scope}'
+    choices = cache.get(key)
+    if choices is None:
+        choices = [(str(value), label) for value, label in load_choices()]
+        cache.set(key, choices, getattr(settings, 'ADMIN_FILTER_CACHE_TIMEOUT', 3600))
+    return choices
+
+
+def use_autocomplete(choices):
+    return len(choices) > getattr(settings, 'ADMIN_FILTER_AUTOCOMPLETE_THRESHOLD', 50)
+
+
+class CachedChoicesFilter(admin.SimpleListFilter):
+    """
+    SimpleListFilter whose lookups are cached. Subclasses set `choices_namespace`
+    and implement load_choices(request) and get_scope(request); `autocomplete_field`
+    names the changelist model's foreign key searched once the filter switches
+    to autocomplete.
+    """
+    choices_namespace = None
+    autocomplete_field = None
+    autocomplete_template = 'admin/filters/autocomplete_filter.html'
+
+    def get_scope(self, request):
+        raise NotImplementedError('subclasses of CachedChoicesFilter must provide a get_scope() method')
+
+    def load_choices(self, request):
+        """(value, label) pairs, fetched in as few queries as possible"""
+        raise NotImplementedError('subclasses of CachedChoicesFilter must provide a load_choices() method')
+
+    def get_choices(self, request):
+        return get_cached_choices(
+            self.choices_namespace, self.get_scope(request), lambda: self.load_choices(request)
+        )
+
+    def lookups(self, request, model_admin):
+        choices = self.get_choices(request)
+        self.autocomplete = self.autocomplete_field is not None and use_autocomplete(choices)
+        if not self.autocomplete:
+            return choices
+
+        # Only the selected choice is listed, others are found through the search box
+        self.template = self.autocomplete_template
+        self.opts = model_admin.model._meta
+        return [(value, label) for value, label in choices if value == self.value()]
@@ -0,0 +1,129 @@
+"""
+Admin changelist counts that stay cheap on large tables.
+
+The default admin paginator runs an exact COUNT(*) over the filtered, joined
+changelist queryset on every page load. EstimatedCountPaginator instead reads
+PostgreSQL's planner estimate for unfiltered lists and counts at most
+ADMIN_COUNT_CAP + 1 rows for filtered ones, which are then shown as "1000+".
+Such approximate counts only size the page links: paging itself is not bounded
+by them, so pages past the cap (or past a stale estimate) still load.
+"""
+from math import ceil
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def get_count_cap():
+    return getattr(settings, 'ADMIN_COUNT_CAP', 1000)
+
+
+def estimate_table_rows(model, using='default'):
+    """Planner row estimate of a model's table, None where unavailable or never analyzed"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+            [connection.ops.quote_name(model._meta.db_table)]
+        )
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose count is estimated for unfiltered querysets and capped for
+    filtered ones. `is_estimated` and `is_capped` tell which happened.
+    """
+    is_estimated = False
+    is_capped = False
+    # Highest page known to exist, from rows read past the approximate count
+    pages_seen = 0
+
+    def _is_unfiltered(self):
+        query = getattr(self.object_list, 'query', None)
+        return query is not None and not query.where and not query.distinct
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return len(queryset)
+
+        if self._is_unfiltered():
+            estimate = estimate_table_rows(queryset.model, queryset.db)
+            # Small tables are counted exactly, estimates only pay off on large ones
+            if estimate is not None and estimate > getattr(settings, 'ADMIN_ESTIMATE_THRESHOLD', 100000):
+                self.is_estimated = True
+                return estimate
+
+        cap = get_count_cap()
+        count = queryset.order_by().values('pk')[:cap + 1].count()
+        if count > cap:
+            self.is_capped = True
+            return cap + 1
+        return count
+
+    @property
+    def is_approximate(self):
+        self.count  # sets is_estimated / is_capped
+        return self.is_estimated or self.is_capped
+
+    @property
+    def num_pages(self):
+        """Pages of the count, extended to one past the last page seen to have more rows"""
+        if self.count == 0 and not self.allow_empty_first_page:
+            return 0
+        return max(ceil(max(1, self.count - self.orphans) / self.per_page), self.pages_seen)
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # Pages past an approximate count may still have rows
+            if not self.is_approximate or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        if not self.is_approximate:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        # One extra row tells whether there is a next page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        self.pages_seen = number + 1 if len(rows) > self.per_page else number
+        return self._get_page(rows[:self.per_page], number, self)
+
+    @property
+    def count_display(self):
+        if self.is_estimated:
+            return f'~{self.count}'
+        if self.is_capped:
+            return f'{get_count_cap()}+'
+        return str(self.count)
+
+
+class EstimatedCountAdminMixin:
+    """
+    ModelAdmin mixin using EstimatedCountPaginator, skipping the unfiltered
+    total count and reusing the changelist's own count for search results
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context=extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        search_term = request.GET.get('q')
+        if changelist is not None and search_term:
+            response.context_data['search_info'] = (
+                f'تم العثور على {changelist.paginator.count_display} نتيجة للبحث عن "{search_term}"'
+            )
+        return response
@@ -0,0 +1,456 @@
+"""
+Endpoint benchmarks and query budgets.
+
+seed_benchmark_data() fills an empty database with cities, centers, doctors,
+staff and patients with their diseases, tests, treatments, surgeries and
+visits, in a fixed shape that grows with a scale factor. BENCHMARK_ENDPOINTS
+has a request for every GET route under /api/v1/ (UNBENCHMARKED_ROUTES names
+the exceptions) and BENCHMARK_TASKS a run of every report task.
+run_benchmarks() times each of them as an admin and counts its queries, and
+check_baseline() compares the result with benchmark_baseline.json, kept next
+to this module: an endpoint or task going over its query budget (a new N+1)
+or, when a tolerance is given, over its p95 latency baseline fails.
+
+The test suite checks the query budgets on every run, and the
+benchmark_endpoints command also checks latency and rewrites the baseline.
+Budgets and baselines hold at the scale the file was recorded at.
+"""
+import json
+import math
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework.throttling import SimpleRateThrottle
+
+from apps.hospital.models import Center, City, Disease, Doctor, Medicine, Staff
+from apps.patients.models import Patient, PatientDisease, Surgery, Test, Treatment, TreatmentMedicine, Visit
+from apps.patients.search import build_visit_documents
+from apps.patients.summary import rebuild_summaries
+from apps.reports import tasks as report_tasks
+from apps.reports.columnar import PYARROW_AVAILABLE
+from apps.reports.models import Report
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+
+# Added to every latency baseline, so sub-millisecond endpoints do not fail on noise
+LATENCY_SLACK_MS = 5
+
+# Rows per unit of scale
+CITIES = 2
+CENTERS_PER_CITY = 2
+DOCTORS_PER_CENTER = 2
+PATIENTS_PER_DOCTOR = 6
+# Reference rows, whatever the scale
+DISEASES = 12
+MEDICINES = 12
+
+Endpoint = namedtuple('Endpoint', ['name', 'url_name', 'kwargs', 'params'])
+ReportTask = namedtuple('ReportTask', ['name', 'task', 'report_type', 'format', 'parameters', 'available'])
+Measurement = namedtuple('Measurement', ['name', 'outcome', 'queries', 'p50_ms', 'p95_ms', 'p99_ms'])
+
+
+def endpoint(url_name, name=None, kwargs=None, **params):
+    """
+    A benchmarked request. Values of kwargs and params are formatted with the
+    seeded objects' ids, e.g. {'pk': '{patient}'}.
+    """
+    return Endpoint(name or url_name, url_name, kwargs or {}, params)
+
+
+BENCHMARK_ENDPOINTS = [
+    # accounts
+    endpoint('user-profile'),
+    endpoint('user-list'),
+    endpoint('user-detail', kwargs={'pk': '{user}'}),
+    # hospital
+    endpoint('city-list'),
+    endpoint('city-detail', kwargs={'pk': '{city}'}),
+    endpoint('city-centers', kwargs={'pk': '{city}'}),
+    endpoint('city-centers-by-city', city_id='{city}'),
+    endpoint('city-statistics'),
+    endpoint('center-list'),
+    endpoint('center-detail', kwargs={'pk': '{center}'}),
+    endpoint('center-doctors', kwargs={'pk': '{center}'}),
+    endpoint('center-staff', kwargs={'pk': '{center}'}),
+    endpoint('center-statistics', kwargs={'pk': '{center}'}),
+    endpoint('center-doctors-by-center', center_id='{center}'),
+    endpoint('doctor-list'),
+    endpoint('doctor-detail', kwargs={'pk': '{doctor}'}),
+    endpoint('doctor-patients', kwargs={'pk': '{doctor}'}),
+    endpoint('doctor-by-specialization', specialization='CARDIOLOGY'),
+    endpoint('doctor-doctor-info', doctor_id='{doctor}'),
+    endpoint('doctor-statistics'),
+    endpoint('staff-list'),
+    endpoint('staff-detail', kwargs={'pk': '{staff}'}),
+    endpoint('staff-by-department', department='NURSING'),
+    endpoint('staff-statistics'),
+    endpoint('medicine-list'),
+    endpoint('medicine-detail', kwargs={'pk': '{medicine}'}),
+    endpoint('medicine-by-dosage-form', dosage_form='tablet'),
+    endpoint('medicine-search', q='Medicine'),
+    endpoint('disease-list'),
+    endpoint('disease-detail', kwargs={'pk': '{disease}'}),
+    endpoint('disease-by-category', category='CHRONIC'),
+    endpoint('disease-search', q='Disease'),
+    endpoint('disease-statistics'),
+    endpoint('centers_by_city', city_id='{city}'),
+    endpoint('reference_data'),
+    # patients
+    endpoint('patient-list'),
+    endpoint('patient-list', name='patient-list:mobile', mobile='true'),
+    endpoint('patient-list', name='patient-list:sparse', fields='id,patient_name,doctor_name'),
+    endpoint('patient-detail', kwargs={'pk': '{patient}'}),
+    endpoint('patient-diseases', kwargs={'pk': '{patient}'}),
+    endpoint('patient-tests', kwargs={'pk': '{patient}'}),
+    endpoint('patient-treatments', kwargs={'pk': '{patient}'}),
+    endpoint('patient-surgeries', kwargs={'pk': '{patient}'}),
+    endpoint('patient-summary', kwargs={'pk': '{patient}'}),
+    endpoint('patient-timeline', kwargs={'pk': '{patient}'}),
+    endpoint('patient-by-doctor', doctor_id='{doctor}'),
+    endpoint('patient-statistics'),
+    endpoint('patientdisease-list'),
+    endpoint('patientdisease-detail', kwargs={'pk': '{patientdisease}'}),
+    endpoint('test-list'),
+    endpoint('test-detail', kwargs={'pk': '{test}'}),
+    endpoint('test-by-type', test_type='BLOOD'),
+    endpoint('test-pending'),
+    endpoint('treatment-list'),
+    endpoint('treatment-detail', kwargs={'pk': '{treatment}'}),
+    endpoint('treatment-active'),
+    endpoint('surgery-list'),
+    endpoint('surgery-detail', kwargs={'pk': '{surgery}'}),
+    endpoint('surgery-by-status', status='SCHEDULED'),
+    endpoint('surgery-upcoming'),
+    endpoint('patient_sync'),
+    endpoint('get_centers_by_city', city_id='{city}'),
+    endpoint('get_doctors_by_center', center_id='{center}'),
+    endpoint('check_phone_uniqueness', phone='07800000000'),
+    endpoint('patient_profile', kwargs={'patient_id': '{patient}'}),
+    # reports
+    endpoint('report-list'),
+    endpoint('report-detail', kwargs={'pk': '{report}'}),
+    endpoint('report-usage'),
+    # dashboard
+    endpoint('dashboard-overview'),
+    endpoint('dashboard-patients-by-city'),
+    endpoint('dashboard-patients-by-center'),
+    endpoint('dashboard-common-diseases'),
+    endpoint('dashboard-disease-prevalence'),
+    endpoint('dashboard-upcoming-surgeries'),
+    endpoint('dashboard-recent-tests'),
+    endpoint('dashboard-active-treatments'),
+    endpoint('dashboard-monthly-statistics'),
+    endpoint('dashboard-doctor-statistics'),
+    endpoint('dashboard-doctor-workload'),
+    endpoint('dashboard-test-statistics'),
+    endpoint('dashboard-surgery-statistics'),
+    endpoint('dashboard-mobile-dashboard'),
+    endpoint('dashboard-search', q='Patient'),
+]
+
+# GET routes under /api/v1/ that are not benchmarked, and why
+UNBENCHMARKED_ROUTES = {
+    'report-download': 'streams a generated file',
+}
+
+BENCHMARK_TASKS = [
+    ReportTask('generate_patient_record_pdf', report_tasks.generate_patient_record_pdf, 'PATIENT_RECORD', 'PDF',
+               {'patient_id': '{patient}'}, True),
+    ReportTask('generate_test_results_pdf', report_tasks.generate_test_results_pdf, 'TEST_RESULTS', 'PDF',
+               {'patient_id': '{patient}'}, True),
+    ReportTask('generate_treatment_summary_pdf', report_tasks.generate_treatment_summary_pdf, 'TREATMENT_SUMMARY',
+               'PDF', {'patient_id': '{patient}'}, True),
+    ReportTask('generate_surgery_report_pdf', report_tasks.generate_surgery_report_pdf, 'SURGERY_REPORT', 'PDF',
+               {'surgery_id': '{surgery}'}, True),
+    ReportTask('generate_patients_per_city_excel', report_tasks.generate_patients_per_city_excel,
+               'PATIENTS_PER_CITY', 'EXCEL', {}, report_tasks.PANDAS_AVAILABLE),
+    ReportTask('generate_common_diseases_excel', report_tasks.generate_common_diseases_excel, 'COMMON_DISEASES',
+               'EXCEL', {}, report_tasks.PANDAS_AVAILABLE),
+    ReportTask('generate_data_export_csv', report_tasks.generate_data_export_csv, 'DATA_EXPORT', 'CSV',
+               {'entity': 'tests', 'year': None, 'incremental': False}, True),
+    ReportTask('generate_data_export_parquet', report_tasks.generate_data_export_parquet, 'DATA_EXPORT', 'PARQUET',
+               {'entity': 'tests', 'year': None}, PYARROW_AVAILABLE),
+]
+
+
+def _walk(patterns, prefix=''):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _walk(pattern.url_patterns, prefix + str(pattern.pattern))
+        else:
+            yield prefix + str(pattern.pattern), pattern
+
+
+def api_get_routes():
+    """URL names of the GET routes under /api/v1/"""
+    names = set()
+    for route, pattern in _walk(get_resolver().url_patterns):
+        if not route.startswith('api/v1/') or pattern.name in (None, 'api-root'):
+            continue
+        callback = pattern.callback
+        actions = getattr(callback, 'actions', None)
+        view_class = getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+        if actions is not None:
+            gets = 'get' in actions
+        elif view_class is not None:
+            gets = hasattr(view_class, 'get')
+        else:
+            # A plain function view, which may answer anything
+            gets = True
+        if gets:
+            names.add(pattern.name)
+    return names
+
+
+def seed_benchmark_data(scale=1, seed=0):
+    """
+    Fill an empty database with the benchmark data of a scale, returning the
+    ids the endpoints are formatted with.
+    """
+    rng = random.Random(seed)
+    User = get_user_model()
+    now = timezone.now()
+    admin = User.objects.create_superuser(
+        email='benchmark-admin@example.invalid', username='benchmark-admin', password=None, role='ADMIN'
+    )
+
+    diseases = Disease.objects.bulk_create([
+        Disease(name=f'Disease {i}', category=('CHRONIC', 'INFECTIOUS', 'GENETIC')[i % 3], icd_code=f'E{i:02d}')
+        for i in range(DISEASES)
+    ])
+    medicines = Medicine.objects.bulk_create([
+        Medicine(name=f'Medicine {i}', dosage_form='tablet', strength=f'{(i + 1) * 50}mg', manufacturer='Benchmark')
+        for i in range(MEDICINES)
+    ])
+
+    city_names = [name for name, _label in City.IRAQ_CITIES][:CITIES * scale]
+    cities = City.objects.bulk_create([City(name=name, state=name.title(), country='Iraq') for name in city_names])
+    centers = Center.objects.bulk_create([
+        Center(name=f'{city.name.title()} Center {i}', city=city, address=city.state,
+               phone_number=f'+96477{city.pk:04d}{i:04d}')
+        for city in cities for i in range(CENTERS_PER_CITY)
+    ])
+
+    # Unusable passwords: hashing thousands of them would dominate seeding
+    password = make_password(None)
+    doctor_count = len(centers) * DOCTORS_PER_CENTER
+    users = User.objects.bulk_create([
+        User(email=f'benchmark-user{i}@example.invalid', username=f'benchmark-user{i}', first_name=f'Name{i}',
+             last_name=f'Family{i}', password=password, role='DOCTOR' if i < doctor_count else 'STAFF')
+        for i in range(doctor_count + len(centers))
+    ])
+    doctors = Doctor.objects.bulk_create([
+        Doctor(user=users[i], center=centers[i // DOCTORS_PER_CENTER], license_number=f'BENCH{i:06d}',
+               specialization=('CARDIOLOGY', 'NEUROLOGY', 'PEDIATRICS')[i % 3], experience_years=i % 30)
+        for i in range(doctor_count)
+    ])
+    staff = Staff.objects.bulk_create([
+        Staff(user=users[doctor_count + i], center=center, department='NURSING', employee_id=f'BENCH{i:06d}')
+        for i, center in enumerate(centers)
+    ])
+
+    patients = Patient.objects.bulk_create([
+        Patient(
+            user=doctor.user, doctor=doctor, patient_name=f'Patient {i}', patient_id=f'077{i:08d}',
+            date_of_birth=date(1940, 1, 1) + timedelta(days=rng.randrange(365 * 80)),
+            gender=rng.choice('MF'), address=doctor.center.address, medical_history='History ' * 20,
+            emergency_contact_name='Contact', emergency_contact_phone=f'078{i:08d}'
+        )
+        for i, doctor in enumerate(doctor for doctor in doctors for _patient in range(PATIENTS_PER_DOCTOR))
+    ])
+    patient_diseases = PatientDisease.objects.bulk_create([
+        PatientDisease(patient=patient, disease=disease, diagnosed_date=date(2024, 1, 1) + timedelta(days=i))
+        for patient in patients for i, disease in enumerate(rng.sample(diseases, 2))
+    ])
+    tests = Test.objects.bulk_create([
+        Test(patient=patient, disease=rng.choice(diseases), test_name=f'Test {i}', test_type='BLOOD',
+             test_date=now - timedelta(days=rng.randrange(365)), status=rng.choice(('PENDING', 'COMPLETED')),
+             results='Result ' * 10)
+        for patient in patients for i in range(3)
+    ])
+    treatments = Treatment.objects.bulk_create([
+        Treatment(patient=patient, disease=rng.choice(diseases), treatment_name=f'Treatment {i}',
+                  description='Description ' * 10, start_date=date(2024, 1, 1) + timedelta(days=rng.randrange(365)),
+                  status=rng.choice(('ACTIVE', 'COMPLETED')))
+        for patient in patients for i in range(2)
+    ])
+    TreatmentMedicine.objects.bulk_create([
+        TreatmentMedicine(treatment=treatment, medicine=medicine, dosage='1 tablet', frequency='daily',
+                          duration_days=30)
+        for treatment in treatments for medicine in rng.sample(medicines, 2)
+    ])
+    surgeries = Surgery.objects.bulk_create([
+        Surgery(patient=patient, surgery_name='Surgery', description='Description',
+                scheduled_date=now + timedelta(days=rng.randrange(-180, 180)), surgeon_name='Surgeon')
+        for patient in patients
+    ])
+    Visit.objects.bulk_create([
+        Visit(patient=patient, doctor=patient.doctor, visit_date=now - timedelta(days=rng.randrange(365)),
+              chief_complaint='Headache and fever', diagnosis='Flu')
+        for patient in patients for _visit in range(2)
+    ])
+    # Kept by signals, which bulk_create skips
+    rebuild_summaries()
+    build_visit_documents(Visit.objects.all())
+
+    report = Report.objects.create(
+        name='Benchmark report', report_type='PATIENTS_PER_CITY', format='EXCEL', status='COMPLETED',
+        generated_by=admin
+    )
+    return {
+        'user': admin.pk, 'city': cities[0].pk, 'center': centers[0].pk, 'doctor': doctors[0].pk,
+        'staff': staff[0].pk, 'medicine': medicines[0].pk, 'disease': diseases[0].pk, 'patient': patients[0].pk,
+        'patientdisease': patient_diseases[0].pk, 'test': tests[0].pk, 'treatment': treatments[0].pk,
+        'surgery': surgeries[0].pk, 'report': report.pk,
+    }
+
+
+def _percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _measure(name, run, iterations, prepare=lambda: None):
+    """Time `run(prepare())` after a warm-up run; the queries are those of the last run"""
+    run(prepare())
+    timings = []
+    for _iteration in range(iterations):
+        argument = prepare()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            outcome = run(argument)
+            timings.append((time.perf_counter() - started) * 1000)
+    return Measurement(
+        name, outcome, len(queries), round(statistics.median(timings), 2),
+        round(_percentile(timings, 0.95), 2), round(_percentile(timings, 0.99), 2)
+    )
+
+
+@contextmanager
+def _unthrottled():
+    # A benchmark's own requests would exhaust the per-user rate; a scope without a rate is not throttled
+    rates = SimpleRateThrottle.THROTTLE_RATES
+    saved = dict(rates)
+    rates.update(dict.fromkeys(rates))
+    try:
+        yield
+    finally:
+        rates.clear()
+        rates.update(saved)
+
+
+def _run_task(task, report_id):
+    try:
+        task(report_id)
+    except Exception as exc:
+        return f'error: {exc.__class__.__name__}'
+    return Report.objects.filter(pk=report_id).values_list('status', flat=True).get()
+
+
+def run_benchmarks(fixtures, iterations=20, names=None):
+    """Measurements of the endpoints and tasks (those in `names`, if given) as the seeded admin"""
+    admin = get_user_model().objects.get(pk=fixtures['user'])
+    client = APIClient()
+    client.force_authenticate(admin)
+    # Session login for the plain Django views
+    client.force_login(admin)
+
+    measurements = []
+    media_root = tempfile.mkdtemp()
+    # Searches run inline, so their queries are counted on this connection. The caches
+    # that need one shared by every process are on, as deployed with Redis: a single
+    # process shares its local cache with itself.
+    shared_cache_settings = {
+        'CONDITIONAL_GET_ENABLED': True, 'PRINCIPAL_CACHE_ENABLED': True, 'REFERENCE_DATA_CACHED_VERSION': True,
+    }
+    try:
+        with _unthrottled(), override_settings(
+            MEDIA_ROOT=media_root, UNIVERSAL_SEARCH_WORKERS=0, **shared_cache_settings
+        ):
+            for spec in BENCHMARK_ENDPOINTS:
+                if names and spec.name not in names:
+                    continue
+                url = reverse(spec.url_name, kwargs={key: value.format(**fixtures) for key, value in spec.kwargs.items()})
+                params = {key: value.format(**fixtures) for key, value in spec.params.items()}
+                measurements.append(_measure(
+                    spec.name, lambda _argument: client.get(url, params, secure=True).status_code, iterations
+                ))
+
+            for spec in BENCHMARK_TASKS:
+                if not spec.available or (names and spec.name not in names):
+                    continue
+                parameters = {
+                    key: value.format(**fixtures) if isinstance(value, str) else value
+                    for key, value in spec.parameters.items()
+                }
+
+                def new_report(spec=spec, parameters=parameters):
+                    return Report.objects.create(
+                        name=f'Benchmark {spec.name}', report_type=spec.report_type, format=spec.format,
+                        generated_by=admin, parameters=dict(parameters)
+                    ).pk
+
+                measurements.append(_measure(
+                    spec.name, lambda report_id, task=spec.task: _run_task(task, report_id), iterations, new_report
+                ))
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+    return measurements
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_baseline(measurements, scale, path=BASELINE_PATH):
+    baseline = {
+        'scale': scale,
+        'measurements': {
+            measurement.name: {
+                'queries': measurement.queries, 'p50_ms': measurement.p50_ms, 'p95_ms': measurement.p95_ms,
+                'p99_ms': measurement.p99_ms,
+            }
+            for measurement in measurements
+        },
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def check_baseline(measurements, baseline, tolerance=None):
+    """
+    Regressions of measurements against a baseline: failed runs, runs missing
+    from it, query counts over budget and, with a tolerance, p95 latencies
+    over tolerance times their baseline
+    """
+    regressions = []
+    expected = baseline['measurements']
+    for measurement in measurements:
+        if measurement.outcome not in (200, 'COMPLETED'):
+            regressions.append(f'{measurement.name}: {measurement.outcome}')
+            continue
+        if measurement.name not in expected:
+            regressions.append(f'{measurement.name}: not in the baseline')
+            continue
+        budget = expected[measurement.name]
+        if measurement.queries > budget['queries']:
+            regressions.append(f"{measurement.name}: {measurement.queries} queries, budget {budget['queries']}")
+        if tolerance is not None and measurement.p95_ms > budget['p95_ms'] * tolerance + LATENCY_SLACK_MS:
+            regressions.append(f"{measurement.name}: p95 {measurement.p95_ms} ms, baseline {budget['p95_ms']} ms")
+    return regressions
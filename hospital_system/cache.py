@@ -0,0 +1,262 @@
+"""
+Two-tier cache backend: a bounded in-process LRU (L1) in front of a shared
+cache such as Redis (L2).
+
+Only keys starting with one of the L1_PREFIXES (small, hot data: version keys,
+filter choices, reference data) are kept in L1; every other key goes straight
+to L2. Each prefix has a generation counter in L2 that every write through this
+backend bumps. A process reads the generations of all prefixes in one
+round-trip at most every L1_POLL_INTERVAL seconds and drops the L1 entries of
+a prefix whose generation moved, so another worker's write is seen within one
+poll interval. L1 entries also expire after L1_TIMEOUT seconds, which bounds
+staleness should L2 ever miss a bump.
+
+Hits and misses are counted per key prefix (the text before the first colon)
+and per tier; stats() returns them for the current process.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'hospital_system.cache.TieredCache',
+            'OPTIONS': {'L2': 'shared', 'L1_PREFIXES': ['reference:']},
+        },
+        'shared': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL},
+    }
+"""
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+GENERATION_KEY = 'tiered:generation:{}'
+
+
+def key_prefix(key):
+    """Metrics bucket of a key: the text before its first colon"""
+    return key.split(':', 1)[0]
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2', 'shared')
+        self.l1_prefixes = tuple(options.get('L1_PREFIXES', ()))
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 60))
+        self.poll_interval = float(options.get('L1_POLL_INTERVAL', 1))
+
+        # key -> (pickled value, expiry, L1 prefix, generation the value was read under)
+        self._l1 = OrderedDict()
+        self._generations = {}
+        self._polled_at = None
+        self._lock = threading.RLock()
+        self._stats = defaultdict(Counter)
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    # L1 bookkeeping
+
+    def _l1_prefix(self, key):
+        for prefix in self.l1_prefixes:
+            if key.startswith(prefix):
+                return prefix
+        return None
+
+    def _poll(self):
+        """Drop the L1 entries of every prefix another process has written to since the last poll"""
+        now = time.monotonic()
+        if self._polled_at is not None and now - self._polled_at < self.poll_interval:
+            return
+        keys = {GENERATION_KEY.format(prefix): prefix for prefix in self.l1_prefixes}
+        current = self.l2.get_many(list(keys))
+        with self._lock:
+            self._polled_at = now
+            for generation_key, prefix in keys.items():
+                generation = current.get(generation_key)
+                if self._generations.get(prefix) != generation:
+                    self._generations[prefix] = generation
+                    self._drop_prefix(prefix)
+
+    def _drop_prefix(self, prefix):
+        for key in [key for key, entry in self._l1.items() if entry[2] == prefix]:
+            del self._l1[key]
+
+    def _l1_get(self, l1_key):
+        with self._lock:
+            entry = self._l1.get(l1_key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._l1[l1_key]
+                return None
+            self._l1.move_to_end(l1_key)
+            return entry
+
+    def _l1_set(self, l1_key, prefix, generation, value, timeout=DEFAULT_TIMEOUT):
+        lifetime = self.l1_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            lifetime = min(lifetime, timeout)
+        if lifetime <= 0:
+            self._l1_delete(l1_key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            # A value read before a generation bump is not cached, it may be stale already
+            if self._generations.get(prefix) != generation:
+                return
+            self._l1[l1_key] = (pickled, time.monotonic() + lifetime, prefix, generation)
+            self._l1.move_to_end(l1_key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, l1_key):
+        with self._lock:
+            self._l1.pop(l1_key, None)
+
+    def _bump(self, prefix):
+        """Tell every process that an L1 prefix changed"""
+        generation_key = GENERATION_KEY.format(prefix)
+        try:
+            generation = self.l2.incr(generation_key)
+        except ValueError:
+            self.l2.add(generation_key, 1, None)
+            generation = self.l2.get(generation_key)
+        with self._lock:
+            seen = self._generations.get(prefix)
+            if seen is None or generation != seen + 1:
+                # Someone else bumped it too, their writes may be in our L1
+                self._drop_prefix(prefix)
+            self._generations[prefix] = generation
+
+    def _count(self, key, outcome):
+        with self._lock:
+            self._stats[key_prefix(key)][outcome] += 1
+
+    def _wrote(self, key, version, value=None, timeout=DEFAULT_TIMEOUT, deleted=False):
+        """Keep L1 in line with a write just made to L2"""
+        prefix = self._l1_prefix(key)
+        if prefix is None:
+            return
+        l1_key = self.make_and_validate_key(key, version)
+        self._l1_delete(l1_key)
+        self._bump(prefix)
+        if not deleted:
+            self._l1_set(l1_key, prefix, self._generations.get(prefix), value, timeout)
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        prefix = self._l1_prefix(key)
+        if prefix is not None:
+            self._poll()
+            l1_key = self.make_and_validate_key(key, version)
+            entry = self._l1_get(l1_key)
+            if entry is not None:
+                self._count(key, 'l1_hits')
+                return pickle.loads(entry[0])
+            generation = self._generations.get(prefix)
+
+        value = self.l2.get(key, self._missing_key, version=version)
+        if value is self._missing_key:
+            self._count(key, 'misses')
+            return default
+        self._count(key, 'l2_hits')
+        if prefix is not None:
+            self._l1_set(l1_key, prefix, generation, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        pending = {}
+        if any(self._l1_prefix(key) for key in keys):
+            self._poll()
+        for key in keys:
+            prefix = self._l1_prefix(key)
+            if prefix is not None:
+                entry = self._l1_get(self.make_and_validate_key(key, version))
+                if entry is not None:
+                    self._count(key, 'l1_hits')
+                    found[key] = pickle.loads(entry[0])
+                    continue
+            pending[key] = (prefix, self._generations.get(prefix))
+
+        fetched = self.l2.get_many(list(pending), version=version) if pending else {}
+        for key, (prefix, generation) in pending.items():
+            if key not in fetched:
+                self._count(key, 'misses')
+                continue
+            self._count(key, 'l2_hits')
+            found[key] = fetched[key]
+            if prefix is not None:
+                self._l1_set(self.make_and_validate_key(key, version), prefix, generation, fetched[key])
+        return found
+
+    def has_key(self, key, version=None):
+        return self.l2.has_key(key, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        self._wrote(key, version, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            self._wrote(key, version, value, timeout, deleted=key in failed)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version=version)
+        if added:
+            self._wrote(key, version, value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        touched = self.l2.touch(key, timeout, version=version)
+        if self._l1_prefix(key) is not None:
+            self._l1_delete(self.make_and_validate_key(key, version))
+        return touched
+
+    def delete(self, key, version=None):
+        deleted = self.l2.delete(key, version=version)
+        self._wrote(key, version, deleted=True)
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        self.l2.delete_many(keys, version=version)
+        for key in keys:
+            self._wrote(key, version, deleted=True)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        # The L2 expiry of the counter is unknown here, so L1 refetches it instead
+        self._wrote(key, version, deleted=True)
+        return value
+
+    def clear(self):
+        self.l2.clear()
+        with self._lock:
+            self._l1.clear()
+            self._generations.clear()
+            self._polled_at = None
+
+    # Metrics
+
+    def stats(self):
+        """{prefix: {'l1_hits', 'l2_hits', 'misses', 'hit_ratio'}} of this process"""
+        with self._lock:
+            stats = {prefix: dict(counts) for prefix, counts in self._stats.items()}
+        for counts in stats.values():
+            for outcome in ('l1_hits', 'l2_hits', 'misses'):
+                counts.setdefault(outcome, 0)
+            total = counts['l1_hits'] + counts['l2_hits'] + counts['misses']
+            counts['hit_ratio'] = round((counts['l1_hits'] + counts['l2_hits']) / total, 3) if total else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,174 @@
+"""
+Conditional GET for the REST viewsets.
+
+Every model a response is built from has a version counter in the cache,
+bumped by hospital_system.signals once a save or delete of one of its rows
+commits. A list response's ETag hashes the counters of the models it shows
+with the user's access scope and the query string, so a polling client whose
+list has not changed gets a 304 without a single query. A detail response's
+ETag hashes the object's own timestamps (updated_at), the counters of the
+models nested in it and the counters of its child collections; the object is
+still loaded, which also checks permissions, but a 304 skips serializing it.
+
+Writes that bypass model signals (queryset.update(), bulk_create()) do not
+bump the counters and need bump_model_version(), or update_versioned().
+
+The counters are only consistent when every process shares the cache, so
+conditional GET is off (CONDITIONAL_GET_ENABLED) unless the cache is Redis:
+with a per-process LocMemCache, a write handled by one gunicorn worker would
+leave the other workers answering 304 for data that changed.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.translation import get_language
+from rest_framework.response import Response
+
+from apps.patients.managers import get_access_scope
+
+# Models with a version counter
+VERSIONED_MODELS = [
+    'accounts.User',
+    'hospital.City', 'hospital.Center', 'hospital.Doctor', 'hospital.Staff',
+    'hospital.Medicine', 'hospital.Disease',
+    'patients.Patient', 'patients.PatientDisease', 'patients.Test', 'patients.Treatment',
+    'patients.TreatmentMedicine', 'patients.Surgery', 'patients.Visit',
+]
+
+# child model -> foreign key to the parent whose detail ETag covers its rows
+CHILD_COLLECTIONS = {
+    'patients.TreatmentMedicine': 'treatment',
+}
+
+
+def _version_key(label):
+    return f'etag:version:{label.lower()}'
+
+
+def _children_key(label, parent_id):
+    return f'etag:children:{label.lower()}:{parent_id}'
+
+
+def _new_version():
+    # Counters start from the clock, so one recreated after an eviction does not repeat old values
+    return int(time.time() * 1000)
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+def get_versions(keys):
+    """Current values of version counters, starting the missing ones"""
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key) for key in keys]
+
+
+def bump_model_version(model):
+    """Make every ETag built from a model's rows stale"""
+    _bump(_version_key(model._meta.label))
+
+
+def bump_children_version(model, parent_id):
+    """Make the detail ETag of the parent of a child collection stale"""
+    _bump(_children_key(model._meta.label, parent_id))
+
+
+def update_versioned(queryset, **values):
+    """
+    queryset.update() that also sets updated_at (when the model has one), so
+    detail ETags and delta sync see the rows change, and bumps the model's
+    counter once the update commits
+    """
+    model = queryset.model
+    if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+        values.setdefault('updated_at', timezone.now())
+    updated = queryset.update(**values)
+    transaction.on_commit(lambda: bump_model_version(model))
+    return updated
+
+
+def _attribute(instance, path):
+    """A dotted attribute path of an instance, None where a relation is missing"""
+    value = instance
+    for name in path.split('.'):
+        try:
+            value = getattr(value, name)
+        except ObjectDoesNotExist:
+            return None
+        if value is None:
+            return None
+    return value
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin answering list and retrieve with ETags, and with a 304 when
+    the request's If-None-Match still matches.
+
+    `etag_models` are the labels of the models nested in both kinds of
+    responses besides the viewset's own, `etag_list_models` those only list
+    responses depend on (e.g. children a list counts), `etag_fields` the
+    timestamps that change with an object and `etag_child_models` the child
+    collections (see CHILD_COLLECTIONS) serialized with it.
+    """
+    etag_models = ()
+    etag_list_models = ()
+    etag_fields = ('updated_at',)
+    etag_child_models = ()
+
+    @property
+    def conditional_get_enabled(self):
+        return getattr(settings, 'CONDITIONAL_GET_ENABLED', True)
+
+    def _etag(self, *parts):
+        request = self.request
+        parts += (request.query_params.urlencode(), request.accepted_renderer.format, get_language())
+        return '"{}"'.format(hashlib.sha256('|'.join(map(str, parts)).encode()).hexdigest()[:32])
+
+    def get_list_etag(self):
+        labels = [self.queryset.model._meta.label, *self.etag_models, *self.etag_list_models]
+        scope = get_access_scope(self.request.user)
+        versions = get_versions([_version_key(label) for label in labels])
+        return self._etag('list', *versions, scope.kind, scope.ids)
+
+    def get_object_etag(self, instance):
+        keys = [_version_key(label) for label in self.etag_models]
+        keys += [_children_key(label, instance.pk) for label in self.etag_child_models]
+        timestamps = [_attribute(instance, path) for path in self.etag_fields]
+        return self._etag('detail', instance._meta.label, instance.pk, *timestamps, *get_versions(keys))
+
+    def list(self, request, *args, **kwargs):
+        if not self.conditional_get_enabled:
+            return super().list(request, *args, **kwargs)
+        etag = self.get_list_etag()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.conditional_get_enabled:
+            return super().retrieve(request, *args, **kwargs)
+        instance = self.get_object()
+        etag = self.get_object_etag(instance)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,560 @@
+"""
+Synthetic datasets at production volumes, for load tests and benchmarks.
+
+generate_dataset() adds governorates, centers, doctors and staff with their
+users, then patients and their diagnoses, tests, treatments, surgeries and
+visits, with Arabic names, Iraqi addresses and valid 11-digit phone ids.
+
+Rows are built in fixed chunks of CHUNK_SIZE, each from a random generator
+seeded with the seed, the step and the chunk, so a seed (and an --as-of date)
+always gives the same dataset whatever the number of workers or batch size.
+Rows get explicit primary keys above the table's current maximum, so a
+worker can point tests or visits at patients another worker inserts, and the
+sequences are reset at the end. Chunks are inserted with bulk_create(), or
+with COPY on PostgreSQL, by a pool of processes; SQLite takes a single
+writer, so there it runs in-process.
+
+bulk_create() and COPY skip model signals: patient summaries and visit search
+documents are built as extra steps, and the ETag counters, reference data
+snapshot and admin doctor choices are invalidated once at the end. Nothing
+else should write to the tables while a dataset is generated.
+"""
+import io
+import math
+import multiprocessing
+import random
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from apps.hospital.models import Center, City, Disease, Doctor, Medicine, Staff
+from apps.hospital.reference import invalidate_reference_data
+from apps.patients.models import Patient, PatientDisease, Surgery, Test, Treatment, TreatmentMedicine, Visit
+from apps.patients.search import build_visit_documents
+from apps.patients.summary import build_summaries
+from .admin_filters import invalidate_filter_choices
+from .conditional import bump_model_version
+
+User = get_user_model()
+
+# Rows per chunk; part of the dataset's seed, changing it changes the data
+CHUNK_SIZE = 10000
+# Patients per build_summaries() call
+SUMMARY_BATCH_SIZE = 1000
+
+DEFAULT_VOLUMES = {
+    'cities': 18,
+    'centers': 50,
+    'doctors': 500,
+    'staff': 200,
+    'patients': 20000,
+    'patient_diseases': 40000,
+    'tests': 200000,
+    'treatments': 40000,
+    'surgeries': 10000,
+    'visits': 200000,
+}
+
+MALE_NAMES = [
+    'محمد', 'أحمد', 'علي', 'حسين', 'حسن', 'عمر', 'مصطفى', 'عباس', 'كرار', 'حيدر', 'يوسف', 'إبراهيم',
+    'خالد', 'سجاد', 'زيد', 'مرتضى', 'عبد الله', 'جعفر', 'سيف', 'ياسر', 'قاسم', 'رضا', 'منتظر', 'أمير',
+]
+FEMALE_NAMES = [
+    'فاطمة', 'زينب', 'مريم', 'نور', 'سارة', 'رقية', 'زهراء', 'هدى', 'آيات', 'دعاء', 'بنين', 'طيبة',
+    'شهد', 'رغد', 'ضحى', 'غدير', 'إسراء', 'حوراء', 'ملاك', 'آية',
+]
+FAMILY_NAMES = [
+    'الجبوري', 'العبيدي', 'الدليمي', 'التميمي', 'الخفاجي', 'الربيعي', 'الساعدي', 'الموسوي', 'الحسيني',
+    'الشمري', 'الزبيدي', 'العزاوي', 'الكعبي', 'البياتي', 'الجنابي', 'السامرائي', 'العامري', 'اللامي',
+    'المالكي', 'الطائي',
+]
+DISTRICTS = [
+    'الجامعة', 'المنصور', 'الكرادة', 'الأندلس', 'الزهراء', 'الحسين', 'الرسالة', 'الأمير', 'الضباط',
+    'الجمهورية', 'العسكري', 'الصناعة',
+]
+CENTER_NAMES = ['مستشفى {} العام', 'مستشفى {} التعليمي', 'مركز {} الصحي', 'مستوصف {}']
+# Relative weights of governorates when placing centers, 1 for the rest
+CITY_WEIGHTS = {'BAGHDAD': 6, 'BASRA': 3, 'MOSUL': 3, 'ERBIL': 2, 'NAJAF': 2, 'KARBALA': 2}
+# Iraqi mobile prefixes: 077 Asiacell, 075 Korek, 078 and 079 Zain
+PHONE_PREFIXES = ('077', '078', '075', '079')
+
+DISEASES = [
+    ('داء السكري من النوع الثاني', 'CHRONIC', 'E11'),
+    ('ارتفاع ضغط الدم', 'CARDIOVASCULAR', 'I10'),
+    ('قصور القلب', 'CARDIOVASCULAR', 'I50'),
+    ('الربو', 'RESPIRATORY', 'J45'),
+    ('الالتهاب الرئوي', 'INFECTIOUS', 'J18'),
+    ('نزلة البرد', 'ACUTE', 'J00'),
+    ('التهاب الكبد الفيروسي', 'INFECTIOUS', 'B19'),
+    ('فقر الدم', 'CHRONIC', 'D64'),
+    ('الاكتئاب', 'MENTAL', 'F32'),
+    ('الصرع', 'NEUROLOGICAL', 'G40'),
+    ('سرطان الثدي', 'CANCER', 'C50'),
+    ('حصى الكلى', 'OTHER', 'N20'),
+    ('التهاب المفاصل الروماتويدي', 'CHRONIC', 'M06'),
+    ('الثلاسيميا', 'GENETIC', 'D56'),
+]
+MEDICINES = [
+    ('باراسيتامول', 'Paracetamol', 'tablet', '500mg'),
+    ('ميتفورمين', 'Metformin', 'tablet', '850mg'),
+    ('أملوديبين', 'Amlodipine', 'tablet', '5mg'),
+    ('أموكسيسيلين', 'Amoxicillin', 'capsule', '500mg'),
+    ('سالبوتامول', 'Salbutamol', 'inhaler', '100mcg'),
+    ('أوميبرازول', 'Omeprazole', 'capsule', '20mg'),
+    ('أتورفاستاتين', 'Atorvastatin', 'tablet', '20mg'),
+    ('إنسولين', 'Insulin glargine', 'injection', '100IU/ml'),
+    ('سيفترياكسون', 'Ceftriaxone', 'injection', '1g'),
+    ('إيبوبروفين', 'Ibuprofen', 'syrup', '100mg/5ml'),
+    ('كاربامازيبين', 'Carbamazepine', 'tablet', '200mg'),
+    ('حامض الفوليك', 'Folic acid', 'tablet', '5mg'),
+]
+MANUFACTURERS = ['الشركة العامة لصناعة الأدوية - سامراء', 'Pioneer Pharma', 'Hikma', 'Julphar']
+TEST_NAMES = {
+    'BLOOD': ['تحليل دم شامل CBC', 'سكر صائم', 'HbA1c', 'وظائف الكلى', 'وظائف الكبد', 'دهون الدم'],
+    'URINE': ['تحليل إدرار عام'],
+    'XRAY': ['أشعة صدر', 'أشعة عظام'],
+    'CT': ['مفراس الرأس', 'مفراس البطن'],
+    'MRI': ['رنين العمود الفقري', 'رنين الدماغ'],
+    'ECG': ['تخطيط القلب'],
+    'ECHO': ['إيكو القلب'],
+    'ULTRASOUND': ['سونار البطن', 'سونار الحوض'],
+    'BIOPSY': ['خزعة'],
+    'CULTURE': ['زرع دم', 'زرع إدرار'],
+}
+TREATMENT_NAMES = ['علاج دوائي', 'علاج طبيعي', 'حمية غذائية', 'علاج بالأنسولين', 'مضادات حيوية', 'متابعة دورية']
+SURGERY_NAMES = [
+    'استئصال الزائدة الدودية', 'استئصال المرارة', 'عملية فتق', 'قسطرة قلبية', 'تبديل مفصل الركبة',
+    'عملية قيصرية', 'استئصال اللوزتين', 'تفتيت حصى الكلى',
+]
+COMPLAINTS = [
+    'صداع', 'ارتفاع في الحرارة', 'ألم في الصدر', 'سعال مستمر', 'ألم في البطن', 'ضيق تنفس', 'دوخة', 'ألم في المفاصل',
+]
+DIAGNOSES = ['التهاب فيروسي', 'ارتفاع ضغط', 'التهاب معدة', 'نزلة برد', 'فقر دم', 'التهاب مفاصل', '']
+FREQUENCIES = ['مرة يومياً', 'مرتين يومياً', 'ثلاث مرات يومياً', 'عند الحاجة']
+
+
+class DatasetPlan:
+    """What the chunk steps need: volumes, seed, dates and the ids of the rows made up front"""
+
+    def __init__(self, volumes, seed, as_of, batch_size, use_copy):
+        self.volumes = volumes
+        self.seed = seed
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+        self.now = timezone.make_aware(datetime.combine(as_of, time(9)))
+        self.today = as_of
+        self.offsets = {}
+        self.doctor_pks = []
+        self.doctor_user_pks = []
+        self.doctor_cities = []
+        self.disease_pks = []
+        self.medicine_pks = []
+        self.pair_step = 1
+
+    def rng(self, step, chunk):
+        return random.Random(f'{self.seed}:{step}:{chunk}')
+
+    def patient_pk(self, index):
+        return self.offsets['patients'] + index + 1
+
+    def doctor_index(self, patient_index):
+        # A fixed spread of patients over doctors, which the child steps recompute
+        return patient_index * 2654435761 % len(self.doctor_pks)
+
+    def past(self, rng, days):
+        return self.now - timedelta(seconds=rng.randrange(days * 86400))
+
+
+def _next_pk(model):
+    return model.objects.aggregate(top=Max('pk'))['top'] or 0
+
+
+def _full_name(rng, gender):
+    first = rng.choice(MALE_NAMES if gender == 'M' else FEMALE_NAMES)
+    return first, f'{rng.choice(MALE_NAMES)} {rng.choice(FAMILY_NAMES)}'
+
+
+def _mobile(rng):
+    return rng.choice(PHONE_PREFIXES) + f'{rng.randrange(10 ** 8):08d}'
+
+
+def phone_id(pk, attempt=0):
+    """
+    A patient's 11-digit phone id, unique among generated patients: the pk is
+    scrambled by a multiplier prime to 10**8, so ids stay unique up to 10**8
+    patients. `attempt` moves to another prefix after a clash.
+    """
+    return PHONE_PREFIXES[(pk + attempt) % len(PHONE_PREFIXES)] + f'{pk * 48271 % 10 ** 8:08d}'
+
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def _copy(model, objs):
+    """Insert model instances with PostgreSQL's COPY, as bulk_create() would"""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not (field.primary_key and getattr(objs[0], field.attname) is None)
+    ]
+    buffer = io.StringIO()
+    for obj in objs:
+        # pre_save() fills auto_now fields
+        values = (field.get_db_prep_save(field.pre_save(obj, True), connection) for field in fields)
+        buffer.write('\t'.join(_copy_value(value) for value in values) + '\n')
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    sql = f"COPY {quote(model._meta.db_table)} ({', '.join(quote(field.column) for field in fields)}) FROM STDIN"
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):
+            raw.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def _insert(plan, model, objs):
+    if not objs:
+        return
+    if plan.use_copy:
+        _copy(model, objs)
+    else:
+        model.objects.bulk_create(objs, batch_size=plan.batch_size)
+
+
+def _prepare(plan):
+    """Cities, centers, users, doctors, staff and the disease and medicine catalogue, in this process"""
+    volumes = plan.volumes
+    rng = plan.rng('setup', 0)
+
+    keys = list(dict(City.IRAQ_CITIES))[:volumes['cities']]
+    labels = {key: str(label) for key, label in City.IRAQ_CITIES}
+    cities = [
+        City.objects.get_or_create(name=key, defaults={'state': labels[key], 'country': 'Iraq'})[0]
+        for key in keys
+    ]
+
+    center_pk = _next_pk(Center)
+    centers = []
+    for index in range(volumes['centers']):
+        city = rng.choices(cities, [CITY_WEIGHTS.get(city.name, 1) for city in cities])[0]
+        district = rng.choice(DISTRICTS)
+        centers.append(Center(
+            pk=center_pk + index + 1, city=city, name=rng.choice(CENTER_NAMES).format(district),
+            address=f'{labels[city.name]} - حي {district}', phone_number=f'+9647{rng.randrange(10 ** 9):09d}',
+        ))
+    _insert(plan, Center, centers)
+
+    # Unusable passwords: hashing thousands of them would take longer than the rest
+    password = make_password(None)
+    user_pk = _next_pk(User)
+    users = []
+    for index in range(volumes['doctors'] + volumes['staff']):
+        role = 'DOCTOR' if index < volumes['doctors'] else 'STAFF'
+        pk = user_pk + index + 1
+        first_name, last_name = _full_name(rng, rng.choice('MF'))
+        users.append(User(
+            pk=pk, email=f'dataset.{role.lower()}.{pk}@example.com', username=f'dataset.{role.lower()}.{pk}',
+            first_name=first_name, last_name=last_name.split()[-1], password=password, role=role,
+            phone_number=f'+964{_mobile(rng)[1:]}',
+        ))
+    _insert(plan, User, users)
+
+    specializations = [key for key, _label in Doctor.SPECIALIZATION_CHOICES]
+    doctor_pk = _next_pk(Doctor)
+    doctors = []
+    for index, user in enumerate(users[:volumes['doctors']]):
+        center = rng.choice(centers)
+        doctors.append(Doctor(
+            pk=doctor_pk + index + 1, user=user, center=center, specialization=rng.choice(specializations),
+            license_number=f'DS{doctor_pk + index + 1:08d}', experience_years=rng.randrange(1, 35),
+            consultation_fee=rng.choice((15000, 20000, 25000, 35000, 50000)),
+        ))
+        plan.doctor_cities.append(labels[center.city.name])
+    _insert(plan, Doctor, doctors)
+    plan.doctor_pks = [doctor.pk for doctor in doctors]
+    plan.doctor_user_pks = [doctor.user_id for doctor in doctors]
+
+    departments = [key for key, _label in Staff.DEPARTMENT_CHOICES]
+    staff_pk = _next_pk(Staff)
+    _insert(plan, Staff, [
+        Staff(
+            pk=staff_pk + index + 1, user=user, center=rng.choice(centers), department=rng.choice(departments),
+            employee_id=f'DS{staff_pk + index + 1:08d}', salary=rng.randrange(600, 2500) * 1000,
+        )
+        for index, user in enumerate(users[volumes['doctors']:])
+    ])
+
+    plan.disease_pks = [
+        Disease.objects.get_or_create(name=name, defaults={'category': category, 'icd_code': icd_code})[0].pk
+        for name, category, icd_code in DISEASES
+    ]
+    plan.medicine_pks = [
+        Medicine.objects.get_or_create(name=name, strength=strength, defaults={
+            'generic_name': generic_name, 'dosage_form': dosage_form, 'manufacturer': MANUFACTURERS[index % 4],
+        })[0].pk
+        for index, (name, generic_name, dosage_form, strength) in enumerate(MEDICINES)
+    ]
+    for model, step in ((Patient, 'patients'), (Treatment, 'treatments'), (Visit, 'visits')):
+        plan.offsets[step] = _next_pk(model)
+
+    pairs = volumes['patients'] * len(plan.disease_pks)
+    if volumes['patient_diseases'] > pairs:
+        raise ValueError(
+            f"{volumes['patient_diseases']:,} patient diseases need more than {volumes['patients']:,} patients"
+        )
+    # A step prime to the number of pairs, so its multiples modulo it visit every pair once
+    plan.pair_step = 2654435761
+    while pairs and math.gcd(plan.pair_step, pairs) != 1:
+        plan.pair_step += 2
+    return [City, Center, User, Doctor, Staff, Disease, Medicine]
+
+
+def _patients(plan, rng, start, stop):
+    blood_groups = [key for key, _label in Patient.BLOOD_GROUP_CHOICES]
+    patients = []
+    for index in range(start, stop):
+        pk = plan.patient_pk(index)
+        doctor = plan.doctor_index(index)
+        gender = rng.choice('MF')
+        first_name, rest = _full_name(rng, gender)
+        _contact_first, contact_rest = _full_name(rng, 'M')
+        patients.append(Patient(
+            pk=pk, user_id=plan.doctor_user_pks[doctor], doctor_id=plan.doctor_pks[doctor],
+            patient_name=f'{first_name} {rest}', patient_id=phone_id(pk),
+            date_of_birth=plan.today - timedelta(days=rng.randrange(90 * 365)), gender=gender,
+            blood_group=rng.choice(blood_groups),
+            address=f'{plan.doctor_cities[doctor]} - حي {rng.choice(DISTRICTS)} - محلة {rng.randrange(100, 999)} '
+                    f'- زقاق {rng.randrange(1, 60)} - دار {rng.randrange(1, 200)}',
+            emergency_contact_name=contact_rest, emergency_contact_phone=_mobile(rng),
+            medical_history=rng.choice(('', '', 'سكري', 'ضغط دم', 'عملية سابقة')),
+            allergies=rng.choice(('', '', '', 'بنسلين')), is_active=rng.random() > 0.02,
+        ))
+
+    # Phone ids typed in by hand may clash with generated ones
+    taken = set(Patient.objects.filter(
+        patient_id__in=[patient.patient_id for patient in patients]
+    ).values_list('patient_id', flat=True))
+    for patient in patients:
+        attempt = 0
+        while patient.patient_id in taken:
+            attempt += 1
+            patient.patient_id = phone_id(patient.pk, attempt)
+    _insert(plan, Patient, patients)
+
+
+def _patient_diseases(plan, rng, start, stop):
+    statuses = [key for key, _label in PatientDisease._meta.get_field('status').choices]
+    diseases = len(plan.disease_pks)
+    pairs = plan.volumes['patients'] * diseases
+    diagnoses = []
+    for index in range(start, stop):
+        # A patient has a disease once: row k takes the k-th (patient, disease) pair of a permutation
+        pair = index * plan.pair_step % pairs
+        diagnoses.append(PatientDisease(
+            patient_id=plan.patient_pk(pair // diseases), disease_id=plan.disease_pks[pair % diseases],
+            status=rng.choice(statuses), diagnosed_date=plan.today - timedelta(days=rng.randrange(5 * 365)),
+        ))
+    _insert(plan, PatientDisease, diagnoses)
+
+
+def _tests(plan, rng, start, stop):
+    tests = []
+    for _index in range(start, stop):
+        test_type = rng.choice(list(TEST_NAMES))
+        test_date = plan.past(rng, 3 * 365)
+        if rng.random() < 0.03:
+            status = 'CANCELLED'
+        elif plan.now - test_date < timedelta(days=7):
+            status = rng.choice(('PENDING', 'IN_PROGRESS', 'COMPLETED'))
+        else:
+            status = 'COMPLETED'
+        tests.append(Test(
+            patient_id=plan.patient_pk(rng.randrange(plan.volumes['patients'])),
+            disease_id=rng.choice(plan.disease_pks), test_name=rng.choice(TEST_NAMES[test_type]),
+            test_type=test_type, test_date=test_date, status=status,
+            results='ضمن المعدل الطبيعي' if status == 'COMPLETED' and rng.random() < 0.7 else
+                    ('خارج المعدل الطبيعي' if status == 'COMPLETED' else ''),
+        ))
+    _insert(plan, Test, tests)
+
+
+def _treatments(plan, rng, start, stop):
+    treatments = []
+    medicines = []
+    for index in range(start, stop):
+        started = plan.today - timedelta(days=rng.randrange(3 * 365))
+        status = rng.choices(('ACTIVE', 'COMPLETED', 'CANCELLED'), (3, 6, 1))[0]
+        treatment = Treatment(
+            pk=plan.offsets['treatments'] + index + 1,
+            patient_id=plan.patient_pk(rng.randrange(plan.volumes['patients'])),
+            disease_id=rng.choice(plan.disease_pks), treatment_name=rng.choice(TREATMENT_NAMES),
+            description='خطة علاجية حسب توصية الطبيب', start_date=started, status=status,
+            end_date=started + timedelta(days=rng.randrange(7, 180)) if status != 'ACTIVE' else None,
+        )
+        treatments.append(treatment)
+        for medicine_pk in rng.sample(plan.medicine_pks, rng.randint(1, min(3, len(plan.medicine_pks)))):
+            medicines.append(TreatmentMedicine(
+                treatment_id=treatment.pk, medicine_id=medicine_pk, dosage=rng.choice(('حبة واحدة', 'حبتان', '5 مل')),
+                frequency=rng.choice(FREQUENCIES), duration_days=rng.choice((5, 7, 10, 14, 30, 90)),
+            ))
+    _insert(plan, Treatment, treatments)
+    _insert(plan, TreatmentMedicine, medicines)
+
+
+def _surgeries(plan, rng, start, stop):
+    surgeries = []
+    for _index in range(start, stop):
+        scheduled = plan.now + timedelta(seconds=rng.randrange(-2 * 365 * 86400, 90 * 86400))
+        if scheduled > plan.now:
+            status = rng.choices(('SCHEDULED', 'POSTPONED'), (9, 1))[0]
+        else:
+            status = rng.choices(('COMPLETED', 'CANCELLED'), (9, 1))[0]
+        first_name, rest = _full_name(rng, rng.choice('MF'))
+        surgeries.append(Surgery(
+            patient_id=plan.patient_pk(rng.randrange(plan.volumes['patients'])),
+            surgery_name=rng.choice(SURGERY_NAMES), description='حسب التقرير الطبي', scheduled_date=scheduled,
+            actual_date=scheduled if status == 'COMPLETED' else None, status=status,
+            surgeon_name=f'د. {first_name} {rest.split()[-1]}',
+            complications=rng.choices(('NONE', 'MINOR', 'MAJOR', 'CRITICAL'), (85, 10, 4, 1))[0]
+            if status == 'COMPLETED' else 'NONE',
+        ))
+    _insert(plan, Surgery, surgeries)
+
+
+def _visits(plan, rng, start, stop):
+    visit_types = [key for key, _label in Visit.VISIT_TYPE_CHOICES]
+    visits = []
+    for index in range(start, stop):
+        patient = rng.randrange(plan.volumes['patients'])
+        visit_date = plan.now + timedelta(seconds=rng.randrange(-3 * 365 * 86400, 30 * 86400))
+        if visit_date > plan.now:
+            status = 'SCHEDULED'
+        else:
+            status = rng.choices(('COMPLETED', 'CANCELLED', 'NO_SHOW'), (85, 5, 10))[0]
+        visits.append(Visit(
+            pk=plan.offsets['visits'] + index + 1, patient_id=plan.patient_pk(patient),
+            doctor_id=plan.doctor_pks[plan.doctor_index(patient)], visit_type=rng.choice(visit_types),
+            visit_date=visit_date, status=status, chief_complaint=rng.choice(COMPLAINTS),
+            diagnosis=rng.choice(DIAGNOSES) if status == 'COMPLETED' else '',
+        ))
+    _insert(plan, Visit, visits)
+
+
+def _summaries(plan, rng, start, stop):
+    for batch in range(start, stop, SUMMARY_BATCH_SIZE):
+        build_summaries(plan.patient_pk(index) for index in range(batch, min(batch + SUMMARY_BATCH_SIZE, stop)))
+
+
+def _search_documents(plan, rng, start, stop):
+    offset = plan.offsets['visits']
+    build_visit_documents(Visit.objects.filter(pk__gt=offset + start, pk__lte=offset + stop))
+
+
+# (step, volume its chunks cover, chunk builder, model written); patients first, they are the others' parent
+STEPS = [
+    ('patients', 'patients', _patients, Patient),
+    ('patient_diseases', 'patient_diseases', _patient_diseases, PatientDisease),
+    ('tests', 'tests', _tests, Test),
+    ('treatments', 'treatments', _treatments, Treatment),
+    ('surgeries', 'surgeries', _surgeries, Surgery),
+    ('visits', 'visits', _visits, Visit),
+    ('summaries', 'patients', _summaries, None),
+    ('search documents', 'visits', _search_documents, None),
+]
+_BUILDERS = {step: builder for step, _volume, builder, _model in STEPS}
+
+# (volume, volume its rows point at)
+DEPENDENCIES = [
+    ('centers', 'cities'), ('doctors', 'centers'), ('staff', 'centers'), ('patients', 'doctors'),
+    ('patient_diseases', 'patients'), ('tests', 'patients'), ('treatments', 'patients'),
+    ('surgeries', 'patients'), ('visits', 'patients'),
+]
+
+_plan = None
+
+
+def _init_worker(plan):
+    global _plan
+    _plan = plan
+
+
+def _run_chunk(task):
+    step, chunk, start, stop = task
+    with transaction.atomic():
+        _BUILDERS[step](_plan, _plan.rng(step, chunk), start, stop)
+    return stop - start
+
+
+def generate_dataset(volumes=None, seed=0, as_of=None, workers=1, batch_size=1000, use_copy=None, progress=None):
+    """
+    Add a dataset of the given volumes (DEFAULT_VOLUMES for those missing).
+    `progress(step, done, total)` is called as a step starts and after each
+    of its chunks. Returns the volumes generated; existing cities, diseases
+    and medicines are reused rather than added.
+    """
+    volumes = {**DEFAULT_VOLUMES, **(volumes or {})}
+    volumes['cities'] = min(volumes['cities'], len(dict(City.IRAQ_CITIES)))
+    for child, parent in DEPENDENCIES:
+        if volumes[child] and not volumes[parent]:
+            raise ValueError(f"{child.replace('_', ' ').capitalize()} need {parent}")
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    if connection.vendor == 'sqlite':
+        # SQLite locks the whole database for a write
+        workers = 1
+    plan = DatasetPlan(volumes, seed, as_of or timezone.localdate(), batch_size, use_copy)
+
+    with transaction.atomic():
+        touched = _prepare(plan)
+
+    pool = None
+    if workers > 1:
+        # Children must open their own connections
+        connections.close_all()
+        pool = multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker, initargs=(plan,))
+    else:
+        _init_worker(plan)
+    try:
+        for step, volume, _builder, model in STEPS:
+            total = volumes[volume]
+            tasks = [
+                (step, chunk, start, min(start + CHUNK_SIZE, total))
+                for chunk, start in enumerate(range(0, total, CHUNK_SIZE))
+            ]
+            done = 0
+            if progress:
+                progress(step, done, total)
+            for rows in (pool.imap_unordered(_run_chunk, tasks) if pool else map(_run_chunk, tasks)):
+                done += rows
+                if progress:
+                    progress(step, done, total)
+            if model is not None:
+                touched.append(model)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), touched + [TreatmentMedicine]):
+            cursor.execute(sql)
+    for model in touched + [TreatmentMedicine]:
+        bump_model_version(model)
+    invalidate_reference_data()
+    invalidate_filter_choices('doctors')
+    return volumes
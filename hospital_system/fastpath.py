@@ -0,0 +1,197 @@
+"""
+Read-only fast path for list responses.
+
+Serializing a page through a ModelSerializer builds a model instance for
+every row and every joined and prefetched object, then dispatches each field
+through get_attribute(). When all the fields of a list's serializer are model
+paths, a ValuesPlan reads the page with values() instead - the row's columns
+and the joined ones the fields need, in one query - and builds each object
+from that dict, formatting every value with the serializer's own field, so
+the result is the one the serializer gives. Nested many=True serializers over
+a reverse foreign key take one more values() query per page.
+
+Serializers with any other kind of field (SerializerMethodField, properties,
+methods besides those in fieldsets.METHOD_SOURCES, other related fields,
+files) or an overridden to_representation() have no plan.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .fieldsets import METHOD_SOURCES
+
+# Methods of METHOD_SOURCES, computed from their columns
+ROW_METHODS = {
+    'get_full_name': lambda first_name, last_name: f'{first_name} {last_name}'.strip(),
+}
+
+UNSUPPORTED_FIELDS = (
+    serializers.SerializerMethodField, serializers.ManyRelatedField, serializers.HiddenField,
+    serializers.FileField,
+)
+
+# Entry kinds
+VALUE = 'value'
+METHOD = 'method'
+OBJECT = 'object'
+LIST = 'list'
+
+
+class _NoPlan(Exception):
+    pass
+
+
+def _is_plain(serializer):
+    return type(serializer).to_representation is serializers.Serializer.to_representation
+
+
+def _lookup(prefix, name):
+    return f'{prefix}__{name}' if prefix else name
+
+
+class ValuesPlan:
+    """How to build a serializer's objects from values() rows of its model"""
+
+    def __init__(self, model):
+        self.model = model
+        self.pk = model._meta.pk.attname
+        self.lookups = {self.pk: None}
+        self.entries = []
+
+    def add_lookup(self, lookup):
+        self.lookups[lookup] = None
+        return lookup
+
+    def values(self, queryset):
+        return queryset.prefetch_related(None).values(*self.lookups)
+
+    def render(self, rows):
+        """The serialized objects of values() rows"""
+        rows = list(rows)
+        children = {}
+        for _kind, name, child_plan, foreign_key in (entry for entry in self.entries if entry[0] == LIST):
+            groups = children[name] = {}
+            if not rows:
+                continue
+            child_rows = list(child_plan.values(
+                child_plan.model._default_manager.filter(**{f'{foreign_key}__in': [row[self.pk] for row in rows]})
+            ))
+            for child_row, record in zip(child_rows, child_plan.render(child_rows)):
+                groups.setdefault(child_row[foreign_key], []).append(record)
+        return [self._build(self.entries, row, children) for row in rows]
+
+    def _build(self, entries, row, children):
+        record = {}
+        for entry in entries:
+            kind, name = entry[0], entry[1]
+            if kind == LIST:
+                record[name] = children[name].get(row[self.pk], [])
+                continue
+            guards = entry[-1]
+            if any(row[guard] is None for guard in guards):
+                # A missing object on the way, which the serializer skips
+                continue
+            if kind == OBJECT:
+                record[name] = None if row[entry[2]] is None else self._build(entry[3], row, children)
+                continue
+            if kind == VALUE:
+                value = row[entry[2]]
+            else:
+                value = entry[3](*(row[lookup] for lookup in entry[2]))
+            represent = entry[4] if kind == METHOD else entry[3]
+            record[name] = None if value is None else represent(value)
+        return record
+
+    def _resolve(self, model, source, prefix):
+        """(model field or method name, lookup prefix of its model, guards) along a dotted source"""
+        parts = source.split('.')
+        guards = []
+        for index, part in enumerate(parts):
+            last = index == len(parts) - 1
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                if last and part in ROW_METHODS:
+                    return part, prefix, guards
+                raise _NoPlan
+            if last:
+                return field, prefix, guards
+            if not (field.many_to_one or (field.one_to_one and field.concrete)):
+                raise _NoPlan
+            lookup = _lookup(prefix, part)
+            if field.null:
+                guards.append(self.add_lookup(lookup))
+            model, prefix = field.related_model, lookup
+        raise _NoPlan
+
+    def add_serializer(self, serializer, model, prefix=''):
+        """The entries of a serializer's fields read from a model at a lookup prefix"""
+        if not _is_plain(serializer):
+            raise _NoPlan
+        entries = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, UNSUPPORTED_FIELDS) or field.source == '*':
+                raise _NoPlan
+            target, target_prefix, guards = self._resolve(model, field.source, prefix)
+            guards = tuple(guards)
+
+            if isinstance(target, str):
+                columns = tuple(
+                    self.add_lookup(_lookup(target_prefix, column)) for column in METHOD_SOURCES[target]
+                )
+                entries.append((METHOD, name, columns, ROW_METHODS[target], field.to_representation, guards))
+                continue
+
+            lookup = _lookup(target_prefix, target.name)
+            if isinstance(field, serializers.ListSerializer):
+                plain_list = type(field).to_representation is serializers.ListSerializer.to_representation
+                if not (target.one_to_many and plain_list) or target_prefix:
+                    raise _NoPlan
+                child_plan = ValuesPlan(target.related_model)
+                foreign_key = child_plan.add_lookup(target.field.attname)
+                child_plan.entries = child_plan.add_serializer(field.child, target.related_model)
+                entries.append((LIST, name, child_plan, foreign_key))
+            elif isinstance(field, serializers.BaseSerializer):
+                if not (target.many_to_one or (target.one_to_one and target.concrete)):
+                    raise _NoPlan
+                nested = self.add_serializer(field, target.related_model, lookup)
+                entries.append((OBJECT, name, self.add_lookup(lookup), nested, guards))
+            elif target.is_relation:
+                if not isinstance(field, serializers.PrimaryKeyRelatedField) or target.many_to_many or not target.concrete:
+                    raise _NoPlan
+                represent = field.pk_field.to_representation if field.pk_field else (lambda pk: pk)
+                entries.append((VALUE, name, self.add_lookup(lookup), represent, guards))
+            else:
+                if isinstance(field, serializers.RelatedField):
+                    raise _NoPlan
+                entries.append((VALUE, name, self.add_lookup(lookup), field.to_representation, guards))
+        return entries
+
+
+def build_plan(serializer):
+    """The ValuesPlan of a ModelSerializer, None when it has none"""
+    plan = ValuesPlan(serializer.Meta.model)
+    try:
+        plan.entries = plan.add_serializer(serializer, plan.model)
+    except _NoPlan:
+        return None
+    return plan
+
+
+class ValuesListMixin:
+    """
+    ViewSet mixin answering list requests through a ValuesPlan of the list
+    serializer, when it has one.
+    """
+
+    def list(self, request, *args, **kwargs):
+        plan = build_plan(self.get_serializer())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+        queryset = plan.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        return Response(plan.render(queryset))
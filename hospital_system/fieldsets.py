@@ -0,0 +1,184 @@
+"""
+Sparse fieldsets for the REST viewsets: ?fields=, ?exclude= and ?expand=.
+
+`fields` keeps only the named fields of each object, `exclude` drops the
+named ones and `expand` replaces a related object's id with the object
+itself, for the relations a serializer lists in `expandable_fields`. Only the
+top-level serializer of a GET is pruned; writes always see every field.
+
+The pruned serializer is also turned into the queryset's select_related(),
+only() and prefetch_related(): each remaining field's source is followed
+through the models to the columns and joins it reads, so dropping
+`medical_history` or a nested user drops its column or join as well. Fields
+whose source is not a model path (SerializerMethodField, properties) list
+what they read in the serializer's `field_sources`; when a remaining field's
+reads are unknown the queryset is left as it was.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDSET_PARAMS = ('fields', 'exclude', 'expand')
+
+# Model methods used as sources -> the columns they read
+METHOD_SOURCES = {
+    'get_full_name': ('first_name', 'last_name'),
+}
+
+
+def _names(query_params, param):
+    return [name.strip() for name in query_params.get(param, '').split(',') if name.strip()]
+
+
+def is_sparse(request):
+    """Whether a request asks for a fieldset other than the default one"""
+    return any(request.query_params.get(param) for param in FIELDSET_PARAMS)
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin pruning and expanding its fields from the request's
+    fieldset parameters.
+
+    `expandable_fields` maps field names to the serializer class showing the
+    related object when expanded, `field_sources` maps field names to the
+    model paths they read when their source does not say ([] for none).
+    """
+    expandable_fields = {}
+    field_sources = {}
+
+    def _is_top_level(self):
+        parent = self.parent
+        return parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS or not self._is_top_level():
+            return fields
+
+        query_params = request.query_params
+        keep, exclude, expand = (_names(query_params, param) for param in FIELDSET_PARAMS)
+        unknown = [name for name in expand if name not in self.expandable_fields]
+        unknown += [name for name in keep + exclude if name not in fields]
+        if unknown:
+            raise serializers.ValidationError({'error': f"Unknown fields: {', '.join(unknown)}"})
+
+        for name in expand:
+            fields[name] = self.expandable_fields[name](read_only=True)
+        if keep:
+            fields = {name: field for name, field in fields.items() if name in keep or name in expand}
+        for name in exclude:
+            fields.pop(name, None)
+        return fields
+
+
+class _Reads:
+    """Columns, joins and prefetched relations a serializer reads, as ORM lookups"""
+
+    def __init__(self):
+        self.columns = set()
+        self.whole = set()
+        self.joins = set()
+        self.prefetches = set()
+
+    def only(self):
+        # Traversing a foreign key loads it, a joined relation needs at least one column
+        for join in self.joins:
+            if not any(lookup == join or lookup.startswith(f'{join}__') for lookup in self.columns | self.whole):
+                self.whole.add(join)
+        return sorted((self.columns - self.joins) | self.whole)
+
+
+def _lookup(prefix, name):
+    return f'{prefix}__{name}' if prefix else name
+
+
+def _read_path(reads, model, path, prefix='', nested=None):
+    """Record what a dotted source path from a model reads, False when that is unknown"""
+    parts = path.split('.') if path else []
+    for index, part in enumerate(parts):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            if part in METHOD_SOURCES and index == len(parts) - 1:
+                reads.columns.update(_lookup(prefix, name) for name in METHOD_SOURCES[part])
+                return True
+            if not prefix:
+                return False
+            # Any other method or property of a related object may read any of its columns
+            reads.whole.add(prefix)
+            return True
+        lookup = _lookup(prefix, part)
+        if field.one_to_many or field.many_to_many:
+            reads.prefetches.add(lookup)
+            return True
+        if field.is_relation and (index < len(parts) - 1 or nested is not None):
+            reads.joins.add(lookup)
+            model, prefix = field.related_model, lookup
+            continue
+        reads.columns.add(lookup)
+        return True
+    if nested is not None:
+        return _read_serializer(reads, nested, model, prefix)
+    return True
+
+
+def _read_serializer(reads, serializer, model, prefix=''):
+    field_sources = getattr(serializer, 'field_sources', {})
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in field_sources:
+            sources = field_sources[name]
+        elif field.source == '*':
+            return False
+        else:
+            sources = [field.source]
+        if isinstance(field, serializers.ListSerializer):
+            nested = field.child
+        else:
+            nested = field if isinstance(field, serializers.BaseSerializer) else None
+        for source in sources:
+            if not _read_path(reads, model, source, prefix, nested):
+                return False
+    return True
+
+
+def project_queryset(queryset, serializer, extra_sources=()):
+    """
+    The queryset loading only what a serializer (plus the dotted
+    extra_sources) reads, or the queryset itself when that is unknown.
+    """
+    reads = _Reads()
+    if not _read_serializer(reads, serializer, queryset.model):
+        return queryset
+    for source in extra_sources:
+        if not _read_path(reads, queryset.model, source):
+            return queryset
+
+    roots = {lookup.split('__')[0] for lookup in reads.prefetches}
+    prefetches = [
+        lookup for lookup in queryset._prefetch_related_lookups
+        if getattr(lookup, 'prefetch_through', lookup).split('__')[0] in roots
+    ]
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if reads.joins:
+        queryset = queryset.select_related(*sorted(reads.joins))
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset.only(*reads.only())
+
+
+class FieldsetProjectionMixin:
+    """
+    ViewSet mixin loading, for list and retrieve requests with a sparse
+    fieldset, only the columns and relations of the fields it keeps.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action in ('list', 'retrieve') and is_sparse(self.request):
+            # The detail ETag reads its timestamps from the loaded object
+            queryset = project_queryset(queryset, self.get_serializer(), getattr(self, 'etag_fields', ()))
+        return queryset
@@ -4,7 +4,7 @@ Django settings for hospital_system project.
 
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -70,6 +70,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.accounts.middleware.PrincipalMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -177,11 +178,21 @@ AUTH_USER_MODEL = 'accounts.User'
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.accounts.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-backed JSON when orjson is installed, the json module otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'hospital_system.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'hospital_system.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_FILTER_BACKENDS': [
@@ -240,12 +251,29 @@ CORS_ALLOW_CREDENTIALS = True
 
 # Cache Configuration
 REDIS_URL = config('REDIS_URL', default='')
+# With Redis, keys under CACHE_L1_PREFIXES are also kept in a per-process LRU of at most
+# CACHE_L1_MAX_ENTRIES entries, each for at most CACHE_L1_TIMEOUT seconds; writes made by
+# other processes are picked up within CACHE_L1_POLL_INTERVAL seconds
+CACHE_L1_PREFIXES = config('CACHE_L1_PREFIXES', default='admin_filter:,prevalence:version,reference:', cast=Csv())
+CACHE_L1_MAX_ENTRIES = config('CACHE_L1_MAX_ENTRIES', default=1000, cast=int)
+CACHE_L1_TIMEOUT = config('CACHE_L1_TIMEOUT', default=60, cast=int)
+CACHE_L1_POLL_INTERVAL = config('CACHE_L1_POLL_INTERVAL', default=1.0, cast=float)
 if REDIS_URL:
     CACHES = {
         'default': {
+            'BACKEND': 'hospital_system.cache.TieredCache',
+            'OPTIONS': {
+                'L2': 'shared',
+                'L1_PREFIXES': CACHE_L1_PREFIXES,
+                'L1_MAX_ENTRIES': CACHE_L1_MAX_ENTRIES,
+                'L1_TIMEOUT': CACHE_L1_TIMEOUT,
+                'L1_POLL_INTERVAL': CACHE_L1_POLL_INTERVAL,
+            },
+        },
+        'shared': {
             'BACKEND': 'django.core.cache.backends.redis.RedisCache',
             'LOCATION': REDIS_URL,
-        }
+        },
     }
 else:
     CACHES = {
@@ -254,6 +282,10 @@ else:
         }
     }
 
+# ETags and 304s on the REST viewsets; their version counters live in the cache, so they
+# need the shared Redis cache whenever more than one process serves requests
+CONDITIONAL_GET_ENABLED = config('CONDITIONAL_GET_ENABLED', default=bool(REDIS_URL), cast=bool)
+
 # Celery Configuration
 if REDIS_URL:
     CELERY_BROKER_URL = REDIS_URL
@@ -263,11 +295,88 @@ if REDIS_URL:
     CELERY_RESULT_SERIALIZER = 'json'
     CELERY_TIMEZONE = TIME_ZONE
     CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+    CELERY_BEAT_SCHEDULE = {
+        'cleanup-expired-reports': {
+            'task': 'apps.reports.tasks.cleanup_expired_reports',
+            'schedule': timedelta(hours=1),
+        },
+        'purge-deletion-log': {
+            'task': 'apps.patients.tasks.purge_deletion_log',
+            'schedule': timedelta(days=1),
+        },
+    }
 else:
     # Disable Celery if Redis is not available
     CELERY_TASK_ALWAYS_EAGER = True
     CELERY_TASK_EAGER_PROPAGATES = True
 
+# Report Retention
+# Days a generated report file is kept before the sweeper deletes it, per report type
+REPORT_RETENTION_DAYS = {
+    'default': config('REPORT_RETENTION_DAYS', default=30, cast=int),
+    'PATIENT_RECORD': 90,
+    'TEST_RESULTS': 90,
+    'TREATMENT_SUMMARY': 90,
+    'SURGERY_REPORT': 90,
+    'PATIENTS_PER_CITY': 14,
+    'COMMON_DISEASES': 14,
+    'CENTER_STATISTICS': 14,
+    'DATA_EXPORT': 7,
+}
+# Days an expired or failed report row is kept before it is deleted
+REPORT_ROW_RETENTION_DAYS = config('REPORT_ROW_RETENTION_DAYS', default=180, cast=int)
+# Disk quota per user for generated report files (0 disables the check)
+REPORT_USER_QUOTA_BYTES = config('REPORT_USER_QUOTA_BYTES', default=500 * 1024 * 1024, cast=int)
+# Rows fetched per database round-trip and rows written between checkpoints for data exports
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+EXPORT_CHECKPOINT_ROWS = config('EXPORT_CHECKPOINT_ROWS', default=50000, cast=int)
+# Rows per Parquet row group, i.e. the most rows held in memory while writing
+EXPORT_ROW_GROUP_SIZE = config('EXPORT_ROW_GROUP_SIZE', default=50000, cast=int)
+
+# Cohort analytics: result cache lifetime, NumPy snapshot lifetime (seconds) and
+# the number of cohort queries within one snapshot lifetime that triggers a snapshot
+COHORT_CACHE_TIMEOUT = config('COHORT_CACHE_TIMEOUT', default=300, cast=int)
+COHORT_SNAPSHOT_TTL = config('COHORT_SNAPSHOT_TTL', default=600, cast=int)
+COHORT_SNAPSHOT_MIN_QUERIES = config('COHORT_SNAPSHOT_MIN_QUERIES', default=3, cast=int)
+# Patient, diagnosis, test and treatment rows above which no snapshot is built (SQL only)
+COHORT_SNAPSHOT_MAX_ROWS = config('COHORT_SNAPSHOT_MAX_ROWS', default=2000000, cast=int)
+# Seconds a disease prevalence window stays cached (diagnosis changes also invalidate it)
+PREVALENCE_CACHE_TIMEOUT = config('PREVALENCE_CACHE_TIMEOUT', default=900, cast=int)
+# Rows per section on the patient profile page before a section has to be expanded
+PATIENT_PROFILE_SECTION_LIMIT = config('PATIENT_PROFILE_SECTION_LIMIT', default=50, cast=int)
+# Admin changelists: filtered lists count at most ADMIN_COUNT_CAP rows ("1000+"), unfiltered
+# lists above ADMIN_ESTIMATE_THRESHOLD rows show the PostgreSQL planner estimate
+ADMIN_COUNT_CAP = config('ADMIN_COUNT_CAP', default=1000, cast=int)
+ADMIN_ESTIMATE_THRESHOLD = config('ADMIN_ESTIMATE_THRESHOLD', default=100000, cast=int)
+# Admin list filter choices: cache lifetime (seconds, changes also invalidate them) and the
+# number of choices above which a filter switches to an autocomplete search box
+ADMIN_FILTER_CACHE_TIMEOUT = config('ADMIN_FILTER_CACHE_TIMEOUT', default=3600, cast=int)
+ADMIN_FILTER_AUTOCOMPLETE_THRESHOLD = config('ADMIN_FILTER_AUTOCOMPLETE_THRESHOLD', default=50, cast=int)
+# Seconds an authenticated user's cached principal (role, profiles, access scope) is kept;
+# user, profile and patient changes also invalidate it
+PRINCIPAL_CACHE_TIMEOUT = config('PRINCIPAL_CACHE_TIMEOUT', default=300, cast=int)
+# Principals are only cached in a cache every process shares, or invalidations made
+# by one gunicorn worker would not reach the others
+PRINCIPAL_CACHE_ENABLED = config('PRINCIPAL_CACHE_ENABLED', default=bool(REDIS_URL), cast=bool)
+# Seconds the reference data snapshot (cities, centers, doctors, diseases, medicines) stays
+# cached; changes to any of them also invalidate it
+REFERENCE_DATA_CACHE_TIMEOUT = config('REFERENCE_DATA_CACHE_TIMEOUT', default=86400, cast=int)
+# Keep the snapshot version as a counter in the cache, which needs a cache every process
+# shares; otherwise every request derives it from the source tables with one query
+REFERENCE_DATA_CACHED_VERSION = config('REFERENCE_DATA_CACHED_VERSION', default=bool(REDIS_URL), cast=bool)
+# Delta sync: rows per entity and page, seconds recent changes wait for the next sync (so
+# late-committing transactions are not skipped) and days tombstones of deleted rows are kept
+SYNC_PAGE_SIZE = config('SYNC_PAGE_SIZE', default=200, cast=int)
+SYNC_SETTLE_SECONDS = config('SYNC_SETTLE_SECONDS', default=2, cast=int)
+SYNC_TOMBSTONE_RETENTION_DAYS = config('SYNC_TOMBSTONE_RETENTION_DAYS', default=90, cast=int)
+# Most visits a search returns, best matches first
+VISIT_SEARCH_MAX_RESULTS = config('VISIT_SEARCH_MAX_RESULTS', default=500, cast=int)
+# Universal search: worker threads (0 searches inline), hits per entity and the time budget (ms)
+# after which entities still searching are left out of a partial result
+UNIVERSAL_SEARCH_WORKERS = config('UNIVERSAL_SEARCH_WORKERS', default=4, cast=int)
+UNIVERSAL_SEARCH_LIMIT = config('UNIVERSAL_SEARCH_LIMIT', default=10, cast=int)
+UNIVERSAL_SEARCH_TIME_BUDGET_MS = config('UNIVERSAL_SEARCH_TIME_BUDGET_MS', default=800, cast=int)
+
 # Email Configuration
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')
@@ -1,8 +1,11 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
 from django.contrib import admin
-from django.db.models.signals import post_migrate
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
 
+from .conditional import CHILD_COLLECTIONS, VERSIONED_MODELS, bump_children_version, bump_model_version
+
 
 @receiver(post_migrate)
 def re_register_admin_models(sender, **kwargs):
@@ -16,3 +19,23 @@ def re_register_admin_models(sender, **kwargs):
         
         # The models should now be registered with our custom admin site
         print("Admin models re-registered with custom admin site")
+
+
+def bump_etag_versions(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Make the ETags built from a model's rows stale once the change commits"""
+    if raw:
+        return
+    # Logins only touch last_login, which no response shows
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    transaction.on_commit(lambda: bump_model_version(sender))
+    parent_field = CHILD_COLLECTIONS.get(sender._meta.label)
+    if parent_field:
+        parent_id = getattr(instance, f'{parent_field}_id')
+        transaction.on_commit(lambda: bump_children_version(sender, parent_id))
+
+
+for label in VERSIONED_MODELS:
+    model = apps.get_model(label)
+    post_save.connect(bump_etag_versions, sender=model, dispatch_uid=f'etag_post_save_{label}')
+    post_delete.connect(bump_etag_versions, sender=model, dispatch_uid=f'etag_post_delete_{label}')
@@ -7,7 +7,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.shortcuts import redirect
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
-from apps.patients.views import patient_profile
+from apps.dashboard.views import universal_search_page
+from apps.patients.views import patient_profile, patient_timeline
 
 # Import admin config to ensure custom admin site is registered
 from hospital_system import admin_config
@@ -21,6 +22,8 @@ urlpatterns = [
     
     # Direct patient profile access - MUST come before admin URLs
     path('admin/patients/patient-profile/<int:patient_id>/', patient_profile, name='admin_patient_profile'),
+    path('admin/patients/patient-profile/<int:patient_id>/timeline/', patient_timeline, name='admin_patient_timeline'),
+    path('admin/search/', universal_search_page, name='admin_universal_search'),
     
     path('admin/', admin.site.urls),
     path('api/v1/auth/', include('apps.accounts.urls')),
@@ -0,0 +1,102 @@
+/**
+ * Reference Data - cities, centers, doctors, diseases and medicines from the
+ * reference data snapshot, downloaded once per browser session and filtered
+ * locally. Later pages only revalidate the stored copy with its ETag, which
+ * costs a 304 while nothing has changed.
+ */
+
+(function() {
+    'use strict';
+
+    const URL = '/api/v1/hospital/reference-data/';
+    const STORAGE_KEY = 'hospital.referenceData';
+    let pending = null;
+
+    function readStored() {
+        try {
+            return JSON.parse(window.sessionStorage.getItem(STORAGE_KEY));
+        } catch (e) {
+            return null;
+        }
+    }
+
+    function store(etag, data) {
+        try {
+            window.sessionStorage.setItem(STORAGE_KEY, JSON.stringify({etag: etag, data: data}));
+        } catch (e) {
+            // Storage full or disabled, the page still has its copy
+        }
+    }
+
+    // Promise of the snapshot, requested at most once per page
+    function load() {
+        if (pending) return pending;
+
+        const stored = readStored();
+        const headers = {'Accept': 'application/json'};
+        if (stored && stored.etag) {
+            headers['If-None-Match'] = stored.etag;
+        }
+        pending = fetch(URL, {credentials: 'same-origin', cache: 'no-store', headers: headers})
+            .then(function(response) {
+                if (response.status === 304 && stored) {
+                    return stored.data;
+                }
+                if (!response.ok) {
+                    throw new Error('Reference data request failed: ' + response.status);
+                }
+                return response.json().then(function(data) {
+                    store(response.headers.get('ETag'), data);
+                    return data;
+                });
+            })
+            .catch(function(error) {
+                pending = null;
+                throw error;
+            });
+        return pending;
+    }
+
+    function findCity(data, cityId) {
+        return data.cities.find(function(city) {
+            return String(city.id) === String(cityId);
+        });
+    }
+
+    // Centers of a city, each with its city's display name; only the active
+    // ones when activeOnly is set (the admin forms list them all)
+    function centersOf(data, cityId, activeOnly) {
+        const city = findCity(data, cityId);
+        if (!city) return [];
+        return city.centers.filter(function(center) {
+            return !activeOnly || center.is_active;
+        }).map(function(center) {
+            return Object.assign({city_name: city.display_name}, center);
+        });
+    }
+
+    // Doctors of a center, or of every center when none is given; only the
+    // available ones when availableOnly is set (the admin forms list them all)
+    function doctorsOf(data, centerId, availableOnly) {
+        const doctors = [];
+        data.cities.forEach(function(city) {
+            city.centers.forEach(function(center) {
+                if (!centerId || centerId === 'any' || String(center.id) === String(centerId)) {
+                    center.doctors.forEach(function(doctor) {
+                        if (!availableOnly || doctor.is_available) {
+                            doctors.push(doctor);
+                        }
+                    });
+                }
+            });
+        });
+        return doctors;
+    }
+
+    window.referenceData = {
+        load: load,
+        centersOf: centersOf,
+        doctorsOf: doctorsOf
+    };
+
+})();
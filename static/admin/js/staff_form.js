@@ -21,36 +21,28 @@
             return;
         }
         
-        // Make AJAX request to get centers for the selected city
-        $.ajax({
-            url: '/api/v1/hospital/centers-by-city/',
-            type: 'GET',
-            data: {
-                'city_id': selectedCityId
-            },
-            success: function(data) {
-                // Add centers to the dropdown
-                if (data.centers && data.centers.length > 0) {
-                    data.centers.forEach(function(center) {
-                        const option = document.createElement('option');
-                        option.value = center.id;
-                        option.textContent = center.name + ' - ' + center.city_name;
-                        centerSelect.appendChild(option);
-                    });
-                } else {
+        // Centers of the selected city, from the reference data snapshot
+        window.referenceData.load().then(function(data) {
+            const centers = window.referenceData.centersOf(data, selectedCityId);
+            if (centers.length > 0) {
+                centers.forEach(function(center) {
                     const option = document.createElement('option');
-                    option.value = '';
-                    option.textContent = 'لا توجد مراكز في هذه المدينة';
+                    option.value = center.id;
+                    option.textContent = center.name + ' - ' + center.city_name;
                     centerSelect.appendChild(option);
-                }
-            },
-            error: function() {
-                console.error('Error loading centers');
+                });
+            } else {
                 const option = document.createElement('option');
                 option.value = '';
-                option.textContent = 'خطأ في تحميل المراكز';
+                option.textContent = 'لا توجد مراكز في هذه المدينة';
                 centerSelect.appendChild(option);
             }
+        }).catch(function() {
+            console.error('Error loading centers');
+            const option = document.createElement('option');
+            option.value = '';
+            option.textContent = 'خطأ في تحميل المراكز';
+            centerSelect.appendChild(option);
         });
     }
     
@@ -23,36 +23,28 @@
             return;
         }
         
-        // Make AJAX request to get centers for the selected city
-        $.ajax({
-            url: '/api/v1/patients/admin/get-centers-by-city/',
-            type: 'GET',
-            data: {
-                'city_id': selectedCityId
-            },
-            success: function(data) {
-                // Add centers to the dropdown
-                if (data.centers && data.centers.length > 0) {
-                    data.centers.forEach(function(center) {
-                        const option = document.createElement('option');
-                        option.value = center.id;
-                        option.textContent = center.name;
-                        centerSelect.appendChild(option);
-                    });
-                } else {
+        // Centers of the selected city, from the reference data snapshot
+        window.referenceData.load().then(function(data) {
+            const centers = window.referenceData.centersOf(data, selectedCityId);
+            if (centers.length > 0) {
+                centers.forEach(function(center) {
                     const option = document.createElement('option');
-                    option.value = '';
-                    option.textContent = 'لا توجد مستشفيات في هذه المدينة';
+                    option.value = center.id;
+                    option.textContent = center.name;
                     centerSelect.appendChild(option);
-                }
-            },
-            error: function() {
-                console.error('Error loading centers');
+                });
+            } else {
                 const option = document.createElement('option');
                 option.value = '';
-                option.textContent = 'خطأ في تحميل المستشفيات';
+                option.textContent = 'لا توجد مستشفيات في هذه المدينة';
                 centerSelect.appendChild(option);
             }
+        }).catch(function() {
+            console.error('Error loading centers');
+            const option = document.createElement('option');
+            option.value = '';
+            option.textContent = 'خطأ في تحميل المستشفيات';
+            centerSelect.appendChild(option);
         });
     }
     
@@ -72,36 +64,28 @@
             return;
         }
         
-        // Make AJAX request to get doctors for the selected center
-        $.ajax({
-            url: '/api/v1/patients/admin/get-doctors-by-center/',
-            type: 'GET',
-            data: {
-                'center_id': selectedCenterId
-            },
-            success: function(data) {
-                // Add doctors to the dropdown
-                if (data.doctors && data.doctors.length > 0) {
-                    data.doctors.forEach(function(doctor) {
-                        const option = document.createElement('option');
-                        option.value = doctor.id;
-                        option.textContent = doctor.name + ' - ' + doctor.specialization;
-                        doctorSelect.appendChild(option);
-                    });
-                } else {
+        // Doctors of the selected center, from the reference data snapshot
+        window.referenceData.load().then(function(data) {
+            const doctors = window.referenceData.doctorsOf(data, selectedCenterId);
+            if (doctors.length > 0) {
+                doctors.forEach(function(doctor) {
                     const option = document.createElement('option');
-                    option.value = '';
-                    option.textContent = 'لا يوجد أطباء في هذا المستشفى';
+                    option.value = doctor.id;
+                    option.textContent = doctor.name + ' - ' + doctor.specialization_display;
                     doctorSelect.appendChild(option);
-                }
-            },
-            error: function() {
-                console.error('Error loading doctors');
+                });
+            } else {
                 const option = document.createElement('option');
                 option.value = '';
-                option.textContent = 'خطأ في تحميل الأطباء';
+                option.textContent = 'لا يوجد أطباء في هذا المستشفى';
                 doctorSelect.appendChild(option);
             }
+        }).catch(function() {
+            console.error('Error loading doctors');
+            const option = document.createElement('option');
+            option.value = '';
+            option.textContent = 'خطأ في تحميل الأطباء';
+            doctorSelect.appendChild(option);
         });
     }
     